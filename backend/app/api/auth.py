@@ -2,32 +2,33 @@
 
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import JSONResponse
-from firebase_admin import auth
-from typing import Dict, Any, Callable
+from typing import Dict, Any
 import re
 import time
-import os
 from functools import partial
 from common_utils.logger import logger, sanitize_request_data, create_dict_logger, log_request
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.core.config import get_settings
+from app.core.startup import init_firebase
+from app.core.token_cache import get_token_cache
+from app.core.metrics import METRICS_PATH, upstream_timer
 
-# 環境変数から設定を読み込み
-from dotenv import load_dotenv
-load_dotenv("./config/.env")
-develop_env_path = "./config_develop/.env.develop"
-if os.path.exists(develop_env_path):
-    load_dotenv(develop_env_path)
+# 設定の読み込み（.envの読み込みはapp.core.configで1回だけ行う）
+settings = get_settings()
 
 # ロギング設定
-LOGOUT_LOG_MAX_LENGTH = int(os.environ["LOGOUT_LOG_MAX_LENGTH"])
-VERIFY_AUTH_LOG_MAX_LENGTH = int(os.environ["VERIFY_AUTH_LOG_MAX_LENGTH"])
-MIDDLE_WARE_LOG_MAX_LENGTH = int(os.environ["MIDDLE_WARE_LOG_MAX_LENGTH"])
-SENSITIVE_KEYS = os.environ["SENSITIVE_KEYS"].split(",")
+LOGOUT_LOG_MAX_LENGTH = settings.logout_log_max_length
+VERIFY_AUTH_LOG_MAX_LENGTH = settings.verify_auth_log_max_length
+MIDDLE_WARE_LOG_MAX_LENGTH = settings.middle_ware_log_max_length
+# ログ用に写し取るリクエストボディの先頭バイト数
+REQUEST_BODY_LOG_PREFIX_BYTES = settings.request_body_log_prefix_bytes
+SENSITIVE_KEYS = settings.sensitive_keys
 
 # リクエストIDが不要なパス
-UNNEED_REQUEST_ID_PATH = os.environ.get("UNNEED_REQUEST_ID_PATH", "").split(",")
-UNNEED_REQUEST_ID_PATH_STARTSWITH = os.environ.get("UNNEED_REQUEST_ID_PATH_STARTSWITH", "").split(",")
-UNNEED_REQUEST_ID_PATH_ENDSWITH = os.environ.get("UNNEED_REQUEST_ID_PATH_ENDSWITH", "").split(",")
+UNNEED_REQUEST_ID_PATH = settings.unneed_request_id_path
+UNNEED_REQUEST_ID_PATH_STARTSWITH = settings.unneed_request_id_path_startswith
+UNNEED_REQUEST_ID_PATH_ENDSWITH = settings.unneed_request_id_path_endswith
 
 router = APIRouter()
 
@@ -58,112 +59,162 @@ async def get_current_user(request: Request):
         raise HTTPException(status_code=401, detail="認証が必要です")
 
     token = auth_header.split("Bearer ")[1]
+
     try:
-        decoded_token = auth.verify_id_token(token, clock_skew_seconds=60)
-        logger.info("認証成功")
-        return decoded_token
+        return verify_token(token)
     except Exception as e:
         logger.error("認証エラー: %s", str(e), exc_info=True)
         raise HTTPException(status_code=401, detail=str(e))
 
+def verify_token(token: str) -> Dict[str, Any]:
+    """
+    Firebase IDトークンを検証し、デコードしたトークンを返す（失敗した場合は例外を送出する）
+    検証済みのトークンであれば署名検証を省略する（有効期限まではキャッシュを使う）
+    ヘッダーを使えないWebSocketの認証にも使う
+    """
+    token_cache = get_token_cache()
+    cached_token = token_cache.get(token)
+    if cached_token is not None:
+        logger.debug("認証成功（検証済みトークン）")
+        return cached_token
+
+    # Firebase Admin SDKの初期化は最初の認証時まで遅延させる
+    init_firebase()
+    from firebase_admin import auth
+
+    with upstream_timer("firebase_auth", "verify_id_token"):
+        decoded_token = auth.verify_id_token(token, clock_skew_seconds=60)
+    token_cache.put(token, decoded_token)
+    logger.info("認証成功")
+    return decoded_token
+
 # ログリクエストミドルウェア
-async def log_request_middleware(request: Request, call_next: Callable) -> JSONResponse:
-    # OPTIONSリクエストの場合はリクエストIDのチェックをスキップ
-    # URLパスの取得
-    path: str = request.url.path
-    # OPTIONSリクエスト、静的アセット、viteのアイコンへのリクエストは処理をスキップ
-    if request.method == "OPTIONS":
-        return await call_next(request)
-
-    # リクエストヘッダーからリクエストIDを取得
-    request_id: str = request.headers.get("X-Request-Id", "")
-
-    # リクエストIDのバリデーション (Fで始まる12桁の16進数)
-    # ルートパス以外のアクセスでリクエストIDが無効な場合はエラーを返す
-    if (
-        not path == "/"
-        and not any(path == unneed for unneed in UNNEED_REQUEST_ID_PATH)
-        and not any(
-            path.startswith(unneed) for unneed in UNNEED_REQUEST_ID_PATH_STARTSWITH
-        )
-        and not any(path.endswith(unneed) for unneed in UNNEED_REQUEST_ID_PATH_ENDSWITH)
-        and not (request_id and re.match(r"^F[0-9a-f]{12}$", request_id))
-    ):
-        # エラー情報をログに記録
-        logger.debug("エラー処理")
-        logger.error(
+class LogRequestMiddleware:
+    """
+    リクエストIDの検証とリクエストのロギングを行うASGIミドルウェア
+
+    リクエストボディは読み込まず、メタ情報と処理時間だけをログに記録する。
+    ボディはreceiveチャネルを経由する際に先頭のbody_prefix_bytesバイトだけを
+    request.state.request_body_prefixに写し取る（log_requestで利用）ため、
+    大きなアップロードやストリーミングでもボディ全体をバッファリングしない
+    """
+
+    def __init__(self, app: ASGIApp, body_prefix_bytes: int = 0):
+        self.app = app
+        self.body_prefix_bytes = body_prefix_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # HTTP以外（lifespan、websocket）とOPTIONSリクエストは処理をスキップ
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        # URLパスの取得
+        path: str = request.url.path
+        # HTTPメソッドの取得
+        method: str = request.method
+        # クライアントのIPアドレスを取得（取得できない場合は"unknown"）
+        client_host: str = request.client.host if request.client else "unknown"
+        # リクエストヘッダーからリクエストIDを取得
+        request_id: str = request.headers.get("X-Request-Id", "")
+
+        # リクエストIDのバリデーション (Fで始まる12桁の16進数)
+        # ルートパス以外のアクセスでリクエストIDが無効な場合はエラーを返す
+        if (
+            not path == "/"
+            and not path == METRICS_PATH
+            and not any(path == unneed for unneed in UNNEED_REQUEST_ID_PATH)
+            and not any(
+                path.startswith(unneed) for unneed in UNNEED_REQUEST_ID_PATH_STARTSWITH
+            )
+            and not any(path.endswith(unneed) for unneed in UNNEED_REQUEST_ID_PATH_ENDSWITH)
+            and not (request_id and re.match(r"^F[0-9a-f]{12}$", request_id))
+        ):
+            # エラー情報をログに記録
+            logger.debug("エラー処理")
+            logger.error(
+                sanitize_request_data(
+                    {
+                        "event": "invalid_request_id",
+                        "path": path,
+                        "method": method,
+                        "client": client_host,
+                        "request_id": request_id,
+                    },
+                    MIDDLE_WARE_LOG_MAX_LENGTH,
+                )
+            )
+
+            # 不正なリクエストIDの場合、403 Forbiddenを返す
+            response = JSONResponse(
+                status_code=403, content={"error": "無効なリクエストIDです"}
+            )
+            await response(scope, receive, send)
+            return
+
+        start_time: float = time.time()
+
+        # リクエスト受信時の詳細情報をログに記録
+        # - リクエストID、パス、メソッド、クライアントIP、ユーザーエージェント
+        logger.debug("リクエスト受信")
+        logger.debug(
             sanitize_request_data(
                 {
-                    "event": "invalid_request_id",
-                    "path": request.url.path,
-                    "method": request.method,
-                    "client": request.client.host if request.client else "unknown",
-                    "request_id": request_id,
+                    "event": "request_received",
+                    "X-Request-Id": request_id,
+                    "path": path,
+                    "method": method,
+                    "client": client_host,
+                    "user_agent": request.headers.get("user-agent", "unknown"),
                 },
                 MIDDLE_WARE_LOG_MAX_LENGTH,
             )
         )
 
-        # 不正なリクエストIDの場合、403 Forbiddenを返す
-        return JSONResponse(
-            status_code=403, content={"error": "無効なリクエストIDです"}
-        )
-    start_time: float = time.time()
-
-    # リクエストの基本情報を収集してロギング
-    # URLパスの取得
-    path = request.url.path
-    # HTTPメソッドの取得
-    method: str = request.method
-    # クライアントのIPアドレスを取得（取得できない場合は"unknown"）
-    client_host: str = request.client.host if request.client else "unknown"
-    # リクエストボディの取得とデコード
-    body: bytes = await request.body()
-    # ボディデータを指定された最大長に制限してデコード
-    decoded_data: str = body.decode("utf-8")
-
-    # リクエスト受信時の詳細情報をログに記録
-    # - リクエストID、パス、メソッド、クライアントIP
-    # - ユーザーエージェント、リクエストボディを含む
-    logger.debug("リクエスト受信")
-    logger.debug(
-        sanitize_request_data(
-            {
-                "event": "request_received",
-                "X-Request-Id": request_id,
-                "path": path,
-                "method": method,
-                "client": client_host,
-                "user_agent": request.headers.get("user-agent", "unknown"),
-                # "request_body": decoded_data,
-            },
-            MIDDLE_WARE_LOG_MAX_LENGTH,
-        )
-    )
-
-    # 次の処理へ
-    response: JSONResponse = await call_next(request)
-
-    # 処理時間の計算
-    process_time: float = time.time() - start_time
-
-    # レスポンス情報のロギング
-    logger.debug("リクエスト処理終了")
-    logger.debug(
-        sanitize_request_data(
-            {
-                "event": "request_completed",
-                "X-Request-Id": request_id,
-                "path": path,
-                "method": method,
-                "status_code": response.status_code,
-                "process_time_sec": round(process_time, 4),
-            },
-            MIDDLE_WARE_LOG_MAX_LENGTH,
-        )
-    )
+        # receiveチャネルを経由するボディの先頭だけを写し取る（ボディ自体はそのまま渡す）
+        body_prefix = bytearray()
+        scope.setdefault("state", {})["request_body_prefix"] = body_prefix
+        body_prefix_bytes = self.body_prefix_bytes
+
+        async def receive_with_tee() -> Message:
+            message = await receive()
+            if message["type"] == "http.request" and len(body_prefix) < body_prefix_bytes:
+                chunk = message.get("body", b"")
+                body_prefix.extend(chunk[: body_prefix_bytes - len(body_prefix)])
+            return message
 
-    return response
+        # レスポンスのステータスコードを記録する
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        # 次の処理へ
+        try:
+            await self.app(scope, receive_with_tee, send_with_status)
+        finally:
+            # 処理時間の計算
+            process_time: float = time.time() - start_time
+
+            # レスポンス情報のロギング
+            logger.debug("リクエスト処理終了")
+            logger.debug(
+                sanitize_request_data(
+                    {
+                        "event": "request_completed",
+                        "X-Request-Id": request_id,
+                        "path": path,
+                        "method": method,
+                        "status_code": status_code,
+                        "process_time_sec": round(process_time, 4),
+                    },
+                    MIDDLE_WARE_LOG_MAX_LENGTH,
+                )
+            )
 
 @router.get("/verify-auth")
 async def verify_auth(request: Request, current_user: Dict[str, Any] = Depends(get_current_user)) -> Dict[str, Any]:
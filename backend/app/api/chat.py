@@ -1,38 +1,159 @@
 # API ルート: chat.py - チャット関連のエンドポイント
 
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import ValidationError
 from typing import Dict, Any, List, Union, AsyncGenerator
-import os
 
 from app.api.auth import get_current_user
-from app.services.chat_service import get_api_key_for_model, common_message_function
+from app.core.config import get_settings
+from app.services.chat_service import fit_history, get_api_key_for_model, stream_message_async
+from app.services.attachment_store import (
+    ATTACHMENT_HASH_PATTERN,
+    decode_file_content,
+    get_attachment_store,
+    missing_attachments,
+    owner_key,
+)
+from app.services.admission import AdmissionRejected, get_admission_controller
+from app.services.image_normalizer import normalize_attachment, normalize_message_images
+from app.services.document_extractor import extract_message_documents
+from app.services.csv_summary import summarize_message_csvs
+from app.services.chunked_upload import (
+    ChunkUploadError,
+    get_chunked_upload_store,
+    load_assembled_request,
+)
 from common_utils.logger import logger, wrap_asyncgenerator_logger, log_request
-from common_utils.class_types import ChatRequest
+from common_utils.class_types import ChatRequest, ChatAttachmentRequest
 
-# 環境変数から設定を読み込み
-from dotenv import load_dotenv
-load_dotenv("./config/.env")
-develop_env_path = "./config_develop/.env.develop"
-if os.path.exists(develop_env_path):
-    load_dotenv(develop_env_path)
+# 設定の読み込み（.envの読み込みはapp.core.configで1回だけ行う）
+settings = get_settings()
 
 # ロギング設定
-CHAT_LOG_MAX_LENGTH = int(os.environ["CHAT_LOG_MAX_LENGTH"])
+CHAT_LOG_MAX_LENGTH = settings.chat_log_max_length
+CHAT_ATTACHMENT_MAX_BYTES = settings.chat_attachment_max_bytes
 
 router = APIRouter()
 
+
+@router.post("/chat/attachments")
+async def upload_chat_attachment(
+    request: Request,
+    attachment: ChatAttachmentRequest,
+    current_user: Dict[str, Any] = Depends(get_current_user),
+) -> Dict[str, Any]:
+    """
+    チャットの添付ファイルを保存し、SHA-256のhashを返す
+    以降のメッセージでは files に content の代わりに hash を指定して参照する
+    """
+    try:
+        data = decode_file_content(attachment.content, attachment.mimeType)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="添付ファイルのbase64が不正です")
+    if len(data) > CHAT_ATTACHMENT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="添付ファイルが大きすぎます")
+
+    # 画像は縮小・再圧縮してから保存する（形式が変わらない場合のみ）
+    normalized = await normalize_attachment(data, attachment.mimeType)
+    if normalized is not None:
+        data = normalized
+
+    # ストアにはユーザーごとのキーで保存する（他のユーザーのhashを指定しても参照できない）
+    owner = current_user.get("uid", "")
+    digest = await asyncio.to_thread(get_attachment_store().put, data, owner)
+    logger.debug(f"添付ファイルを保存しました: {attachment.name} ({attachment.mimeType}) {digest}")
+    return {"hash": digest, "size": len(data)}
+
+
+def _attachment_hashes(messages: List[Dict[str, Any]]) -> List[str]:
+    """メッセージのfilesでhash参照されている添付ファイル"""
+    return [
+        file["hash"]
+        for msg in messages
+        for file in (msg.get("files") or [])
+        if isinstance(file, dict) and file.get("hash")
+    ]
+
+
+def _scope_attachment_hashes(messages: List[Dict[str, Any]], owner: str) -> List[Dict[str, Any]]:
+    """filesのhashをownerのストアのキーに置き換える（元のメッセージは変更しない）"""
+    scoped = []
+    for msg in messages:
+        files = msg.get("files")
+        if files and any(isinstance(file, dict) and file.get("hash") for file in files):
+            files = [
+                dict(file, hash=owner_key(owner, file["hash"]))
+                if isinstance(file, dict) and file.get("hash")
+                else file
+                for file in files
+            ]
+            msg = dict(msg, files=files)
+        scoped.append(msg)
+    return scoped
+
+
+async def _receive_chat_chunk(
+    chat_request: ChatRequest, current_user: Dict[str, Any]
+) -> Union[JSONResponse, ChatRequest]:
+    """
+    分割アップロードのチャンクをディスクに保存する
+    全チャンクが揃っていなければ受信状況（202）を返し、揃っていれば結合したリクエストを返す
+    """
+    store = get_chunked_upload_store()
+    try:
+        status = await asyncio.to_thread(
+            store.save_chunk,
+            chat_request.chunkId,
+            chat_request.chunkIndex if chat_request.chunkIndex is not None else -1,
+            chat_request.totalChunks or 0,
+            chat_request.chunkData,
+            current_user.get("uid", ""),
+            chat_request.chunkChecksum,
+        )
+        if status.assembled_path is None:
+            return JSONResponse(
+                status_code=202,
+                content={
+                    "chunkId": status.chunk_id,
+                    "received": status.received,
+                    "totalChunks": status.total,
+                },
+            )
+        payload = await asyncio.to_thread(load_assembled_request, store, status)
+    except ChunkUploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    try:
+        assembled = ChatRequest(**payload)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=f"結合したリクエストが不正です: {e}")
+    if assembled.chunked:
+        raise HTTPException(status_code=400, detail="結合したリクエストが分割アップロードのチャンクです")
+    logger.debug(f"分割アップロードを受信しました: {status.chunk_id} ({status.total}チャンク)")
+    return assembled
+
+
 @router.post("/chat")
 async def chat(
     request: Request,
     chat_request: ChatRequest,
     current_user: Dict[str, Any] = Depends(get_current_user),
-) -> StreamingResponse:
+) -> Response:
     logger.debug("チャットリクエストを処理中")
     try:
         request_info: Dict[str, Any] = await log_request(request, current_user, CHAT_LOG_MAX_LENGTH)
         logger.debug("リクエスト情報: %s", request_info)
 
+        # 分割アップロード: 全チャンクが揃ったリクエストだけが結合したリクエストで応答をストリーミングする
+        if chat_request.chunked:
+            received = await _receive_chat_chunk(chat_request, current_user)
+            if isinstance(received, JSONResponse):
+                return received
+            chat_request = received
+
         messages: List[Dict[str, Any]] = chat_request.messages
         model: str = chat_request.model
         logger.debug(f"モデル: {model}")
@@ -44,6 +165,21 @@ async def chat(
 
         model_api_key: str = get_api_key_for_model(model)
 
+        # hash参照の添付ファイルが全て保存済みか確認する（無い場合はクライアントが再アップロードする）
+        attachment_hashes = _attachment_hashes(messages)
+        if attachment_hashes:
+            invalid = [h for h in attachment_hashes if not ATTACHMENT_HASH_PATTERN.match(str(h))]
+            if invalid:
+                raise HTTPException(status_code=400, detail=f"不正な添付ファイルのhashです: {invalid}")
+            owner = current_user.get("uid", "")
+            missing = await asyncio.to_thread(
+                missing_attachments, get_attachment_store(), owner, attachment_hashes
+            )
+            if missing:
+                raise HTTPException(status_code=409, detail={"missing": missing})
+            # 以降はこのユーザーがアップロードした添付ファイルだけを参照する
+            messages = _scope_attachment_hashes(messages, owner)
+
         # メッセージ変換処理のログ出力を追加
         transformed_messages: List[Dict[str, Any]] = []
         for msg in messages:
@@ -87,6 +223,19 @@ async def chat(
                         parts_info.append("image")
                 logger.debug(f"メッセージ[{i}]: role={role}, parts={parts_info}")
 
+        # 画像の添付ファイルを縮小・再圧縮する（プロセスプールで行い、結果は入力のhashごとに再利用する）
+        transformed_messages = await normalize_message_images(transformed_messages)
+        # Wordファイルの本体はテキストに置き換える（プロセスプールで並列に解析し、結果は内容のhashごとに再利用する）
+        transformed_messages = await extract_message_documents(transformed_messages)
+        # 大きなCSVは全体の代わりに要約（スキーマ・統計・サンプル）を送る
+        transformed_messages = await summarize_message_csvs(transformed_messages)
+
+        # 会話をトークン予算に収める（省略したトークン数はレスポンスヘッダーで返す）
+        history = await asyncio.to_thread(fit_history, model, transformed_messages)
+
+        # モデルごとの実行枠を取得する（混雑している場合は429）。枠はストリームの終わりまで保持する
+        ticket = await get_admission_controller().acquire(model)
+
         # ストリーミングレスポンスの作成
         @wrap_asyncgenerator_logger(
             meta_info={
@@ -97,22 +246,36 @@ async def chat(
             max_length=CHAT_LOG_MAX_LENGTH,
         )
         async def generate_stream() -> AsyncGenerator[str, None]:
-            for chunk in common_message_function(
-                model=model,
-                stream=True,
-                messages=transformed_messages,
-                api_key=model_api_key,
-            ):
-                yield chunk
+            # Vertex AIのストリームは専用スレッドで読み込む（イベントループをブロックしない）
+            try:
+                async for chunk in stream_message_async(
+                    model=model,
+                    messages=history.messages,
+                    api_key=model_api_key,
+                    trim_history=False,
+                ):
+                    yield chunk
+            finally:
+                ticket.release()
 
         return StreamingResponse(
             generate_stream(),
+            # ストリームが開始されずに終わった場合も枠を返す
+            background=BackgroundTask(ticket.release),
             media_type="text/event-stream",
-            headers={"Cache-Control": "no-cache", "Transfer-Encoding": "chunked"},
+            headers={
+                "Cache-Control": "no-cache",
+                "Transfer-Encoding": "chunked",
+                "X-Chat-Tokens-Saved": str(history.tokens_saved),
+            },
         )
 
     except HTTPException as he:
         raise he
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         logger.error("チャットエラー: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
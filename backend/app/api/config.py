@@ -2,43 +2,39 @@
 
 from fastapi import APIRouter, Depends, HTTPException, Request
 from typing import Dict, Any
-import os
 from functools import partial
 
 from app.api.auth import get_current_user
+from app.core.config import get_settings
 from common_utils.logger import logger, create_dict_logger, log_request
 
-# 環境変数から設定を読み込み
-from dotenv import load_dotenv
-load_dotenv("./config/.env")
-develop_env_path = "./config_develop/.env.develop"
-if os.path.exists(develop_env_path):
-    load_dotenv(develop_env_path)
+# 設定の読み込み（.envの読み込みはapp.core.configで1回だけ行う）
+settings = get_settings()
 
 # 設定値の読み込み
-MAX_IMAGES = int(os.environ["MAX_IMAGES"])
-MAX_AUDIO_FILES = int(os.environ["MAX_AUDIO_FILES"])
-MAX_TEXT_FILES = int(os.environ["MAX_TEXT_FILES"])
-MAX_LONG_EDGE = int(os.environ["MAX_LONG_EDGE"])
-MAX_IMAGE_SIZE = int(os.environ["MAX_IMAGE_SIZE"])
-GOOGLE_MAPS_API_CACHE_TTL = int(os.environ["GOOGLE_MAPS_API_CACHE_TTL"])
-GEOCODING_NO_IMAGE_MAX_BATCH_SIZE = int(os.environ["GEOCODING_NO_IMAGE_MAX_BATCH_SIZE"])
-GEOCODING_WITH_IMAGE_MAX_BATCH_SIZE = int(os.environ["GEOCODING_WITH_IMAGE_MAX_BATCH_SIZE"])
-SPEECH_MAX_SECONDS = int(os.environ["SPEECH_MAX_SECONDS"])
-MODELS = os.environ["MODELS"]
-IMAGEN_MODELS = os.environ["IMAGEN_MODELS"]
-IMAGEN_NUMBER_OF_IMAGES = os.environ["IMAGEN_NUMBER_OF_IMAGES"]
-IMAGEN_ASPECT_RATIOS = os.environ["IMAGEN_ASPECT_RATIOS"]
-IMAGEN_LANGUAGES = os.environ["IMAGEN_LANGUAGES"]
-IMAGEN_ADD_WATERMARK = os.environ["IMAGEN_ADD_WATERMARK"]
-IMAGEN_SAFETY_FILTER_LEVELS = os.environ["IMAGEN_SAFETY_FILTER_LEVELS"]
-IMAGEN_PERSON_GENERATIONS = os.environ["IMAGEN_PERSON_GENERATIONS"]
-WHISPER_MAX_SECONDS = int(os.environ["WHISPER_MAX_SECONDS"])
-WHISPER_MAX_BYTES = int(os.environ["WHISPER_MAX_BYTES"])
+MAX_IMAGES = settings.max_images
+MAX_AUDIO_FILES = settings.max_audio_files
+MAX_TEXT_FILES = settings.max_text_files
+MAX_LONG_EDGE = settings.max_long_edge
+MAX_IMAGE_SIZE = settings.max_image_size
+GOOGLE_MAPS_API_CACHE_TTL = settings.google_maps_api_cache_ttl
+GEOCODING_NO_IMAGE_MAX_BATCH_SIZE = settings.geocoding_no_image_max_batch_size
+GEOCODING_WITH_IMAGE_MAX_BATCH_SIZE = settings.geocoding_with_image_max_batch_size
+SPEECH_MAX_SECONDS = settings.speech_max_seconds
+MODELS = settings.models
+IMAGEN_MODELS = settings.imagen_models
+IMAGEN_NUMBER_OF_IMAGES = settings.imagen_number_of_images
+IMAGEN_ASPECT_RATIOS = settings.imagen_aspect_ratios
+IMAGEN_LANGUAGES = settings.imagen_languages
+IMAGEN_ADD_WATERMARK = settings.imagen_add_watermark
+IMAGEN_SAFETY_FILTER_LEVELS = settings.imagen_safety_filter_levels
+IMAGEN_PERSON_GENERATIONS = settings.imagen_person_generations
+WHISPER_MAX_SECONDS = settings.whisper_max_seconds
+WHISPER_MAX_BYTES = settings.whisper_max_bytes
 
 # ロギング設定
-CONFIG_LOG_MAX_LENGTH = int(os.environ["CONFIG_LOG_MAX_LENGTH"])
-SENSITIVE_KEYS = os.environ["SENSITIVE_KEYS"].split(",")
+CONFIG_LOG_MAX_LENGTH = settings.config_log_max_length
+SENSITIVE_KEYS = settings.sensitive_keys
 
 router = APIRouter()
 
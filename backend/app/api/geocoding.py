@@ -3,25 +3,22 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from typing import Dict, Any, List, AsyncGenerator
-import os, json, asyncio, time
+import json, asyncio, time
 
 from app.api.auth import get_current_user
+from app.core.config import get_settings
 from app.services.geocoding_service import get_google_maps_api_key, process_optimized_geocode
 from common_utils.logger import logger, wrap_asyncgenerator_logger, log_request
 from common_utils.class_types import GeocodingRequest
 
-# 環境変数から設定を読み込み
-from dotenv import load_dotenv
-load_dotenv("./config/.env")
-develop_env_path = "./config_develop/.env.develop"
-if os.path.exists(develop_env_path):
-    load_dotenv(develop_env_path)
+# 設定の読み込み（.envの読み込みはapp.core.configで1回だけ行う）
+settings = get_settings()
 
 # 設定値の読み込み
-GEOCODING_NO_IMAGE_MAX_BATCH_SIZE = int(os.environ["GEOCODING_NO_IMAGE_MAX_BATCH_SIZE"])
-GEOCODING_WITH_IMAGE_MAX_BATCH_SIZE = int(os.environ["GEOCODING_WITH_IMAGE_MAX_BATCH_SIZE"])
-GEOCODING_BATCH_SIZE = int(os.environ.get("GEOCODING_BATCH_SIZE", "5"))
-GEOCODING_LOG_MAX_LENGTH = int(os.environ["GEOCODING_LOG_MAX_LENGTH"])
+GEOCODING_NO_IMAGE_MAX_BATCH_SIZE = settings.geocoding_no_image_max_batch_size
+GEOCODING_WITH_IMAGE_MAX_BATCH_SIZE = settings.geocoding_with_image_max_batch_size
+GEOCODING_BATCH_SIZE = settings.geocoding_batch_size
+GEOCODING_LOG_MAX_LENGTH = settings.geocoding_log_max_length
 
 router = APIRouter()
 
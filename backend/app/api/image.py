@@ -1,26 +1,24 @@
 # API ルート: image.py - 画像生成関連のエンドポイント
 
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import JSONResponse
 from typing import Dict, Any, List, Optional
-import os
 from functools import partial
 
 from app.api.auth import get_current_user
+from app.core.config import get_settings
 from app.services.image_service import generate_image
+from app.services.admission import AdmissionRejected, get_admission_controller, is_retryable_error
 from common_utils.logger import logger, create_dict_logger, log_request
 from common_utils.class_types import GenerateImageRequest
 
-# 環境変数から設定を読み込み
-from dotenv import load_dotenv
-load_dotenv("./config/.env")
-develop_env_path = "./config_develop/.env.develop"
-if os.path.exists(develop_env_path):
-    load_dotenv(develop_env_path)
+# 設定の読み込み（.envの読み込みはapp.core.configで1回だけ行う）
+settings = get_settings()
 
 # ロギング設定
-GENERATE_IMAGE_LOG_MAX_LENGTH = int(os.environ["GENERATE_IMAGE_LOG_MAX_LENGTH"])
-SENSITIVE_KEYS = os.environ["SENSITIVE_KEYS"].split(",")
+GENERATE_IMAGE_LOG_MAX_LENGTH = settings.generate_image_log_max_length
+SENSITIVE_KEYS = settings.sensitive_keys
 
 router = APIRouter()
 
@@ -72,7 +70,9 @@ async def generate_image_endpoint(
         )
 
     try:
-        image_list = generate_image(**kwargs)
+        # モデルごとの実行枠を取得し、生成はスレッドで行う（イベントループをブロックしない）
+        async with get_admission_controller().admit(model_name):
+            image_list = await asyncio.to_thread(generate_image, **kwargs)
         if not image_list:
             error_message: str = "画像生成に失敗しました。プロンプトにコンテンツポリシーに違反する内容（人物表現など）が含まれている可能性があります。別の内容を試してください。"
             logger.warning(error_message)
@@ -95,7 +95,17 @@ async def generate_image_endpoint(
         )
     except HTTPException as he:
         raise he
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
+        if is_retryable_error(e):
+            # 再試行しても上流のクォータ超過が解消しなかった場合は500ではなく429を返す
+            retry_after = max(1, int(settings.vertex_retry_max_seconds))
+            raise HTTPException(
+                status_code=429, detail=str(e), headers={"Retry-After": str(retry_after)}
+            )
         error_message: str = str(e)
         logger.error(f"画像生成エラー: {error_message}", exc_info=True)
         raise HTTPException(status_code=500, detail=error_message)
\ No newline at end of file
@@ -0,0 +1,43 @@
+# API ルート: metrics.py - メトリクスの公開エンドポイント
+
+import hmac
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+from app.core.config import get_settings
+from app.core.metrics import render_metrics
+
+router = APIRouter()
+
+# Prometheusのテキスト形式（exposition format 0.0.4）
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def verify_metrics_access(request: Request) -> None:
+    """
+    メトリクスの公開可否を確認する
+    METRICS_ENABLEDが無効の場合は404、METRICS_TOKENを設定した場合はBearerトークンが一致しなければ401
+    """
+    settings = get_settings()
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not settings.metrics_token:
+        return
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(
+        token.strip().encode(), settings.metrics_token.encode()
+    ):
+        raise HTTPException(
+            status_code=401, detail="認証が必要です", headers={"WWW-Authenticate": "Bearer"}
+        )
+
+
+@router.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    dependencies=[Depends(verify_metrics_access)],
+)
+async def metrics() -> PlainTextResponse:
+    """プロセス内で収集したメトリクスをPrometheusのテキスト形式で返す"""
+    return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -1,108 +1,308 @@
 # API ルート: speech.py - 音声認識関連のエンドポイント
 
-from fastapi import APIRouter, Depends, HTTPException, Request
-from typing import Dict, Any, List
-import os, base64, datetime
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple, Union
+from pydantic import ValidationError
+import asyncio, base64, datetime, json, time
 
-from app.api.auth import get_current_user
-from app.services.speech_service import transcribe_streaming_v2
+from app.api.auth import get_current_user, verify_token
+from app.core.config import get_settings
+from app.core.metrics import REGISTRY
+from app.core.stream_bridge import ChunkFeeder
+from app.services.speech_service import (
+    iterate_recognition,
+    streaming_recognize_v2,
+    transcribe_streaming_v2,
+)
 from common_utils.logger import logger, create_dict_logger, log_request
 from common_utils.class_types import SpeechToTextRequest
 
-# 環境変数から設定を読み込み
-from dotenv import load_dotenv
-load_dotenv("./config/.env")
-develop_env_path = "./config_develop/.env.develop"
-if os.path.exists(develop_env_path):
-    load_dotenv(develop_env_path)
+# 設定の読み込み（.envの読み込みはapp.core.configで1回だけ行う）
+settings = get_settings()
 
 # ロギング設定
-SPEECH2TEXT_LOG_MAX_LENGTH = int(os.environ["SPEECH2TEXT_LOG_MAX_LENGTH"])
-VERIFY_AUTH_LOG_MAX_LENGTH = int(os.environ["VERIFY_AUTH_LOG_MAX_LENGTH"])
+SPEECH2TEXT_LOG_MAX_LENGTH = settings.speech2text_log_max_length
+VERIFY_AUTH_LOG_MAX_LENGTH = settings.verify_auth_log_max_length
+
+# multipart・octet-streamの音声を受信してから認識に渡すまでに溜めておくチャンク数
+SPEECH_UPLOAD_BUFFER_CHUNKS = 4
+# WebSocketの開始メッセージで指定できる、ヘッダーの無い音声の形式（それ以外は形式を自動判定する）
+SPEECH_STREAM_ENCODINGS = ("LINEAR16", "MULAW", "ALAW")
+# WebSocketを閉じるときのコード（RFC 6455）
+WS_POLICY_VIOLATION = 1008
+WS_INTERNAL_ERROR = 1011
+
+SPEECH_STREAM_FIRST_RESULT = REGISTRY.histogram(
+    "speech_stream_first_result_seconds",
+    "Time from the first audio chunk to the first recognition result on the WebSocket stream",
+)
 
 router = APIRouter()
 
-@router.post("/speech2text")
+def format_time(time_obj: datetime.timedelta) -> str:
+    seconds: float = time_obj.total_seconds()
+    hrs: int = int(seconds // 3600)
+    mins: int = int((seconds % 3600) // 60)
+    secs: int = int(seconds % 60)
+    msecs: int = int(seconds * 1000) % 1000
+    return f"{hrs:02d}:{mins:02d}:{secs:02d}.{msecs:03d}"
+
+def timed_words(alternative) -> List[Dict[str, str]]:
+    """単語ごとの時刻付きテキスト（単語時刻情報が無い場合は全体を1つのセグメントにする）"""
+    if not alternative.words:
+        return [{"start_time": "00:00:00", "end_time": "00:00:00", "text": alternative.transcript}]
+    return [
+        {
+            "start_time": format_time(w.start_offset),
+            "end_time": format_time(w.end_offset),
+            "text": w.word,
+        }
+        for w in alternative.words
+    ]
+
+async def json_audio_bytes(request: Request) -> bytes:
+    """JSON（{"audio_data": <base64またはdata URL>}）の音声をデコードする"""
+    try:
+        speech_request = SpeechToTextRequest.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    audio_data: str = speech_request.audio_data
+
+    if not audio_data:
+        logger.error("音声データが見つかりません")
+        raise HTTPException(
+            status_code=400, detail="音声データが提供されていません"
+        )
+
+    # ヘッダー除去（"data:audio/～;base64,..."形式の場合）
+    if audio_data.startswith("data:"):
+        _, audio_data = audio_data.split(",", 1)
+
+    try:
+        audio_bytes: bytes = await asyncio.to_thread(base64.b64decode, audio_data)
+        logger.debug(f"受信した音声サイズ: {len(audio_bytes) / 1024:.2f} KB")
+    except Exception as e:
+        logger.error(f"音声データのBase64デコードエラー: {str(e)}")
+        raise HTTPException(
+            status_code=400, detail=f"音声データの解析に失敗しました: {str(e)}"
+        )
+
+    # 受信したデータが空でないか確認
+    if len(audio_bytes) == 0:
+        logger.error("音声データが空です")
+        raise HTTPException(status_code=400, detail="音声データが空です")
+    return audio_bytes
+
+async def body_audio_chunks(request: Request) -> AsyncIterator[bytes]:
+    """ボディ全体が音声の場合（application/octet-stream・audio/*）に、受信したチャンクを順に返す"""
+    async for chunk in request.stream():
+        if chunk:
+            yield chunk
+
+async def multipart_audio_chunks(request: Request) -> AsyncIterator[bytes]:
+    """
+    multipart/form-data の音声のパート（audio フィールド、または最初のファイル）のデータを受信した順に返す
+    パートを一時ファイルに書き出さず、受信したチャンクごとに解析する
+    """
+    from python_multipart.exceptions import MultipartParseError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+
+    _, params = parse_options_header(request.headers.get("Content-Type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status_code=400, detail="multipartのboundaryがありません")
+
+    headers: Dict[bytes, bytes] = {}
+    header_field, header_value = bytearray(), bytearray()
+    state = {"audio": False, "done": False}
+    pending: List[bytes] = []
+
+    def on_part_begin() -> None:
+        headers.clear()
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        header_value.extend(data[start:end])
+
+    def on_header_end() -> None:
+        headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished() -> None:
+        _, options = parse_options_header(headers.get(b"content-disposition", b""))
+        state["audio"] = not state["done"] and (
+            options.get(b"name") == b"audio" or b"filename" in options
+        )
+
+    def on_part_data(data: bytes, start: int, end: int) -> None:
+        if state["audio"]:
+            pending.append(bytes(data[start:end]))
+
+    def on_part_end() -> None:
+        if state["audio"]:
+            state["audio"], state["done"] = False, True
+
+    parser = MultipartParser(
+        boundary,
+        {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if pending:
+                yield b"".join(pending)
+                pending.clear()
+        parser.finalize()
+    except MultipartParseError as e:
+        raise HTTPException(status_code=400, detail=f"multipartの解析に失敗しました: {e}")
+
+async def start_audio_upload(
+    chunks: AsyncIterator[bytes],
+) -> Tuple[ChunkFeeder[bytes], asyncio.Task]:
+    """
+    受信した音声を認識のリクエストに渡し始める
+    溜めておくのはSPEECH_UPLOAD_BUFFER_CHUNKSチャンクまで（超えた分は受信を待たせる）
+    戻り値の音声は認識に渡すイテラブル、タスクはボディを読み終えると完了する
+    """
+    first = await anext(chunks, None)
+    if first is None:
+        logger.error("音声データが空です")
+        raise HTTPException(status_code=400, detail="音声データが空です")
+
+    audio = ChunkFeeder[bytes](SPEECH_UPLOAD_BUFFER_CHUNKS)
+
+    async def pump() -> None:
+        received = len(first)
+        try:
+            await audio.put(first)
+            async for chunk in chunks:
+                if audio.closed:
+                    break
+                received += len(chunk)
+                await audio.put(chunk)
+            logger.debug(f"受信した音声サイズ: {received / 1024:.2f} KB")
+        finally:
+            # 音声の終わりを認識に伝える
+            audio.close()
+
+    return audio, asyncio.create_task(pump())
+
+async def prefetch_until_uploaded(
+    responses: AsyncIterator, audio: ChunkFeeder[bytes], upload: asyncio.Task
+) -> AsyncIterator:
+    """
+    ボディを読み終えるまで認識の応答を先読みし、読み終えた後に順に返す
+    （StreamingResponseは切断の検知にreceiveを使うため、ボディの受信中に返し始めると受信と競合する）
+    """
+    buffered: asyncio.Queue = asyncio.Queue()
+
+    async def prefetch() -> None:
+        try:
+            async for response in responses:
+                buffered.put_nowait(response)
+        except Exception as e:
+            buffered.put_nowait(e)
+        finally:
+            buffered.put_nowait(None)
+            # 認識が途中で終わった場合は、残りのボディの受信を止める
+            audio.close()
+
+    prefetch_task = asyncio.create_task(prefetch())
+    await upload
+
+    async def replay() -> AsyncIterator:
+        while (item := await buffered.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+        await prefetch_task
+
+    return replay()
+
+@router.post("/speech2text", response_model=None)
 async def speech2text(
     request: Request,
-    speech_request: SpeechToTextRequest,
     current_user: Dict[str, Any] = Depends(get_current_user),
-) -> Dict[str, Any]:
+) -> Union[Dict[str, Any], StreamingResponse]:
+    """
+    音声を文字起こしする
+    音声は次のいずれかの形式で送る
+    - application/json: {"audio_data": <base64またはdata URL>}
+    - multipart/form-data: audio フィールド（または最初のファイル）に音声
+    - application/octet-stream（audio/* も可）: ボディ全体が音声
+    multipart・octet-streamの場合はボディを読み込みながらチャンクごとに認識に渡す（全体をメモリに持たない）
+    Acceptに application/x-ndjson を指定した場合は、確定した結果を1行ずつ返し、
+    最後の行で全体（{"type": "end", "transcription", "timed_transcription"}）を返す
+    """
     logger.debug("音声認識処理開始")
     try:
         request_info: Dict[str, Any] = await log_request(
             request, current_user, VERIFY_AUTH_LOG_MAX_LENGTH
         )
 
-        audio_data: str = speech_request.audio_data
+        content_type = request.headers.get("Content-Type", "").split(";", 1)[0].strip().lower()
+        upload: Optional[asyncio.Task] = None
+        if content_type == "multipart/form-data":
+            audio, upload = await start_audio_upload(multipart_audio_chunks(request))
+        elif content_type == "application/octet-stream" or content_type.startswith("audio/"):
+            audio, upload = await start_audio_upload(body_audio_chunks(request))
+        else:
+            audio = await json_audio_bytes(request)
 
-        if not audio_data:
-            logger.error("音声データが見つかりません")
-            raise HTTPException(
-                status_code=400, detail="音声データが提供されていません"
-            )
+        meta_info = {
+            k: request_info[k] for k in ("X-Request-Id", "path", "email") if k in request_info
+        }
 
-        # ヘッダー除去（"data:audio/～;base64,..."形式の場合）
-        if audio_data.startswith("data:"):
-            _, audio_data = audio_data.split(",", 1)
+        # 音声認識処理（応答は音声認識用のスレッドプールで受け取り、イベントループをブロックしない）
+        logger.debug("音声認識処理を開始します")
+        responses = iterate_recognition(
+            lambda: transcribe_streaming_v2(audio, language_codes=["ja-JP"])
+        )
 
-        try:
-            audio_bytes: bytes = base64.b64decode(audio_data)
-            logger.debug(f"受信した音声サイズ: {len(audio_bytes) / 1024:.2f} KB")
-        except Exception as e:
-            logger.error(f"音声データのBase64デコードエラー: {str(e)}")
-            raise HTTPException(
-                status_code=400, detail=f"音声データの解析に失敗しました: {str(e)}"
+        # NDJSONを受け付けるクライアントには、確定した結果を届いた順に返す
+        if "application/x-ndjson" in request.headers.get("Accept", ""):
+            if upload is not None:
+                responses = await prefetch_until_uploaded(responses, audio, upload)
+            return StreamingResponse(
+                ndjson_transcription(responses, meta_info), media_type="application/x-ndjson"
             )
 
-        # 受信したデータが空でないか確認
-        if len(audio_bytes) == 0:
-            logger.error("音声データが空です")
-            raise HTTPException(status_code=400, detail="音声データが空です")
+        full_transcript: str = ""
+        timed_transcription: List[Dict[str, str]] = []
 
         try:
-            # 音声認識処理
-            logger.debug("音声認識処理を開始します")
-            responses = transcribe_streaming_v2(audio_bytes, language_codes=["ja-JP"])
+            async for response in responses:
+                for result in response.results:
+                    alternative = result.alternatives[0]
+                    full_transcript += alternative.transcript + "\n"
+                    timed_transcription.extend(timed_words(alternative))
+            if upload is not None:
+                # ボディの受信に失敗した場合（multipartの不正など）は途中までの結果を返さない
+                await upload
             logger.debug("音声認識完了")
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"音声認識エラー: {str(e)}", exc_info=True)
             raise HTTPException(status_code=500, detail=f"音声認識エラー: {str(e)}")
-
-        full_transcript: str = ""
-        timed_transcription: List[Dict[str, str]] = []
-
-        def format_time(time_obj: datetime.timedelta) -> str:
-            seconds: float = time_obj.total_seconds()
-            hrs: int = int(seconds // 3600)
-            mins: int = int((seconds % 3600) // 60)
-            secs: int = int(seconds % 60)
-            msecs: int = int(seconds * 1000) % 1000
-            return f"{hrs:02d}:{mins:02d}:{secs:02d}.{msecs:03d}"
-
-        for response in responses:
-            for result in response.results:
-                alternative = result.alternatives[0]
-                full_transcript += alternative.transcript + "\n"
-                if alternative.words:
-                    for w in alternative.words:
-                        start_time_str: str = format_time(w.start_offset)
-                        end_time_str: str = format_time(w.end_offset)
-                        timed_transcription.append(
-                            {
-                                "start_time": start_time_str,
-                                "end_time": end_time_str,
-                                "text": w.word,
-                            }
-                        )
-                else:
-                    timed_transcription.append(
-                        {
-                            "start_time": "00:00:00",
-                            "end_time": "00:00:00",
-                            "text": alternative.transcript,
-                        }
-                    )
+        finally:
+            if upload is not None:
+                # 認識が途中で終わった場合は、残りのボディの受信を止める
+                audio.close()
+                upload.cancel()
 
         logger.debug(
             f"文字起こし結果: {len(full_transcript)} 文字, {len(timed_transcription)} セグメント"
@@ -115,15 +315,179 @@ async def speech2text(
 
         return create_dict_logger(
             response_data,
-            meta_info={
-                k: request_info[k]
-                for k in ("X-Request-Id", "path", "email")
-                if k in request_info
-            },
+            meta_info=meta_info,
             max_length=SPEECH2TEXT_LOG_MAX_LENGTH,
         )
     except HTTPException as he:
         raise he
     except Exception as e:
         logger.error(f"音声文字起こしエラー: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+def stream_result_messages(response) -> List[Dict[str, Any]]:
+    """ストリーミング認識の応答をWebSocketで送るメッセージに変換する"""
+    messages: List[Dict[str, Any]] = []
+    for result in response.results:
+        if not result.alternatives:
+            continue
+        alternative = result.alternatives[0]
+        if result.is_final:
+            messages.append(
+                {
+                    "type": "final",
+                    "text": alternative.transcript,
+                    "timed_transcription": timed_words(alternative),
+                }
+            )
+        elif alternative.transcript:
+            messages.append(
+                {"type": "interim", "text": alternative.transcript, "stability": result.stability}
+            )
+    return messages
+
+async def ndjson_transcription(
+    responses: AsyncIterator, meta_info: Dict[str, Any]
+) -> AsyncIterator[bytes]:
+    """確定した結果を1行ずつ返し、最後に全体を返す（エラーの場合は {"type": "error"} の行で終える）"""
+    transcripts: List[str] = []
+    timed_transcription: List[Dict[str, str]] = []
+    try:
+        async for response in responses:
+            for message in stream_result_messages(response):
+                transcripts.append(message["text"])
+                timed_transcription.extend(message["timed_transcription"])
+                yield (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+    except Exception as e:
+        logger.error(f"音声認識エラー: {str(e)}", exc_info=True)
+        error = {"type": "error", "detail": f"音声認識エラー: {str(e)}"}
+        yield (json.dumps(error, ensure_ascii=False) + "\n").encode("utf-8")
+        return
+    response_data = {
+        "type": "end",
+        "transcription": "\n".join(transcripts).strip(),
+        "timed_transcription": timed_transcription,
+    }
+    create_dict_logger(response_data, meta_info=meta_info, max_length=SPEECH2TEXT_LOG_MAX_LENGTH)
+    yield (json.dumps(response_data, ensure_ascii=False) + "\n").encode("utf-8")
+
+async def _receive_stream_start(websocket: WebSocket) -> Optional[Dict[str, Any]]:
+    """開始メッセージを受け取り、認証する（失敗した場合は接続を閉じてNoneを返す）"""
+    try:
+        start = json.loads(
+            await asyncio.wait_for(
+                websocket.receive_text(), timeout=settings.speech_stream_start_timeout_seconds
+            )
+        )
+    except WebSocketDisconnect:
+        return None
+    except (asyncio.TimeoutError, KeyError, ValueError):
+        await websocket.close(code=WS_POLICY_VIOLATION, reason="開始メッセージがありません")
+        return None
+    if not isinstance(start, dict):
+        await websocket.close(
+            code=WS_POLICY_VIOLATION, reason="開始メッセージはJSONオブジェクトで送ってください"
+        )
+        return None
+
+    auth_header = websocket.headers.get("Authorization", "")
+    token = start.get("token") or auth_header.removeprefix("Bearer ")
+    try:
+        current_user = await asyncio.to_thread(verify_token, token)
+    except Exception as e:
+        logger.warning(f"音声認識ストリームの認証エラー: {e}")
+        await websocket.close(code=WS_POLICY_VIOLATION, reason="認証が必要です")
+        return None
+
+    encoding = start.get("encoding") or None
+    if encoding is not None and encoding not in SPEECH_STREAM_ENCODINGS:
+        await websocket.close(code=WS_POLICY_VIOLATION, reason=f"未対応の音声形式です: {encoding}")
+        return None
+    sample_rate_hertz = start.get("sampleRateHertz")
+    if sample_rate_hertz is not None and (
+        type(sample_rate_hertz) is not int or sample_rate_hertz <= 0
+    ):
+        await websocket.close(
+            code=WS_POLICY_VIOLATION, reason=f"sampleRateHertzが不正です: {sample_rate_hertz!r}"
+        )
+        return None
+    return {
+        "email": current_user.get("email", ""),
+        "language_codes": start.get("languageCodes") or ["ja-JP"],
+        "encoding": encoding,
+        "sample_rate_hertz": sample_rate_hertz,
+    }
+
+@router.websocket("/speech2text/stream")
+async def speech2text_stream(websocket: WebSocket) -> None:
+    """
+    マイクの音声をWebSocketで受け取りながら文字起こしし、途中結果と確定結果を届いた順に返す
+    （録音を終えてから全体を送る /speech2text と違い、話している間に最初のテキストが返る）
+    1. クライアントは接続後、最初にJSONの開始メッセージを送る
+       {"token": <Firebase IDトークン>, "languageCodes": ["ja-JP"],
+        "encoding": "LINEAR16", "sampleRateHertz": 16000}
+       encodingを省略した場合は形式を自動判定する（MediaRecorderのWebM/Opusなど）
+    2. 音声はバイナリメッセージで順に送り、録音を終えたら {"type": "stop"} を送る
+    3. サーバーは {"type": "ready"} を返した後、
+       {"type": "interim", "text", "stability"} / {"type": "final", "text", "timed_transcription"} を順に返し、
+       認識が終わると {"type": "end"} を送って接続を閉じる。エラーの場合は {"type": "error", "detail"}
+    1回の接続で認識するのは SPEECH_STREAM_MAX_SECONDS 秒まで（超えた分の音声は送らずに認識を終える）
+    """
+    await websocket.accept()
+    options = await _receive_stream_start(websocket)
+    if options is None:
+        return
+    email = options.pop("email")
+    logger.debug(f"音声認識ストリーム開始: {email} {options}")
+
+    audio = ChunkFeeder[bytes](settings.speech_stream_buffer_chunks)
+    first_audio_at: List[float] = []
+
+    async def receive_audio() -> None:
+        """クライアントの音声を認識のリクエストに渡す（停止・切断・時間の上限で終える）"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.speech_stream_max_seconds
+        try:
+            while True:
+                message = await asyncio.wait_for(websocket.receive(), deadline - loop.time())
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    if not first_audio_at:
+                        first_audio_at.append(time.monotonic())
+                    await audio.put(message["bytes"])
+                elif message.get("text") and json.loads(message["text"]).get("type") == "stop":
+                    break
+        except asyncio.TimeoutError:
+            logger.info(f"音声認識ストリームが{settings.speech_stream_max_seconds}秒に達しました: {email}")
+        except (ValueError, AttributeError):
+            logger.warning("音声認識ストリームの不正なメッセージを受信しました")
+        finally:
+            audio.close()
+
+    receiver = asyncio.create_task(receive_audio())
+    try:
+        await websocket.send_json({"type": "ready"})
+        results = 0
+        async for response in iterate_recognition(
+            lambda: streaming_recognize_v2(audio, **options)
+        ):
+            for message in stream_result_messages(response):
+                if results == 0 and first_audio_at:
+                    SPEECH_STREAM_FIRST_RESULT.observe(value=time.monotonic() - first_audio_at[0])
+                results += 1
+                await websocket.send_json(message)
+        await websocket.send_json({"type": "end"})
+        await websocket.close()
+        logger.debug(f"音声認識ストリーム完了: {email} {results}件")
+    except WebSocketDisconnect:
+        logger.debug(f"音声認識ストリームの途中でクライアントが切断しました: {email}")
+    except Exception as e:
+        logger.error(f"音声認識ストリームエラー: {e}", exc_info=True)
+        try:
+            await websocket.send_json({"type": "error", "detail": f"音声認識エラー: {e}"})
+            await websocket.close(code=WS_INTERNAL_ERROR)
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+    finally:
+        audio.close()
+        receiver.cancel()
@@ -6,13 +6,15 @@ from typing import Dict, Any, List, Optional
 import os, json, io, base64, hashlib, math, datetime, uuid
 import subprocess, shlex, tempfile
 from pydantic import BaseModel
-from pydub import AudioSegment
-from google.cloud import storage, pubsub_v1, firestore
+from google.cloud import storage, firestore
 from google.cloud.firestore_v1 import FieldFilter, WriteBatch, Query
 from google.cloud.firestore_v1._helpers import Timestamp
 from functools import partial
 
 from app.api.auth import get_current_user
+from app.core.config import get_settings
+from app.core.clients import ClientRegistry, get_clients
+from app.core.metrics import instrument_upstream, upstream_timer
 from common_utils.logger import logger, create_dict_logger, log_request
 from common_utils.class_types import WhisperUploadRequest, WhisperFirestoreData, WhisperPubSubMessageData, WhisperSegment, WhisperEditRequest, WhisperSpeakerConfigRequest
 
@@ -21,42 +23,30 @@ from app.api.whisper_batch import trigger_whisper_batch_processing, _get_current
 from app.core.audio_utils import probe_duration, convert_audio_to_wav_16k_mono
 from app.services.whisper_queue import enqueue_job_atomic, decrement_processing_counter
 
-# 環境変数から設定を読み込み
-from dotenv import load_dotenv
-load_dotenv("./config/.env")
-develop_env_path = "./config_develop/.env.develop"
-if os.path.exists(develop_env_path):
-    load_dotenv(develop_env_path)
+# 設定の読み込み（.envの読み込みはapp.core.configで1回だけ行う）
+settings = get_settings()
 
 # 設定値の読み込み
-GCP_PROJECT_ID = os.environ["GCP_PROJECT_ID"]
-GCS_BUCKET_NAME = os.environ["GCS_BUCKET_NAME"]
-GCS_BUCKET = os.environ["GCS_BUCKET"]  # バケット名
-PUBSUB_TOPIC = os.environ["PUBSUB_TOPIC"]
-WHISPER_JOBS_COLLECTION = os.environ["WHISPER_JOBS_COLLECTION"]
-GENERAL_LOG_MAX_LENGTH = int(os.environ["GENERAL_LOG_MAX_LENGTH"])
-SENSITIVE_KEYS = os.environ["SENSITIVE_KEYS"].split(",")
+GCP_PROJECT_ID = settings.gcp_project_id
+GCS_BUCKET_NAME = settings.gcs_bucket_name
+GCS_BUCKET = settings.gcs_bucket  # バケット名
+PUBSUB_TOPIC = settings.pubsub_topic
+WHISPER_JOBS_COLLECTION = settings.whisper_jobs_collection
+GENERAL_LOG_MAX_LENGTH = settings.general_log_max_length
+SENSITIVE_KEYS = settings.sensitive_keys
 # Whisper制限設定
-WHISPER_MAX_SECONDS = int(os.environ["WHISPER_MAX_SECONDS"])
-WHISPER_MAX_BYTES = int(os.environ["WHISPER_MAX_BYTES"])
+WHISPER_MAX_SECONDS = settings.whisper_max_seconds
+WHISPER_MAX_BYTES = settings.whisper_max_bytes
 # 最大音声サイズ設定（互換性のために残す）
-MAX_AUDIO_BYTES = min(WHISPER_MAX_BYTES, int(os.environ.get("MAX_AUDIO_BYTES", 100 * 1024 * 1024)))  # WHISPER_MAX_BYTESとの小さい方
-MAX_AUDIO_BASE64_CHARS = int(os.environ.get("MAX_AUDIO_BASE64_CHARS", int(WHISPER_MAX_BYTES * 1.5)))  # Base64エンコードによるオーバーヘッド考慮
+MAX_AUDIO_BYTES = settings.max_audio_bytes  # WHISPER_MAX_BYTESとの小さい方
+MAX_AUDIO_BASE64_CHARS = settings.max_audio_base64_chars  # Base64エンコードによるオーバーヘッド考慮
 # PROCESS_TIMEOUT_SECONDS と AUDIO_TIMEOUT_MULTIPLIER を .env から読み込む
-PROCESS_TIMEOUT_SECONDS = int(os.environ.get("PROCESS_TIMEOUT_SECONDS", "300"))
-AUDIO_TIMEOUT_MULTIPLIER = float(os.environ.get("AUDIO_TIMEOUT_MULTIPLIER", "2.0"))
-FIRESTORE_MAX_DAYS = int(os.environ.get("FIRESTORE_MAX_DAYS", "30")) # 追加：デフォルト30日
+PROCESS_TIMEOUT_SECONDS = settings.process_timeout_seconds
+AUDIO_TIMEOUT_MULTIPLIER = settings.audio_timeout_multiplier
+FIRESTORE_MAX_DAYS = settings.firestore_max_days # 追加：デフォルト30日
 
 router = APIRouter()
 
-# Google Translate APIを使用するためのインポート
-try:
-    from google.cloud import translate_v2 as translate
-    TRANSLATE_CLIENT = translate.Client()
-except ImportError:
-    logger.warning("Google Cloud Translate API not available")
-    TRANSLATE_CLIENT = None
-
 # 署名付きURL用のレスポンスモデル
 class UploadUrlResponse(BaseModel):
     upload_url: str
@@ -72,6 +62,7 @@ create_dict_logger = partial(create_dict_logger, sensitive_keys=SENSITIVE_KEYS)
 async def create_upload_url(
     content_type: str = Body(..., embed=True),
     current_user: Dict[str, Any] = Depends(get_current_user),
+    clients: ClientRegistry = Depends(get_clients),
 ):
     """
     音声ファイルをGCSに直接アップロードするための署名付きURLを生成
@@ -84,7 +75,7 @@ async def create_upload_url(
     blob_name = f"whisper/{user_id}/{random_uuid}"
     
     # 署名付きURLの生成
-    bucket = storage.Client().bucket(GCS_BUCKET)
+    bucket = clients.storage.bucket(GCS_BUCKET)
     blob = bucket.blob(blob_name)
     signed_url = blob.generate_signed_url(
         version="v4",
@@ -101,7 +92,8 @@ async def upload_audio(
     request: Request, 
     whisper_request: WhisperUploadRequest,
     background_tasks: BackgroundTasks, # Add BackgroundTasks dependency
-    current_user: Dict[str, Any] = Depends(get_current_user)
+    current_user: Dict[str, Any] = Depends(get_current_user),
+    clients: ClientRegistry = Depends(get_clients),
 ) -> Dict[str, Any]:
     try:
         request_info: Dict[str, Any] = await log_request(
@@ -121,7 +113,7 @@ async def upload_audio(
             return JSONResponse(status_code=400, content={"detail": "GCSオブジェクト名が提供されていません"})
             
         # GCSから音声データを取得して検証
-        storage_client_instance: storage.Client = storage.Client()
+        storage_client_instance: storage.Client = clients.storage
         bucket = storage_client_instance.bucket(GCS_BUCKET_NAME)
         blob = bucket.blob(whisper_request.gcsObject)
         
@@ -166,7 +158,8 @@ async def upload_audio(
         try:
             # 一時ファイルにダウンロード
             with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(original_filename_for_probe)[1]) as tmp_original_audio_file:
-                blob.download_to_filename(tmp_original_audio_file.name)
+                with upstream_timer("gcs", "download"):
+                    blob.download_to_filename(tmp_original_audio_file.name)
                 tmp_original_audio_file.flush()
                 original_local_path = tmp_original_audio_file.name
 
@@ -195,20 +188,21 @@ async def upload_audio(
             return JSONResponse(status_code=400, content={"detail": f"音声長さの取得に失敗しました: {str(e)}"})
         
         # ENV テンプレートから直接フルパスを組み立て
-        audio_blob_filename = os.environ["WHISPER_AUDIO_BLOB"].format(
+        audio_blob_filename = settings.whisper_audio_blob.format(
             file_hash=file_hash,
             ext="wav" # 拡張子をwavに固定
         )
         audio_gcs_full_path = f"gs://{GCS_BUCKET_NAME}/{audio_blob_filename}"
         
         # 結合トランスクリプト出力用のパス
-        combine_blob_filename = os.environ["WHISPER_COMBINE_BLOB"].format(file_hash=file_hash)
+        combine_blob_filename = settings.whisper_combine_blob.format(file_hash=file_hash)
         # combine_uri = f"gs://{GCS_BUCKET_NAME}/{combine_blob_filename}" # この変数は直接使わない
 
         # 変換されたWAVファイルをGCSの最終的な場所にアップロード
         destination_bucket = storage_client_instance.bucket(GCS_BUCKET_NAME)
         destination_blob = destination_bucket.blob(audio_blob_filename)
-        destination_blob.upload_from_filename(converted_wav_path)
+        with upstream_timer("gcs", "upload"):
+            destination_blob.upload_from_filename(converted_wav_path)
         logger.info(f"変換された音声をアップロードしました: {audio_gcs_full_path}")
 
         # 元のアップロード用の一時GCSオブジェクトを削除
@@ -298,6 +292,7 @@ async def upload_audio(
         # Consider specific error handling for batch trigger failures if not an HTTPException
         raise HTTPException(status_code=500, detail=f"Upload or batch trigger error: {str(e)}")
 
+@instrument_upstream("firestore")
 async def check_and_update_timeout_jobs(db: firestore.Client, user_id_for_filter: Optional[str] = None):
     """
     処理中のジョブでタイムアウトしたものを検索し、ステータスを 'failed' に更新する。
@@ -389,6 +384,7 @@ async def list_jobs(
     tag: str | None = None,
     limit: int = 100,
     current_user: Dict[str, Any] = Depends(get_current_user),
+    clients: ClientRegistry = Depends(get_clients),
 ):
     """ログインユーザー自身のジョブを一覧取得。取得前にタイムアウトジョブのステータスを更新する。"""
     try:
@@ -401,7 +397,7 @@ async def list_jobs(
             logger.error(f"User email not found in current_user for user_id: {current_user.get('uid')}")
             raise HTTPException(status_code=400, detail="User email not found.")
 
-        db = firestore.Client()
+        db = clients.firestore
 
         # ② 時間経過しすぎたlauncedとprocessingについてfailedにする
         # --- タイムアウトジョブのチェックと更新 ---
@@ -493,6 +489,7 @@ async def get_job(
     request: Request,
     file_hash: str,
     current_user: Dict[str, Any] = Depends(get_current_user),
+    clients: ClientRegistry = Depends(get_clients),
 ):
     """ハッシュ値を指定して特定のジョブ詳細を取得"""
     try:
@@ -500,7 +497,7 @@ async def get_job(
             request, current_user, GENERAL_LOG_MAX_LENGTH
         )
 
-        db = firestore.Client()
+        db = clients.firestore
         col = db.collection(WHISPER_JOBS_COLLECTION)
         q = col.where(filter=FieldFilter("file_hash", "==", file_hash)).where(
             filter=FieldFilter("user_id", "==", current_user["uid"])
@@ -527,6 +524,7 @@ async def get_job(
         logger.exception(f"ジョブ詳細取得エラー: {file_hash}")
         return JSONResponse(status_code=500, content={"detail": f"ジョブ詳細取得エラー: {str(e)}"})
 
+@instrument_upstream("firestore")
 def _update_job_status(
     db: firestore.Client,
     file_hash: str,
@@ -578,6 +576,7 @@ async def cancel_job(
     request: Request,
     file_hash: str,
     current_user: Dict[str, Any] = Depends(get_current_user),
+    clients: ClientRegistry = Depends(get_clients),
 ):
     """キュー待ち中のジョブをキャンセルする"""
     try:
@@ -585,7 +584,7 @@ async def cancel_job(
             request, current_user, GENERAL_LOG_MAX_LENGTH
         )
         
-        db = firestore.Client()
+        db = clients.firestore
         job_id = _update_job_status(db, file_hash, current_user["uid"], "canceled")
         
         response_data = {"status": "canceled", "job_id": job_id, "file_hash": file_hash}
@@ -610,6 +609,7 @@ async def edit_job_transcript(
     file_hash: str,
     edit_request: WhisperEditRequest, # リクエストボディを受け取る
     current_user: Dict[str, Any] = Depends(get_current_user),
+    clients: ClientRegistry = Depends(get_clients),
 ):
     """特定ジョブの文字起こし結果を編集してGCSに保存する"""
     try:
@@ -618,7 +618,7 @@ async def edit_job_transcript(
         )
         user_id = current_user["uid"]
 
-        db = firestore.Client()
+        db = clients.firestore
         col_ref = db.collection(WHISPER_JOBS_COLLECTION)
         
         # file_hashとuser_idでドキュメントを検索
@@ -641,13 +641,14 @@ async def edit_job_transcript(
         edited_transcript_blob_name = f"{file_hash}/edited_transcript.json"
         
         # GCSに保存
-        storage_client = storage.Client()
+        storage_client = clients.storage
         bucket = storage_client.bucket(GCS_BUCKET_NAME)
         blob = bucket.blob(edited_transcript_blob_name)
         
         # JSONとして保存
         json_content = json.dumps(segments_data, ensure_ascii=False, indent=2)
-        blob.upload_from_string(json_content, content_type='application/json')
+        with upstream_timer("gcs", "upload"):
+            blob.upload_from_string(json_content, content_type='application/json')
         
         logger.info(f"編集された文字起こし結果をGCSに保存しました: gs://{GCS_BUCKET_NAME}/{edited_transcript_blob_name}")
         
@@ -689,6 +690,7 @@ async def retry_job(
     file_hash: str,
     background_tasks: BackgroundTasks, # Add BackgroundTasks
     current_user: Dict[str, Any] = Depends(get_current_user),
+    clients: ClientRegistry = Depends(get_clients),
 ):
     """完了/失敗/キャンセル済みのジョブを再キューし、バッチ処理を再トリガーする"""
     try:
@@ -698,7 +700,7 @@ async def retry_job(
         )
         user_id = current_user["uid"]
 
-        db_client = firestore.Client() # Explicitly create client or use global
+        db_client = clients.firestore
         col_ref = db_client.collection(WHISPER_JOBS_COLLECTION)
         
         # Find the job by file_hash and user_id
@@ -754,6 +756,7 @@ async def get_original_transcript(
     request: Request,
     file_hash: str,
     current_user: Dict[str, Any] = Depends(get_current_user),
+    clients: ClientRegistry = Depends(get_clients),
 ):
     """元の文字起こし結果（combine.json）をGCSから取得"""
     try:
@@ -763,7 +766,7 @@ async def get_original_transcript(
         user_id = current_user["uid"]
 
         # ユーザーの権限確認：file_hashに対応するジョブが存在し、そのユーザーのものかチェック
-        db = firestore.Client()
+        db = clients.firestore
         col = db.collection(WHISPER_JOBS_COLLECTION)
         q = col.where(filter=FieldFilter("file_hash", "==", file_hash)).where(
             filter=FieldFilter("user_id", "==", user_id)
@@ -776,7 +779,7 @@ async def get_original_transcript(
         # GCSから元の文字起こし結果を取得
         combine_blob_name = f"{file_hash}/combine.json"
         
-        storage_client = storage.Client()
+        storage_client = clients.storage
         bucket = storage_client.bucket(GCS_BUCKET_NAME)
         blob = bucket.blob(combine_blob_name)
         
@@ -784,7 +787,8 @@ async def get_original_transcript(
             raise HTTPException(status_code=404, detail="文字起こし結果が見つかりません")
         
         # JSONデータを取得
-        json_content = blob.download_as_text()
+        with upstream_timer("gcs", "download"):
+            json_content = blob.download_as_text()
         segments_data = json.loads(json_content)
         
         logger.info(f"元の文字起こし結果を返しました: {file_hash}")
@@ -801,6 +805,7 @@ async def get_edited_transcript(
     request: Request,
     file_hash: str,
     current_user: Dict[str, Any] = Depends(get_current_user),
+    clients: ClientRegistry = Depends(get_clients),
 ):
     """編集済み文字起こし結果（edited_transcript.json）をGCSから取得"""
     try:
@@ -810,7 +815,7 @@ async def get_edited_transcript(
         user_id = current_user["uid"]
 
         # ユーザーの権限確認：file_hashに対応するジョブが存在し、そのユーザーのものかチェック
-        db = firestore.Client()
+        db = clients.firestore
         col = db.collection(WHISPER_JOBS_COLLECTION)
         q = col.where(filter=FieldFilter("file_hash", "==", file_hash)).where(
             filter=FieldFilter("user_id", "==", user_id)
@@ -823,7 +828,7 @@ async def get_edited_transcript(
         # GCSから編集済み文字起こし結果を取得
         edited_blob_name = f"{file_hash}/edited_transcript.json"
         
-        storage_client = storage.Client()
+        storage_client = clients.storage
         bucket = storage_client.bucket(GCS_BUCKET_NAME)
         blob = bucket.blob(edited_blob_name)
         
@@ -831,7 +836,8 @@ async def get_edited_transcript(
             raise HTTPException(status_code=404, detail="編集済み文字起こし結果が見つかりません")
         
         # JSONデータを取得
-        json_content = blob.download_as_text()
+        with upstream_timer("gcs", "download"):
+            json_content = blob.download_as_text()
         segments_data = json.loads(json_content)
         
         logger.info(f"編集済み文字起こし結果を返しました: {file_hash}")
@@ -849,6 +855,7 @@ async def save_speaker_config(
     file_hash: str,
     speaker_config_request: WhisperSpeakerConfigRequest,
     current_user: Dict[str, Any] = Depends(get_current_user),
+    clients: ClientRegistry = Depends(get_clients),
 ):
     """スピーカー設定をGCSに保存する"""
     try:
@@ -858,7 +865,7 @@ async def save_speaker_config(
         user_id = current_user["uid"]
 
         # ユーザーの権限確認：file_hashに対応するジョブが存在し、そのユーザーのものかチェック
-        db = firestore.Client()
+        db = clients.firestore
         col = db.collection(WHISPER_JOBS_COLLECTION)
         q = col.where(filter=FieldFilter("file_hash", "==", file_hash)).where(
             filter=FieldFilter("user_id", "==", user_id)
@@ -884,7 +891,7 @@ async def save_speaker_config(
         speaker_config_blob_name = f"{file_hash}/speaker_config.json"
         
         # GCSに保存
-        storage_client = storage.Client()
+        storage_client = clients.storage
         bucket = storage_client.bucket(GCS_BUCKET_NAME)
         blob = bucket.blob(speaker_config_blob_name)
         
@@ -930,6 +937,7 @@ async def get_speaker_config(
     request: Request,
     file_hash: str,
     current_user: Dict[str, Any] = Depends(get_current_user),
+    clients: ClientRegistry = Depends(get_clients),
 ):
     """スピーカー設定をGCSから取得"""
     try:
@@ -939,7 +947,7 @@ async def get_speaker_config(
         user_id = current_user["uid"]
 
         # ユーザーの権限確認：file_hashに対応するジョブが存在し、そのユーザーのものかチェック
-        db = firestore.Client()
+        db = clients.firestore
         col = db.collection(WHISPER_JOBS_COLLECTION)
         q = col.where(filter=FieldFilter("file_hash", "==", file_hash)).where(
             filter=FieldFilter("user_id", "==", user_id)
@@ -952,7 +960,7 @@ async def get_speaker_config(
         # GCSからスピーカー設定を取得
         speaker_config_blob_name = f"{file_hash}/speaker_config.json"
         
-        storage_client = storage.Client()
+        storage_client = clients.storage
         bucket = storage_client.bucket(GCS_BUCKET_NAME)
         blob = bucket.blob(speaker_config_blob_name)
         
@@ -962,7 +970,8 @@ async def get_speaker_config(
             return {}
         
         # JSONデータを取得
-        json_content = blob.download_as_text()
+        with upstream_timer("gcs", "download"):
+            json_content = blob.download_as_text()
         speaker_config_data = json.loads(json_content)
         
         logger.info(f"スピーカー設定を返しました: {file_hash}")
@@ -979,7 +988,8 @@ async def get_speaker_config(
 async def translate_transcript(
     request: Request,
     body: Dict[str, Any] = Body(...),
-    current_user=Depends(get_current_user)
+    current_user=Depends(get_current_user),
+    clients: ClientRegistry = Depends(get_clients),
 ):
     """
     文字起こし結果を翻訳する
@@ -995,11 +1005,12 @@ async def translate_transcript(
         if not job_id or not file_hash:
             raise HTTPException(status_code=400, detail="job_idとfile_hashが必要です")
         
-        if not TRANSLATE_CLIENT:
+        translate_client = clients.translate
+        if not translate_client:
             raise HTTPException(status_code=503, detail="翻訳サービスが利用できません")
         
         # Firestoreからジョブ情報を取得
-        db = firestore.Client()
+        db = clients.firestore
         doc_ref = db.collection(WHISPER_JOBS_COLLECTION).document(job_id)
         doc = doc_ref.get()
         
@@ -1024,7 +1035,7 @@ async def translate_transcript(
             if original_text.strip():
                 try:
                     # Google Translate APIで翻訳
-                    result = TRANSLATE_CLIENT.translate(
+                    result = translate_client.translate(
                         original_text,
                         target_language=target_language
                     )
@@ -1076,7 +1087,8 @@ async def translate_transcript(
 async def summarize_transcript(
     request: Request,
     body: Dict[str, Any] = Body(...),
-    current_user=Depends(get_current_user)
+    current_user=Depends(get_current_user),
+    clients: ClientRegistry = Depends(get_clients),
 ):
     """
     文字起こし結果を要約する
@@ -1094,7 +1106,7 @@ async def summarize_transcript(
             raise HTTPException(status_code=400, detail="job_idとfile_hashが必要です")
         
         # Firestoreからジョブ情報を取得
-        db = firestore.Client()
+        db = clients.firestore
         doc_ref = db.collection(WHISPER_JOBS_COLLECTION).document(job_id)
         doc = doc_ref.get()
         
@@ -1177,6 +1189,7 @@ async def get_audio_url(
     request: Request,
     file_hash: str,
     current_user: Dict[str, Any] = Depends(get_current_user),
+    clients: ClientRegistry = Depends(get_clients),
 ):
     """音声ファイルの署名付きURLを動的生成して返す"""
     try:
@@ -1186,7 +1199,7 @@ async def get_audio_url(
         user_id = current_user["uid"]
 
         # ユーザーの権限確認：file_hashに対応するジョブが存在し、そのユーザーのものかチェック
-        db = firestore.Client()
+        db = clients.firestore
         col = db.collection(WHISPER_JOBS_COLLECTION)
         q = col.where(filter=FieldFilter("file_hash", "==", file_hash)).where(
             filter=FieldFilter("user_id", "==", user_id)
@@ -1197,12 +1210,12 @@ async def get_audio_url(
             raise HTTPException(status_code=404, detail="ジョブが見つかりません")
 
         # WHISPER_AUDIO_BLOBテンプレートを使って音声ファイルのGCSパスを構築
-        audio_blob_filename = os.environ["WHISPER_AUDIO_BLOB"].format(
+        audio_blob_filename = settings.whisper_audio_blob.format(
             file_hash=file_hash,
             ext="wav"  # whisper_batch/app/main.pyで常にwavに変換される
         )
         
-        storage_client = storage.Client()
+        storage_client = clients.storage
         bucket = storage_client.bucket(GCS_BUCKET_NAME)
         blob = bucket.blob(audio_blob_filename)
         
@@ -5,29 +5,21 @@ import datetime
 from typing import Optional
 
 from fastapi import APIRouter, HTTPException, BackgroundTasks, Request
-from google.cloud import firestore, batch_v1
-from google.cloud.batch_v1.types import (
-    Job,
-    TaskGroup,
-    TaskSpec,
-    Runnable,
-    ComputeResource,
-    AllocationPolicy,
-    LogsPolicy,
-    Environment,
-)
-from google.protobuf.duration_pb2 import Duration # Correct import for Duration
+from google.cloud import firestore
 
 from common_utils.logger import logger # Use FastAPI logger
+from app.core.clients import get_client_registry
+from app.core.metrics import instrument_upstream
 from common_utils.class_types import (
     WhisperFirestoreData,
     WhisperPubSubMessageData, # For handling notifications
     WhisperBatchParameter,    # For setting Batch job env vars
 )
 
-# Firestore client (initialized globally or passed around)
+# Firestore client (shared per process, created on first use instead of at import time)
 # Ensure GOOGLE_APPLICATION_CREDENTIALS is set in the FastAPI server's environment
-db: firestore.Client = firestore.Client()
+def _db() -> firestore.Client:
+    return get_client_registry().firestore
 
 router = APIRouter()
 
@@ -50,12 +42,13 @@ def _get_env_var(var_name: str, default: Optional[str] = None) -> str:
         raise ValueError(f"Missing environment variable: {var_name}")
     return value
 
+@instrument_upstream("firestore")
 def _get_current_processing_job_count() -> int:
     """Counts currently 'processing' jobs in Firestore."""
     try:
         whisper_jobs_collection = _get_env_var("WHISPER_JOBS_COLLECTION")
         processing_count_snapshot = (
-            db.collection(whisper_jobs_collection)
+            _db().collection(whisper_jobs_collection)
             .where("status", "in", ["processing", "launched"]) # processing と launched をカウント
             .count()
             .get()
@@ -71,11 +64,26 @@ def _get_current_processing_job_count() -> int:
         logger.error(f"Error counting processing jobs: {e}", exc_info=True)
         return 0 # Treat error as no jobs processing to be safe, or handle as critical
 
+@instrument_upstream("batch", "create_job")
 def _create_gcp_batch_job(job_data: WhisperFirestoreData) -> str:
     """
     Creates and launches a GCP Batch job for a given WhisperFirestoreData.
     This is adapted from whisper_queue/app/main.py's create_batch_job.
     """
+    # batch_v1 is only needed when a job is actually launched
+    from google.cloud import batch_v1
+    from google.cloud.batch_v1.types import (
+        Job,
+        TaskGroup,
+        TaskSpec,
+        Runnable,
+        ComputeResource,
+        AllocationPolicy,
+        LogsPolicy,
+        Environment,
+    )
+    from google.protobuf.duration_pb2 import Duration # Correct import for Duration
+
     gcp_project_id = _get_env_var("GCP_PROJECT_ID")
     gcp_region = _get_env_var("GCP_REGION")
     batch_image_url = _get_env_var("BATCH_IMAGE_URL")
@@ -83,7 +91,7 @@ def _create_gcp_batch_job(job_data: WhisperFirestoreData) -> str:
     
     logger.info(f"Creating GCP Batch job for Firestore job_id: {job_data.job_id}, file_hash: {job_data.file_hash}")
 
-    batch_client: batch_v1.BatchServiceClient = batch_v1.BatchServiceClient()
+    batch_client: batch_v1.BatchServiceClient = get_client_registry().batch # Shared client (created once per process)
     batch_job_name: str = f"whisper-{job_data.job_id}-{int(time.time())}"
 
     job = Job()
@@ -200,7 +208,7 @@ async def trigger_whisper_batch_processing(job_id: str, background_tasks: Backgr
     To be called by whisper.py after a new job is created.
     """
     whisper_jobs_collection = _get_env_var("WHISPER_JOBS_COLLECTION")
-    job_ref = db.collection(whisper_jobs_collection).document(job_id)
+    job_ref = _db().collection(whisper_jobs_collection).document(job_id)
     
     logger.info(f"Attempting to trigger batch processing for job_id: {job_id}")
 
@@ -312,7 +320,7 @@ def handle_batch_job_notification(notification_data: WhisperPubSubMessageData):
     error_msg = notification_data.error_message
     
     whisper_jobs_collection = _get_env_var("WHISPER_JOBS_COLLECTION")
-    job_ref = db.collection(whisper_jobs_collection).document(job_id)
+    job_ref = _db().collection(whisper_jobs_collection).document(job_id)
     
     logger.info(f"Handling batch job notification: job_id={job_id}, event_type={event_type}, error='{error_msg}'")
 
@@ -0,0 +1,131 @@
+"""
+Google Cloudクライアントのレジストリ
+
+Firestore / Storage / Pub/Sub / Batch / Translate / Speech の各クライアントを
+プロセス内で1度だけ生成して使い回し、リクエストごとのクライアント生成と
+認証処理（gRPC/HTTPチャネルの確立）のコストを無くす
+"""
+
+import threading
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import Request
+
+from app.core.config import Settings, get_settings
+from common_utils.logger import logger
+
+
+class ClientRegistry:
+    """
+    Google Cloudクライアントを遅延生成して保持するレジストリ
+    各クライアントは初回アクセス時に1度だけ生成され、以降は同じインスタンスを返す
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self._clients: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name: str, factory: Callable[[], Any]) -> Any:
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                logger.debug(f"クライアントを生成します: {name}")
+                client = factory()
+                self._clients[name] = client
+        return client
+
+    # 各SDKのインポートは初回アクセス時まで遅延させる
+    @property
+    def firestore(self) -> "firestore.Client":
+        def factory():
+            from google.cloud import firestore
+            return firestore.Client()
+
+        return self._get_or_create("firestore", factory)
+
+    @property
+    def storage(self) -> "storage.Client":
+        def factory():
+            from google.cloud import storage
+            return storage.Client()
+
+        return self._get_or_create("storage", factory)
+
+    @property
+    def publisher(self) -> "pubsub_v1.PublisherClient":
+        def factory():
+            from google.cloud import pubsub_v1
+            return pubsub_v1.PublisherClient()
+
+        return self._get_or_create("publisher", factory)
+
+    @property
+    def batch(self) -> "batch_v1.BatchServiceClient":
+        def factory():
+            from google.cloud import batch_v1
+            return batch_v1.BatchServiceClient()
+
+        return self._get_or_create("batch", factory)
+
+    @property
+    def speech(self) -> "SpeechClient":
+        def factory():
+            from google.cloud.speech_v2 import SpeechClient
+            return SpeechClient()
+
+        return self._get_or_create("speech", factory)
+
+    @property
+    def translate(self) -> Optional[Any]:
+        """Translateクライアント（ライブラリが無い場合はNone）"""
+
+        def factory():
+            try:
+                from google.cloud import translate_v2 as translate
+            except ImportError:
+                logger.warning("Google Cloud Translate API not available")
+                return False
+            return translate.Client()
+
+        # ライブラリが無い場合もFalseとしてキャッシュし、再試行しない
+        return self._get_or_create("translate", factory) or None
+
+    def close(self) -> None:
+        """生成済みのクライアントを閉じる（アプリケーション終了時）"""
+        with self._lock:
+            clients = list(self._clients.items())
+            self._clients.clear()
+        for name, client in clients:
+            close = getattr(client, "close", None)
+            if not callable(close):
+                transport = getattr(client, "transport", None)
+                close = getattr(transport, "close", None)
+            if callable(close):
+                try:
+                    close()
+                    logger.debug(f"クライアントを閉じました: {name}")
+                except Exception as e:
+                    logger.warning(f"クライアントのクローズに失敗: {name}: {e}")
+
+
+@lru_cache(maxsize=1)
+def get_client_registry() -> ClientRegistry:
+    """プロセス全体で共有するClientRegistryを取得する"""
+    return ClientRegistry(get_settings())
+
+
+def get_clients(request: Request) -> ClientRegistry:
+    """
+    FastAPIの依存関係: lifespanで生成したClientRegistryを返す
+    lifespanを経由しない場合（テスト等）はプロセス共有のレジストリを使う
+    """
+    clients = getattr(request.app.state, "clients", None)
+    if clients is None:
+        clients = get_client_registry()
+        request.app.state.clients = clients
+    return clients
@@ -0,0 +1,390 @@
+"""
+アプリケーション設定
+
+.envファイルの読み込みと環境変数の解釈をプロセス全体で1回だけ行い、
+型付きのSettingsオブジェクトとして各モジュールに提供する
+"""
+
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional
+from dotenv import load_dotenv
+
+# .envファイルのパス
+ENV_PATH = "./config/.env"
+# 開発環境の場合はDEVELOP_ENV_PATHに対応する.envファイルがある
+DEVELOP_ENV_PATH = "./config_develop/.env.develop"
+
+
+def _split(value: str) -> List[str]:
+    """カンマ区切りの文字列をリストに変換する"""
+    return value.split(",")
+
+
+@dataclass(frozen=True)
+class Settings:
+    """バックエンド全体で共有する設定値"""
+
+    # ===== アプリケーション設定 =====
+    port: int
+    frontend_path: str
+    origins: List[str]
+    allowed_ips: Optional[str]
+    firebase_client_secret_path: str
+    ssl_cert_path: str
+    ssl_key_path: str
+
+    # ===== Google Cloud設定 =====
+    gcp_project_id: str
+    gcp_region: str
+    gcs_bucket_name: str
+    gcs_bucket: str
+    pubsub_topic: str
+    whisper_jobs_collection: str
+    whisper_audio_blob: str
+    whisper_combine_blob: str
+
+    # ===== リクエストIDが不要なパス設定 =====
+    unneed_request_id_path: List[str]
+    unneed_request_id_path_startswith: List[str]
+    unneed_request_id_path_endswith: List[str]
+
+    # ===== ログ設定 =====
+    sensitive_keys: List[str]
+    logout_log_max_length: int
+    verify_auth_log_max_length: int
+    middle_ware_log_max_length: int
+    chat_log_max_length: int
+    config_log_max_length: int
+    geocoding_log_max_length: int
+    generate_image_log_max_length: int
+    speech2text_log_max_length: int
+    general_log_max_length: int
+
+    # ===== フロントエンドに公開する設定値 =====
+    max_images: int
+    max_audio_files: int
+    max_text_files: int
+    max_long_edge: int
+    max_image_size: int
+    google_maps_api_cache_ttl: int
+    geocoding_no_image_max_batch_size: int
+    geocoding_with_image_max_batch_size: int
+    geocoding_batch_size: int
+    speech_max_seconds: int
+    models: str
+    imagen_models: str
+    imagen_number_of_images: str
+    imagen_aspect_ratios: str
+    imagen_languages: str
+    imagen_add_watermark: str
+    imagen_safety_filter_levels: str
+    imagen_person_generations: str
+    whisper_max_seconds: int
+    whisper_max_bytes: int
+
+    # ===== Google Maps設定 =====
+    google_maps_api_key_path: str = ""
+    secret_manager_id_for_google_maps_api_key: str = ""
+
+    # ===== Whisper処理設定 =====
+    max_audio_bytes: int = 100 * 1024 * 1024
+    max_audio_base64_chars: int = 0
+    process_timeout_seconds: int = 300
+    audio_timeout_multiplier: float = 2.0
+    firestore_max_days: int = 30
+    max_processing_jobs: int = 5
+    max_concurrent: int = 5
+
+    # モデルごとのAPIキー（JSON文字列）
+    model_api_keys: str = "{}"
+
+    # ログ用に写し取るリクエストボディの先頭バイト数（0でボディを記録しない）
+    request_body_log_prefix_bytes: int = 1024
+
+    # ===== 起動設定 =====
+    # 起動後にバックグラウンドで初期化するSDK（カンマ区切り、"all"で全て、空で無効）
+    startup_warmup: str = ""
+
+    # ===== 認証設定 =====
+    # 検証済みIDトークンのキャッシュ件数（0で無効）
+    token_cache_size: int = 1024
+    # Google公開鍵証明書の再取得間隔（秒、0で無効）
+    token_cert_refresh_seconds: int = 3600
+
+    # ===== チャット設定 =====
+    # ストリーミング応答の読み込みに使うスレッド数（同時に読み込めるストリーム数の上限）
+    chat_stream_workers: int = 32
+    # 添付ファイルの保存先（"local" / "gcs"）
+    chat_attachment_store: str = "local"
+    # localの場合の保存ディレクトリと合計サイズの上限
+    chat_attachment_dir: str = "/tmp/chat_attachments"
+    chat_attachment_disk_bytes: int = 1024 * 1024 * 1024
+    # 読み込んだ添付ファイルをメモリに保持する合計サイズ
+    chat_attachment_cache_bytes: int = 128 * 1024 * 1024
+    # 1ファイルの上限
+    chat_attachment_max_bytes: int = 20 * 1024 * 1024
+    # 画像の縮小・再圧縮に使うプロセス数と、結果をメモリに保持する合計サイズ
+    chat_image_workers: int = 2
+    chat_image_cache_bytes: int = 64 * 1024 * 1024
+    # DOCXのテキスト抽出に使うプロセス数と、抽出したテキストをメモリに保持する合計サイズ
+    chat_document_workers: int = 2
+    chat_document_cache_bytes: int = 32 * 1024 * 1024
+    # この文字数を超えるCSVは全体の代わりに要約（スキーマ・統計・サンプル）を送る
+    chat_csv_summary_chars: int = 200_000
+    # 要約で分析する行数の上限と、1回に読み込む行数
+    chat_csv_sample_rows: int = 100_000
+    chat_csv_chunk_rows: int = 20_000
+    # 分割アップロード（chunked）のチャンクを書き出すディレクトリ
+    chat_chunk_dir: str = "/tmp/chat_chunks"
+    # 最後のチャンクの受信からこの秒数を過ぎた未完了のアップロードは削除する
+    chat_chunk_ttl_seconds: int = 3600
+    # 1チャンクの上限とチャンク数の上限
+    chat_chunk_max_bytes: int = 8 * 1024 * 1024
+    chat_chunk_max_count: int = 256
+    # 結合したリクエストの上限（全体をワーカーのメモリに読み込むため）
+    chat_chunk_max_total_bytes: int = 64 * 1024 * 1024
+    # 会話の先頭部分をVertex AIのコンテキストキャッシュに保持するか
+    chat_context_cache: bool = True
+    # キャッシュの有効期限（秒、使われている間は延長する）
+    chat_context_cache_ttl_seconds: int = 3600
+    # キャッシュを作成する最小トークン数（Vertex AIの下限以上にする）
+    chat_context_cache_min_tokens: int = 32768
+    # プロセスで保持するキャッシュ数の上限
+    chat_context_cache_max_entries: int = 256
+    # 1リクエストで送る会話のトークン数の上限（0で無効）とモデルごとの上限（JSON）
+    chat_history_token_budget: int = 200000
+    chat_history_model_budgets: str = "{}"
+    # 概算がこの割合を超えたらcount_tokensで数える
+    chat_history_count_threshold: float = 0.8
+    # 上限を超えた場合はこの割合まで古いターンを省略する
+    chat_history_target_ratio: float = 0.75
+    # 応答キャッシュ（"" で無効 / "memory" / "disk" / "redis"）
+    chat_response_cache: str = ""
+    # メモリに保持する件数と有効期限（秒）
+    chat_response_cache_entries: int = 1024
+    chat_response_cache_ttl_seconds: int = 86400
+    # temperatureがこの値以下のリクエストだけをキャッシュする
+    chat_response_cache_max_temperature: float = 0.3
+    # diskの場合の保存ディレクトリと合計サイズの上限、redisの場合の接続先
+    chat_response_cache_dir: str = "/tmp/chat_responses"
+    chat_response_cache_disk_bytes: int = 256 * 1024 * 1024
+    chat_response_cache_redis_url: str = "redis://localhost:6379/0"
+
+    # ===== Vertex AIのアドミッション制御 =====
+    # モデルごとの同時実行数とモデル別の上書き（JSON）
+    vertex_concurrency: int = 8
+    vertex_model_concurrency: str = "{}"
+    # 実行枠を待てるリクエスト数と待ち時間の上限（秒）。超えた場合は429を返す
+    vertex_queue_size: int = 32
+    vertex_queue_timeout_seconds: float = 30.0
+    # 429/503の再試行回数（初回を含む）とバックオフの初期値・上限（秒）
+    vertex_retry_attempts: int = 4
+    vertex_retry_base_seconds: float = 0.5
+    vertex_retry_max_seconds: float = 8.0
+
+    # ===== 音声認識（ストリーミング）設定 =====
+    # 認識の応答を読み込むスレッド数（同時に認識できるストリーム数の上限）
+    speech_stream_workers: int = 8
+    # 1回の接続で認識する時間の上限（秒）。Speech-to-Textのストリーミングは1回5分まで
+    speech_stream_max_seconds: float = 290.0
+    # 認識に送る前に溜めておける音声チャンク数（超えた分は受信を待たせる）
+    speech_stream_buffer_chunks: int = 64
+    # 接続してから開始メッセージ（認証・設定）を待つ時間（秒）
+    speech_stream_start_timeout_seconds: float = 10.0
+
+    # ===== 静的ファイル設定 =====
+    # 起動時にアセットの圧縮済みファイル（.br/.gz）を作成するか
+    static_precompress: bool = True
+
+    # ===== メトリクス設定 =====
+    # /backend/metrics を公開するか（公開する場合もMETRICS_TOKENでの認証を推奨）
+    metrics_enabled: bool = False
+    # 設定した場合は Authorization: Bearer <トークン> を付けた要求にだけメトリクスを返す
+    metrics_token: str = ""
+
+    # ===== サーバー設定（python -m app.main で起動した場合） =====
+    # ワーカープロセス数（"auto"で利用可能なCPU数）
+    server_workers: str = "1"
+    # イベントループ（uvloop / asyncio）
+    server_worker_class: str = "uvloop"
+    # keep-aliveの待ち時間（秒）。前段のプロキシのアイドルタイムアウトより長くする
+    server_keep_alive_seconds: float = 75.0
+    # listenソケットのバックログ
+    server_backlog: int = 2048
+    # シャットダウン時に処理中のリクエストを待つ時間（秒）。Cloud RunはSIGTERMの10秒後に強制終了する
+    server_graceful_timeout_seconds: float = 8.0
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """環境変数からSettingsを生成する（必須項目が無い場合はKeyError）"""
+        env = os.environ
+        whisper_max_bytes = int(env["WHISPER_MAX_BYTES"])
+        return cls(
+            port=int(env.get("PORT", "8080")),
+            frontend_path=env["FRONTEND_PATH"],
+            origins=[org for org in env.get("ORIGINS", "").split(",") if org],
+            allowed_ips=env.get("ALLOWED_IPS"),
+            firebase_client_secret_path=env.get("FIREBASE_CLIENT_SECRET_PATH", ""),
+            ssl_cert_path=env.get("SSL_CERT_PATH", ""),
+            ssl_key_path=env.get("SSL_KEY_PATH", ""),
+            gcp_project_id=env["GCP_PROJECT_ID"],
+            gcp_region=env["GCP_REGION"],
+            gcs_bucket_name=env["GCS_BUCKET_NAME"],
+            gcs_bucket=env["GCS_BUCKET"],
+            pubsub_topic=env["PUBSUB_TOPIC"],
+            whisper_jobs_collection=env["WHISPER_JOBS_COLLECTION"],
+            whisper_audio_blob=env["WHISPER_AUDIO_BLOB"],
+            whisper_combine_blob=env["WHISPER_COMBINE_BLOB"],
+            unneed_request_id_path=_split(env.get("UNNEED_REQUEST_ID_PATH", "")),
+            unneed_request_id_path_startswith=_split(
+                env.get("UNNEED_REQUEST_ID_PATH_STARTSWITH", "")
+            ),
+            unneed_request_id_path_endswith=_split(
+                env.get("UNNEED_REQUEST_ID_PATH_ENDSWITH", "")
+            ),
+            sensitive_keys=_split(env["SENSITIVE_KEYS"]),
+            logout_log_max_length=int(env["LOGOUT_LOG_MAX_LENGTH"]),
+            verify_auth_log_max_length=int(env["VERIFY_AUTH_LOG_MAX_LENGTH"]),
+            middle_ware_log_max_length=int(env["MIDDLE_WARE_LOG_MAX_LENGTH"]),
+            chat_log_max_length=int(env["CHAT_LOG_MAX_LENGTH"]),
+            config_log_max_length=int(env["CONFIG_LOG_MAX_LENGTH"]),
+            geocoding_log_max_length=int(env["GEOCODING_LOG_MAX_LENGTH"]),
+            generate_image_log_max_length=int(env["GENERATE_IMAGE_LOG_MAX_LENGTH"]),
+            speech2text_log_max_length=int(env["SPEECH2TEXT_LOG_MAX_LENGTH"]),
+            general_log_max_length=int(env["GENERAL_LOG_MAX_LENGTH"]),
+            max_images=int(env["MAX_IMAGES"]),
+            max_audio_files=int(env["MAX_AUDIO_FILES"]),
+            max_text_files=int(env["MAX_TEXT_FILES"]),
+            max_long_edge=int(env["MAX_LONG_EDGE"]),
+            max_image_size=int(env["MAX_IMAGE_SIZE"]),
+            google_maps_api_cache_ttl=int(env["GOOGLE_MAPS_API_CACHE_TTL"]),
+            geocoding_no_image_max_batch_size=int(env["GEOCODING_NO_IMAGE_MAX_BATCH_SIZE"]),
+            geocoding_with_image_max_batch_size=int(env["GEOCODING_WITH_IMAGE_MAX_BATCH_SIZE"]),
+            geocoding_batch_size=int(env.get("GEOCODING_BATCH_SIZE", "5")),
+            speech_max_seconds=int(env["SPEECH_MAX_SECONDS"]),
+            models=env["MODELS"],
+            imagen_models=env["IMAGEN_MODELS"],
+            imagen_number_of_images=env["IMAGEN_NUMBER_OF_IMAGES"],
+            imagen_aspect_ratios=env["IMAGEN_ASPECT_RATIOS"],
+            imagen_languages=env["IMAGEN_LANGUAGES"],
+            imagen_add_watermark=env["IMAGEN_ADD_WATERMARK"],
+            imagen_safety_filter_levels=env["IMAGEN_SAFETY_FILTER_LEVELS"],
+            imagen_person_generations=env["IMAGEN_PERSON_GENERATIONS"],
+            whisper_max_seconds=int(env["WHISPER_MAX_SECONDS"]),
+            whisper_max_bytes=whisper_max_bytes,
+            google_maps_api_key_path=env.get("GOOGLE_MAPS_API_KEY_PATH", ""),
+            secret_manager_id_for_google_maps_api_key=env.get(
+                "SECRET_MANAGER_ID_FOR_GOOGLE_MAPS_API_KEY", ""
+            ),
+            # WHISPER_MAX_BYTESとの小さい方
+            max_audio_bytes=min(
+                whisper_max_bytes,
+                int(env.get("MAX_AUDIO_BYTES", 100 * 1024 * 1024)),
+            ),
+            # Base64エンコードによるオーバーヘッド考慮
+            max_audio_base64_chars=int(
+                env.get("MAX_AUDIO_BASE64_CHARS", int(whisper_max_bytes * 1.5))
+            ),
+            process_timeout_seconds=int(env.get("PROCESS_TIMEOUT_SECONDS", "300")),
+            audio_timeout_multiplier=float(env.get("AUDIO_TIMEOUT_MULTIPLIER", "2.0")),
+            firestore_max_days=int(env.get("FIRESTORE_MAX_DAYS", "30")),
+            max_processing_jobs=int(env.get("MAX_PROCESSING_JOBS", "5")),
+            max_concurrent=int(env.get("MAX_CONCURRENT", "5")),
+            model_api_keys=env.get("MODEL_API_KEYS", "{}"),
+            request_body_log_prefix_bytes=int(
+                env.get("REQUEST_BODY_LOG_PREFIX_BYTES", "1024")
+            ),
+            startup_warmup=env.get("STARTUP_WARMUP", ""),
+            token_cache_size=int(env.get("TOKEN_CACHE_SIZE", "1024")),
+            token_cert_refresh_seconds=int(env.get("TOKEN_CERT_REFRESH_SECONDS", "3600")),
+            chat_stream_workers=int(env.get("CHAT_STREAM_WORKERS", "32")),
+            chat_attachment_store=env.get("CHAT_ATTACHMENT_STORE", "local"),
+            chat_attachment_dir=env.get("CHAT_ATTACHMENT_DIR", "/tmp/chat_attachments"),
+            chat_attachment_disk_bytes=int(
+                env.get("CHAT_ATTACHMENT_DISK_BYTES", 1024 * 1024 * 1024)
+            ),
+            chat_attachment_cache_bytes=int(
+                env.get("CHAT_ATTACHMENT_CACHE_BYTES", 128 * 1024 * 1024)
+            ),
+            chat_attachment_max_bytes=int(
+                env.get("CHAT_ATTACHMENT_MAX_BYTES", 20 * 1024 * 1024)
+            ),
+            chat_image_workers=int(env.get("CHAT_IMAGE_WORKERS", "2")),
+            chat_image_cache_bytes=int(env.get("CHAT_IMAGE_CACHE_BYTES", 64 * 1024 * 1024)),
+            chat_document_workers=int(env.get("CHAT_DOCUMENT_WORKERS", "2")),
+            chat_document_cache_bytes=int(
+                env.get("CHAT_DOCUMENT_CACHE_BYTES", 32 * 1024 * 1024)
+            ),
+            chat_csv_summary_chars=int(env.get("CHAT_CSV_SUMMARY_CHARS", "200000")),
+            chat_csv_sample_rows=int(env.get("CHAT_CSV_SAMPLE_ROWS", "100000")),
+            chat_csv_chunk_rows=int(env.get("CHAT_CSV_CHUNK_ROWS", "20000")),
+            chat_chunk_dir=env.get("CHAT_CHUNK_DIR", "/tmp/chat_chunks"),
+            chat_chunk_ttl_seconds=int(env.get("CHAT_CHUNK_TTL_SECONDS", "3600")),
+            chat_chunk_max_bytes=int(env.get("CHAT_CHUNK_MAX_BYTES", 8 * 1024 * 1024)),
+            chat_chunk_max_count=int(env.get("CHAT_CHUNK_MAX_COUNT", "256")),
+            chat_chunk_max_total_bytes=int(env.get("CHAT_CHUNK_MAX_TOTAL_BYTES", 64 * 1024 * 1024)),
+            chat_context_cache=env.get("CHAT_CONTEXT_CACHE", "true").lower() == "true",
+            chat_context_cache_ttl_seconds=int(env.get("CHAT_CONTEXT_CACHE_TTL_SECONDS", "3600")),
+            chat_context_cache_min_tokens=int(env.get("CHAT_CONTEXT_CACHE_MIN_TOKENS", "32768")),
+            chat_context_cache_max_entries=int(env.get("CHAT_CONTEXT_CACHE_MAX_ENTRIES", "256")),
+            chat_history_token_budget=int(env.get("CHAT_HISTORY_TOKEN_BUDGET", "200000")),
+            chat_history_model_budgets=env.get("CHAT_HISTORY_MODEL_BUDGETS", "{}"),
+            chat_history_count_threshold=float(env.get("CHAT_HISTORY_COUNT_THRESHOLD", "0.8")),
+            chat_history_target_ratio=float(env.get("CHAT_HISTORY_TARGET_RATIO", "0.75")),
+            chat_response_cache=env.get("CHAT_RESPONSE_CACHE", ""),
+            chat_response_cache_entries=int(env.get("CHAT_RESPONSE_CACHE_ENTRIES", "1024")),
+            chat_response_cache_ttl_seconds=int(env.get("CHAT_RESPONSE_CACHE_TTL_SECONDS", "86400")),
+            chat_response_cache_max_temperature=float(
+                env.get("CHAT_RESPONSE_CACHE_MAX_TEMPERATURE", "0.3")
+            ),
+            chat_response_cache_dir=env.get("CHAT_RESPONSE_CACHE_DIR", "/tmp/chat_responses"),
+            chat_response_cache_disk_bytes=int(
+                env.get("CHAT_RESPONSE_CACHE_DISK_BYTES", 256 * 1024 * 1024)
+            ),
+            chat_response_cache_redis_url=env.get(
+                "CHAT_RESPONSE_CACHE_REDIS_URL", "redis://localhost:6379/0"
+            ),
+            vertex_concurrency=int(env.get("VERTEX_CONCURRENCY", "8")),
+            vertex_model_concurrency=env.get("VERTEX_MODEL_CONCURRENCY", "{}"),
+            vertex_queue_size=int(env.get("VERTEX_QUEUE_SIZE", "32")),
+            vertex_queue_timeout_seconds=float(env.get("VERTEX_QUEUE_TIMEOUT_SECONDS", "30")),
+            vertex_retry_attempts=int(env.get("VERTEX_RETRY_ATTEMPTS", "4")),
+            vertex_retry_base_seconds=float(env.get("VERTEX_RETRY_BASE_SECONDS", "0.5")),
+            vertex_retry_max_seconds=float(env.get("VERTEX_RETRY_MAX_SECONDS", "8")),
+            speech_stream_workers=int(env.get("SPEECH_STREAM_WORKERS", "8")),
+            speech_stream_max_seconds=float(env.get("SPEECH_STREAM_MAX_SECONDS", "290")),
+            speech_stream_buffer_chunks=int(env.get("SPEECH_STREAM_BUFFER_CHUNKS", "64")),
+            speech_stream_start_timeout_seconds=float(
+                env.get("SPEECH_STREAM_START_TIMEOUT_SECONDS", "10")
+            ),
+            static_precompress=env.get("STATIC_PRECOMPRESS", "true").lower() == "true",
+            metrics_enabled=env.get("METRICS_ENABLED", "false").lower() == "true",
+            metrics_token=env.get("METRICS_TOKEN", ""),
+            server_workers=env.get("SERVER_WORKERS", "1"),
+            server_worker_class=env.get("SERVER_WORKER_CLASS", "uvloop"),
+            server_keep_alive_seconds=float(env.get("SERVER_KEEP_ALIVE_SECONDS", "75")),
+            server_backlog=int(env.get("SERVER_BACKLOG", "2048")),
+            server_graceful_timeout_seconds=float(
+                env.get("SERVER_GRACEFUL_TIMEOUT_SECONDS", "8")
+            ),
+        )
+
+
+def load_env_files() -> None:
+    """.envファイルを読み込む（開発環境用の.envがあれば上書き）"""
+    load_dotenv(ENV_PATH)
+    if os.path.exists(DEVELOP_ENV_PATH):
+        load_dotenv(DEVELOP_ENV_PATH)
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """
+    プロセス全体で共有するSettingsを取得する
+    初回呼び出し時のみ.envを読み込み、以降はキャッシュを返す
+    FastAPIの依存関係（Depends(get_settings)）としても利用できる
+    """
+    load_env_files()
+    return Settings.from_env()
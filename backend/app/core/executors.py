@@ -0,0 +1,55 @@
+"""
+プロセス全体で共有するエグゼキューター（スレッドプール・プロセスプール）
+
+エグゼキューターは最初に使う時に作成し、lifespanの終了時に shutdown_executors() でまとめて終了する。
+"""
+
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, List, Tuple, TypeVar
+
+from common_utils.logger import setup_worker_logging
+
+E = TypeVar("E")
+
+# lazy_executorで作成したエグゼキューターの終了処理（登録順）
+_shutdown_hooks: List[Callable[[], None]] = []
+_hooks_lock = threading.Lock()
+
+
+def _shutdown_now(executor: Any) -> None:
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def lazy_executor(
+    factory: Callable[[], E], close: Callable[[E], None] = _shutdown_now
+) -> Tuple[Callable[[], E], Callable[[], None]]:
+    """
+    factory() で作るエグゼキューターの (get, shutdown) を返す
+    getは最初の呼び出しで作成して以降は同じものを返し、shutdownは作成済みの場合のみcloseで終了する
+    """
+    get = lru_cache(maxsize=1)(factory)
+
+    def shutdown() -> None:
+        if get.cache_info().currsize:
+            close(get())
+            get.cache_clear()
+
+    with _hooks_lock:
+        _shutdown_hooks.append(shutdown)
+    return get, shutdown
+
+
+def shutdown_executors() -> None:
+    """lifespanの終了時に呼ぶ（lazy_executorで作成済みのものを全て終了する）"""
+    with _hooks_lock:
+        hooks = list(_shutdown_hooks)
+    for shutdown in hooks:
+        shutdown()
+
+
+def worker_process_pool(max_workers: int) -> ProcessPoolExecutor:
+    """CPUを使う処理（画像の再圧縮・DOCXの解析など）に使うプロセスプール"""
+    # 子プロセスのログは親のQueueListenerに届かないため、標準出力に直接書き込むよう初期化する
+    return ProcessPoolExecutor(max_workers=max_workers, initializer=setup_worker_logging)
@@ -0,0 +1,408 @@
+"""
+メトリクスの収集とServer-Timingヘッダー
+
+- ルートごとのレイテンシ・レスポンスサイズのヒストグラム、処理中リクエスト数、
+  外部サービス（Firestore / GCS / Vertex AI / Maps / Speech など）の呼び出し時間を記録する
+- /backend/metrics でPrometheusのテキスト形式として公開する
+- 各レスポンスにServer-Timingヘッダーを付け、外部サービスごとの所要時間を返す
+"""
+
+import functools
+import inspect
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from common_utils.logger import dropped_log_records
+
+# メトリクスを公開するパス（リクエストIDの検証・メトリクスの記録の対象外）
+METRICS_PATH = "/backend/metrics"
+
+# ヒストグラムのバケット
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+LabelValues = Tuple[str, ...]
+
+# サンプルの行のメトリクス名（ラベルと値の前まで）
+_SAMPLE_NAME = re.compile(r"[a-zA-Z_:][a-zA-Z0-9_:]*")
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape_label_value(str(value))}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    """ラベル付きメトリクスの共通部分"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in items
+        ]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # ラベルごとに [バケットごとの件数..., 合計値, 件数]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, *labels: str, value: float) -> None:
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0.0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._values.items()]
+        lines = self._header()
+        bucket_labelnames = self.labelnames + ("le",)
+        for labels, series in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(bucket_labelnames, labels + (str(bound),))} {cumulative}"
+                )
+            lines.append(
+                f"{self.name}_bucket{_format_labels(bucket_labelnames, labels + ('+Inf',))} {series[-1]}"
+            )
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """プロセス内のメトリクスを保持し、Prometheusのテキスト形式に変換する"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        # 出力時に値を計算するメトリクス（キャッシュの統計など）
+        self._collectors: List[Callable[[], List[str]]] = []
+        # 全てのサンプルに付けるラベル（複数ワーカーの場合のpidなど）
+        self._constant_labels = ""
+
+    def set_constant_labels(self, **labels: str) -> None:
+        """
+        全てのサンプルに同じラベルを付ける
+        ワーカーが複数の場合、値はワーカーごとに別々に集計されるため、pidで区別できるようにする
+        """
+        self._constant_labels = _format_labels(tuple(labels), tuple(labels.values()))[1:-1]
+
+    def _add_constant_labels(self, line: str) -> str:
+        if not self._constant_labels or line.startswith("#"):
+            return line
+        end = _SAMPLE_NAME.match(line).end()
+        if line[end : end + 1] == "{":
+            return f"{line[: end + 1]}{self._constant_labels},{line[end + 1 :]}"
+        return f"{line[:end]}{{{self._constant_labels}}}{line[end:]}"
+
+    def register(self, metric: _Metric) -> Any:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], List[str]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        if self._constant_labels:
+            lines = [self._add_constant_labels(line) for line in lines]
+        return "\n".join(lines) + "\n"
+
+
+# プロセス全体で共有するレジストリ
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "Total HTTP requests", ("method", "route", "status")
+)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency until the response body is complete",
+    ("method", "route"),
+)
+HTTP_REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "http_requests_in_flight", "HTTP requests currently being processed", ("method",)
+)
+HTTP_RESPONSE_SIZE = REGISTRY.histogram(
+    "http_response_size_bytes", "HTTP response body size", ("route",), SIZE_BUCKETS
+)
+UPSTREAM_DURATION = REGISTRY.histogram(
+    "upstream_call_duration_seconds",
+    "Duration of calls to external services",
+    ("service", "operation"),
+)
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "upstream_call_errors_total", "Failed calls to external services", ("service", "operation")
+)
+
+
+def _render_log_metrics() -> List[str]:
+    """ログのキューが満杯で破棄したログの件数（INFO以下のみ。WARNING以上は破棄しない）"""
+    return [
+        "# HELP log_records_dropped_total Log records dropped because the log queue was full",
+        "# TYPE log_records_dropped_total counter",
+        f"log_records_dropped_total {dropped_log_records()}",
+    ]
+
+
+REGISTRY.add_collector(_render_log_metrics)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
+
+
+# ===== Server-Timing =====
+
+class _RequestTimings:
+    """1リクエスト内の外部サービスごとの所要時間の合計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+
+_request_timings: ContextVar[Optional[_RequestTimings]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+def _record_upstream(service: str, operation: str, seconds: float, failed: bool) -> None:
+    UPSTREAM_DURATION.observe(service, operation, value=seconds)
+    if failed:
+        UPSTREAM_ERRORS.inc(service, operation)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(service, seconds)
+
+
+@contextmanager
+def upstream_timer(service: str, operation: str) -> Iterator[None]:
+    """with ブロック内の外部サービス呼び出しの時間を記録する"""
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        _record_upstream(service, operation, time.perf_counter() - start, failed)
+
+
+def instrument_upstream(service: str, operation: Optional[str] = None) -> Callable:
+    """
+    外部サービスを呼び出す関数の所要時間を記録するデコレータ
+    同期関数・非同期関数・ジェネレーター（ストリーミング応答）のいずれにも使える
+    ジェネレーターの場合は最後のチャンクを受け取るまでの時間を記録する
+    """
+
+    def decorator(func: Callable) -> Callable:
+        op = operation or func.__name__
+
+        if inspect.isasyncgenfunction(func):
+
+            @functools.wraps(func)
+            async def async_gen_wrapper(*args, **kwargs):
+                with upstream_timer(service, op):
+                    async for item in func(*args, **kwargs):
+                        yield item
+
+            return async_gen_wrapper
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with upstream_timer(service, op):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                _record_upstream(service, op, time.perf_counter() - start, True)
+                raise
+            if inspect.isgenerator(result):
+                return _timed_generator(result, service, op, start)
+            _record_upstream(service, op, time.perf_counter() - start, False)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def _timed_generator(generator, service: str, operation: str, start: float):
+    failed = False
+    try:
+        yield from generator
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        _record_upstream(service, operation, time.perf_counter() - start, failed)
+
+
+def _route_label(scope: Scope) -> str:
+    """ラベルにはURLではなくルートのテンプレートを使う（ラベルの種類が増えすぎないように）"""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path:
+        return path
+    # Mount（静的ファイルなど）はマウント先のパス
+    return scope.get("root_path") or "<unmatched>"
+
+
+class MetricsMiddleware:
+    """
+    リクエストごとのメトリクスを記録し、Server-Timingヘッダーを付けるASGIミドルウェア
+    Server-Timingにはレスポンスヘッダー送信までに掛かった時間（app）と外部サービスごとの時間を載せる
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] == METRICS_PATH:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        start = time.perf_counter()
+        timings = _RequestTimings()
+        token = _request_timings.set(timings)
+        status_code = 500
+        response_size = 0
+        HTTP_REQUESTS_IN_FLIGHT.inc(method)
+
+        async def send_with_metrics(message: Message) -> None:
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", _server_timing(timings, start))
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            _request_timings.reset(token)
+            HTTP_REQUESTS_IN_FLIGHT.dec(method)
+            route = _route_label(scope)
+            HTTP_REQUESTS.inc(method, route, str(status_code))
+            HTTP_REQUEST_DURATION.observe(method, route, value=time.perf_counter() - start)
+            HTTP_RESPONSE_SIZE.observe(route, value=response_size)
+
+
+def _server_timing(timings: _RequestTimings, start: float) -> str:
+    entries = [f"app;dur={(time.perf_counter() - start) * 1000:.1f}"]
+    with timings._lock:
+        durations = list(timings.durations.items())
+    entries.extend(f"{name};dur={seconds * 1000:.1f}" for name, seconds in durations)
+    return ", ".join(entries)
@@ -0,0 +1,144 @@
+"""
+本番用のHypercorn起動設定
+
+- ワーカー数は SERVER_WORKERS（"auto" で利用可能なCPU数）
+- イベントループは uvloop（インストールされていない環境では asyncio にフォールバック）
+- keep-alive・listenバックログ・シャットダウン時の待ち時間（graceful drain）を設定値から決める
+
+ワーカーが1つの場合はこのプロセス内でアプリを起動し、
+複数の場合はHypercornがワーカープロセスを起動して待ち受けソケットを共有する
+（各ワーカーは APPLICATION_PATH のアプリを読み込み、lifespanもワーカーごとに実行される）
+"""
+
+import asyncio
+import math
+import os
+from typing import Optional
+
+from app.core.config import Settings
+from common_utils.logger import logger
+
+# 複数ワーカー時に各ワーカーが読み込むアプリ
+APPLICATION_PATH = "app.main:app"
+
+# cgroup v2 のCPU上限（コンテナのCPU割り当て）
+CGROUP_CPU_MAX_PATH = "/sys/fs/cgroup/cpu.max"
+
+
+def _cgroup_cpu_limit(path: str = CGROUP_CPU_MAX_PATH) -> Optional[int]:
+    """cgroupのCPU上限（quota / period を切り上げ）。上限が無い場合はNone"""
+    try:
+        with open(path) as f:
+            quota, period = f.read().split()[:2]
+    except (OSError, ValueError):
+        return None
+    if quota == "max":
+        return None
+    return max(1, math.ceil(int(quota) / int(period)))
+
+
+def available_cpus() -> int:
+    """このプロセスが使えるCPU数（CPUアフィニティとコンテナのCPU上限の小さい方）"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    return max(1, min(cpus, limit) if limit else cpus)
+
+
+def resolve_worker_count(value: str) -> int:
+    """SERVER_WORKERS の値をワーカー数に変換する（"auto" は利用可能なCPU数）"""
+    value = (value or "").strip().lower()
+    if value in ("", "auto"):
+        return available_cpus()
+    return max(1, int(value))
+
+
+def resolve_worker_class(value: str) -> str:
+    """uvloopが指定されていてもインストールされていなければasyncioを使う"""
+    if value == "uvloop":
+        try:
+            import uvloop  # noqa: F401
+        except ImportError:
+            logger.warning("uvloopがインストールされていないためasyncioのイベントループを使用します")
+            return "asyncio"
+    return value
+
+
+def build_server_config(settings: Settings):
+    """SettingsからHypercornのConfigを生成する"""
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"0.0.0.0:{settings.port}"]
+    config.loglevel = "info"
+    config.workers = resolve_worker_count(settings.server_workers)
+    config.worker_class = resolve_worker_class(settings.server_worker_class)
+    config.application_path = APPLICATION_PATH
+    config.keep_alive_timeout = settings.server_keep_alive_seconds
+    config.backlog = settings.server_backlog
+    # SIGTERM受信後、処理中のリクエストの完了を待つ時間
+    config.graceful_timeout = settings.server_graceful_timeout_seconds
+
+    # SSL/TLS設定（証明書と秘密鍵のパスを指定）
+    if (
+        settings.ssl_cert_path
+        and settings.ssl_key_path
+        and os.path.exists(settings.ssl_cert_path)
+        and os.path.exists(settings.ssl_key_path)
+    ):
+        config.certfile = settings.ssl_cert_path
+        config.keyfile = settings.ssl_key_path
+        # SSLプロトコルを明示的に設定して安全性と互換性を確保
+        config.ciphers = "ECDHE+AESGCM:ECDHE+CHACHA20:DHE+AESGCM:DHE+CHACHA20"
+        logger.info("SSL/TLSが有効化されました")
+
+        # HTTP/2を有効化し優先する
+        config.alpn_protocols = ["h2", "http/1.1"]
+        config.h2_max_concurrent_streams = 250  # HTTP/2の同時ストリーム数を設定
+        config.h2_max_inbound_frame_size = 2**14  # HTTP/2フレームの最大サイズを設定
+        logger.info("HTTP/2が有効化されました")
+    else:
+        logger.warning(
+            "SSL/TLS証明書が見つからないか設定されていません。HTTP/1.1のみで動作します"
+        )
+        # HTTP/1.1のみを使用
+        config.alpn_protocols = ["http/1.1"]
+    return config
+
+
+def _new_event_loop(worker_class: str) -> asyncio.AbstractEventLoop:
+    if worker_class == "uvloop":
+        import uvloop
+
+        return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+def run_server(app, settings: Settings, application_path: str = APPLICATION_PATH) -> None:
+    """
+    Hypercornでアプリを起動する（SIGTERM/SIGINTで新規受付を止め、処理中のリクエストを待って終了する）
+    application_path は複数ワーカー時に各ワーカーが読み込むアプリ（ベンチマーク等で差し替える）
+    """
+    config = build_server_config(settings)
+    config.application_path = application_path
+    logger.info(
+        "Hypercornを使用してFastAPIアプリを起動します（TLS設定：%s、ワーカー数：%d、イベントループ：%s）",
+        "有効" if config.ssl_enabled else "無効",
+        config.workers,
+        config.worker_class,
+    )
+
+    if config.workers == 1:
+        import hypercorn.asyncio
+
+        with asyncio.Runner(loop_factory=lambda: _new_event_loop(config.worker_class)) as runner:
+            runner.run(hypercorn.asyncio.serve(app, config))
+        return
+
+    from hypercorn.run import run
+
+    exit_code = run(config)
+    if exit_code:
+        raise SystemExit(exit_code)
@@ -0,0 +1,167 @@
+"""
+起動処理の遅延初期化とタイミング計測
+
+- Firebase Admin SDK / Vertex AI の初期化を最初に必要になった時点まで遅延させる
+- ルーターのインポート時間と各SDKの初期化時間を記録し、起動レポートとして出力する
+- 設定（STARTUP_WARMUP）に応じて、ポートのバインド後にバックグラウンドでウォームアップする
+"""
+
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List
+
+from app.core.config import get_settings
+from common_utils.logger import logger
+
+# プロセス開始（このモジュールの初回インポート）時刻
+PROCESS_START = time.perf_counter()
+
+# モジュールごとのインポート時間（秒）
+_import_timings: Dict[str, float] = {}
+# SDKごとの初期化時間（秒）
+_init_timings: Dict[str, float] = {}
+
+_init_lock = threading.Lock()
+_firebase_initialized = False
+_vertex_ai_initialized = False
+
+
+@contextmanager
+def record_import(module_name: str) -> Iterator[None]:
+    """with ブロック内のインポートに掛かった時間を記録する"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _import_timings[module_name] = time.perf_counter() - start
+
+
+def _record_init(name: str, start: float) -> None:
+    elapsed = time.perf_counter() - start
+    _init_timings[name] = elapsed
+    logger.debug(f"{name}の初期化完了: {elapsed * 1000:.1f}ms")
+
+
+def init_firebase() -> None:
+    """Firebase Admin SDKを初期化する（2回目以降は何もしない）"""
+    global _firebase_initialized
+    if _firebase_initialized:
+        return
+    with _init_lock:
+        if _firebase_initialized:
+            return
+        start = time.perf_counter()
+        import firebase_admin
+        from firebase_admin import credentials
+
+        firebase_client_secret_path = get_settings().firebase_client_secret_path
+        try:
+            # 初期化されているかチェック
+            firebase_admin.get_app()
+            logger.debug("Firebase既に初期化済み")
+        except ValueError:
+            # 初期化されていない場合のみ初期化
+            if os.path.exists(firebase_client_secret_path):
+                logger.debug(f"Firebase認証情報を読み込み: {firebase_client_secret_path}")
+                cred = credentials.Certificate(firebase_client_secret_path)
+                firebase_admin.initialize_app(cred)  # 名前を指定しない
+            else:
+                logger.debug("Firebase認証情報なしで初期化")
+                firebase_admin.initialize_app()  # 名前を指定しない
+        _firebase_initialized = True
+        _record_init("firebase", start)
+
+
+def init_vertex_ai() -> None:
+    """VertexAIを初期化する（2回目以降は何もしない）"""
+    global _vertex_ai_initialized
+    if _vertex_ai_initialized:
+        return
+    with _init_lock:
+        if _vertex_ai_initialized:
+            return
+        start = time.perf_counter()
+        import vertexai
+
+        settings = get_settings()
+        try:
+            vertexai.init(project=settings.gcp_project_id, location=settings.gcp_region)
+            logger.debug("VertexAI初期化完了")
+        except Exception as e:
+            logger.error(f"VertexAI初期化エラー: {str(e)}", exc_info=True)
+            raise
+        _vertex_ai_initialized = True
+        _record_init("vertexai", start)
+
+
+def _warm_up_client(name: str) -> Callable[[], Any]:
+    def warm_up() -> Any:
+        from app.core.clients import get_client_registry
+
+        start = time.perf_counter()
+        client = getattr(get_client_registry(), name)
+        _record_init(name, start)
+        return client
+
+    return warm_up
+
+
+# STARTUP_WARMUPで指定できるウォームアップ対象
+WARMUP_TARGETS: Dict[str, Callable[[], Any]] = {
+    "firebase": init_firebase,
+    "vertexai": init_vertex_ai,
+    "firestore": _warm_up_client("firestore"),
+    "storage": _warm_up_client("storage"),
+    "speech": _warm_up_client("speech"),
+    "translate": _warm_up_client("translate"),
+}
+
+
+def resolve_warmup_targets(value: str) -> List[str]:
+    """STARTUP_WARMUPの値（カンマ区切り、"all"で全て）を対象名のリストに変換する"""
+    names = [name.strip().lower() for name in value.split(",") if name.strip()]
+    if "all" in names:
+        return list(WARMUP_TARGETS)
+    unknown = [name for name in names if name not in WARMUP_TARGETS]
+    if unknown:
+        logger.warning(f"不明なウォームアップ対象を無視します: {unknown}")
+    return [name for name in names if name in WARMUP_TARGETS]
+
+
+async def warm_up(targets: List[str]) -> None:
+    """
+    指定されたSDKをバックグラウンドで初期化する
+    lifespanからタスクとして起動され、サーバーがリクエストを受け付け始めてから実行される
+    """
+    # lifespanの起動処理を先に完了させ、ポートのバインドを待たせない
+    await asyncio.sleep(0)
+    for name in targets:
+        try:
+            await asyncio.to_thread(WARMUP_TARGETS[name])
+        except Exception as e:
+            logger.warning(f"ウォームアップに失敗しました: {name}: {e}")
+    log_startup_report()
+
+
+def startup_report() -> Dict[str, Any]:
+    """起動時間のレポート（インポート時間・初期化時間はミリ秒）"""
+    return {
+        "event": "startup_report",
+        "elapsed_ms": round((time.perf_counter() - PROCESS_START) * 1000, 1),
+        "imports_ms": {
+            name: round(seconds * 1000, 1)
+            for name, seconds in sorted(
+                _import_timings.items(), key=lambda item: item[1], reverse=True
+            )
+        },
+        "inits_ms": {
+            name: round(seconds * 1000, 1) for name, seconds in _init_timings.items()
+        },
+    }
+
+
+def log_startup_report() -> None:
+    logger.info(startup_report())
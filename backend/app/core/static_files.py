@@ -0,0 +1,223 @@
+"""
+フロントエンドの静的ファイル配信
+
+- FRONTEND_PATH/assets の各ファイルに対して、事前に圧縮した .br / .gz を作成し、
+  Accept-Encoding に応じて圧縮済みのファイルをそのまま返す（リクエストごとに圧縮しない）
+- ファイル名にハッシュを含むアセット（Viteのビルド成果物）は Cache-Control: immutable で長期キャッシュさせる
+- index.html はメモリ上に保持し、ETagによる再検証（304）に対応する
+
+圧縮済みファイルはDockerイメージのビルド時に作成する（python -m app.core.static_files <dir>）。
+起動時にも作成するが、元ファイルより新しい圧縮済みファイルがあれば作り直さない。
+brotliがインストールされていない環境ではgzipのみ作成・配信する。
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from common_utils.logger import logger
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotliは任意の依存
+    brotli = None
+
+# これより小さいファイルは圧縮しない（ヘッダーのオーバーヘッドの方が大きい）
+PRECOMPRESS_MIN_BYTES = 1024
+# 圧縮対象の拡張子（画像・フォントなど圧縮済みの形式は除く）
+PRECOMPRESS_EXTENSIONS = (".js", ".mjs", ".css", ".html", ".svg", ".json", ".map", ".txt", ".wasm")
+
+# ファイル名にハッシュを含むアセット（例: index-BxY1a2b3.js）
+HASHED_ASSET_PATTERN = re.compile(r"[-.][A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# ハッシュを含まないファイル・index.htmlは毎回再検証させる
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Accept-Encodingの優先順（エンコーディング名, 拡張子）
+ENCODINGS: List[Tuple[str, str]] = [("br", ".br"), ("gzip", ".gz")]
+
+
+def available_encodings() -> List[Tuple[str, str]]:
+    return [(name, suffix) for name, suffix in ENCODINGS if name != "br" or brotli is not None]
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    # mtime=0 で内容が同じなら同じバイト列にする（ETagを安定させる）
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def accepted_encodings(accept_encoding: str) -> List[str]:
+    """Accept-Encodingから受け入れ可能なエンコーディング名を返す（q=0は除く）"""
+    accepted = []
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name and quality > 0:
+            accepted.append(name.strip().lower())
+    return accepted
+
+
+def precompress_directory(directory: str, min_bytes: int = PRECOMPRESS_MIN_BYTES) -> int:
+    """
+    directory配下の圧縮対象ファイルの .br / .gz を作成し、作成したファイル数を返す
+    元ファイルより新しい圧縮済みファイルがある場合や、圧縮しても小さくならない場合は作成しない
+    """
+    created = 0
+    encodings = available_encodings()
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            if not filename.endswith(PRECOMPRESS_EXTENSIONS):
+                continue
+            path = os.path.join(root, filename)
+            source_stat = os.stat(path)
+            if source_stat.st_size < min_bytes:
+                continue
+            data = None
+            for encoding, suffix in encodings:
+                target = path + suffix
+                try:
+                    if os.stat(target).st_mtime >= source_stat.st_mtime:
+                        continue
+                except FileNotFoundError:
+                    pass
+                if data is None:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                compressed = _compress(data, encoding)
+                if len(compressed) >= len(data):
+                    continue
+                # 書き込み途中のファイルを配信しないよう一時ファイルから置き換える
+                temp_path = f"{target}.{os.getpid()}.tmp"
+                with open(temp_path, "wb") as f:
+                    f.write(compressed)
+                os.replace(temp_path, target)
+                created += 1
+    return created
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """圧縮済みファイルの選択とキャッシュヘッダーを追加したStaticFiles"""
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = os.fspath(full_path)
+        headers = {
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL
+            if HASHED_ASSET_PATTERN.search(os.path.basename(full_path))
+            else REVALIDATE_CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+
+        response = None
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        for encoding, suffix in available_encodings():
+            if encoding not in accepted:
+                continue
+            try:
+                variant_stat = os.stat(full_path + suffix)
+            except OSError:
+                continue
+            # Content-Typeは元ファイルの拡張子から決める
+            response = FileResponse(
+                full_path + suffix,
+                status_code=status_code,
+                stat_result=variant_stat,
+                media_type=mimetypes.guess_type(full_path)[0] or "text/plain",
+                headers={**headers, "Content-Encoding": encoding},
+            )
+            break
+        if response is None:
+            response = FileResponse(
+                full_path, status_code=status_code, stat_result=stat_result, headers=headers
+            )
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+class CachedIndexHtml:
+    """
+    index.htmlをメモリ上に保持し、ETagによる再検証に対応する
+    ファイルの更新はcheck_interval秒ごとに更新日時を確認して反映する
+    """
+
+    def __init__(self, path: str, check_interval: float = 5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._etag = ""
+        # エンコーディング名（""は無圧縮）ごとの本文
+        self._bodies: Dict[str, bytes] = {}
+
+    def _load(self, now: float) -> None:
+        with self._lock:
+            if self._mtime is not None and now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            mtime = os.stat(self.path).st_mtime
+            if mtime == self._mtime:
+                return
+            with open(self.path, "rb") as f:
+                body = f.read()
+            bodies = {"": body}
+            for encoding, _ in available_encodings():
+                bodies[encoding] = _compress(body, encoding)
+            self._bodies = bodies
+            # 圧縮の有無で本文が異なるため弱いETagにする
+            self._etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+            self._mtime = mtime
+            logger.debug("index.htmlを読み込みました: %s (%d bytes)", self.path, len(body))
+
+    def response(self, request: Request) -> Response:
+        self._load(time.monotonic())
+        headers = {
+            "ETag": "W/" + self._etag,
+            "Cache-Control": REVALIDATE_CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+        if_none_match = request.headers.get("if-none-match", "")
+        if self._etag in [tag.strip(" W/") for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+        for encoding, _ in available_encodings():
+            if encoding in accepted:
+                headers["Content-Encoding"] = encoding
+                return Response(self._bodies[encoding], media_type="text/html", headers=headers)
+        return Response(self._bodies[""], media_type="text/html", headers=headers)
+
+
+if __name__ == "__main__":
+    # ビルド時に圧縮済みファイルを作成する: python -m app.core.static_files <dir> [<dir> ...]
+    for directory in sys.argv[1:]:
+        print(f"{directory}: {precompress_directory(directory)} files compressed")
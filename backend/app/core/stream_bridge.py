@@ -0,0 +1,166 @@
+"""
+同期ストリームと非同期ストリームのブリッジ
+
+Vertex AIのストリーミング応答（generate_content(stream=True)）のような同期ジェネレーターを
+イベントループのスレッドで回すと、ネットワーク読み込みの間ほかのリクエストが全て止まる。
+ここでは専用の上限付きスレッドプールでジェネレーターを回し、asyncio.Queue経由で受け渡す。
+- キューが満杯の間は生産側のスレッドが待つ（読み手が遅い場合のバックプレッシャー）
+- 読み手が途中で終了した場合（クライアントの切断など）は生産側に停止を伝え、ジェネレーターを閉じる
+- スレッドが全て使用中の場合、新しいストリームは空きが出るまで待つ
+逆向き（WebSocketで届く音声をSpeech-to-Textの同期リクエストのイテレーターに渡すなど）には ChunkFeeder を使う。
+"""
+
+import asyncio
+import contextvars
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import AsyncIterator, Callable, Generic, Iterable, Iterator, Optional, TypeVar
+
+from app.core.config import get_settings
+from app.core.executors import lazy_executor
+
+T = TypeVar("T")
+
+# 生産側と読み手の間に溜めておくチャンク数
+DEFAULT_BUFFER_SIZE = 16
+
+# 終了を表す番兵
+_DONE = object()
+
+
+class _ProducerStopped(Exception):
+    """読み手が終了したため生産側を止める"""
+
+
+class _StreamError:
+    """生産側で発生した例外を読み手に渡すための入れ物"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def _create_stream_executor() -> ThreadPoolExecutor:
+    """ストリーミング応答の読み込み専用のスレッドプール（同時ストリーム数の上限）"""
+    return ThreadPoolExecutor(
+        max_workers=get_settings().chat_stream_workers, thread_name_prefix="chat-stream"
+    )
+
+
+get_stream_executor, shutdown_stream_executor = lazy_executor(_create_stream_executor)
+
+
+async def iterate_in_thread(
+    factory: Callable[[], Iterable[T]],
+    executor: Optional[ThreadPoolExecutor] = None,
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+) -> AsyncIterator[T]:
+    """
+    factory() が返す同期イテラブルをスレッドプールで回し、要素を非同期に返す
+    factory自体（接続・最初の応答待ち）もスレッドで実行する
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+    stopped = threading.Event()
+
+    def put(item) -> None:
+        # キューに空きが出るまでこのスレッドで待つ（読み手の終了・ループの終了は定期的に確認する）
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            try:
+                future.result(timeout=1.0)
+                return
+            except FutureTimeoutError:
+                if stopped.is_set() or loop.is_closed():
+                    future.cancel()
+                    raise _ProducerStopped()
+
+    def produce() -> None:
+        iterator = None
+        try:
+            iterator = iter(factory())
+            for item in iterator:
+                if stopped.is_set():
+                    break
+                put(item)
+            else:
+                put(_DONE)
+        except _ProducerStopped:
+            pass
+        except BaseException as e:  # noqa: BLE001 - 読み手に渡して再送出する
+            if not stopped.is_set():
+                try:
+                    put(_StreamError(e))
+                except _ProducerStopped:
+                    pass
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    # メトリクス（Server-Timing）などのcontextvarsをスレッドに引き継ぐ
+    context = contextvars.copy_context()
+    future = loop.run_in_executor(executor or get_stream_executor(), context.run, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _StreamError):
+                raise item.error
+            yield item
+        await future
+    finally:
+        if not future.done():
+            stopped.set()
+            # 満杯のキューで待っている生産側を解放する
+            while not queue.empty():
+                queue.get_nowait()
+
+
+class ChunkFeeder(Generic[T]):
+    """
+    非同期に届くチャンクを、ワーカースレッドで回す同期イテラブルに受け渡す
+    - 溜めておけるチャンク数を超えた場合、put は空きが出るまで待つ（送り手が速い場合のバックプレッシャー）
+    - close() の後、読み手は残りのチャンクを読み終えた時点でイテレーションを終える。put は何もしない
+    """
+
+    # 満杯のキューに空きが出たか、読み手が終了したかを確認する間隔（秒）
+    POLL_SECONDS = 0.01
+
+    def __init__(self, max_chunks: int):
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_chunks)
+        self._closed = threading.Event()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    async def put(self, chunk: T) -> None:
+        while not self._closed.is_set():
+            try:
+                self._queue.put_nowait(chunk)
+                return
+            except queue.Full:
+                await asyncio.sleep(self.POLL_SECONDS)
+
+    def close(self) -> None:
+        self._closed.set()
+        try:
+            # 空のキューで待っている読み手を起こす
+            self._queue.put_nowait(_DONE)
+        except queue.Full:
+            pass
+
+    def __iter__(self) -> Iterator[T]:
+        while True:
+            try:
+                item = self._queue.get(timeout=self.POLL_SECONDS * 50)
+            except queue.Empty:
+                if self._closed.is_set():
+                    return
+                continue
+            if item is _DONE:
+                return
+            yield item
@@ -0,0 +1,147 @@
+"""
+検証済みIDトークンのキャッシュ
+
+Firebase IDトークンの検証（RSA署名の検証と公開鍵証明書の取得）を
+トークンごとに1回だけにするため、検証済みのクレームをトークンの有効期限（exp）まで保持する
+- キーはトークンそのものではなくSHA-256ハッシュ（メモリ上にトークンを残さない）
+- エントリ数の上限を超えた場合は最も古く使われたものから破棄する（LRU）
+- Googleの公開鍵証明書はバックグラウンドで定期的に再取得し、リクエスト処理中の取得を避ける
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import get_settings
+from app.core.metrics import REGISTRY
+from common_utils.logger import logger
+
+
+class VerifiedTokenCache:
+    """検証済みトークンのクレームを有効期限まで保持する上限付きLRUキャッシュ"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """有効期限内のクレームを返す（無い場合・期限切れの場合はNone）"""
+        key = self._key(token)
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            exp, claims = entry
+            if exp <= now:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return claims
+
+    def put(self, token: str, claims: Dict[str, Any]) -> None:
+        """検証済みのクレームを保存する（expが無いクレームは保存しない）"""
+        exp = claims.get("exp")
+        if not isinstance(exp, (int, float)) or self.maxsize <= 0:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (float(exp), claims)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """ヒット数・ミス数などの統計"""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_token_cache() -> VerifiedTokenCache:
+    """プロセス全体で共有するトークンキャッシュを取得する"""
+    return VerifiedTokenCache(get_settings().token_cache_size)
+
+
+def _render_token_cache_metrics() -> List[str]:
+    """トークンキャッシュの統計をPrometheusのテキスト形式で返す"""
+    stats = get_token_cache().stats()
+    lines = [
+        "# HELP token_cache_entries Verified ID tokens currently cached",
+        "# TYPE token_cache_entries gauge",
+        f"token_cache_entries {stats['size']}",
+        "# HELP token_cache_lookups_total Verified token cache lookups",
+        "# TYPE token_cache_lookups_total counter",
+    ]
+    lines += [
+        f'token_cache_lookups_total{{result="{result}"}} {stats[key]}'
+        for result, key in (("hit", "hits"), ("miss", "misses"))
+    ]
+    return lines
+
+
+REGISTRY.add_collector(_render_token_cache_metrics)
+
+
+def refresh_google_certs() -> None:
+    """
+    IDトークン検証用のGoogle公開鍵証明書を再取得する
+    firebase_adminの検証器が使うHTTPキャッシュ（Cache-Control準拠）に
+    no-cacheで取得した最新の証明書を格納し、検証時の取得を不要にする
+    """
+    from app.core.startup import init_firebase
+
+    init_firebase()
+    from firebase_admin import auth
+    from firebase_admin._token_gen import ID_TOKEN_CERT_URI
+
+    verifier = getattr(auth._get_client(None), "_token_verifier", None)
+    if verifier is None:
+        logger.warning("Firebaseのトークン検証器が見つからないため証明書を更新できません")
+        return
+    response = verifier.request(
+        url=ID_TOKEN_CERT_URI, method="GET", headers={"Cache-Control": "no-cache"}
+    )
+    if response.status != 200:
+        raise RuntimeError(f"証明書の取得に失敗しました: HTTP {response.status}")
+    logger.debug("Google公開鍵証明書を更新しました")
+
+
+async def refresh_google_certs_periodically(interval_seconds: float) -> None:
+    """lifespanからタスクとして起動し、interval_seconds間隔で証明書を再取得する"""
+    while True:
+        try:
+            await asyncio.to_thread(refresh_google_certs)
+        except Exception as e:
+            logger.warning(f"Google公開鍵証明書の更新に失敗しました: {e}")
+        logger.debug(f"トークンキャッシュ統計: {get_token_cache().stats()}")
+        await asyncio.sleep(interval_seconds)
@@ -2,69 +2,116 @@
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import os
-from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import credentials
+import asyncio
+from contextlib import asynccontextmanager
 from common_utils.logger import logger
 from fastapi import Request
-
-# API ルーターのインポート
-from app.api.geocoding import router as geocoding_router
-from app.api.chat import router as chat_router
-from app.api.config import router as config_router
-from app.api.auth import router as auth_router
-from app.api.speech import router as speech_router
-from app.api.image import router as image_router
-from app.api.whisper import router as whisper_router
-from app.api.whisper_batch import router as whisper_batch_router # Import the new batch router
-
-# .envファイルを読み込み
-load_dotenv("./config/.env")
-develop_env_path = "./config_develop/.env.develop"
-# 開発環境の場合はdevelop_env_pathに対応する.envファイルがある
-if os.path.exists(develop_env_path):
-    load_dotenv(develop_env_path)
+from app.core.config import get_settings
+from app.core.clients import get_client_registry
+from app.core.startup import (
+    record_import,
+    resolve_warmup_targets,
+    warm_up,
+    log_startup_report,
+)
+from app.core.token_cache import refresh_google_certs_periodically
+from app.core.executors import shutdown_executors
+from app.core.metrics import REGISTRY, MetricsMiddleware
+from app.core.server import resolve_worker_count
+from app.core.static_files import CachedIndexHtml, PrecompressedStaticFiles, precompress_directory
+from app.services.chunked_upload import purge_expired_uploads_periodically
+
+# API ルーターのインポート（モジュールごとのインポート時間を起動レポートに記録）
+with record_import("app.api.geocoding"):
+    from app.api.geocoding import router as geocoding_router
+with record_import("app.api.chat"):
+    from app.api.chat import router as chat_router
+with record_import("app.api.config"):
+    from app.api.config import router as config_router
+with record_import("app.api.auth"):
+    from app.api.auth import router as auth_router
+with record_import("app.api.speech"):
+    from app.api.speech import router as speech_router
+with record_import("app.api.image"):
+    from app.api.image import router as image_router
+with record_import("app.api.whisper"):
+    from app.api.whisper import router as whisper_router
+with record_import("app.api.whisper_batch"):
+    from app.api.whisper_batch import router as whisper_batch_router # Import the new batch router
+with record_import("app.api.metrics"):
+    from app.api.metrics import router as metrics_router
+
+# 設定の読み込み（.envの読み込みはプロセス全体で1回だけ）
+settings = get_settings()
 
 # ===== アプリケーション設定 =====
-PORT = int(os.environ.get("PORT", "8080"))
-FRONTEND_PATH = os.environ["FRONTEND_PATH"]
+PORT = settings.port
+FRONTEND_PATH = settings.frontend_path
 
 # CORS設定
-ORIGINS = [org for org in os.environ.get("ORIGINS", "").split(",") if org]
+ORIGINS = settings.origins
 
 # IPアクセス制限
-ALLOWED_IPS = os.environ.get("ALLOWED_IPS")
-
-# ===== Firebase設定 =====
-FIREBASE_CLIENT_SECRET_PATH = os.environ.get("FIREBASE_CLIENT_SECRET_PATH", "")
-
-# ===== リクエストIDが不要なパス設定 =====
-UNNEED_REQUEST_ID_PATH = os.environ.get("UNNEED_REQUEST_ID_PATH", "").split(",")
-UNNEED_REQUEST_ID_PATH_STARTSWITH = os.environ.get("UNNEED_REQUEST_ID_PATH_STARTSWITH", "").split(",")
-UNNEED_REQUEST_ID_PATH_ENDSWITH = os.environ.get("UNNEED_REQUEST_ID_PATH_ENDSWITH", "").split(",")
-
-# ログでマスクするセンシティブ情報
-SENSITIVE_KEYS = os.environ["SENSITIVE_KEYS"].split(",")
-
-# Firebase Admin SDKの初期化
-try:
-    # 初期化されているかチェック
-    firebase_admin.get_app()
-    logger.debug("Firebase既に初期化済み")
-except ValueError:
-    # 初期化されていない場合のみ初期化
-    if os.path.exists(FIREBASE_CLIENT_SECRET_PATH):
-        logger.debug(f"Firebase認証情報を読み込み: {FIREBASE_CLIENT_SECRET_PATH}")
-        cred = credentials.Certificate(FIREBASE_CLIENT_SECRET_PATH)
-        firebase_admin.initialize_app(cred)  # 名前を指定しない
+ALLOWED_IPS = settings.allowed_ips
+
+# 静的ファイル
+ASSETS_PATH = os.path.join(FRONTEND_PATH, "assets")
+INDEX_HTML = CachedIndexHtml(os.path.join(FRONTEND_PATH, "index.html"))
+
+# Firebase Admin SDK / VertexAI の初期化は最初のリクエスト時（またはウォームアップ時）まで
+# 遅延させる（app.core.startup.init_firebase / init_vertex_ai）
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """設定とクライアントレジストリを1度だけ生成し、app.stateで共有する"""
+    app.state.settings = settings
+    app.state.clients = get_client_registry()
+    logger.debug("クライアントレジストリを初期化しました")
+
+    # ワーカーが複数の場合、メトリクス・キャッシュ・同時実行数の上限はワーカーごとのため、
+    # /backend/metrics の値はpidのラベルで区別する（集計はPrometheus側でpidをまとめて行う）
+    if resolve_worker_count(settings.server_workers) > 1:
+        REGISTRY.set_constant_labels(pid=str(os.getpid()))
+
+    # ウォームアップはバックグラウンドで行い、リクエストの受け付けを待たせない
+    warmup_task = None
+    warmup_targets = resolve_warmup_targets(settings.startup_warmup)
+    if warmup_targets:
+        logger.info(f"バックグラウンドでウォームアップします: {warmup_targets}")
+        warmup_task = asyncio.create_task(warm_up(warmup_targets))
     else:
-        logger.debug("Firebase認証情報なしで初期化")
-        firebase_admin.initialize_app()  # 名前を指定しない
+        log_startup_report()
+
+    # アセットの圧縮済みファイル（.br/.gz）をバックグラウンドで作成する（ビルド時に作成済みなら何もしない）
+    precompress_task = None
+    if settings.static_precompress and os.path.isdir(ASSETS_PATH):
+        precompress_task = asyncio.create_task(asyncio.to_thread(precompress_directory, ASSETS_PATH))
+
+    # IDトークン検証用の公開鍵証明書を定期的に再取得する
+    cert_refresh_task = None
+    if settings.token_cert_refresh_seconds > 0:
+        cert_refresh_task = asyncio.create_task(
+            refresh_google_certs_periodically(settings.token_cert_refresh_seconds)
+        )
+
+    # 中断されたチャットの分割アップロードを定期的に削除する
+    chunk_purge_task = asyncio.create_task(
+        purge_expired_uploads_periodically(max(60, settings.chat_chunk_ttl_seconds // 4))
+    )
+    try:
+        yield
+    finally:
+        for task in (warmup_task, precompress_task, cert_refresh_task, chunk_purge_task):
+            if task is not None and not task.done():
+                task.cancel()
+        # 作成済みのスレッドプール・プロセスプール（ストリーム・音声認識・画像・DOCX・コンテキストキャッシュ）
+        shutdown_executors()
+        app.state.clients.close()
+        logger.debug("クライアントレジストリを終了しました")
 
 # FastAPIアプリケーションの初期化
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 logger.debug("ORIGINS: %s", ORIGINS)
 
@@ -75,14 +122,16 @@ app.add_middleware(
     allow_credentials=False,  # ユーザーの指示に従い False のまま維持
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["Content-Type", "Authorization", "X-Request-Id"],
-    expose_headers=["Authorization"],
+    expose_headers=["Authorization", "X-Chat-Tokens-Saved"],
 )
 
 # ミドルウェアのインポート
-from app.api.auth import log_request_middleware
+from app.api.auth import LogRequestMiddleware, REQUEST_BODY_LOG_PREFIX_BYTES
 
-# ミドルウェアの登録（正しい方法：app.middlewareデコレータは使わず、関数を直接使用）
-app.middleware("http")(log_request_middleware)
+# ミドルウェアの登録（ボディを読み込まない純粋なASGIミドルウェア）
+app.add_middleware(LogRequestMiddleware, body_prefix_bytes=REQUEST_BODY_LOG_PREFIX_BYTES)
+# メトリクスの記録とServer-Timingヘッダー（最も外側で計測する）
+app.add_middleware(MetricsMiddleware)
 
 # ルーターの登録
 app.include_router(geocoding_router, prefix="/backend")
@@ -93,11 +142,13 @@ app.include_router(speech_router, prefix="/backend")
 app.include_router(image_router, prefix="/backend")
 app.include_router(whisper_router, prefix="/backend", tags=["whisper"]) # Add tags for OpenAPI
 app.include_router(whisper_batch_router, prefix="/backend/batch", tags=["batch"]) # Add the new batch router
+app.include_router(metrics_router, prefix="/backend", tags=["metrics"])
 
 # 静的ファイル配信設定
+# 圧縮済みファイルの選択とキャッシュヘッダー（ハッシュ付きのアセットはimmutable）
 app.mount(
     "/assets",
-    StaticFiles(directory=os.path.join(FRONTEND_PATH, "assets")),
+    PrecompressedStaticFiles(directory=ASSETS_PATH),
     name="assets",
 )
 
@@ -119,62 +170,20 @@ async def vite_svg():
     from fastapi import HTTPException
     raise HTTPException(status_code=404, detail="ファイルが見つかりません")
 
+# index.htmlはメモリ上に保持し、ETagが一致すれば304を返す
 @app.get("/")
-async def index():
-    from fastapi.responses import FileResponse
+async def index(request: Request):
     logger.debug("インデックスページリクエスト: %s", FRONTEND_PATH)
-    return FileResponse(os.path.join(FRONTEND_PATH, "index.html"))
+    return INDEX_HTML.response(request)
 
 @app.get("/{path:path}")
-async def static_file(path: str):
-    from fastapi.responses import FileResponse
+async def static_file(request: Request, path: str):
     logger.debug(f"パスリクエスト: /{path}")
-    return FileResponse(os.path.join(FRONTEND_PATH, "index.html"))
+    return INDEX_HTML.response(request)
 
 # アプリケーション起動部分
 if __name__ == "__main__":
-    import hypercorn.asyncio
-    from hypercorn.config import Config
-
-    # Hypercornの設定
-    config = Config()
-    config.bind = [f"0.0.0.0:{PORT}"]
-    config.loglevel = "info"
-    config.workers = 1
-
-    # SSL/TLS設定（証明書と秘密鍵のパスを指定）
-    SSL_CERT_PATH = os.environ.get("SSL_CERT_PATH", "")
-    SSL_KEY_PATH = os.environ.get("SSL_KEY_PATH", "")
-    
-    if (
-        SSL_CERT_PATH
-        and SSL_KEY_PATH
-        and os.path.exists(SSL_CERT_PATH)
-        and os.path.exists(SSL_KEY_PATH)
-    ):
-        config.certfile = SSL_CERT_PATH
-        config.keyfile = SSL_KEY_PATH
-        # SSLプロトコルを明示的に設定して安全性と互換性を確保
-        config.ciphers = "ECDHE+AESGCM:ECDHE+CHACHA20:DHE+AESGCM:DHE+CHACHA20"
-        logger.info("SSL/TLSが有効化されました")
-
-        # HTTP/2を有効化し優先する
-        config.alpn_protocols = ["h2", "http/1.1"]
-        config.h2_max_concurrent_streams = 250  # HTTP/2の同時ストリーム数を設定
-        config.h2_max_inbound_frame_size = 2**14  # HTTP/2フレームの最大サイズを設定
-        logger.info("HTTP/2が有効化されました")
-    else:
-        logger.warning(
-            "SSL/TLS証明書が見つからないか設定されていません。HTTP/1.1のみで動作します"
-        )
-        # HTTP/1.1のみを使用
-        config.alpn_protocols = ["http/1.1"]
-
-    logger.info(
-        "Hypercornを使用してFastAPIアプリを起動します（TLS設定：%s）",
-        "有効" if hasattr(config, "certfile") else "無効",
-    )
+    from app.core.server import run_server
 
-    # Hypercornでアプリを起動
-    import asyncio
-    asyncio.run(hypercorn.asyncio.serve(app, config))
\ No newline at end of file
+    # ワーカー数・イベントループ・keep-alive等はSERVER_*の環境変数で設定する（app.core.server）
+    run_server(app, settings)
@@ -0,0 +1,187 @@
+"""
+Vertex AI呼び出しのアドミッション制御
+
+バースト時にVertex AIのクォータ超過（429）が500エラーになるのを防ぐため、
+- モデルごとに同時に実行する呼び出し数を制限し、超えた分は上限付きの待ち行列でタイムアウトまで待たせる
+- 待ち行列が一杯、または待ち時間がタイムアウトした場合は AdmissionRejected を送出する
+  （APIは Retry-After 付きの429を返し、混雑している上流にさらに負荷を掛けない）
+- 上流が429/503を返した場合は、ジッター付きの指数バックオフで再試行する
+"""
+
+import asyncio
+import json
+import math
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import AsyncIterator, Callable, Dict, Optional, TypeVar
+
+from app.core.config import get_settings
+from app.core.metrics import REGISTRY
+from common_utils.logger import logger
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = (429, 503)
+
+ADMISSION_IN_FLIGHT = REGISTRY.gauge(
+    "vertex_admission_in_flight", "Vertex AI calls currently admitted", ("model",)
+)
+ADMISSION_WAITING = REGISTRY.gauge(
+    "vertex_admission_waiting", "Requests waiting for a Vertex AI slot", ("model",)
+)
+ADMISSION_REJECTED = REGISTRY.counter(
+    "vertex_admission_rejected_total", "Requests rejected by admission control", ("model", "reason")
+)
+UPSTREAM_RETRIES = REGISTRY.counter(
+    "vertex_retries_total", "Vertex AI calls retried after 429/503", ("operation",)
+)
+
+
+class AdmissionRejected(Exception):
+    """待ち行列が一杯、または待ち時間がタイムアウトした（retry_after秒後の再試行を促す）"""
+
+    def __init__(self, model: str, retry_after: int):
+        super().__init__(f"モデル '{model}' へのリクエストが混雑しています。{retry_after}秒後に再試行してください。")
+        self.model = model
+        self.retry_after = retry_after
+
+
+@dataclass
+class AdmissionTicket:
+    """取得した実行枠（releaseは何度呼んでもよい）"""
+
+    _release: Callable[[], None]
+    _released: bool = field(default=False)
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._release()
+
+
+class _ModelSlots:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.waiting = 0
+        # 1回の呼び出しで枠を保持する時間の移動平均（Retry-Afterの算出に使う）
+        self.average_hold = 1.0
+
+
+class AdmissionController:
+    """モデルごとの同時実行数の制限と上限付きの待ち行列"""
+
+    def __init__(
+        self,
+        concurrency: int,
+        max_queue: int,
+        queue_timeout: float,
+        model_concurrency: Optional[Dict[str, int]] = None,
+    ):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.model_concurrency = model_concurrency or {}
+        self._slots: Dict[str, _ModelSlots] = {}
+
+    def _model_slots(self, model: str) -> _ModelSlots:
+        slots = self._slots.get(model)
+        if slots is None:
+            slots = self._slots[model] = _ModelSlots(self.model_concurrency.get(model, self.concurrency))
+        return slots
+
+    def retry_after(self, model: str) -> int:
+        """待っている件数が処理されるまでの見込み時間（秒）"""
+        slots = self._model_slots(model)
+        return max(1, math.ceil(slots.average_hold * (slots.waiting + 1) / slots.limit))
+
+    def _reject(self, model: str, reason: str) -> AdmissionRejected:
+        ADMISSION_REJECTED.inc(model, reason)
+        logger.warning(f"Vertex AIへのリクエストを受け付けませんでした: {model} ({reason})")
+        return AdmissionRejected(model, self.retry_after(model))
+
+    async def acquire(self, model: str) -> AdmissionTicket:
+        """実行枠を取得する（ストリーミングのように枠を応答の終わりまで保持する場合に使う）"""
+        slots = self._model_slots(model)
+        if slots.semaphore.locked() and slots.waiting >= self.max_queue:
+            raise self._reject(model, "queue_full")
+        slots.waiting += 1
+        ADMISSION_WAITING.inc(model)
+        try:
+            await asyncio.wait_for(slots.semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self._reject(model, "timeout")
+        finally:
+            slots.waiting -= 1
+            ADMISSION_WAITING.dec(model)
+
+        ADMISSION_IN_FLIGHT.inc(model)
+        started = time.monotonic()
+
+        def release() -> None:
+            slots.average_hold = slots.average_hold * 0.8 + (time.monotonic() - started) * 0.2
+            ADMISSION_IN_FLIGHT.dec(model)
+            slots.semaphore.release()
+
+        return AdmissionTicket(release)
+
+    @asynccontextmanager
+    async def admit(self, model: str) -> AsyncIterator[None]:
+        ticket = await self.acquire(model)
+        try:
+            yield
+        finally:
+            ticket.release()
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """上流の429（クォータ超過）・503（一時的な利用不可）"""
+    try:
+        return int(getattr(error, "code", 0) or 0) in RETRYABLE_STATUS_CODES
+    except (TypeError, ValueError):
+        return False
+
+
+def call_with_backoff(
+    fn: Callable[[], T],
+    operation: str,
+    attempts: Optional[int] = None,
+    base_delay: Optional[float] = None,
+    max_delay: Optional[float] = None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> T:
+    """
+    429/503の場合にジッター付きの指数バックオフ（full jitter）で再試行する
+    同期関数用（Vertex AIの呼び出しはワーカースレッドで行うため、スレッド内で待つ）
+    """
+    settings = get_settings()
+    attempts = settings.vertex_retry_attempts if attempts is None else attempts
+    base_delay = settings.vertex_retry_base_seconds if base_delay is None else base_delay
+    max_delay = settings.vertex_retry_max_seconds if max_delay is None else max_delay
+    attempts = max(1, attempts)
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except Exception as e:
+            if not is_retryable_error(e) or attempt == attempts - 1:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * (2**attempt)))
+            UPSTREAM_RETRIES.inc(operation)
+            logger.warning(f"{operation} を{delay:.2f}秒後に再試行します（{attempt + 1}/{attempts - 1}）: {e}")
+            sleep(delay)
+    raise RuntimeError("unreachable")
+
+
+@lru_cache(maxsize=1)
+def get_admission_controller() -> AdmissionController:
+    """プロセス全体で共有するアドミッション制御"""
+    settings = get_settings()
+    return AdmissionController(
+        settings.vertex_concurrency,
+        settings.vertex_queue_size,
+        settings.vertex_queue_timeout_seconds,
+        {model: int(limit) for model, limit in json.loads(settings.vertex_model_concurrency).items()},
+    )
@@ -0,0 +1,255 @@
+"""
+チャット添付ファイルのストア（コンテンツアドレス）
+
+添付ファイルは1度だけアップロードし、SHA-256をキーとして保存する。
+メッセージの files には内容（base64）の代わりに hash を載せて送れるため、
+会話の履歴が長くなってもリクエストサイズとJSONの解析時間が増えない。
+ストアにはユーザーごとのキー（uidとhashのSHA-256）で保存するため、他のユーザーの添付ファイルの
+hashを指定しても存在の確認・内容の参照はできない（クライアントに返すhashは内容のSHA-256のまま）。
+- gcs   : GCSバケットの chat_attachments/<hash> に保存し、画像・音声は gs:// のURIのままVertex AIに渡す
+- local : ローカルディスクに保存し、合計サイズの上限を超えたら最も古く使われたものから削除する（LRU）。
+          存在・使用順・合計サイズはディレクトリから求め、同じディレクトリを使う全ワーカーで共有する
+どちらも読み込んだ内容はメモリ上のLRUキャッシュに保持する。
+"""
+
+import base64
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
+from app.core.config import get_settings
+from app.core.metrics import upstream_timer
+from common_utils.logger import logger
+
+ATTACHMENT_HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+GCS_ATTACHMENT_PREFIX = "chat_attachments/"
+
+
+def is_binary_mime_type(mime_type: str) -> bool:
+    """画像・音声はバイナリとしてVertex AIに渡す（それ以外はテキストとして本文に含める）"""
+    return mime_type.startswith("image/") or mime_type.startswith("audio/")
+
+
+def decode_file_content(content: str, mime_type: str) -> bytes:
+    """files の content（data URL・base64・テキスト）を保存するバイト列に変換する"""
+    if not is_binary_mime_type(mime_type):
+        return content.encode("utf-8")
+    if content.startswith("data:") and "," in content:
+        content = content.split(",", 1)[1]
+    return base64.b64decode(content, validate=False)
+
+
+def attachment_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def owner_key(owner: str, digest: str) -> str:
+    """ストアのキー（同じ内容でもユーザーごとに別のキーになる）"""
+    return hashlib.sha256(f"{owner}:{digest}".encode("utf-8")).hexdigest()
+
+
+class BytesLruCache:
+    """合計バイト数の上限付きLRUキャッシュ"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+class LocalAttachmentStore:
+    """
+    ローカルディスクの添付ファイルストア（合計サイズの上限を超えたらLRUで削除）
+
+    サーバーのワーカーが複数の場合も同じディレクトリを共有するため、存在の確認・使用順・合計サイズは
+    プロセスのメモリではなくディレクトリから求める（使用順はファイルの更新日時で表し、読むたびに更新する）。
+    """
+
+    def __init__(self, directory: str, max_bytes: int, cache_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._cache = BytesLruCache(cache_bytes)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest)
+
+    def _touch(self, digest: str) -> bool:
+        """使用日時を更新する（ファイルが無い場合はFalse）"""
+        now = time.time_ns()
+        try:
+            os.utime(self._path(digest), ns=(now, now))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _evict(self, keep: str) -> None:
+        """ディレクトリ内の合計サイズが上限を超えていれば、最も古く使われたファイルから削除する"""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not ATTACHMENT_HASH_PATTERN.match(entry.name):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # 他のワーカーが削除した
+                    continue
+                entries.append((stat.st_mtime_ns, entry.name, stat.st_size))
+                total += stat.st_size
+        evicted = 0
+        for _, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(self._path(name))
+                evicted += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        if evicted:
+            logger.debug(f"添付ファイルを{evicted}件削除しました（容量上限）")
+
+    def put(self, data: bytes, owner: str) -> str:
+        """ownerのキーで保存し、内容のSHA-256を返す"""
+        digest = attachment_hash(data)
+        key = owner_key(owner, digest)
+        if not self._touch(key):
+            # 他のワーカー・スレッドと名前が重ならない一時ファイルに書いてから置き換える
+            temp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, self._path(key))
+            self._touch(key)
+            with self._lock:
+                self._evict(keep=key)
+        self._cache.put(key, data)
+        return digest
+
+    def get(self, digest: str) -> Optional[bytes]:
+        found = self._touch(digest)
+        data = self._cache.get(digest)
+        if data is None and found:
+            try:
+                with open(self._path(digest), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                # 確認した後に他のワーカーが削除した
+                return None
+            self._cache.put(digest, data)
+        return data
+
+    def exists(self, digest: str) -> bool:
+        return self._cache.get(digest) is not None or os.path.exists(self._path(digest))
+
+    def uri(self, digest: str) -> Optional[str]:
+        """Vertex AIが直接読めるURI（ローカルディスクの場合は無い）"""
+        return None
+
+
+class GcsAttachmentStore:
+    """GCSの添付ファイルストア"""
+
+    def __init__(self, bucket_name: str, cache_bytes: int, prefix: str = GCS_ATTACHMENT_PREFIX):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self._cache = BytesLruCache(cache_bytes)
+        # 存在を確認済みのhash（GCS上のオブジェクトは削除しない前提）
+        self._known = set()
+
+    def _blob(self, digest: str):
+        from app.core.clients import get_client_registry
+
+        return get_client_registry().storage.bucket(self.bucket_name).blob(self.prefix + digest)
+
+    def put(self, data: bytes, owner: str) -> str:
+        """ownerのキーで保存し、内容のSHA-256を返す"""
+        from google.api_core.exceptions import PreconditionFailed
+
+        digest = attachment_hash(data)
+        key = owner_key(owner, digest)
+        if not self.exists(key):
+            try:
+                with upstream_timer("gcs", "upload"):
+                    # 同じ内容が同時にアップロードされた場合は先に保存された方を使う
+                    self._blob(key).upload_from_string(data, if_generation_match=0)
+            except PreconditionFailed:
+                pass
+            self._known.add(key)
+        self._cache.put(key, data)
+        return digest
+
+    def get(self, digest: str) -> Optional[bytes]:
+        from google.api_core.exceptions import NotFound
+
+        data = self._cache.get(digest)
+        if data is None:
+            try:
+                with upstream_timer("gcs", "download"):
+                    data = self._blob(digest).download_as_bytes()
+            except NotFound:
+                return None
+            self._cache.put(digest, data)
+        return data
+
+    def exists(self, digest: str) -> bool:
+        if digest in self._known:
+            return True
+        with upstream_timer("gcs", "exists"):
+            found = self._blob(digest).exists()
+        if found:
+            self._known.add(digest)
+        return found
+
+    def uri(self, digest: str) -> Optional[str]:
+        return f"gs://{self.bucket_name}/{self.prefix}{digest}"
+
+
+def missing_attachments(store, owner: str, digests: Iterable[str]) -> List[str]:
+    """ownerがアップロードしていないhashの一覧（他のユーザーだけが保存したhashも含む）"""
+    return [
+        digest for digest in dict.fromkeys(digests) if not store.exists(owner_key(owner, digest))
+    ]
+
+
+@lru_cache(maxsize=1)
+def get_attachment_store():
+    """設定に応じた添付ファイルストア（プロセス全体で共有する）"""
+    settings = get_settings()
+    if settings.chat_attachment_store == "gcs":
+        return GcsAttachmentStore(settings.gcs_bucket_name, settings.chat_attachment_cache_bytes)
+    return LocalAttachmentStore(
+        settings.chat_attachment_dir,
+        settings.chat_attachment_disk_bytes,
+        settings.chat_attachment_cache_bytes,
+    )
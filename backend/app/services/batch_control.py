@@ -1,17 +1,23 @@
 from datetime import datetime, timedelta
-import os
 import google.cloud.firestore as firestore
+from app.core.config import get_settings
+from app.core.clients import get_client_registry
+from app.core.metrics import instrument_upstream
 
-# Firestore クライアント
-db = firestore.Client()
+# Firestore クライアント（プロセス共有。インポート時ではなく初回アクセス時に生成）
+def _db() -> firestore.Client:
+    return get_client_registry().firestore
+
+settings = get_settings()
 
 # 同時処理上限
-MAX_CONCURRENT = int(os.getenv('MAX_CONCURRENT', '5'))
+MAX_CONCURRENT = settings.max_concurrent
 
-## タイムアウト閾値用環境変数
-PROCESS_TIMEOUT_SECONDS = int(os.getenv('PROCESS_TIMEOUT_SECONDS', '300'))
-AUDIO_TIMEOUT_MULTIPLIER = float(os.getenv('AUDIO_TIMEOUT_MULTIPLIER', '2.0'))
+## タイムアウト閾値用設定
+PROCESS_TIMEOUT_SECONDS = settings.process_timeout_seconds
+AUDIO_TIMEOUT_MULTIPLIER = settings.audio_timeout_multiplier
 
+@instrument_upstream("firestore")
 def clear_stale_processing():
     """
     各ジョブの音声長と固定タイムアウトを比較し、
@@ -20,7 +26,7 @@ def clear_stale_processing():
     を超過したものを failed に移行する
     """
     now = datetime.utcnow()
-    for doc in db.collection('whisper_jobs') \
+    for doc in _db().collection('whisper_jobs') \
                   .where('status', '==', 'processing') \
                   .stream():
         data = doc.to_dict()
@@ -42,9 +48,11 @@ def clear_stale_processing():
                 'error': 'processing timeout'
             })
 
+@instrument_upstream("firestore", "take_job")
 @firestore.transactional
 def _atomically_take_job(tx):
     # 1) キューからジョブを1件取得
+    db = _db()
     queued_docs = list(
         db.collection('whisper_jobs')
           .where('status', '==', 'queued')
@@ -75,6 +83,6 @@ def trigger_whisper_batch_processing():
     clear_stale_processing()
 
     # 次のキュージョブを取ってバッチ実行
-    doc = _atomically_take_job(db.transaction())
+    doc = _atomically_take_job(_db().transaction())
     if doc:
         _execute_batch_job_creation(doc.to_dict())
\ No newline at end of file
@@ -0,0 +1,238 @@
+"""
+チャット履歴のトークン予算による調整
+
+prepare_messages_for_vertex の前に、会話全体がモデルごとのトークン予算に収まるよう古いターンを省略する。
+- トークン数はVertex AIのcount_tokensで数えた会話の先頭部分の値をキャッシュし、
+  それ以降のメッセージだけをローカルで概算する（概算はcount_tokensの結果でモデルごとに補正する）
+- 概算が予算の一定割合（count_threshold）を超えた場合だけcount_tokensを呼ぶ
+- 予算を超えた場合は古いターン（ユーザーのメッセージとその応答）から省略し、
+  省略した質問の冒頭を残った最初のメッセージの先頭に要約として付ける
+- 省略したターンの添付ファイルのうち、残ったメッセージで名前が出てくるものは残す
+- 毎ターン先頭部分が変わってコンテキストキャッシュが使えなくならないよう、予算の target_ratio まで減らす
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.config import get_settings
+from app.core.metrics import REGISTRY
+from app.services.context_cache import (
+    estimate_message_tokens,
+    message_fingerprints,
+    message_text,
+)
+from common_utils.logger import logger
+
+HISTORY_TOKENS_SAVED = REGISTRY.counter(
+    "chat_history_tokens_saved_total",
+    "Prompt tokens removed from chat requests by history trimming",
+    ("model",),
+)
+HISTORY_TRIMMED_REQUESTS = REGISTRY.counter(
+    "chat_history_trimmed_requests_total", "Chat requests whose history was trimmed", ("model",)
+)
+
+# 要約に含める省略した質問の数と1件あたりの文字数
+SUMMARY_MAX_QUESTIONS = 10
+SUMMARY_PREVIEW_CHARS = 80
+
+CountTokens = Callable[[List[Dict[str, Any]]], int]
+
+
+@dataclass
+class HistoryTrimResult:
+    """調整後のメッセージと、調整前後のトークン数"""
+
+    messages: List[Dict[str, Any]]
+    original_tokens: int
+    tokens: int
+    dropped_messages: int = 0
+    kept_attachments: List[str] = field(default_factory=list)
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.original_tokens - self.tokens)
+
+
+class TokenCounter:
+    """count_tokensの結果をキャッシュし、未計測の部分をローカルで概算する"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        # 会話の先頭部分のハッシュ -> count_tokensのトークン数
+        self._exact: "OrderedDict[str, int]" = OrderedDict()
+        # モデル -> count_tokens / ローカルの概算 の比率
+        self._ratio: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def ratio(self, model: str) -> float:
+        return self._ratio.get(model, 1.0)
+
+    def estimate(self, model: str, messages: List[Dict[str, Any]], fingerprints: List[str]) -> int:
+        """計測済みの最長の先頭部分のトークン数 + 残りのメッセージの概算"""
+        base, start = 0, 0
+        with self._lock:
+            for length in range(len(messages), 0, -1):
+                exact = self._exact.get(fingerprints[length - 1])
+                if exact is not None:
+                    self._exact.move_to_end(fingerprints[length - 1])
+                    base, start = exact, length
+                    break
+        rest = sum(estimate_message_tokens(msg) for msg in messages[start:])
+        return base + int(rest * self.ratio(model))
+
+    def count(
+        self, model: str, messages: List[Dict[str, Any]], fingerprints: List[str], count_tokens: CountTokens
+    ) -> int:
+        """count_tokensで数え、結果をキャッシュしてローカルの概算を補正する（計測済みなら呼ばない）"""
+        with self._lock:
+            exact = self._exact.get(fingerprints[-1])
+        if exact is not None:
+            return exact
+        exact = count_tokens(messages)
+        estimated = sum(estimate_message_tokens(msg) for msg in messages)
+        with self._lock:
+            self._exact[fingerprints[-1]] = exact
+            while len(self._exact) > self.max_entries:
+                self._exact.popitem(last=False)
+            if estimated > 0:
+                # 直近の計測を重めにした移動平均
+                previous = self._ratio.get(model)
+                ratio = exact / estimated
+                self._ratio[model] = ratio if previous is None else previous * 0.5 + ratio * 0.5
+        return exact
+
+
+def _prepend_note(content: Any, note: str) -> Any:
+    """要約をメッセージの先頭に付ける（リスト形式の場合は画像などのパートを残したまま先頭に追加する）"""
+    if isinstance(content, str):
+        return f"{note}\n\n{content}"
+    return [{"type": "text", "text": note}] + list(content)
+
+
+def _summary_note(dropped: List[Dict[str, Any]]) -> str:
+    """省略したターンの要約（質問の冒頭を新しい順に並べる）"""
+    questions = [message_text(msg) for msg in dropped if msg.get("role") == "user"]
+    lines = [f"（以前の会話のうち{len(dropped)}件のメッセージを省略しました。省略した主な質問:"]
+    for text in reversed(questions[-SUMMARY_MAX_QUESTIONS:]):
+        text = " ".join(text.split())
+        if text:
+            lines.append(f"- {text[:SUMMARY_PREVIEW_CHARS]}{'...' if len(text) > SUMMARY_PREVIEW_CHARS else ''}")
+    lines.append("）")
+    return "\n".join(lines)
+
+
+class HistoryTrimmer:
+    """会話をモデルごとのトークン予算に収める"""
+
+    def __init__(
+        self,
+        default_budget: int,
+        model_budgets: Optional[Dict[str, int]] = None,
+        count_threshold: float = 0.8,
+        target_ratio: float = 0.75,
+        counter: Optional[TokenCounter] = None,
+    ):
+        self.default_budget = default_budget
+        self.model_budgets = model_budgets or {}
+        self.count_threshold = count_threshold
+        self.target_ratio = target_ratio
+        self.counter = counter or TokenCounter()
+
+    def budget(self, model: str) -> int:
+        return self.model_budgets.get(model, self.default_budget)
+
+    def fit(
+        self, model: str, messages: List[Dict[str, Any]], count_tokens: Optional[CountTokens] = None
+    ) -> HistoryTrimResult:
+        budget = self.budget(model)
+        if budget <= 0 or not messages:
+            return HistoryTrimResult(messages, 0, 0)
+        fingerprints = message_fingerprints(model, messages)
+        total = self.counter.estimate(model, messages, fingerprints)
+        if total > budget * self.count_threshold and count_tokens is not None:
+            try:
+                total = self.counter.count(model, messages, fingerprints, count_tokens)
+            except Exception as e:
+                logger.warning(f"count_tokensに失敗したため概算で調整します: {e}")
+        if total <= budget:
+            return HistoryTrimResult(messages, total, total)
+        return self._trim(model, messages, total, int(budget * self.target_ratio))
+
+    def _trim(
+        self, model: str, messages: List[Dict[str, Any]], total: int, target: int
+    ) -> HistoryTrimResult:
+        ratio = self.counter.ratio(model)
+        system = [msg for msg in messages if msg.get("role") == "system"]
+        turns = [msg for msg in messages if msg.get("role") != "system"]
+        # ターンの区切り（ユーザーのメッセージの位置）。最後のメッセージは必ず残す
+        starts = [i for i, msg in enumerate(turns) if msg.get("role") == "user" and i > 0]
+        starts.append(len(turns) - 1)
+        fixed = sum(estimate_message_tokens(msg) for msg in system)
+        # 後ろからの累積（start以降のメッセージの概算）
+        suffix = [0] * (len(turns) + 1)
+        for i in range(len(turns) - 1, -1, -1):
+            suffix[i] = suffix[i + 1] + estimate_message_tokens(turns[i])
+
+        result = None
+        for start in starts:
+            dropped, kept = turns[:start], turns[start:]
+            if not dropped:
+                continue
+            kept_text = "\n".join(message_text(msg) for msg in kept)
+            # 残ったメッセージで名前が出てくる添付ファイルは残す
+            carried = [
+                file
+                for msg in dropped
+                for file in (msg.get("files") or [])
+                if file.get("name") and file["name"] in kept_text
+            ]
+            note = _summary_note(dropped)
+            estimated = (
+                fixed
+                + suffix[start]
+                + estimate_message_tokens({"content": note, "files": carried})
+            )
+            tokens = int(estimated * ratio)
+            if tokens <= target or start == starts[-1]:
+                first = dict(kept[0])
+                first["content"] = _prepend_note(first.get("content", ""), note)
+                if carried:
+                    first["files"] = carried + list(first.get("files") or [])
+                result = HistoryTrimResult(
+                    system + [first] + kept[1:],
+                    total,
+                    tokens,
+                    dropped_messages=len(dropped),
+                    kept_attachments=[file["name"] for file in carried],
+                )
+                break
+        if result is None:
+            logger.warning(f"省略できる履歴がありません: {model} 約{total}トークン")
+            return HistoryTrimResult(messages, total, total)
+        if result.tokens > target:
+            logger.warning(f"履歴を省略してもトークン予算を超えています: {model} 約{result.tokens}トークン")
+
+        HISTORY_TRIMMED_REQUESTS.inc(model)
+        HISTORY_TOKENS_SAVED.inc(model, amount=result.tokens_saved)
+        logger.info(
+            f"チャット履歴を調整しました: {model} {result.dropped_messages}件省略 "
+            f"{result.original_tokens}→約{result.tokens}トークン"
+        )
+        return result
+
+
+@lru_cache(maxsize=1)
+def get_history_trimmer() -> HistoryTrimmer:
+    """プロセス全体で共有する履歴の調整（count_tokensの結果のキャッシュを共有する）"""
+    settings = get_settings()
+    return HistoryTrimmer(
+        settings.chat_history_token_budget,
+        {model: int(budget) for model, budget in json.loads(settings.chat_history_model_budgets).items()},
+        settings.chat_history_count_threshold,
+        settings.chat_history_target_ratio,
+    )
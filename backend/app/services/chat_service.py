@@ -1,50 +1,38 @@
 # サービス: chat_service.py - チャット関連のビジネスロジック
 
-import os
+import itertools
 import json
-import vertexai
-from vertexai.generative_models import GenerativeModel, GenerationConfig, Part, Content
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Callable, TYPE_CHECKING
 from common_utils.logger import logger
-from dotenv import load_dotenv
+from app.core.config import get_settings
+from app.core.metrics import instrument_upstream
+from app.core.stream_bridge import iterate_in_thread
+from app.services.model_registry import get_model_allow_list, get_model_cache
+from app.services.attachment_store import get_attachment_store, is_binary_mime_type
+from app.services.context_cache import get_context_cache
+from app.services.chat_history import HistoryTrimResult, get_history_trimmer
+from app.services.response_cache import get_response_cache, response_cache_key
+from app.services.admission import call_with_backoff, is_retryable_error
 
-# .envファイルを読み込み
-load_dotenv("./config/.env")
-develop_env_path = "./config_develop/.env.develop"
-# 開発環境の場合はdevelop_env_pathに対応する.envファイルがある
-if os.path.exists(develop_env_path):
-    load_dotenv(develop_env_path)
+# vertexaiのインポートは数秒掛かるため、最初のチャットリクエストまで遅延させる
+if TYPE_CHECKING:
+    from vertexai.generative_models import Content
 
-# 環境変数から直接取得
-GCP_PROJECT_ID = os.environ["GCP_PROJECT_ID"]
-GCP_REGION = os.environ["GCP_REGION"]
-MODELS = os.environ["MODELS"]
+# 設定の読み込み（.envの読み込みはapp.core.configで1回だけ行う）
+settings = get_settings()
 
 # モデル名からAPIキーを取得する関数
 def get_api_key_for_model(model: str) -> str:
     """モデル名からAPIキーを取得する"""
     source = model.split("/")[0] if "/" in model else model
-    return json.loads(os.environ.get("MODEL_API_KEYS", "{}")).get(source, "")
+    return json.loads(settings.model_api_keys).get(source, "")
 
-# VertexAIの初期化
-def init_vertex_ai():
-    try:
-        vertexai.init(project=GCP_PROJECT_ID, location=GCP_REGION)
-        logger.debug("VertexAI初期化完了")
-    except Exception as e:
-        logger.error(f"VertexAI初期化エラー: {str(e)}", exc_info=True)
-        raise
-
-# 初期化を1回だけ行う
-try:
-    init_vertex_ai()
-except Exception as e:
-    logger.error(f"VertexAI初期化時のエラー: {str(e)}")
-
-def prepare_messages_for_vertex(messages: List[Dict[str, Any]]) -> List[Content]:
+def prepare_messages_for_vertex(messages: List[Dict[str, Any]]) -> List["Content"]:
     """
     メッセージをVertexAI用のContent形式に変換する
     """
+    from vertexai.generative_models import Part, Content
+
     content_list = []
 
     for msg in messages:
@@ -60,6 +48,11 @@ def prepare_messages_for_vertex(messages: List[Dict[str, Any]]) -> List[Content]
             if role == "user" and msg.get("files"):
                 logger.debug(f"ファイルデータを検出: {len(msg['files'])}個のファイル")
                 for file in msg.get("files", []):
+                    # アップロード済みの添付ファイルはhashで参照する
+                    if file.get("hash"):
+                        parts.append(attachment_part(file))
+                        continue
+
                     # ファイルのMIMEタイプとデータを取得
                     mime_type = file.get("mimeType", "")
                     file_data = file.get("content", "")
@@ -146,66 +139,181 @@ def prepare_messages_for_vertex(messages: List[Dict[str, Any]]) -> List[Content]
 
     return content_list
 
+def attachment_part(file: Dict[str, Any]):
+    """hashで参照された添付ファイルをPartに変換する（GCSの画像・音声はURIのまま渡す）"""
+    from vertexai.generative_models import Part
+
+    digest = file["hash"]
+    mime_type = file.get("mimeType", "")
+    file_name = file.get("name", "不明なファイル")
+    store = get_attachment_store()
+    if is_binary_mime_type(mime_type):
+        uri = store.uri(digest)
+        if uri:
+            return Part.from_uri(uri, mime_type=mime_type)
+    data = store.get(digest)
+    if data is None:
+        raise ValueError(f"添付ファイルが見つかりません: {digest}")
+    if is_binary_mime_type(mime_type):
+        return Part.from_data(mime_type=mime_type, data=data)
+    return Part.from_text(
+        f"\n--- {file_name} ---\n{data.decode('utf-8', errors='replace')}\n--- ファイル終了 ---\n"
+    )
+
+DEFAULT_GENERATION = (0.2, 0.95, 40, 8192, True)
+
+@instrument_upstream("vertex", "count_tokens")
+def count_message_tokens(model: str, messages: List[Dict[str, Any]]) -> int:
+    """Vertex AIのcount_tokensでメッセージのトークン数を数える"""
+    gen_model = get_model_cache().get(model, DEFAULT_GENERATION)
+    return gen_model.count_tokens(prepare_messages_for_vertex(messages)).total_tokens
+
+def fit_history(model: str, messages: List[Dict[str, Any]]) -> HistoryTrimResult:
+    """
+    会話をモデルのトークン予算に収める（prepare_messages_for_vertexの前に行う）
+    省略したトークン数は戻り値のtokens_savedとメトリクスで確認できる
+    """
+    count_tokens = None
+    if model in get_model_allow_list():
+        count_tokens = lambda msgs: count_message_tokens(model, msgs)
+    return get_history_trimmer().fit(model, messages, count_tokens)
+
 def common_message_function(
-    *, model: str, messages: List[Dict[str, Any]], stream: bool = False, **kwargs
+    *,
+    model: str,
+    messages: List[Dict[str, Any]],
+    stream: bool = False,
+    trim_history: bool = True,
+    **kwargs,
 ):
     """
     VertexAI GenerativeModel経由でチャットメッセージを送信し応答を取得する
+    trim_history=Falseの場合は履歴の調整を行わない（呼び出し元でfit_historyを済ませた場合）
+    応答キャッシュにある場合はVertex AIを呼ばない（外部サービス呼び出しのメトリクスにも数えない）
     """
     try:
         # モデル検証: フロントエンドから送られてきたモデルが環境変数MODELSに含まれているか確認
-        allowed_models = MODELS.split(",")
-        # モデル名がデフォルト値でないか確認（カンマ区切りでオプション:デフォルト値の形式）
-        model_options = []
-        for model_option in allowed_models:
-            if ":" in model_option:
-                model_name, is_default = model_option.split(":", 1)
-                model_options.append(model_name.strip("{}"))
-            else:
-                model_options.append(model_option.strip("{}"))
-
-        logger.debug(
-            f"MODELS : {model_options}",
-        )
-        if model not in model_options:
+        allow_list = get_model_allow_list()
+        if model not in allow_list:
             logger.error(
-                f"指定されたモデル '{model}' は許可されていません。許可モデル: {model_options}"
+                f"指定されたモデル '{model}' は許可されていません。許可モデル: {list(allow_list.models)}"
             )
             raise ValueError(f"指定されたモデル '{model}' は許可されていません。")
 
-        # メッセージをVertexAI用に変換
-        content_list = prepare_messages_for_vertex(messages)
-
-        # モデルインスタンスの取得
-        gen_model = GenerativeModel(model_name=model)
-
-        # 生成設定
-        generation_config = GenerationConfig(
-            temperature=kwargs.get("temperature", 0.2),
-            top_p=kwargs.get("top_p", 0.95),
-            top_k=kwargs.get("top_k", 40),
-            max_output_tokens=kwargs.get("max_tokens", 8192),
-            audio_timestamp=kwargs.get(
-                "audio_timestamp", True
-            ),  # 音声タイムスタンプを有効化
+        # 会話をトークン予算に収める
+        if trim_history:
+            messages = fit_history(model, messages).messages
+
+        generation = (
+            kwargs.get("temperature", 0.2),
+            kwargs.get("top_p", 0.95),
+            kwargs.get("top_k", 40),
+            kwargs.get("max_tokens", 8192),
+            kwargs.get("audio_timestamp", True),  # 音声タイムスタンプを有効化
         )
 
-        if stream:
-            def chat_stream():
-                response_stream = gen_model.generate_content(
-                    content_list, generation_config=generation_config, stream=True
-                )
+        # 決定的な（temperatureの低い）リクエストは保存済みの応答を返す
+        response_cache = get_response_cache()
+        cache_key = None
+        if response_cache is not None and generation[0] <= settings.chat_response_cache_max_temperature:
+            cache_key = response_cache_key(model, generation, messages)
+            cached_chunks = response_cache.get(cache_key)
+            if cached_chunks is not None:
+                logger.debug(f"応答キャッシュを使います: {model} {cache_key[:16]}")
+                # 受け取った時と同じチャンクの区切りでストリーミングする
+                return iter(cached_chunks) if stream else "".join(cached_chunks)
 
-                for response in response_stream:
-                    # レスポンスから生成されたテキストを抽出
-                    yield response.text if response.text else ""
+        def store(chunks: List[str]) -> None:
+            # 最後まで受け取れた応答だけを保存する
+            if cache_key is not None:
+                response_cache.put(cache_key, chunks)
 
-            return chat_stream()
-        else:
-            response = gen_model.generate_content(
-                content_list, generation_config=generation_config
-            )
-            return response.text
+        return _generate_content(model, messages, generation, stream, store)
     except Exception as e:
         logger.error(f"メッセージ生成エラー: {str(e)}", exc_info=True)
-        raise
\ No newline at end of file
+        raise
+
+
+@instrument_upstream("vertex", "generate_content")
+def _generate_content(
+    model: str,
+    messages: List[Dict[str, Any]],
+    generation: tuple,
+    stream: bool,
+    store: Callable[[List[str]], None],
+):
+    """Vertex AIのgenerate_contentを呼び出す（受け取った応答はstoreに渡す）"""
+    # 会話の先頭部分がコンテキストキャッシュにあれば、キャッシュ以降のメッセージだけを送る
+    plan = None
+    if settings.chat_context_cache:
+        plan = get_context_cache().plan(model, messages, prepare_messages_for_vertex)
+
+    def request_args(use_cache: bool):
+        # モデルインスタンスの取得（モデル名と生成設定ごとに再利用する）
+        if use_cache:
+            gen_model = get_model_cache().get(model, generation, plan.cached_content)
+            return gen_model, prepare_messages_for_vertex(messages[plan.prefix_length:])
+        return get_model_cache().get(model, generation), prepare_messages_for_vertex(messages)
+
+    def fallback(e: Exception):
+        # キャッシュが期限切れ・削除済みの場合は全てのメッセージを送り直す
+        logger.warning(f"コンテキストキャッシュを使わずに再送します: {e}")
+        get_context_cache().invalidate(plan.fingerprint)
+        return request_args(False)
+
+    gen_model, content_list = request_args(plan is not None)
+
+    if stream:
+        def chat_stream():
+            nonlocal gen_model, content_list
+
+            def start():
+                # 最初のチャンクまでは429/503を再試行できる（以降は応答の途中のため再試行しない）
+                response_stream = iter(gen_model.generate_content(content_list, stream=True))
+                return response_stream, next(response_stream, None)
+
+            try:
+                response_stream, first = call_with_backoff(start, "generate_content")
+            except Exception as e:
+                if plan is None or is_retryable_error(e):
+                    raise
+                gen_model, content_list = fallback(e)
+                response_stream, first = call_with_backoff(start, "generate_content")
+            if first is None:
+                return
+
+            chunks = []
+            for response in itertools.chain([first], response_stream):
+                # レスポンスから生成されたテキストを抽出
+                text = response.text if response.text else ""
+                chunks.append(text)
+                yield text
+            store(chunks)
+
+        return chat_stream()
+
+    try:
+        response = call_with_backoff(
+            lambda: gen_model.generate_content(content_list), "generate_content"
+        )
+    except Exception as e:
+        if plan is None or is_retryable_error(e):
+            raise
+        gen_model, content_list = fallback(e)
+        response = call_with_backoff(
+            lambda: gen_model.generate_content(content_list), "generate_content"
+        )
+    store([response.text])
+    return response.text
+
+async def stream_message_async(
+    *, model: str, messages: List[Dict[str, Any]], **kwargs
+) -> AsyncIterator[str]:
+    """
+    common_message_function(stream=True) のチャンクを非同期に返す
+    Vertex AIへの接続・応答の読み込みは専用スレッドで行い、イベントループをブロックしない
+    """
+    async for chunk in iterate_in_thread(
+        lambda: common_message_function(model=model, messages=messages, stream=True, **kwargs)
+    ):
+        yield chunk
@@ -0,0 +1,245 @@
+"""
+チャットリクエストの分割アップロード
+
+ChatRequest の chunked / chunkId / chunkIndex / totalChunks / chunkData で、
+1つのチャットリクエスト（messagesとmodelのJSON）を複数のリクエストに分けて送る。
+- 各チャンク（base64）はデコードしてディスクに書き出し、メモリには溜めない
+- チャンクは順不同で受け付け、chunkChecksum（SHA-256）が指定されていれば検証する
+- 全チャンクが揃った時点で1度だけ結合し、結合したファイルからリクエストを読み込む
+- 一定時間更新の無いアップロード（中断されたもの）は定期的に削除する
+結合したリクエストはJSONとして読み込むため、base64の添付ファイルも含めて全体がワーカーのメモリに載る。
+そのため受信したチャンクの合計サイズを max_total_bytes（CHAT_CHUNK_MAX_TOTAL_BYTES）までに制限し、超えた場合は413にする。
+大きな添付ファイルは /chat/attachments で先にアップロードし、messagesにはhashだけを載せる。
+"""
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from app.core.config import get_settings
+from common_utils.logger import logger
+
+CHUNK_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+META_FILE = "meta.json"
+ASSEMBLED_FILE = "assembled.json"
+# 結合処理中であることを示すディレクトリ（mkdirが成功した1リクエストだけが結合する）
+ASSEMBLING_MARKER = ".assembling"
+
+
+class ChunkUploadError(Exception):
+    """分割アップロードの不正なリクエスト（status_codeでHTTPステータスを表す）"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass
+class ChunkStatus:
+    chunk_id: str
+    received: int
+    total: int
+    # 全チャンクが揃い、このリクエストで結合したファイルのパス
+    assembled_path: Optional[str] = None
+
+
+class ChunkedUploadStore:
+    """チャンクをディスクに書き出し、揃ったら結合する"""
+
+    def __init__(
+        self,
+        directory: str,
+        ttl_seconds: int,
+        max_chunk_bytes: int,
+        max_chunks: int,
+        max_total_bytes: int,
+    ):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_chunk_bytes = max_chunk_bytes
+        self.max_chunks = max_chunks
+        self.max_total_bytes = max_total_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _upload_dir(self, chunk_id: str) -> str:
+        return os.path.join(self.directory, chunk_id)
+
+    def _part_path(self, chunk_id: str, index: int) -> str:
+        return os.path.join(self._upload_dir(chunk_id), f"{index:06d}.part")
+
+    def _load_or_create_meta(self, chunk_id: str, total: int, owner: str) -> Dict[str, Any]:
+        upload_dir = self._upload_dir(chunk_id)
+        meta_path = os.path.join(upload_dir, META_FILE)
+        os.makedirs(upload_dir, exist_ok=True)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            meta = {"total": total, "owner": owner, "created_at": time.time()}
+            temp_path = f"{meta_path}.{os.getpid()}.{time.monotonic_ns()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            try:
+                # 同時に最初のチャンクが届いた場合は先に作成されたメタデータを使う
+                os.link(temp_path, meta_path)
+            except FileExistsError:
+                with open(meta_path, encoding="utf-8") as f:
+                    meta = json.load(f)
+            finally:
+                os.remove(temp_path)
+        if meta["owner"] != owner:
+            raise ChunkUploadError("他のユーザーのアップロードです", status_code=403)
+        if meta["total"] != total:
+            raise ChunkUploadError("totalChunksが最初のチャンクと一致しません")
+        return meta
+
+    def save_chunk(
+        self,
+        chunk_id: str,
+        index: int,
+        total: int,
+        chunk_data: str,
+        owner: str,
+        checksum: Optional[str] = None,
+    ) -> ChunkStatus:
+        """チャンクを保存し、全チャンクが揃っていれば結合する"""
+        if not CHUNK_ID_PATTERN.match(chunk_id or ""):
+            raise ChunkUploadError("chunkIdが不正です")
+        if not 0 < total <= self.max_chunks or not 0 <= index < total:
+            raise ChunkUploadError("chunkIndexまたはtotalChunksが不正です")
+        try:
+            data = base64.b64decode(chunk_data or "", validate=True)
+        except (binascii.Error, ValueError):
+            raise ChunkUploadError("chunkDataのbase64が不正です")
+        if len(data) > self.max_chunk_bytes:
+            raise ChunkUploadError("チャンクが大きすぎます", status_code=413)
+        if checksum and hashlib.sha256(data).hexdigest() != checksum.lower():
+            raise ChunkUploadError(f"チャンク{index}のチェックサムが一致しません")
+
+        self._load_or_create_meta(chunk_id, total, owner)
+        if self.received_bytes(chunk_id, exclude_index=index) + len(data) > self.max_total_bytes:
+            self.discard(chunk_id)
+            raise ChunkUploadError("分割アップロードの合計サイズが大きすぎます", status_code=413)
+        part_path = self._part_path(chunk_id, index)
+        temp_path = f"{part_path}.{os.getpid()}.{time.monotonic_ns()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        # 同じチャンクの再送は上書きする
+        os.replace(temp_path, part_path)
+        # 最終更新日時（期限切れの判定に使う）
+        os.utime(self._upload_dir(chunk_id))
+
+        received = self.received_count(chunk_id)
+        status = ChunkStatus(chunk_id=chunk_id, received=received, total=total)
+        if received == total:
+            status.assembled_path = self._assemble(chunk_id, total)
+        return status
+
+    def received_count(self, chunk_id: str) -> int:
+        try:
+            return sum(1 for name in os.listdir(self._upload_dir(chunk_id)) if name.endswith(".part"))
+        except FileNotFoundError:
+            return 0
+
+    def received_bytes(self, chunk_id: str, exclude_index: Optional[int] = None) -> int:
+        """受信済みのチャンクの合計サイズ（exclude_indexのチャンクは再送で上書きされるため除く）"""
+        excluded = f"{exclude_index:06d}.part" if exclude_index is not None else None
+        total = 0
+        try:
+            with os.scandir(self._upload_dir(chunk_id)) as it:
+                for entry in it:
+                    if entry.name.endswith(".part") and entry.name != excluded:
+                        try:
+                            total += entry.stat().st_size
+                        except FileNotFoundError:
+                            continue
+        except FileNotFoundError:
+            return 0
+        return total
+
+    def _assemble(self, chunk_id: str, total: int) -> Optional[str]:
+        """チャンクを順番に1つのファイルへ結合する（他のリクエストが結合中ならNone）"""
+        upload_dir = self._upload_dir(chunk_id)
+        try:
+            os.mkdir(os.path.join(upload_dir, ASSEMBLING_MARKER))
+        except FileExistsError:
+            return None
+        assembled_path = os.path.join(upload_dir, ASSEMBLED_FILE)
+        with open(assembled_path, "wb") as out:
+            for index in range(total):
+                part_path = self._part_path(chunk_id, index)
+                with open(part_path, "rb") as part:
+                    shutil.copyfileobj(part, out)
+                os.remove(part_path)
+        logger.debug(f"分割アップロードを結合しました: {chunk_id} ({total}チャンク)")
+        return assembled_path
+
+    def discard(self, chunk_id: str) -> None:
+        shutil.rmtree(self._upload_dir(chunk_id), ignore_errors=True)
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """ttl_seconds以上更新の無いアップロードを削除し、削除した件数を返す"""
+        now = time.time() if now is None else now
+        purged = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.stat(path).st_mtime < self.ttl_seconds:
+                    continue
+            except FileNotFoundError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            purged += 1
+        if purged:
+            logger.info(f"期限切れの分割アップロードを{purged}件削除しました")
+        return purged
+
+
+def load_assembled_request(store: ChunkedUploadStore, status: ChunkStatus) -> Dict[str, Any]:
+    """
+    結合したファイルからチャットリクエストを読み込み、アップロードを削除する
+    全体をメモリに読み込むため、同時に受信したチャンクで上限を超えていた場合はここでも413にする
+    """
+    try:
+        if os.path.getsize(status.assembled_path) > store.max_total_bytes:
+            raise ChunkUploadError("分割アップロードの合計サイズが大きすぎます", status_code=413)
+        with open(status.assembled_path, "rb") as f:
+            payload = json.load(f)
+    except ValueError:
+        raise ChunkUploadError("結合したリクエストがJSONとして不正です")
+    finally:
+        store.discard(status.chunk_id)
+    if not isinstance(payload, dict):
+        raise ChunkUploadError("結合したリクエストがJSONオブジェクトではありません")
+    return payload
+
+
+@lru_cache(maxsize=1)
+def get_chunked_upload_store() -> ChunkedUploadStore:
+    settings = get_settings()
+    return ChunkedUploadStore(
+        settings.chat_chunk_dir,
+        settings.chat_chunk_ttl_seconds,
+        settings.chat_chunk_max_bytes,
+        settings.chat_chunk_max_count,
+        settings.chat_chunk_max_total_bytes,
+    )
+
+
+async def purge_expired_uploads_periodically(interval_seconds: float) -> None:
+    """lifespanからタスクとして起動し、中断された分割アップロードを削除する"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await asyncio.to_thread(get_chunked_upload_store().purge_expired)
+        except Exception as e:
+            logger.warning(f"分割アップロードの削除に失敗しました: {e}")
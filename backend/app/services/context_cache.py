@@ -0,0 +1,299 @@
+"""
+Vertex AIのコンテキストキャッシュ（CachedContent）
+
+会話のうち変わらない先頭部分（systemメッセージ・添付ファイル・過去のターン）を
+CachedContentとして1度だけ作成し、以降のターンはキャッシュと差分のメッセージだけを送る。
+- メッセージのハッシュを先頭から連鎖させた値をキーとし、一致する最長の先頭部分のキャッシュを使う
+- キャッシュの作成は応答を待たせないようバックグラウンドで行い、次のターンから使う
+- キャッシュされていない部分がmin_tokensを超えたら、より長い先頭部分のキャッシュを作成する
+- 有効期限（ttl_seconds）の残りが少ないキャッシュは使う時に延長し、上限件数を超えたら古いものから削除する
+- 作成できないモデル（キャッシュ非対応・トークン数不足など）は一定時間キャッシュを使わない
+  （429/503などの一時的なエラーはその回の作成だけを見送る）
+キャッシュの一覧はプロセスごとに保持する（複数ワーカーでは同じ先頭部分を別々にキャッシュすることがある）
+"""
+
+import datetime
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.config import get_settings
+from app.core.executors import lazy_executor
+from app.core.metrics import REGISTRY, upstream_timer
+from app.services.admission import is_retryable_error
+from common_utils.logger import logger
+
+CONTEXT_CACHE_EVENTS = REGISTRY.counter(
+    "chat_context_cache_events_total",
+    "Vertex AI context cache lookups and lifecycle events",
+    ("event",),
+)
+
+# 画像1枚あたりのトークン数（Geminiの固定値）
+IMAGE_TOKENS = 258
+
+# キャッシュを作成できないモデル・内容を表すエラー
+# （InvalidArgument・FailedPrecondition（最小トークン数の不足など）は400、NotFoundは404）
+UNSUPPORTED_STATUS_CODES = (400, 404)
+
+
+def message_fingerprints(model: str, messages: List[Dict[str, Any]]) -> List[str]:
+    """i番目の値が messages[: i + 1] の先頭部分を表すハッシュの連鎖"""
+    fingerprints = []
+    current = hashlib.sha256(model.encode("utf-8")).hexdigest()
+    for msg in messages:
+        digest = hashlib.sha256(current.encode("ascii"))
+        digest.update(json.dumps(msg, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+        current = digest.hexdigest()
+        fingerprints.append(current)
+    return fingerprints
+
+
+def estimate_text_tokens(text: str) -> int:
+    """英数字は4文字、それ以外（日本語など）は1文字を1トークンとして概算する"""
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return ascii_chars // 4 + (len(text) - ascii_chars)
+
+
+def message_text(msg: Dict[str, Any]) -> str:
+    """メッセージの本文（リスト形式の場合はテキストのパートだけをつなげる）"""
+    content = msg.get("content", "")
+    if isinstance(content, str):
+        return content
+    return " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+
+
+def _is_unsupported_error(error: BaseException) -> bool:
+    """キャッシュ非対応のモデル・トークン数不足など、再試行しても作成できないエラー"""
+    if is_retryable_error(error):
+        return False
+    try:
+        return int(getattr(error, "code", 0) or 0) in UNSUPPORTED_STATUS_CODES
+    except (TypeError, ValueError):
+        return False
+
+
+def estimate_message_tokens(msg: Dict[str, Any]) -> int:
+    """メッセージ（本文と添付ファイル）のトークン数の概算"""
+    content = msg.get("content", "")
+    if isinstance(content, str):
+        tokens = estimate_text_tokens(content)
+    else:
+        tokens = sum(
+            estimate_text_tokens(part.get("text", "")) if part.get("type") == "text" else IMAGE_TOKENS
+            for part in content
+        )
+    for file in msg.get("files") or []:
+        mime_type = file.get("mimeType", "")
+        if mime_type.startswith("image/"):
+            tokens += IMAGE_TOKENS
+        elif file.get("hash") or mime_type.startswith("audio/"):
+            # hash参照の添付ファイルと音声はサイズから概算する
+            tokens += int(file.get("size") or len(file.get("content", ""))) // 4
+        else:
+            tokens += estimate_text_tokens(file.get("content", ""))
+    return tokens
+
+
+def _create_cached_content(
+    model: str, system_instruction: Optional[str], contents: List[Any], ttl_seconds: int, display_name: str
+) -> Any:
+    from vertexai.preview import caching
+
+    with upstream_timer("vertex", "create_cached_content"):
+        return caching.CachedContent.create(
+            model_name=model,
+            system_instruction=system_instruction,
+            contents=contents,
+            ttl=datetime.timedelta(seconds=ttl_seconds),
+            display_name=display_name,
+        )
+
+
+@dataclass
+class _CacheEntry:
+    cached_content: Any
+    prefix_length: int
+    tokens: int
+    expires_at: float
+
+
+@dataclass
+class ContextCachePlan:
+    """リクエストで使うキャッシュと、キャッシュに含まれる先頭のメッセージ数"""
+
+    cached_content: Any
+    prefix_length: int
+    fingerprint: str
+
+
+class ContextCacheManager:
+    """会話の先頭部分のCachedContentを作成・再利用・延長・削除する"""
+
+    def __init__(
+        self,
+        ttl_seconds: int,
+        min_tokens: int,
+        max_entries: int = 256,
+        unsupported_retry_seconds: float = 3600.0,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.max_entries = max_entries
+        self.unsupported_retry_seconds = unsupported_retry_seconds
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._creating: set = set()
+        # キャッシュの作成に失敗したモデル -> 再試行できる時刻
+        self._unsupported: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="context-cache")
+
+    def plan(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        build_contents: Callable[[List[Dict[str, Any]]], List[Any]],
+    ) -> Optional[ContextCachePlan]:
+        """
+        使えるキャッシュを返す（無ければNone）
+        最後のメッセージを除いた先頭部分がキャッシュより十分に長ければ、次のターン用にキャッシュを作成する
+        """
+        if len(messages) < 2:
+            return None
+        prefix = messages[:-1]
+        tokens = sum(estimate_message_tokens(msg) for msg in prefix)
+        # キャッシュが1件も無く、作成もしない場合はハッシュを計算しない
+        if not self._entries and tokens < self.min_tokens:
+            return None
+        fingerprints = message_fingerprints(model, messages)
+        now = time.monotonic()
+        plan = None
+        cached_tokens = 0
+        with self._lock:
+            for fingerprint in [f for f, e in self._entries.items() if e.expires_at <= now]:
+                del self._entries[fingerprint]
+                CONTEXT_CACHE_EVENTS.inc("expired")
+            for prefix_length in range(len(messages) - 1, 0, -1):
+                entry = self._entries.get(fingerprints[prefix_length - 1])
+                if entry is not None:
+                    self._entries.move_to_end(fingerprints[prefix_length - 1])
+                    plan = ContextCachePlan(
+                        entry.cached_content, prefix_length, fingerprints[prefix_length - 1]
+                    )
+                    cached_tokens = entry.tokens
+                    break
+            retry_at = self._unsupported.get(model, 0.0)
+        CONTEXT_CACHE_EVENTS.inc("hit" if plan else "miss")
+        if plan is not None:
+            self._extend_if_expiring(plan.fingerprint, now)
+
+        target = fingerprints[len(prefix) - 1]
+        if retry_at > now or (plan is not None and plan.fingerprint == target):
+            return plan
+        if tokens >= self.min_tokens and tokens - cached_tokens >= self.min_tokens:
+            with self._lock:
+                if target in self._creating:
+                    return plan
+                self._creating.add(target)
+            self._executor.submit(self._create, model, prefix, target, tokens, build_contents)
+        return plan
+
+    def _create(
+        self,
+        model: str,
+        prefix: List[Dict[str, Any]],
+        fingerprint: str,
+        tokens: int,
+        build_contents: Callable[[List[Dict[str, Any]]], List[Any]],
+    ) -> None:
+        try:
+            system = "\n".join(message_text(msg) for msg in prefix if msg.get("role") == "system")
+            contents = build_contents([msg for msg in prefix if msg.get("role") != "system"])
+            cached_content = _create_cached_content(
+                model, system or None, contents, self.ttl_seconds, f"chat-{fingerprint[:16]}"
+            )
+        except Exception as e:
+            CONTEXT_CACHE_EVENTS.inc("create_failed")
+            if not _is_unsupported_error(e):
+                # 429/503などの一時的なエラーは今回の作成だけを見送る（次のターンで再び作成する）
+                logger.warning(f"コンテキストキャッシュの作成を見送りました（{model}）: {e}")
+                return
+            logger.warning(f"コンテキストキャッシュを作成できないモデルです（{model}）: {e}")
+            with self._lock:
+                self._unsupported[model] = time.monotonic() + self.unsupported_retry_seconds
+            return
+        finally:
+            with self._lock:
+                self._creating.discard(fingerprint)
+
+        CONTEXT_CACHE_EVENTS.inc("created")
+        logger.debug(f"コンテキストキャッシュを作成しました: {model} {len(prefix)}件 約{tokens}トークン")
+        with self._lock:
+            self._entries[fingerprint] = _CacheEntry(
+                cached_content, len(prefix), tokens, time.monotonic() + self.ttl_seconds
+            )
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[1].cached_content)
+        for cached_content in evicted:
+            self._delete(cached_content)
+
+    def _extend_if_expiring(self, fingerprint: str, now: float) -> None:
+        """有効期限の残りが1/4を切ったキャッシュを延長する"""
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None or entry.expires_at - now > self.ttl_seconds / 4:
+                return
+            # 延長中に他のリクエストが重ねて延長しないよう、先に期限を更新する
+            entry.expires_at = now + self.ttl_seconds
+
+        def extend() -> None:
+            try:
+                with upstream_timer("vertex", "update_cached_content"):
+                    entry.cached_content.update(ttl=datetime.timedelta(seconds=self.ttl_seconds))
+                CONTEXT_CACHE_EVENTS.inc("extended")
+            except Exception as e:
+                logger.warning(f"コンテキストキャッシュを延長できませんでした: {e}")
+                self.invalidate(fingerprint)
+
+        self._executor.submit(extend)
+
+    def _delete(self, cached_content: Any) -> None:
+        def delete() -> None:
+            try:
+                with upstream_timer("vertex", "delete_cached_content"):
+                    cached_content.delete()
+                CONTEXT_CACHE_EVENTS.inc("deleted")
+            except Exception as e:
+                logger.debug(f"コンテキストキャッシュの削除に失敗しました: {e}")
+
+        self._executor.submit(delete)
+
+    def invalidate(self, fingerprint: str) -> None:
+        """使えなくなったキャッシュ（期限切れ・削除済み）を一覧から外す"""
+        with self._lock:
+            self._entries.pop(fingerprint, None)
+        CONTEXT_CACHE_EVENTS.inc("invalidated")
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _create_context_cache() -> ContextCacheManager:
+    """プロセス全体で共有するコンテキストキャッシュ（作成・延長・削除を行うスレッドプールを持つ）"""
+    settings = get_settings()
+    return ContextCacheManager(
+        settings.chat_context_cache_ttl_seconds,
+        settings.chat_context_cache_min_tokens,
+        settings.chat_context_cache_max_entries,
+    )
+
+
+get_context_cache, shutdown_context_cache = lazy_executor(
+    _create_context_cache, close=ContextCacheManager.shutdown
+)
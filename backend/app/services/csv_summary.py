@@ -0,0 +1,111 @@
+"""
+チャットのCSV添付ファイルの要約
+
+chat_csv_summary_chars 文字を超えるCSVは、全体をプロンプトに含める代わりに
+app.utils.csv_analyzer の要約（列のスキーマ・統計と先頭のサンプル）に置き換えてVertex AIに送る。
+- 分析はワーカースレッドで行い、イベントループをブロックしない
+- 要約は内容のSHA-256をキーにメモリ上のLRUに保持し、会話の各ターンで同じCSVを分析し直さない
+小さいCSVは全体をそのまま送る。
+"""
+
+import asyncio
+import hashlib
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import get_settings
+from app.core.metrics import REGISTRY
+from app.services.attachment_store import BytesLruCache, get_attachment_store
+from app.utils.csv_analyzer import analyze_csv, format_csv_summary
+from common_utils.logger import logger
+
+CSV_MIME_TYPES = frozenset({"text/csv", "application/csv"})
+# 要約が1件あたり数KBのため、保持するサイズは小さくてよい
+SUMMARY_CACHE_BYTES = 8 * 1024 * 1024
+
+CSV_CHARS_SAVED = REGISTRY.counter(
+    "chat_csv_summary_chars_saved_total", "Characters of CSV attachments replaced by a summary"
+)
+
+
+@lru_cache(maxsize=1)
+def get_csv_summary_cache() -> BytesLruCache:
+    """CSVのSHA-256 -> 要約のテキスト（UTF-8）"""
+    return BytesLruCache(SUMMARY_CACHE_BYTES)
+
+
+def is_csv_file(file: Dict[str, Any]) -> bool:
+    name = file.get("name", "") or ""
+    return file.get("mimeType", "").lower() in CSV_MIME_TYPES or name.lower().endswith(".csv")
+
+
+def summarize_csv(content: str) -> str:
+    """CSVの要約を作る（同期。結果はSHA-256ごとに再利用する）"""
+    key = hashlib.sha256(content.encode("utf-8", errors="replace")).hexdigest()
+    cache = get_csv_summary_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        return cached.decode("utf-8")
+    settings = get_settings()
+    summary = format_csv_summary(
+        analyze_csv(content, settings.chat_csv_sample_rows, settings.chat_csv_chunk_rows)
+    )
+    cache.put(key, summary.encode("utf-8"))
+    CSV_CHARS_SAVED.inc(amount=max(0, len(content) - len(summary)))
+    logger.debug(f"CSVを要約しました: {len(content):,}文字 → {len(summary):,}文字")
+    return summary
+
+
+def _summarize_or_none(content: str) -> Optional[str]:
+    if len(content) <= get_settings().chat_csv_summary_chars:
+        return None
+    try:
+        return summarize_csv(content)
+    except Exception as e:
+        # 解析できないCSVはそのまま送る
+        logger.warning(f"CSVを要約できませんでした: {e}")
+        return None
+
+
+def summarize_csv_if_large(content: str) -> str:
+    """chat_csv_summary_charsを超えるCSVは要約を、それ以外（要約できない場合を含む）はそのまま返す"""
+    return _summarize_or_none(content) or content
+
+
+async def _summarize_file(file: Dict[str, Any]) -> Optional[str]:
+    if file.get("hash"):
+        data = await asyncio.to_thread(get_attachment_store().get, file["hash"])
+        if data is None:
+            # 見つからないファイルはVertex AIへの変換時にエラーにする
+            return None
+        return await asyncio.to_thread(
+            lambda: _summarize_or_none(data.decode("utf-8", errors="replace"))
+        )
+    return await asyncio.to_thread(_summarize_or_none, file["content"])
+
+
+def _csv_files(messages: List[Dict[str, Any]]) -> List[Tuple[int, int, Dict[str, Any]]]:
+    return [
+        (i, j, file)
+        for i, msg in enumerate(messages)
+        for j, file in enumerate(msg.get("files") or [])
+        if isinstance(file, dict)
+        and (file.get("hash") or isinstance(file.get("content"), str))
+        and is_csv_file(file)
+    ]
+
+
+async def summarize_message_csvs(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """メッセージのfilesに含まれる大きなCSVを要約に置き換える（元のメッセージは変更しない）"""
+    targets = _csv_files(messages)
+    if not targets:
+        return messages
+    summaries = await asyncio.gather(*(_summarize_file(file) for _, _, file in targets))
+    if not any(summaries):
+        return messages
+    summarized = [dict(msg, files=list(msg["files"])) if msg.get("files") else msg for msg in messages]
+    for (i, j, file), summary in zip(targets, summaries):
+        if summary is not None:
+            replaced = {k: v for k, v in file.items() if k != "hash"}
+            summarized[i]["files"][j] = dict(replaced, content=summary)
+    return summarized
@@ -0,0 +1,143 @@
+"""
+チャットのWord（DOCX）添付ファイルのテキスト抽出
+
+DOCXの内容（base64・data URL、またはhashで参照するアップロード済みの添付ファイル）が届いた場合に、
+本文をテキストに置き換えてからVertex AIに送る。
+- 一時ファイルを使わず、メモリ上のZIPをそのまま解析する（file_utils.extract_docx_text）
+- 解析はCPUを使うため、上限付きのProcessPoolExecutorで複数のファイルを並列に処理する
+- 抽出したテキストは内容のSHA-256をキーにメモリ上のLRUに保持し、同じファイルは1回だけ解析する
+  （会話の各ターンで同じファイルが送られても、1ターンに同じファイルが複数あっても解析は1回）
+クライアントで抽出済みのテキストはそのまま送る。
+"""
+
+import asyncio
+import base64
+import binascii
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+
+from app.core.config import get_settings
+from app.core.executors import lazy_executor, worker_process_pool
+from app.services.attachment_store import BytesLruCache, attachment_hash, get_attachment_store
+from app.utils.file_utils import extract_docx_text
+from common_utils.logger import logger
+
+DOCX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+# ZIPのローカルファイルヘッダー（"PK\x03\x04"）と、そのbase64表現
+ZIP_SIGNATURE = b"PK\x03\x04"
+ZIP_SIGNATURE_BASE64 = "UEsDB"
+DOCX_EXTRACTION_ERROR = "[DOCX text extraction error]"
+
+
+def _create_document_executor() -> ProcessPoolExecutor:
+    """DOCXのテキスト抽出に使うプロセスプール（プロセス全体で共有する）"""
+    return worker_process_pool(get_settings().chat_document_workers)
+
+
+get_document_executor, shutdown_document_executor = lazy_executor(_create_document_executor)
+
+
+@lru_cache(maxsize=1)
+def get_document_text_cache() -> BytesLruCache:
+    """DOCXのSHA-256 -> 抽出したテキスト（UTF-8）"""
+    return BytesLruCache(get_settings().chat_document_cache_bytes)
+
+
+def is_docx_file(file: Dict[str, Any]) -> bool:
+    name = file.get("name", "") or ""
+    return file.get("mimeType", "") == DOCX_MIME_TYPE or name.lower().endswith(".docx")
+
+
+def decode_docx_content(content: str) -> Optional[bytes]:
+    """
+    filesのcontentがDOCXの本体（data URLまたはbase64）であればバイト列を返す
+    クライアントで抽出済みのテキストの場合はNone
+    """
+    if content.startswith("data:") and "," in content:
+        header, content = content.split(",", 1)
+        if ";base64" not in header:
+            return None
+    elif not content.startswith(ZIP_SIGNATURE_BASE64):
+        return None
+    try:
+        data = base64.b64decode(content, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return data if data.startswith(ZIP_SIGNATURE) else None
+
+
+async def extract_docx(data: bytes, digest: Optional[str] = None) -> str:
+    """DOCXのテキストを抽出する（結果はSHA-256ごとに再利用する）"""
+    key = digest or attachment_hash(data)
+    cache = get_document_text_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        return cached.decode("utf-8")
+    loop = asyncio.get_running_loop()
+    try:
+        text = await loop.run_in_executor(get_document_executor(), extract_docx_text, data)
+    except Exception as e:
+        # 壊れたファイルはエラーの表示に置き換える（キャッシュしない）
+        logger.error("DOCXテキスト抽出エラー: %s", str(e), exc_info=True)
+        return DOCX_EXTRACTION_ERROR
+    logger.debug(f"DOCXのテキストを抽出しました: {len(data) // 1024}KB → {len(text)}文字")
+    cache.put(key, text.encode("utf-8"))
+    return text
+
+
+def _docx_files(messages: List[Dict[str, Any]]) -> List[Tuple[int, int, Dict[str, Any]]]:
+    return [
+        (i, j, file)
+        for i, msg in enumerate(messages)
+        for j, file in enumerate(msg.get("files") or [])
+        if isinstance(file, dict) and (file.get("content") or file.get("hash")) and is_docx_file(file)
+    ]
+
+
+async def _load_docx(file: Dict[str, Any]) -> Tuple[Optional[str], Optional[bytes]]:
+    """(SHA-256, DOCXの本体) を返す（抽出済みのテキストの場合は本体がNone）"""
+    if file.get("hash"):
+        digest = file["hash"]
+        if get_document_text_cache().get(digest) is not None:
+            # 抽出済み（extract_docxはキャッシュから返すため本体は読み込まない）
+            return digest, b""
+        stored = await asyncio.to_thread(get_attachment_store().get, digest)
+        if stored is None:
+            # 見つからないファイルはVertex AIへの変換時にエラーにする
+            return None, None
+        if stored.startswith(ZIP_SIGNATURE):
+            return digest, stored
+        # テキストの添付ファイルとして保存されたdata URL・base64
+        data = decode_docx_content(stored.decode("utf-8", errors="replace"))
+        return (digest, data) if data is not None else (None, None)
+    data = await asyncio.to_thread(decode_docx_content, file["content"])
+    if data is None:
+        return None, None
+    return await asyncio.to_thread(attachment_hash, data), data
+
+
+async def extract_message_documents(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    メッセージのfilesに含まれるDOCXの本体を抽出したテキストに置き換える（元のメッセージは変更しない）
+    同じ内容のファイルは1回だけ解析し、異なるファイルはプロセスプールで並列に解析する
+    """
+    targets = _docx_files(messages)
+    if not targets:
+        return messages
+    loaded = await asyncio.gather(*(_load_docx(file) for _, _, file in targets))
+
+    extractions: Dict[str, Awaitable[str]] = {}
+    for digest, data in loaded:
+        if data is not None and digest not in extractions:
+            extractions[digest] = extract_docx(data, digest)
+    if not extractions:
+        return messages
+    texts = dict(zip(extractions, await asyncio.gather(*extractions.values())))
+
+    extracted = [dict(msg, files=list(msg["files"])) if msg.get("files") else msg for msg in messages]
+    for (i, j, file), (digest, _) in zip(targets, loaded):
+        if digest in texts:
+            replaced = {k: v for k, v in file.items() if k != "hash"}
+            extracted[i]["files"][j] = dict(replaced, content=texts[digest], mimeType=DOCX_MIME_TYPE)
+    return extracted
@@ -5,24 +5,21 @@ import base64
 import json
 from typing import Dict, Any, Optional, Tuple, List
 import asyncio
-from google.cloud import secretmanager
 from common_utils.logger import logger
 from app.utils.maps import get_coordinates, get_address, get_static_map, get_street_view
-from dotenv import load_dotenv
+from app.core.config import get_settings
+from app.core.metrics import instrument_upstream
 
-# .envファイルを読み込み
-load_dotenv("./config/.env")
-develop_env_path = "./config_develop/.env.develop"
-# 開発環境の場合はdevelop_env_pathに対応する.envファイルがある
-if os.path.exists(develop_env_path):
-    load_dotenv(develop_env_path)
+# 設定の読み込み（.envの読み込みはapp.core.configで1回だけ行う）
+settings = get_settings()
 
-# 環境変数から直接取得
-GCP_PROJECT_ID = os.environ["GCP_PROJECT_ID"]
-GOOGLE_MAPS_API_KEY_PATH = os.environ.get("GOOGLE_MAPS_API_KEY_PATH", "")
-SECRET_MANAGER_ID_FOR_GOOGLE_MAPS_API_KEY = os.environ.get("SECRET_MANAGER_ID_FOR_GOOGLE_MAPS_API_KEY", "")
+# 設定値
+GCP_PROJECT_ID = settings.gcp_project_id
+GOOGLE_MAPS_API_KEY_PATH = settings.google_maps_api_key_path
+SECRET_MANAGER_ID_FOR_GOOGLE_MAPS_API_KEY = settings.secret_manager_id_for_google_maps_api_key
 
 # Secret Managerからシークレットを取得するための関数
+@instrument_upstream("secretmanager")
 def access_secret(secret_id, version_id="latest"):
     """
     Secret Managerからシークレットを取得する関数
@@ -36,6 +33,8 @@ def access_secret(secret_id, version_id="latest"):
     try:
         logger.debug(f"Secret Managerから{secret_id}を取得しています")
 
+        from google.cloud import secretmanager
+
         client = secretmanager.SecretManagerServiceClient()
         name = f"projects/{GCP_PROJECT_ID}/secrets/{secret_id}/versions/{version_id}"
         response = client.access_secret_version(request={"name": name})
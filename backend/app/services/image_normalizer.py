@@ -0,0 +1,115 @@
+"""
+チャットの画像添付ファイルの正規化
+
+ユーザーの画像を元のサイズのままVertex AIに送らないよう、
+process_uploaded_image（MAX_LONG_EDGE / MAX_IMAGE_SIZE への縮小・再圧縮）をチャットの経路で行う。
+- 縮小・再圧縮はCPUを使うため、上限付きのProcessPoolExecutorで行いイベントループをブロックしない
+- 結果は入力のSHA-256をキーにメモリ上のLRUに保持し、会話の各ターンで同じ画像を再圧縮しない
+"""
+
+import asyncio
+import base64
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import get_settings
+from app.core.executors import lazy_executor, worker_process_pool
+from app.services.attachment_store import BytesLruCache
+from app.utils.file_utils import process_uploaded_image
+from common_utils.logger import logger
+
+# Pillowで読み込んで再圧縮する画像（GIFのアニメーションなどはそのまま送る）
+NORMALIZED_MIME_TYPES = frozenset(
+    {"image/jpeg", "image/jpg", "image/png", "image/webp", "image/bmp", "image/tiff"}
+)
+
+
+def _create_image_executor() -> ProcessPoolExecutor:
+    """画像の正規化に使うプロセスプール（プロセス全体で共有する）"""
+    return worker_process_pool(get_settings().chat_image_workers)
+
+
+get_image_executor, shutdown_image_executor = lazy_executor(_create_image_executor)
+
+
+@lru_cache(maxsize=1)
+def get_normalized_image_cache() -> BytesLruCache:
+    """入力のSHA-256 -> 正規化したdata URL"""
+    return BytesLruCache(get_settings().chat_image_cache_bytes)
+
+
+def _data_url(content: str, mime_type: str) -> str:
+    if content.startswith("data:"):
+        return content
+    return f"data:{mime_type};base64,{content}"
+
+
+def _mime_type_of(data_url: str) -> str:
+    return data_url[5:].split(";", 1)[0].split(",", 1)[0]
+
+
+async def normalize_image(content: str, mime_type: str) -> Tuple[str, str]:
+    """
+    画像（data URLまたはbase64）を正規化し、(data URL, MIMEタイプ) を返す
+    正規化できない画像は元の内容のまま返す
+    """
+    data_url = _data_url(content, mime_type)
+    key = hashlib.sha256(data_url.encode("ascii", "replace")).hexdigest()
+    cache = get_normalized_image_cache()
+    cached = cache.get(key)
+    if cached is None:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(get_image_executor(), process_uploaded_image, data_url)
+        # 処理に失敗した場合はヘッダーの無いbase64が返るため、元の画像を使う
+        if not result.startswith("data:") or len(result) >= len(data_url):
+            result = data_url
+        else:
+            logger.debug(
+                f"画像を正規化しました: {mime_type} {len(data_url) // 1024}KB → {len(result) // 1024}KB"
+            )
+        cached = result.encode("ascii")
+        cache.put(key, cached)
+    normalized = cached.decode("ascii")
+    return normalized, _mime_type_of(normalized)
+
+
+def _image_files(messages: List[Dict[str, Any]]) -> List[Tuple[int, int, Dict[str, Any]]]:
+    return [
+        (i, j, file)
+        for i, msg in enumerate(messages)
+        for j, file in enumerate(msg.get("files") or [])
+        if isinstance(file, dict)
+        and file.get("content")
+        and not file.get("hash")
+        and file.get("mimeType", "").lower() in NORMALIZED_MIME_TYPES
+    ]
+
+
+async def normalize_message_images(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """メッセージのfilesに含まれる画像を並列に正規化する（元のメッセージは変更しない）"""
+    targets = _image_files(messages)
+    if not targets:
+        return messages
+    results = await asyncio.gather(
+        *(normalize_image(file["content"], file["mimeType"]) for _, _, file in targets)
+    )
+    normalized = [dict(msg, files=list(msg["files"])) if msg.get("files") else msg for msg in messages]
+    for (i, j, file), (content, mime_type) in zip(targets, results):
+        normalized[i]["files"][j] = dict(file, content=content, mimeType=mime_type)
+    return normalized
+
+
+async def normalize_attachment(data: bytes, mime_type: str) -> Optional[bytes]:
+    """
+    アップロードされた画像を正規化したバイト列（MIMEタイプが変わる場合や対象外の画像はNone）
+    hashで参照する添付ファイルはクライアントのMIMEタイプのまま送るため、形式は変えない
+    """
+    if mime_type.lower() not in NORMALIZED_MIME_TYPES:
+        return None
+    encoded = await asyncio.to_thread(lambda: base64.b64encode(data).decode("ascii"))
+    normalized, normalized_mime = await normalize_image(encoded, mime_type)
+    if normalized_mime != mime_type.lower() or normalized.endswith(encoded):
+        return None
+    return await asyncio.to_thread(base64.b64decode, normalized.split(",", 1)[1])
@@ -1,22 +1,11 @@
 # サービス: image_service.py - 画像生成関連のビジネスロジック
 
-import os
 from common_utils.logger import logger
-from vertexai.preview.vision_models import ImageGenerationModel
-import vertexai
-from dotenv import load_dotenv
-
-# .envファイルを読み込み
-load_dotenv("./config/.env")
-develop_env_path = "./config_develop/.env.develop"
-# 開発環境の場合はdevelop_env_pathに対応する.envファイルがある
-if os.path.exists(develop_env_path):
-    load_dotenv(develop_env_path)
-
-# 環境変数から直接取得
-GCP_PROJECT_ID = os.environ["GCP_PROJECT_ID"]
-GCP_REGION = os.environ["GCP_REGION"]
+from app.core.startup import init_vertex_ai
+from app.core.metrics import instrument_upstream
+from app.services.admission import call_with_backoff
 
+@instrument_upstream("vertex", "generate_images")
 def generate_image(
     prompt: str,
     model_name: str,
@@ -47,11 +36,9 @@ def generate_image(
     Returns:
         list: 生成された画像オブジェクトのリスト
     """
-    # Vertex AI の初期化（認証情報はGOOGLE_APPLICATION_CREDENTIALSで指定されたファイルから取得）
-    vertexai.init(
-        project=GCP_PROJECT_ID,
-        location=GCP_REGION,
-    )
+    # Vertex AI の初期化（プロセス内で初回のみ。認証情報はGOOGLE_APPLICATION_CREDENTIALSで指定されたファイルから取得）
+    init_vertex_ai()
+    from vertexai.preview.vision_models import ImageGenerationModel
 
     # Imagen3 モデルのロード
     model = ImageGenerationModel.from_pretrained(model_name)
@@ -70,7 +57,8 @@ def generate_image(
     if seed is not None:
         kwargs["seed"] = seed
         
-    images = model.generate_images(**kwargs)
+    # クォータ超過（429）・一時的な利用不可（503）はバックオフして再試行する
+    images = call_with_backoff(lambda: model.generate_images(**kwargs), "generate_images")
     image_list = images.images
     logger.debug("画像の数：%d", len(image_list))
     return image_list
\ No newline at end of file
@@ -0,0 +1,130 @@
+"""
+チャットモデルのレジストリ
+
+- 環境変数MODELSの許可モデル一覧をプロセスで1回だけ解析し、集合として保持する
+  （"{model}" はデフォルトモデル、フロントエンドの parseOptionsWithDefault と同じ解釈）
+- GenerativeModelのインスタンスをモデル名と生成設定ごとに初回だけ作成して再利用する
+リクエストごとの処理はモデルの検証・取得ともに辞書の参照だけになる
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, FrozenSet, Optional, Tuple
+
+from app.core.config import get_settings
+from app.core.startup import init_vertex_ai
+from common_utils.logger import logger
+
+# 生成設定のキー: (temperature, top_p, top_k, max_output_tokens, audio_timestamp)
+GenerationKey = Tuple[float, float, int, int, bool]
+
+
+@dataclass(frozen=True)
+class ModelAllowList:
+    """許可モデルの一覧（設定順）とデフォルトモデル"""
+
+    models: Tuple[str, ...]
+    default_model: Optional[str]
+    names: FrozenSet[str]
+
+    def __contains__(self, model: object) -> bool:
+        return model in self.names
+
+
+def parse_model_options(value: str) -> ModelAllowList:
+    """
+    カンマ区切りのモデル一覧を解析する
+    {}で囲まれたモデルをデフォルトとし、無ければ先頭のモデルをデフォルトとする
+    （旧形式の "model:default" も受け付ける）
+    """
+    models = []
+    default_model = None
+    for item in value.split(","):
+        item = item.strip()
+        if ":" in item:
+            item = item.split(":", 1)[0]
+        if item.startswith("{") and item.endswith("}"):
+            item = item[1:-1]
+            default_model = item
+        item = item.strip("{}")
+        if item and item not in models:
+            models.append(item)
+    if default_model is None and models:
+        default_model = models[0]
+    return ModelAllowList(
+        models=tuple(models), default_model=default_model, names=frozenset(models)
+    )
+
+
+@lru_cache(maxsize=1)
+def get_model_allow_list() -> ModelAllowList:
+    """環境変数MODELSの許可モデル一覧（プロセスで1回だけ解析する）"""
+    allow_list = parse_model_options(get_settings().models)
+    logger.debug(f"MODELS : {list(allow_list.models)} (default: {allow_list.default_model})")
+    return allow_list
+
+
+class GenerativeModelCache:
+    """モデル名と生成設定ごとにGenerativeModelを保持する上限付きLRUキャッシュ"""
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self._models: "OrderedDict[Tuple[str, GenerationKey, Optional[str]], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model: str, generation: GenerationKey, cached_content: Any = None) -> Any:
+        """
+        GenerativeModelを返す（無ければ作成する）
+        cached_contentを指定した場合はコンテキストキャッシュを使うモデルを返す
+        """
+        key = (model, generation, getattr(cached_content, "name", None))
+        with self._lock:
+            cached = self._models.get(key)
+            if cached is not None:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        # VertexAIの初期化（プロセス内で初回のみ）
+        init_vertex_ai()
+        from vertexai.generative_models import GenerationConfig, GenerativeModel
+
+        temperature, top_p, top_k, max_output_tokens, audio_timestamp = generation
+        generation_config = GenerationConfig(
+            temperature=temperature,
+            top_p=top_p,
+            top_k=top_k,
+            max_output_tokens=max_output_tokens,
+            audio_timestamp=audio_timestamp,
+        )
+        if cached_content is not None:
+            from vertexai.preview.generative_models import GenerativeModel as PreviewGenerativeModel
+
+            gen_model = PreviewGenerativeModel.from_cached_content(
+                cached_content=cached_content, generation_config=generation_config
+            )
+        else:
+            gen_model = GenerativeModel(model_name=model, generation_config=generation_config)
+        with self._lock:
+            # 同時に作成された場合は先に登録された方を使う
+            gen_model = self._models.setdefault(key, gen_model)
+            self._models.move_to_end(key)
+            while len(self._models) > self.maxsize:
+                self._models.popitem(last=False)
+        logger.debug(f"GenerativeModelを作成しました: {model} {generation}")
+        return gen_model
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+
+@lru_cache(maxsize=1)
+def get_model_cache() -> GenerativeModelCache:
+    """プロセス全体で共有するGenerativeModelのキャッシュ"""
+    return GenerativeModelCache()
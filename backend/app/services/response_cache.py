@@ -0,0 +1,195 @@
+"""
+チャット応答のキャッシュ（オプトイン）
+
+定型のプロンプト（貼り付けた文章の要約テンプレートなど）を低いtemperatureで送るリクエストは
+同じ応答になるため、モデル名・生成設定・メッセージの正規化したハッシュをキーに応答を再利用する。
+- メモリ上のLRU（件数の上限と有効期限付き）に加え、ディスクまたはRedis互換のストアに保存できる
+- 応答はストリーミングで受け取ったチャンクの区切りのまま保存し、キャッシュからも同じ区切りでストリーミングする
+- ヒット率と再利用した応答のバイト数をメトリクスとして公開する
+CHAT_RESPONSE_CACHE（"memory" / "disk" / "redis"）を設定した場合だけ有効になる（redisの場合はredisパッケージが必要）
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import get_settings
+from app.core.metrics import REGISTRY
+from common_utils.logger import logger
+
+RESPONSE_CACHE_LOOKUPS = REGISTRY.counter(
+    "chat_response_cache_lookups_total", "Chat response cache lookups", ("result",)
+)
+RESPONSE_CACHE_BYTES_SAVED = REGISTRY.counter(
+    "chat_response_cache_bytes_saved_total", "Response bytes served from the chat response cache"
+)
+
+REDIS_KEY_PREFIX = "chat_response:"
+
+
+def response_cache_key(model: str, generation: Sequence[Any], messages: List[Dict[str, Any]]) -> str:
+    """モデル名・生成設定・メッセージを正規化したJSONのSHA-256"""
+    canonical = json.dumps(
+        {"model": model, "generation": list(generation), "messages": messages},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class DiskResponseBackend:
+    """応答をディレクトリにファイルとして保存する（合計サイズの上限を超えたら古いものから削除）"""
+
+    def __init__(self, directory: str, max_bytes: int, ttl_seconds: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(directory):
+            if len(name) == 64:
+                stat = os.stat(os.path.join(directory, name))
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self._size += size
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = os.path.join(self.directory, key)
+        try:
+            if time.time() - os.stat(path).st_mtime > self.ttl_seconds:
+                return None
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key: str, value: bytes) -> None:
+        path = os.path.join(self.directory, key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(value)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._size += len(value) - self._index.pop(key, 0)
+            self._index[key] = len(value)
+            evicted = []
+            while self._size > self.max_bytes and len(self._index) > 1:
+                old_key, size = self._index.popitem(last=False)
+                self._size -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(os.path.join(self.directory, old_key))
+            except FileNotFoundError:
+                pass
+
+
+class RedisResponseBackend:
+    """Redis互換のストアに有効期限付きで保存する"""
+
+    def __init__(self, url: str, ttl_seconds: int):
+        import redis
+
+        self.ttl_seconds = ttl_seconds
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._client.get(REDIS_KEY_PREFIX + key)
+
+    def set(self, key: str, value: bytes) -> None:
+        self._client.set(REDIS_KEY_PREFIX + key, value, ex=self.ttl_seconds)
+
+
+class ResponseCache:
+    """メモリ上のLRUと、任意の永続化先（backend）の2段のキャッシュ"""
+
+    def __init__(self, max_entries: int, ttl_seconds: int, backend: Any = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        # key -> (有効期限, チャンク)
+        self._entries: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key: str, chunks: List[str]) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, chunks)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """保存済みの応答のチャンク（無ければNone）"""
+        chunks = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    chunks = entry[1]
+                else:
+                    del self._entries[key]
+        if chunks is None and self.backend is not None:
+            try:
+                data = self.backend.get(key)
+            except Exception as e:
+                logger.warning(f"応答キャッシュの読み込みに失敗しました: {e}")
+                data = None
+            if data is not None:
+                chunks = json.loads(data)
+                self._remember(key, chunks)
+
+        if chunks is None:
+            RESPONSE_CACHE_LOOKUPS.inc("miss")
+            return None
+        RESPONSE_CACHE_LOOKUPS.inc("hit")
+        RESPONSE_CACHE_BYTES_SAVED.inc(amount=sum(len(chunk.encode("utf-8")) for chunk in chunks))
+        return chunks
+
+    def put(self, key: str, chunks: List[str]) -> None:
+        if not "".join(chunks):
+            return
+        self._remember(key, list(chunks))
+        if self.backend is not None:
+            try:
+                self.backend.set(key, json.dumps(chunks, ensure_ascii=False).encode("utf-8"))
+            except Exception as e:
+                logger.warning(f"応答キャッシュの保存に失敗しました: {e}")
+
+
+@lru_cache(maxsize=1)
+def get_response_cache() -> Optional[ResponseCache]:
+    """設定に応じた応答キャッシュ（CHAT_RESPONSE_CACHEが空の場合はNone）"""
+    settings = get_settings()
+    mode = settings.chat_response_cache.lower()
+    if not mode:
+        return None
+    backend = None
+    if mode == "disk":
+        backend = DiskResponseBackend(
+            settings.chat_response_cache_dir,
+            settings.chat_response_cache_disk_bytes,
+            settings.chat_response_cache_ttl_seconds,
+        )
+    elif mode == "redis":
+        try:
+            backend = RedisResponseBackend(
+                settings.chat_response_cache_redis_url, settings.chat_response_cache_ttl_seconds
+            )
+        except ImportError:
+            logger.warning("redisパッケージが無いため、応答キャッシュはメモリだけを使います")
+    logger.info(f"チャット応答のキャッシュを有効にしました: {mode}")
+    return ResponseCache(
+        settings.chat_response_cache_entries, settings.chat_response_cache_ttl_seconds, backend
+    )
@@ -1,75 +1,142 @@
 # サービス: speech_service.py - 音声認識関連のビジネスロジック
 
-import os
-from google.cloud.speech_v2 import SpeechClient
-from google.cloud.speech_v2.types import cloud_speech as cloud_speech_types
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Iterable, Iterator, Optional, Union
 from common_utils.logger import logger
-from dotenv import load_dotenv
+from app.core.config import get_settings
+from app.core.executors import lazy_executor
+from app.core.clients import get_client_registry
+from app.core.metrics import instrument_upstream
+from app.core.stream_bridge import iterate_in_thread
 
-# .envファイルを読み込み
-load_dotenv("./config/.env")
-develop_env_path = "./config_develop/.env.develop"
-# 開発環境の場合はdevelop_env_pathに対応する.envファイルがある
-if os.path.exists(develop_env_path):
-    load_dotenv(develop_env_path)
+# 設定の読み込み（.envの読み込みはapp.core.configで1回だけ行う）
+settings = get_settings()
 
-# 環境変数から直接取得
-GCP_PROJECT_ID = os.environ["GCP_PROJECT_ID"]
+# 設定値
+GCP_PROJECT_ID = settings.gcp_project_id
 
-def transcribe_streaming_v2(
-    audio_content: bytes, language_codes: list = ["ja-JP"]
-) -> list[cloud_speech_types.StreamingRecognizeResponse]:
-    """Google Cloud Speech-to-Text APIを使用して、ストリーミングで音声ファイルを文字起こしします。
-    引数:
-        audio_content (bytes): 文字起こしする音声コンテンツのバイトデータ。
-        language_codes (list): 認識に使用する言語コードのリスト。デフォルトは ["ja-JP"]。
-    戻り値:
-        list[cloud_speech_types.StreamingRecognizeResponse]: 文字起こしされたセグメントを含む認識結果のリスト。
+# API の制限に合わせ、1リクエストで送る音声を25600バイト（約25KB）までにする
+SPEECH_CHUNK_BYTES = 25600
+
+if TYPE_CHECKING:
+    from google.cloud.speech_v2.types import cloud_speech as cloud_speech_types
+
+def _create_speech_executor() -> ThreadPoolExecutor:
     """
-    project_id = GCP_PROJECT_ID  # プロジェクトIDの取得
-    client = SpeechClient()
-
-    # API の制限に合わせ、各チャンクサイズを25600バイト（約25KB）に固定
-    chunk_length = 25600
-    stream = [
-        audio_content[start : start + chunk_length]
-        for start in range(0, len(audio_content), chunk_length)
-    ]
-    audio_requests = (
-        cloud_speech_types.StreamingRecognizeRequest(audio=audio) for audio in stream
+    音声認識のストリームを回すスレッドプール（同時に認識するストリーム数の上限）
+    長い認識がチャットのストリームや他のリクエストのスレッドを占有しないよう専用にする
+    """
+    return ThreadPoolExecutor(
+        max_workers=settings.speech_stream_workers, thread_name_prefix="speech-stream"
     )
 
+get_speech_executor, shutdown_speech_executor = lazy_executor(_create_speech_executor)
+
+def iterate_recognition(
+    factory: Callable[[], Iterable["cloud_speech_types.StreamingRecognizeResponse"]],
+) -> AsyncIterator["cloud_speech_types.StreamingRecognizeResponse"]:
+    """
+    factory() が返す認識の応答を音声認識用のスレッドプールで受け取り、非同期に返す
+    スレッドが全て使用中の場合、新しい認識は空きが出るまで待つ
+    """
+    return iterate_in_thread(factory, get_speech_executor())
+
+def streaming_config_request(
+    language_codes: list,
+    interim_results: bool = False,
+    encoding: Optional[str] = None,
+    sample_rate_hertz: Optional[int] = None,
+) -> "cloud_speech_types.StreamingRecognizeRequest":
+    """
+    ストリーミング認識の最初に送る設定のリクエストを作成する
+    encodingを省略した場合は音声の形式を自動判定する（WAV・WebM/Opus・OGG/Opus・MP3・FLACなど）
+    LINEAR16などヘッダーの無い形式の場合はencodingとsample_rate_hertzを指定する
+    """
+    from google.cloud.speech_v2.types import cloud_speech as cloud_speech_types
+
+    if encoding:
+        decoding = {
+            "explicit_decoding_config": cloud_speech_types.ExplicitDecodingConfig(
+                encoding=cloud_speech_types.ExplicitDecodingConfig.AudioEncoding[encoding],
+                sample_rate_hertz=sample_rate_hertz or 16000,
+                audio_channel_count=1,
+            )
+        }
+    else:
+        decoding = {"auto_decoding_config": cloud_speech_types.AutoDetectDecodingConfig()}
+
     # RecognitionConfig の設定（単語時刻情報は features 内で指定）
     recognition_config = cloud_speech_types.RecognitionConfig(
-        auto_decoding_config=cloud_speech_types.AutoDetectDecodingConfig(),
+        **decoding,
         language_codes=language_codes,
         model="long",
         features=cloud_speech_types.RecognitionFeatures(enable_word_time_offsets=True),
     )
     streaming_config = cloud_speech_types.StreamingRecognitionConfig(
-        config=recognition_config
+        config=recognition_config,
+        streaming_features=cloud_speech_types.StreamingRecognitionFeatures(
+            interim_results=interim_results
+        ),
     )
-    config_request = cloud_speech_types.StreamingRecognizeRequest(
-        recognizer=f"projects/{project_id}/locations/global/recognizers/_",
+    return cloud_speech_types.StreamingRecognizeRequest(
+        recognizer=f"projects/{GCP_PROJECT_ID}/locations/global/recognizers/_",
         streaming_config=streaming_config,
     )
 
-    def requests(
-        config_request: cloud_speech_types.StreamingRecognizeRequest, audio_iter
-    ):
-        # 最初に設定情報を送信
-        yield config_request
-        # 続いて音声チャンクを送信
-        yield from audio_iter
+def split_audio(audio: bytes) -> Iterator[bytes]:
+    """音声をAPIの上限（SPEECH_CHUNK_BYTES）以下に分割する"""
+    for start in range(0, len(audio), SPEECH_CHUNK_BYTES):
+        yield audio[start : start + SPEECH_CHUNK_BYTES]
 
-    # ストリーミング認識を実行
-    responses_iterator = client.streaming_recognize(
-        requests=requests(config_request, audio_requests)
+@instrument_upstream("speech", "streaming_recognize")
+def streaming_recognize_v2(
+    audio_chunks: Iterable[bytes],
+    language_codes: list = ["ja-JP"],
+    interim_results: bool = True,
+    encoding: Optional[str] = None,
+    sample_rate_hertz: Optional[int] = None,
+) -> Iterator["cloud_speech_types.StreamingRecognizeResponse"]:
+    """届いた順に音声を送りながら認識し、途中結果・確定結果の応答を順に返します。
+    引数:
+        audio_chunks (Iterable[bytes]): 音声のバイトデータ（届いた順。終わると認識を終える）。
+        language_codes (list): 認識に使用する言語コードのリスト。デフォルトは ["ja-JP"]。
+        interim_results (bool): 確定前の途中結果も返すかどうか。
+        encoding (str): ヘッダーの無い音声の形式（"LINEAR16"など）。省略した場合は自動判定する。
+        sample_rate_hertz (int): encodingを指定した場合のサンプリングレート。
+    戻り値:
+        Iterator[cloud_speech_types.StreamingRecognizeResponse]: 認識結果の応答。
+    """
+    from google.cloud.speech_v2.types import cloud_speech as cloud_speech_types
+
+    # プロセス共有のSpeechClientを使い回す
+    client = get_client_registry().speech
+    config_request = streaming_config_request(
+        language_codes, interim_results, encoding, sample_rate_hertz
     )
-    responses = []
-    for response in responses_iterator:
-        responses.append(response)
+
+    def requests():
+        # 最初に設定情報を送信し、続いて音声チャンクを届いた順に送信
+        yield config_request
+        for chunk in audio_chunks:
+            for audio in split_audio(chunk):
+                yield cloud_speech_types.StreamingRecognizeRequest(audio=audio)
+
+    yield from client.streaming_recognize(requests=requests())
+
+def transcribe_streaming_v2(
+    audio_content: Union[bytes, Iterable[bytes]], language_codes: list = ["ja-JP"]
+) -> Iterator["cloud_speech_types.StreamingRecognizeResponse"]:
+    """Google Cloud Speech-to-Text APIを使用して、ストリーミングで音声ファイルを文字起こしします。
+    応答はリストに溜めず、受け取った順に返します（呼び出し側はiterate_recognitionで非同期に読む）。
+    引数:
+        audio_content (bytes | Iterable[bytes]): 文字起こしする音声コンテンツのバイトデータ。
+            アップロードを受信しながら認識する場合は、受信した順のチャンクのイテラブル。
+        language_codes (list): 認識に使用する言語コードのリスト。デフォルトは ["ja-JP"]。
+    戻り値:
+        Iterator[cloud_speech_types.StreamingRecognizeResponse]: 文字起こしされたセグメントを含む認識結果。
+    """
+    audio_chunks = [audio_content] if isinstance(audio_content, bytes) else audio_content
+    for response in streaming_recognize_v2(audio_chunks, language_codes, interim_results=False):
         for result in response.results:
             logger.debug(f"Transcript: {result.alternatives[0].transcript}")
-
-    return responses
\ No newline at end of file
+        yield response
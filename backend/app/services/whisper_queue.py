@@ -2,18 +2,23 @@
 Whisperジョブキューの管理サービス
 """
 
-import os
 from fastapi import HTTPException
 from google.cloud import firestore
 from common_utils.logger import logger
+from app.core.config import get_settings
+from app.core.clients import get_client_registry
+from app.core.metrics import instrument_upstream
 
-# 環境変数から設定を読み込み
-WHISPER_JOBS_COLLECTION = os.environ["WHISPER_JOBS_COLLECTION"]
-MAX_PROCESSING_JOBS = int(os.environ.get("MAX_PROCESSING_JOBS", 5))  # デフォルト値は5
+# 設定から読み込み
+settings = get_settings()
+WHISPER_JOBS_COLLECTION = settings.whisper_jobs_collection
+MAX_PROCESSING_JOBS = settings.max_processing_jobs  # デフォルト値は5
 
-# Firestoreクライアント
-db = firestore.Client()
+# Firestoreクライアント（プロセス共有。インポート時ではなく初回アクセス時に生成）
+def _db() -> firestore.Client:
+    return get_client_registry().firestore
 
+@instrument_upstream("firestore")
 def enqueue_job_atomic(job_dict: dict):
     """
     Firestoreトランザクションを使ってジョブを登録し、同時に処理中ジョブ数を原子的に確認する
@@ -28,6 +33,7 @@ def enqueue_job_atomic(job_dict: dict):
         raise ValueError("ジョブデータに'id'キーが必要です")
     
     job_id = job_dict["id"]
+    db = _db()
     job_ref = db.collection(WHISPER_JOBS_COLLECTION).document(job_id)
     counter_ref = db.collection("meta").document("counters")
     transaction = db.transaction()
@@ -62,11 +68,12 @@ def enqueue_job_atomic(job_dict: dict):
         logger.error(f"ジョブ登録トランザクションエラー: {str(e)}")
         raise HTTPException(status_code=500, detail=f"ジョブ登録に失敗しました: {str(e)}")
 
+@instrument_upstream("firestore")
 def decrement_processing_counter():
     """
     処理中ジョブカウンターをデクリメントする（ジョブ完了時や失敗時に呼び出す）
     """
-    counter_ref = db.collection("meta").document("counters")
+    counter_ref = _db().collection("meta").document("counters")
     try:
         counter_ref.update({"processing": firestore.Increment(-1)})
         logger.debug("処理中ジョブカウンターをデクリメントしました")
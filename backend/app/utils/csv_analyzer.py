@@ -0,0 +1,184 @@
+# app/utils/csv_analyzer.py - CSVの要約（スキーマ・統計・サンプル）
+
+"""
+大きなCSVをそのままプロンプトに含める代わりに、モデルに渡す要約を作る
+
+- 本文は io.StringIO から chunk_rows 行ずつ読み込み（全体を splitlines() で複製しない）、
+  sample_rows 行を分析した時点で読み込みを止める（総行数は改行の数から見積もる）
+- 列ごとの型の推定・欠損数・最小値/最大値・頻出値は、チャンクごとに pandas/NumPy でまとめて計算する
+- プレビューは先頭の数行だけを読んで作る
+pandasのインポートには時間が掛かるため、最初に分析するときまで遅延させる。
+"""
+
+import csv
+import io
+from collections import Counter
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import List, Optional
+
+# 列ごとに頻出値を表示する件数と、チャンクごとに集計に加える件数
+TOP_VALUES = 5
+TOP_VALUES_PER_CHUNK = 200
+# プレビュー・頻出値の1つの値の最大文字数
+MAX_VALUE_CHARS = 60
+BOOLEAN_VALUES = frozenset({"true", "false", "yes", "no", "t", "f", "y", "n"})
+
+
+def _clip(value: str) -> str:
+    value = str(value)
+    return value if len(value) <= MAX_VALUE_CHARS else value[: MAX_VALUE_CHARS - 3] + "..."
+
+
+@dataclass
+class ColumnSummary:
+    """1列の集計（チャンクごとに加算する）"""
+
+    name: str
+    count: int = 0
+    nulls: int = 0
+    numeric: int = 0
+    integer: int = 0
+    dates: int = 0
+    booleans: int = 0
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+    first_date: Optional[str] = None
+    last_date: Optional[str] = None
+    top: Counter = field(default_factory=Counter)
+
+    @property
+    def inferred_type(self) -> str:
+        if self.count == 0:
+            return "empty"
+        if self.numeric == self.count:
+            return "integer" if self.integer == self.count else "float"
+        if self.dates == self.count:
+            return "datetime"
+        if self.booleans == self.count:
+            return "boolean"
+        return "string"
+
+    def describe(self) -> str:
+        kind = self.inferred_type
+        text = f"- {_clip(self.name)}: {kind}, 欠損{self.nulls:,}"
+        if kind in ("integer", "float") and self.minimum is not None:
+            fmt = "{:,.0f}" if kind == "integer" else "{:,.6g}"
+            text += f", 最小{fmt.format(self.minimum)}, 最大{fmt.format(self.maximum)}"
+        elif kind == "datetime" and self.first_date is not None:
+            text += f", 最初{self.first_date}, 最後{self.last_date}"
+        if kind not in ("integer", "float", "datetime", "empty") or len(self.top) <= TOP_VALUES:
+            top = ", ".join(f"{_clip(value)}({count:,})" for value, count in self.top.most_common(TOP_VALUES))
+            if top:
+                text += f", 頻出値: {top}"
+        return text
+
+
+@dataclass
+class CsvSummary:
+    size_chars: int
+    estimated_rows: int
+    analyzed_rows: int
+    columns: List[ColumnSummary]
+    preview: str
+
+    @property
+    def truncated(self) -> bool:
+        return self.analyzed_rows < self.estimated_rows
+
+
+def _analyze_chunk(chunk, columns: List[ColumnSummary]) -> None:
+    """1チャンク分の列をまとめて集計する（値はすべて文字列として読み込んでいる）"""
+    import pandas as pd
+
+    for column, summary in zip(chunk.columns, columns):
+        values = chunk[column].dropna()
+        summary.nulls += len(chunk) - len(values)
+        if values.empty:
+            continue
+        summary.count += len(values)
+
+        counts = values.value_counts()
+        summary.top.update(counts.head(TOP_VALUES_PER_CHUNK).to_dict())
+
+        # ここまで全て数値の列だけ数値として変換する（一度でも数値以外があれば以降は変換しない）
+        if summary.numeric == summary.count - len(values):
+            numbers = pd.to_numeric(values, errors="coerce")
+            valid = numbers.dropna()
+            summary.numeric += len(valid)
+            if not valid.empty:
+                array = valid.to_numpy(dtype="float64")
+                summary.integer += int((array == array.round()).sum())
+                low, high = float(array.min()), float(array.max())
+                summary.minimum = low if summary.minimum is None else min(summary.minimum, low)
+                summary.maximum = high if summary.maximum is None else max(summary.maximum, high)
+
+        if summary.numeric < summary.count and summary.dates == summary.count - len(values):
+            dates = pd.to_datetime(values, errors="coerce", format="ISO8601").dropna()
+            summary.dates += len(dates)
+            if not dates.empty:
+                first, last = dates.min().isoformat(), dates.max().isoformat()
+                summary.first_date = first if summary.first_date is None else min(summary.first_date, first)
+                summary.last_date = last if summary.last_date is None else max(summary.last_date, last)
+
+        if summary.booleans == summary.count - len(values):
+            summary.booleans += int(values.str.strip().str.lower().isin(BOOLEAN_VALUES).sum())
+
+
+def csv_preview(content: str, max_rows: int = 5) -> str:
+    """先頭の max_rows 行だけを読んでプレビューを作る"""
+    rows = list(islice(csv.reader(io.StringIO(content)), max_rows + 1))
+    lines = [", ".join(_clip(value) for value in row) for row in rows[:max_rows]]
+    if len(rows) > max_rows:
+        lines.append("...")
+    return "\n".join(lines)
+
+
+def analyze_csv(
+    content: str, sample_rows: int = 100_000, chunk_rows: int = 20_000, preview_rows: int = 5
+) -> CsvSummary:
+    """CSVを先頭から chunk_rows 行ずつ読み、sample_rows 行まで分析する"""
+    import pandas as pd
+
+    reader = pd.read_csv(
+        io.StringIO(content),
+        dtype=str,
+        chunksize=chunk_rows,
+        skipinitialspace=True,
+        on_bad_lines="skip",
+    )
+    columns: List[ColumnSummary] = []
+    analyzed = 0
+    with reader:
+        for chunk in reader:
+            if not columns:
+                columns = [ColumnSummary(str(name)) for name in chunk.columns]
+            chunk = chunk.iloc[: sample_rows - analyzed]
+            _analyze_chunk(chunk, columns)
+            analyzed += len(chunk)
+            if analyzed >= sample_rows:
+                break
+
+    # 総行数は改行の数から見積もる（ヘッダーの1行を除く。引用符内の改行も数えるため概算）
+    estimated_rows = max(analyzed, content.count("\n") + (not content.endswith("\n")) - 1)
+    return CsvSummary(
+        size_chars=len(content),
+        estimated_rows=estimated_rows,
+        analyzed_rows=analyzed,
+        columns=columns,
+        preview=csv_preview(content, preview_rows),
+    )
+
+
+def format_csv_summary(summary: CsvSummary) -> str:
+    """モデルに渡す要約のテキスト"""
+    scope = f"先頭{summary.analyzed_rows:,}行を分析" if summary.truncated else "全行を分析"
+    lines = [
+        f"[CSVの要約: 元のファイルは{summary.size_chars:,}文字・約{summary.estimated_rows:,}行"
+        f"（{scope}）。全体の内容の代わりにスキーマと統計・サンプルを示します]",
+        f"列（{len(summary.columns)}）:",
+        *(column.describe() for column in summary.columns),
+        "サンプル（先頭の行）:",
+        summary.preview,
+    ]
+    return "\n".join(lines)
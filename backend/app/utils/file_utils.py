@@ -1,30 +1,63 @@
 # app/utils/file_utils.py - ファイル処理ユーティリティ
 
-import os
 import base64
 import io
-import tempfile
-import csv
 from PIL import Image
 from typing import Dict, List, Any, Optional, Tuple
 import docx2txt
 from common_utils.logger import logger
-from dotenv import load_dotenv
+from app.core.config import get_settings
+from app.services.csv_summary import summarize_csv_if_large
+from app.utils.csv_analyzer import csv_preview
 
-# .envファイルを読み込み
-load_dotenv("./config/.env")
-develop_env_path = "./config_develop/.env.develop"
-# 開発環境の場合はdevelop_env_pathに対応する.envファイルがある
-if os.path.exists(develop_env_path):
-    load_dotenv(develop_env_path)
+# 設定の読み込み（.envの読み込みはapp.core.configで1回だけ行う）
+settings = get_settings()
 
-# 環境変数から直接取得
-MAX_LONG_EDGE = int(os.environ["MAX_LONG_EDGE"])
-MAX_IMAGE_SIZE = int(os.environ["MAX_IMAGE_SIZE"])
+# 設定値
+MAX_LONG_EDGE = settings.max_long_edge
+MAX_IMAGE_SIZE = settings.max_image_size
+
+# JPEGの品質の初期値と下限（下限でもMAX_IMAGE_SIZEを超える場合は下限の品質で返す）
+JPEG_QUALITY = 85
+JPEG_MIN_QUALITY = 25
+# 縮小率がこの倍数以上の場合は整数倍の縮小（reduce）を先に行ってからLANCZOSで仕上げる
+RESIZE_REDUCING_GAP = 3.0
+
+def _encode_image(image: Image.Image, output_format: str, quality: int, optimize: bool) -> bytes:
+    output = io.BytesIO()
+    if output_format == "PNG":
+        image.save(output, format=output_format, optimize=optimize)
+    else:
+        image.save(output, format=output_format, quality=quality, optimize=optimize)
+    return output.getvalue()
+
+def _search_jpeg_quality(image: Image.Image, first_size: int) -> int:
+    """
+    MAX_IMAGE_SIZEに収まる最も高い品質を二分探索する
+    最初の探索点は品質85で1回エンコードしたサイズから見込みを立てる（サイズは品質にほぼ比例して減る）
+    探索中はoptimize無しでエンコードする（optimizeはサイズを小さくする方向にしか働かない）
+    """
+    low, high = JPEG_MIN_QUALITY, JPEG_QUALITY - 1
+    best = JPEG_MIN_QUALITY
+    guess = int(JPEG_QUALITY * MAX_IMAGE_SIZE / first_size)
+    while low <= high:
+        quality = min(high, max(low, guess)) if guess is not None else (low + high) // 2
+        guess = None
+        size = len(_encode_image(image, "JPEG", quality, optimize=False))
+        logger.debug("再圧縮の試行: %.1fKB (quality=%d)", size / 1024, quality)
+        if size <= MAX_IMAGE_SIZE:
+            best = quality
+            low = quality + 1
+        else:
+            high = quality - 1
+    return best
 
 def process_uploaded_image(image_data: str) -> str:
     """
     画像データを処理し、サイズや形式を調整する
+    - JPEGはdraft()で縮小後に近いサイズでデコードする（DCTの段階で1/2・1/4・1/8に縮小）
+    - 大きく縮小する場合は整数倍の縮小（reduce）をしてからLANCZOSでリサイズする
+    - JPEGの品質はMAX_IMAGE_SIZEに収まる最も高い値を二分探索する
     """
     try:
         header = None
@@ -32,8 +65,6 @@ def process_uploaded_image(image_data: str) -> str:
             header, image_data = image_data.split(",", 1)
         image_bytes = base64.b64decode(image_data)
         image = Image.open(io.BytesIO(image_bytes))
-        if image.mode not in ("RGB", "RGBA"):
-            image = image.convert("RGB")
         width, height = image.size
         logger.debug(
             "元の画像サイズ: %dx%dpx, 容量: %.1fKB",
@@ -41,32 +72,36 @@ def process_uploaded_image(image_data: str) -> str:
             height,
             len(image_bytes) / 1024,
         )
+        target_size = None
         if max(width, height) > MAX_LONG_EDGE:
             scale = MAX_LONG_EDGE / max(width, height)
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            logger.debug("リサイズ後: %dx%dpx", new_width, new_height)
-        quality = 85
-        output = io.BytesIO()
+            target_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            if image.format == "JPEG":
+                # デコード時に縮小する（目的のサイズ以上を保つ範囲で最も小さい倍率が選ばれる）
+                image.draft("RGB", target_size)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB")
+        if target_size is not None:
+            image = image.resize(
+                target_size, Image.Resampling.LANCZOS, reducing_gap=RESIZE_REDUCING_GAP
+            )
+            logger.debug("リサイズ後: %dx%dpx", target_size[0], target_size[1])
+
+        quality = JPEG_QUALITY
         output_format = "JPEG"
         mime_type = "image/jpeg"
         if header and "png" in header.lower():
             output_format = "PNG"
             mime_type = "image/png"
-            image.save(output, format=output_format, optimize=True)
         else:
             image = image.convert("RGB")
-            image.save(output, format=output_format, quality=quality, optimize=True)
-        output_data = output.getvalue()
+        output_data = _encode_image(image, output_format, quality, optimize=True)
         logger.debug(
             "圧縮後の容量: %.1fKB (quality=%d)", len(output_data) / 1024, quality
         )
-        while len(output_data) > MAX_IMAGE_SIZE and quality > 30:
-            quality -= 10
-            output = io.BytesIO()
-            image.save(output, format=output_format, quality=quality, optimize=True)
-            output_data = output.getvalue()
+        if output_format == "JPEG" and len(output_data) > MAX_IMAGE_SIZE:
+            quality = _search_jpeg_quality(image, len(output_data))
+            output_data = _encode_image(image, output_format, quality, optimize=True)
             logger.debug(
                 "再圧縮後の容量: %.1fKB (quality=%d)", len(output_data) / 1024, quality
             )
@@ -124,7 +159,12 @@ def process_text_file(text_file: Dict[str, str]) -> Dict[str, str]:
         if file_type == "csv":
             # CSVのプレビューを作成
             preview = parse_csv_preview(content)
-            return {"name": name, "type": "csv", "content": content, "preview": preview}
+            return {
+                "name": name,
+                "type": "csv",
+                "content": summarize_csv_if_large(content),
+                "preview": preview,
+            }
         elif file_type == "docx":
             return {
                 "name": name,
@@ -151,45 +191,29 @@ def process_text_file(text_file: Dict[str, str]) -> Dict[str, str]:
 
 def parse_csv_preview(content: str, max_rows: int = 5) -> str:
     """
-    CSVの内容から簡単なプレビューを生成する
+    CSVの内容から簡単なプレビューを生成する（先頭の max_rows 行だけを読む）
     """
     try:
-        preview_lines = []
-        csv_reader = csv.reader(content.splitlines())
-
-        for i, row in enumerate(csv_reader):
-            if i >= max_rows:
-                preview_lines.append("...")
-                break
-            preview_lines.append(", ".join(row))
-
-        return "\n".join(preview_lines)
+        return csv_preview(content, max_rows)
     except Exception as e:
         logger.error("CSV解析エラー: %s", str(e), exc_info=True)
         return "[CSV parsing error]"
 
+def extract_docx_text(data: bytes) -> str:
+    """
+    DOCXのバイト列からテキストを抽出する
+    一時ファイルに書き出さず、メモリ上のZIP（BytesIO）をそのまま解析する
+    （プロセスプールから呼ぶためモジュールのトップレベルに置く）
+    """
+    return docx2txt.process(io.BytesIO(data))
+
 def process_docx_text(docx_content: str) -> str:
     """
     DOCXファイルの内容をテキストとして抽出する
     注: docx_contentはbase64エンコードされたデータ
     """
     try:
-        # base64デコード
-        binary_data = base64.b64decode(docx_content)
-
-        # 一時ファイルに保存
-        with tempfile.NamedTemporaryFile(suffix=".docx", delete=False) as temp_file:
-            temp_file_path = temp_file.name
-            temp_file.write(binary_data)
-
-        try:
-            # docx2txtを使用してテキスト抽出
-            text = docx2txt.process(temp_file_path)
-            return text
-        finally:
-            # 一時ファイルを削除
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
+        return extract_docx_text(base64.b64decode(docx_content))
     except Exception as e:
         logger.error("DOCXテキスト抽出エラー: %s", str(e), exc_info=True)
         return "[DOCX text extraction error]"
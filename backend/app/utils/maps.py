@@ -2,8 +2,10 @@
 
 import requests
 from common_utils.logger import logger
+from app.core.metrics import instrument_upstream
 
 
+@instrument_upstream("maps")
 def get_static_map(
     api_key, latitude, longitude, zoom=18, size=(600, 600), map_type="satellite"
 ):
@@ -40,6 +42,7 @@ def get_static_map(
     return response
 
 
+@instrument_upstream("maps")
 def get_coordinates(api_key, address):
     """
     住所や建物名などのキーワードから緯度経度を取得します。（ジオコーディング）
@@ -60,6 +63,7 @@ def get_coordinates(api_key, address):
     return data
 
 
+@instrument_upstream("maps")
 def get_address(api_key, latitude, longitude):
     """
     緯度経度から住所を取得します。（リバースジオコーディング）
@@ -87,6 +91,7 @@ def get_address(api_key, latitude, longitude):
     return data
 
 
+@instrument_upstream("maps")
 def get_street_view(
     api_key, latitude, longitude, size=(600, 600), heading=None, pitch=0, fov=90
 ):
@@ -41,12 +41,20 @@ class ChatRequest(BaseModel):
     chunkIndex: Optional[int] = Field(default=None, alias="chunk_index")
     totalChunks: Optional[int] = Field(default=None, alias="total_chunks")
     chunkData: Optional[str] = Field(default=None, alias="chunk_data")
+    # chunkDataをデコードしたバイト列のSHA-256（16進数、指定した場合のみ検証する）
+    chunkChecksum: Optional[str] = Field(default=None, alias="chunk_checksum")
 
     class Config:
         populate_by_name = True  # camelCaseとsnake_case両方を受け入れ
         extra = "forbid"
 
 
+class ChatAttachmentRequest(BaseModel):
+    content: str  # base64（data URL可）またはテキスト
+    mimeType: str = ""
+    name: Optional[str] = None
+
+
 class SpeechToTextRequest(BaseModel):
     audio_data: str
 
@@ -1,11 +1,19 @@
 # utils/logger.py
+import asyncio
+import atexit
 import logging
 import os
 import json
-from typing import Dict, List, Any
+import queue
+import random
+import re
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, List, Any, Callable, Optional, Pattern, Tuple, Union
 from copy import copy
 from fastapi import Request
-from functools import wraps
+from functools import lru_cache, wraps
 
 # 環境変数DEBUGの値を取得し、デバッグモードの設定を行う
 # デフォルトは空文字列
@@ -16,96 +24,408 @@ if not debug or debug.lower() == "false" or debug == "0":
 else:
     DEBUG = True
 
-# ロギング設定の初期化
-if DEBUG:
-    # デバッグモード時のログ設定
-    # - ログレベル: DEBUG（詳細なログを出力）
-    # - フォーマット: タイムスタンプ、ログレベル、ファイル名、行番号、メッセージ
-    # - 出力先: コンソール(StreamHandler)とファイル(app_debug.log)
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format="%(asctime)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s",
-        handlers=[logging.StreamHandler(), logging.FileHandler("app_debug.log")],
-    )
-else:
-    # 本番モード時のログ設定
-    # - ログレベル: INFO（重要な情報のみ出力）
-    # - フォーマット: タイムスタンプ、ログレベル、メッセージ（ファイル情報なし）
-    # - 出力先: コンソール(StreamHandler)とファイル(app.log)
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s",
-        handlers=[logging.StreamHandler(), logging.FileHandler("app.log")],
+# ===== ログ出力設定 =====
+# LOG_FORMAT: "json"（構造化ログ、デフォルト）または "text"（従来の1行形式）
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# LOG_FILE_PATH: 指定した場合のみファイルにも出力する（Cloud Runではメモリ上のファイルシステムを消費するため既定では無効）
+LOG_FILE_PATH = os.getenv("LOG_FILE_PATH", "")
+# LOG_FILE_MAX_BYTES / LOG_FILE_BACKUP_COUNT: ファイル出力のローテーション設定
+LOG_FILE_MAX_BYTES = int(os.getenv("LOG_FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_FILE_BACKUP_COUNT = int(os.getenv("LOG_FILE_BACKUP_COUNT", "3"))
+# LOG_SAMPLING: ロガーごとのINFO以下のログの出力割合（例: "httpx=0.1,common_utils.logger=0.5"）
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")
+# LOG_QUEUE_SIZE: 出力待ちのログの上限（超えた場合はINFO以下を破棄し、イベントループを待たせない）
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# WARNING以上のログはキューが満杯でも破棄せず、この秒数だけ空きを待ってから直接書き込む
+LOG_QUEUE_WARNING_WAIT_SECONDS = 0.05
+# LOG_DROP_REPORT_SECONDS: 破棄したログの件数をWARNINGのログで報告する間隔
+LOG_DROP_REPORT_SECONDS = float(os.getenv("LOG_DROP_REPORT_SECONDS", "60"))
+# LOG_STREAM_MODE: ストリーミング応答のログ形式
+#   "summary"（デフォルト）: ストリーム終了時に集計を1件だけ出力する
+#   "chunk": 従来どおりチャンクごとに出力する
+LOG_STREAM_MODE = os.getenv("LOG_STREAM_MODE", "summary").lower()
+# LOG_STREAM_SAMPLE_EVERY: summaryモードでもN件に1件のチャンクを個別に出力する（0で無効、デバッグ用）
+LOG_STREAM_SAMPLE_EVERY = int(os.getenv("LOG_STREAM_SAMPLE_EVERY", "0"))
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    ログレコードを1行のJSONに変換するフォーマッタ
+    Cloud Loggingが解釈できるようにseverityとmessageを出力し、
+    辞書をログに渡した場合はそのまま構造化データとして出力する
+    """
+
+    def __init__(self, include_location: bool = False):
+        super().__init__()
+        self.include_location = include_location
+
+    def format(self, record: logging.LogRecord) -> str:
+        if isinstance(record.msg, dict) and not record.args:
+            message: Any = record.msg
+        else:
+            message = record.getMessage()
+        payload: Dict[str, Any] = {
+            "time": self.formatTime(record),
+            "severity": record.levelname,
+            "logger": record.name,
+            "message": message,
+        }
+        if self.include_location:
+            payload["location"] = f"{record.filename}:{record.lineno}"
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exception"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    ロガー名ごとにINFO以下のログを指定の割合で間引くフィルタ
+    WARNING以上のログは常に出力する
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        # 最も長く一致するロガー名の設定を使う（"httpx"は"httpx._client"にも適用）
+        name = record.name
+        while True:
+            rate = self.rates.get(name)
+            if rate is not None:
+                return rate >= 1 or random.random() < rate
+            if "." not in name:
+                return True
+            name = name.rsplit(".", 1)[0]
+
+
+_exception_formatter = logging.Formatter()
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """
+    キューが満杯の場合はINFO以下のログを破棄するQueueHandler（呼び出し側をブロックしない）
+    WARNING以上のログは破棄せず、少しだけ空きを待ち、それでも満杯なら出力用のハンドラで直接書き込む
+    破棄した件数はdroppedに数え、次にキューに入れられたときにWARNINGのログで報告する（LOG_DROP_REPORT_SECONDSごと）
+    """
+
+    # 破棄したログの件数（累計）と、報告済みの件数・報告した時刻
+    dropped = 0
+    reported = 0
+    reported_at = 0.0
+
+    def __init__(self, log_queue: "queue.Queue", fallback: Optional[logging.Handler] = None):
+        super().__init__(log_queue)
+        self.fallback = fallback
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 辞書のログは構造化データのままキューに入れる（文字列への変換は出力スレッドで行う）
+        record = copy(record)
+        if isinstance(record.msg, dict) and not record.args:
+            record.msg = dict(record.msg)
+        else:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.WARNING:
+                self._enqueue_important(record)
+            else:
+                self.dropped += 1
+            return
+        if self.dropped > self.reported:
+            self._report_dropped()
+
+    def _enqueue_important(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put(record, timeout=LOG_QUEUE_WARNING_WAIT_SECONDS)
+        except queue.Full:
+            if self.fallback is not None:
+                self.fallback.handle(record)
+            else:
+                sys.stderr.write(f"{record.levelname} {record.name}: {record.msg}\n")
+
+    def _report_dropped(self) -> None:
+        now = time.monotonic()
+        if now - self.reported_at < LOG_DROP_REPORT_SECONDS:
+            return
+        total = self.dropped
+        report = logging.LogRecord(
+            __name__, logging.WARNING, __file__, 0,
+            {"event": "log_records_dropped", "dropped": total - self.reported, "dropped_total": total},
+            None, None,
+        )
+        try:
+            self.queue.put_nowait(report)
+        except queue.Full:
+            # 報告できなかった件数は次の機会に報告する
+            return
+        self.reported, self.reported_at = total, now
+
+
+class _LogQueueListener(QueueListener):
+    """停止時にキューが満杯でも、出力スレッドが空きを作るまで待って終了を通知するQueueListener"""
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+def _parse_sampling(value: str) -> Dict[str, float]:
+    rates: Dict[str, float] = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        name, rate = item.split("=", 1)
+        try:
+            rates[name.strip()] = float(rate)
+        except ValueError:
+            continue
+    return rates
+
+
+def _build_output_handlers() -> List[logging.Handler]:
+    """QueueListenerが実際の出力に使うハンドラ"""
+    if LOG_FORMAT == "text":
+        if DEBUG:
+            formatter: logging.Formatter = logging.Formatter(
+                "%(asctime)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s"
+            )
+        else:
+            formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    else:
+        formatter = JsonFormatter(include_location=DEBUG)
+
+    handlers: List[logging.Handler] = [logging.StreamHandler(sys.stdout)]
+    if LOG_FILE_PATH:
+        handlers.append(
+            RotatingFileHandler(
+                LOG_FILE_PATH,
+                maxBytes=LOG_FILE_MAX_BYTES,
+                backupCount=LOG_FILE_BACKUP_COUNT,
+                encoding="utf-8",
+            )
+        )
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def setup_logging() -> QueueListener:
+    """
+    ルートロガーにQueueHandlerを設定し、出力はQueueListenerのスレッドで行う
+    ログを呼び出したスレッド（イベントループ）ではファイル・標準出力への書き込みを行わない
+    """
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(LOG_QUEUE_SIZE)
+    output_handlers = _build_output_handlers()
+    # キューが満杯の場合、WARNING以上のログは標準出力のハンドラで直接書き込む
+    queue_handler = _DroppingQueueHandler(log_queue, fallback=output_handlers[0])
+    queue_handler.addFilter(SamplingFilter(_parse_sampling(LOG_SAMPLING)))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    # デバッグモード時はDEBUG、本番モード時はINFO以上を出力
+    root.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+
+    listener = _LogQueueListener(log_queue, *output_handlers, respect_handler_level=True)
+    listener.start()
+    # 終了時にキューに残ったログを書き出す
+    atexit.register(listener.stop)
+    return listener
+
+
+def setup_worker_logging() -> None:
+    """
+    ProcessPoolExecutorのワーカープロセスの初期化（initializer）に使う
+    forkした子プロセスにはQueueListenerのスレッドが無く、キューに入れたログを誰も書き出さないため、
+    ルートロガーのハンドラを標準出力に直接書き込むハンドラに置き換える
+    （ファイル出力は親プロセスとのローテーションの競合を避けるため行わない）
+    """
+    handler = _build_output_handlers()[0]
+    handler.addFilter(SamplingFilter(_parse_sampling(LOG_SAMPLING)))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+
+
+def dropped_log_records() -> int:
+    """キューが満杯で破棄したログの件数（メトリクス用。プロセスプールのワーカーなどキューを使わない場合は0）"""
+    return sum(
+        handler.dropped
+        for handler in logging.getLogger().handlers
+        if isinstance(handler, _DroppingQueueHandler)
     )
+
+
+log_listener = setup_logging()
 # 現在のモジュール用のロガーを取得
 logger = logging.getLogger(__name__)
 
 
+# サニタイズ処理の上限（ログ出力のコストをペイロードの大きさに依存させない）
+# - SANITIZE_MAX_NODES: 1回のサニタイズで訪問する要素数の上限
+# - SANITIZE_MAX_BYTES: 1回のサニタイズで出力する文字数の合計の上限
+# - SANITIZE_MAX_DEPTH: ネストの深さの上限
+SANITIZE_MAX_NODES = int(os.getenv("LOG_SANITIZE_MAX_NODES", "2000"))
+SANITIZE_MAX_BYTES = int(os.getenv("LOG_SANITIZE_MAX_BYTES", "262144"))
+SANITIZE_MAX_DEPTH = 32
+
+TRUNCATED = "[TRUNCATED]"
+REDACTED = "[REDACTED]"
+
+_NOT_JSON = object()
+
+
+class _SanitizeBudget:
+    """1回のサニタイズで使える残りの要素数と文字数"""
+
+    __slots__ = ("nodes", "chars")
+
+    def __init__(self, nodes: int, chars: int):
+        self.nodes = nodes
+        self.chars = chars
+
+
+@lru_cache(maxsize=32)
+def _compile_sensitive_matchers(
+    sensitive_keys: Tuple[str, ...]
+) -> Tuple[Optional[Callable], Optional[Pattern]]:
+    """
+    機密キーの判定用の正規表現をコンパイルする（キーのリストごとに1回だけ）
+
+    Returns:
+        (キー名の判定関数, JSONとして解釈できない文字列中の "キー": "値" を伏せ字にする正規表現)
+    """
+    if not sensitive_keys:
+        return None, None
+    alternatives = "|".join(re.escape(key) for key in sensitive_keys)
+    key_pattern = re.compile(alternatives, re.IGNORECASE)
+    text_pattern = re.compile(
+        r'("[^"\\]*(?:' + alternatives + r')[^"\\]*"\s*:\s*)"(?:[^"\\]|\\.)*("?)',
+        re.IGNORECASE,
+    )
+    return key_pattern.search, text_pattern
+
+
+def _try_parse_json(text: Union[str, bytes]) -> Any:
+    """JSONのオブジェクト・配列に見える場合だけパースする（失敗した場合は_NOT_JSON）"""
+    stripped = text.lstrip()[:1]
+    if stripped not in ("{", "[", b"{", b"["):
+        return _NOT_JSON
+    try:
+        return json.loads(text)
+    except ValueError:
+        return _NOT_JSON
+
+
+def _sanitize(
+    data: Any,
+    max_length: int,
+    key_matcher: Optional[Callable],
+    text_pattern: Optional[Pattern],
+    budget: _SanitizeBudget,
+    depth: int,
+) -> Any:
+    budget.nodes -= 1
+    if budget.nodes < 0 or depth > SANITIZE_MAX_DEPTH or budget.chars <= 0:
+        return TRUNCATED
+
+    if isinstance(data, (str, bytes, bytearray)):
+        limit = min(max_length, budget.chars) if max_length else budget.chars
+        if len(data) > limit:
+            # パースする前に切り詰める（長い文字列はJSONとして解釈しない）
+            text = data[:limit]
+            if not isinstance(text, str):
+                text = bytes(text).decode("utf-8", errors="replace")
+            budget.chars -= len(text)
+            if text_pattern is not None:
+                text = text_pattern.sub(r'\1"' + REDACTED + r"\2", text)
+            return text + TRUNCATED
+
+        parsed = _try_parse_json(data)
+        if parsed is not _NOT_JSON:
+            return _sanitize(
+                parsed, max_length, key_matcher, text_pattern, budget, depth + 1
+            )
+        text = (
+            data
+            if isinstance(data, str)
+            else bytes(data).decode("utf-8", errors="replace")
+        )
+        budget.chars -= len(text)
+        return text
+
+    if isinstance(data, dict):
+        sanitized = {}
+        for index, (key, value) in enumerate(data.items()):
+            if budget.nodes <= 0 or budget.chars <= 0:
+                sanitized[TRUNCATED] = f"{len(data) - index} items"
+                break
+            if key_matcher is not None and isinstance(key, str) and key_matcher(key):
+                budget.nodes -= 1
+                sanitized[key] = REDACTED
+            else:
+                sanitized[key] = _sanitize(
+                    value, max_length, key_matcher, text_pattern, budget, depth + 1
+                )
+        return sanitized
+
+    if isinstance(data, (list, tuple)):
+        sanitized_list = []
+        for index, item in enumerate(data):
+            if budget.nodes <= 0 or budget.chars <= 0:
+                sanitized_list.append(f"{TRUNCATED} {len(data) - index} items")
+                break
+            sanitized_list.append(
+                _sanitize(item, max_length, key_matcher, text_pattern, budget, depth + 1)
+            )
+        return sanitized_list
+
+    return data
+
+
 def sanitize_request_data(
-    data: Any, max_length: int = 65536, sensitive_keys: List[str] = []
+    data: Any,
+    max_length: int = 65536,
+    sensitive_keys: List[str] = [],
+    max_nodes: Optional[int] = None,
+    max_bytes: Optional[int] = None,
 ) -> Any:
     """
     リクエストデータから機密情報を削除する関数
+    訪問する要素数と出力する文字数に上限を設け、ペイロードが大きくても処理量が一定を超えないようにする
 
     Args:
         data (Any): サニタイズするデータ
-        max_length : 最大文字数。Falseに評価されるときは無限
+        max_length : 最大文字数。Falseに評価されるときは無限（ただしmax_bytesは適用される）
         sensitive_keys (List[str]): 機密キーのリスト（省略可）
-
+        max_nodes (int, optional): 訪問する要素数の上限（省略時はSANITIZE_MAX_NODES）
+        max_bytes (int, optional): 出力する文字数の合計の上限（省略時はSANITIZE_MAX_BYTES）
 
     Returns:
         Any: サニタイズされたデータ
     """
-    try:
-        data = json.loads(data)
-    except:
-        pass
-    if (
-        max_length
-        and isinstance(data, (str, bytes, bytearray))
-        and len(data) > max_length
-    ):
-        if isinstance(data, str):
-            return data[:max_length] + "[TRUNCATED]"
-        elif isinstance(data, (bytes, bytearray)):
-            # バイナリデータを文字列に変換してから切り詰める
-            try:
-                # UTF-8でデコードを試みる
-                return (
-                    data.decode("utf-8", errors="replace")[:max_length] + "[TRUNCATED]"
-                )
-            except Exception:
-                # デコードに失敗した場合はbyteアレイのまま
-                return data[:max_length] + b"[TRUNCATED]"
-    elif isinstance(data, (bytes, bytearray)):
-        # 長さが制限を超えていなくても、バイナリデータは文字列に変換
-        try:
-            return data.decode("utf-8", errors="replace")
-        except Exception:
-            return data.hex()
-    elif isinstance(data, dict):
-        sanitized = {}
-        for key, value in data.items():
-            if isinstance(key, str) and any(
-                s_key in key.lower() for s_key in sensitive_keys
-            ):
-                sanitized[key] = "[REDACTED]"
-            elif isinstance(value, (dict, list, str, bytes, bytearray)):
-                sanitized[key] = sanitize_request_data(
-                    value, max_length=max_length, sensitive_keys=sensitive_keys
-                )
-            else:
-                sanitized[key] = value
-        return sanitized
-    elif isinstance(data, list):
-        return [
-            sanitize_request_data(
-                item, max_length=max_length, sensitive_keys=sensitive_keys
-            )
-            for item in data
-        ]
-    else:
-        return data
+    key_matcher, text_pattern = _compile_sensitive_matchers(tuple(sensitive_keys))
+    budget = _SanitizeBudget(
+        SANITIZE_MAX_NODES if max_nodes is None else max_nodes,
+        SANITIZE_MAX_BYTES if max_bytes is None else max_bytes,
+    )
+    return _sanitize(data, max_length, key_matcher, text_pattern, budget, 0)
 
 
 async def log_request(request: Request, current_user: Dict | None, log_max_length: int):
@@ -122,7 +442,10 @@ async def log_request(request: Request, current_user: Dict | None, log_max_lengt
         "method": request.method,
         "client": request.client.host if request.client else "unknown",
         "user_agent": request.headers.get("user-agent", "unknown"),
-        "request_body": await request.body(),
+        # ボディは読み込まず、ミドルウェアが写し取った先頭部分だけを記録する
+        "request_body": bytes(
+            request.scope.get("state", {}).get("request_body_prefix", b"")
+        ),
     }
 
     # 受けたリクエストの情報をロガー表示する
@@ -135,42 +458,164 @@ async def log_request(request: Request, current_user: Dict | None, log_max_lengt
     return request_info
 
 
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    """p50/p90/p99/maxをミリ秒（小数第1位まで）で返す"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+    last = len(ordered) - 1
+    return {
+        name: round(ordered[min(last, int(len(ordered) * ratio))] * 1000, 1)
+        for name, ratio in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))
+    } | {"max": round(ordered[-1] * 1000, 1)}
+
+
+# UTF-8の継続バイト（0x80〜0xBF）。文字数を数えるときに除く
+_UTF8_CONTINUATION_BYTES = bytes(range(0x80, 0xC0))
+
+
+class StreamSummary:
+    """
+    1つのストリーミング応答の集計
+    最初のチャンクまでの時間、チャンク数、バイト数、チャンク間隔、先頭と末尾の内容を記録する
+    """
+
+    def __init__(self, sample_length: int = 1000):
+        self.sample_length = sample_length
+        self.start = time.perf_counter()
+        self.first_chunk_at: Optional[float] = None
+        self.last_chunk_at: Optional[float] = None
+        self.chunks = 0
+        self.bytes = 0
+        self.chars = 0
+        self.gaps: List[float] = []
+        self.head = ""
+        self.tail = ""
+
+    def add(self, chunk: Any) -> None:
+        now = time.perf_counter()
+        if self.first_chunk_at is None:
+            self.first_chunk_at = now
+        else:
+            self.gaps.append(now - self.last_chunk_at)
+        self.last_chunk_at = now
+        self.chunks += 1
+
+        if isinstance(chunk, (bytes, bytearray)):
+            data = bytes(chunk)
+            self.bytes += len(data)
+            # 文字数はUTF-8の継続バイト以外のバイト数（チャンク全体はデコードしない）
+            self.chars += len(data.translate(None, _UTF8_CONTINUATION_BYTES))
+            # sample_length文字分（UTF-8は1文字最大4バイト）の先頭と末尾だけをデコードする
+            limit = self.sample_length * 4
+            head = data[:limit].decode("utf-8", errors="replace")
+            tail = head if len(data) <= limit else data[-limit:].decode("utf-8", errors="replace")
+        else:
+            head = tail = chunk if isinstance(chunk, str) else str(chunk)
+            self.bytes += len(head.encode("utf-8"))
+            self.chars += len(head)
+
+        # 先頭はsample_length文字まで、末尾は直近のsample_length文字を保持する
+        if len(self.head) < self.sample_length:
+            self.head += head[: self.sample_length - len(self.head)]
+        self.tail = (self.tail + tail[-self.sample_length :])[-self.sample_length :]
+
+    def to_dict(self, status: str) -> Dict[str, Any]:
+        end = time.perf_counter()
+        return {
+            "event": "stream_summary",
+            "status": status,
+            "ttfb_ms": (
+                round((self.first_chunk_at - self.start) * 1000, 1)
+                if self.first_chunk_at is not None
+                else None
+            ),
+            "duration_ms": round((end - self.start) * 1000, 1),
+            "chunks": self.chunks,
+            "bytes": self.bytes,
+            "gap_ms": _percentiles(self.gaps),
+            "head": self.head,
+            # 先頭と末尾が重なる短いストリームでは末尾を省略する（文字数で比べる）
+            "tail": self.tail if self.chars > len(self.head) else "",
+        }
+
+
 def wrap_asyncgenerator_logger(
-    meta_info: dict = {}, max_length: int = 1000
+    meta_info: dict = {},
+    max_length: int = 1000,
+    mode: Optional[str] = None,
+    sample_every: Optional[int] = None,
 ) -> callable:
     """
     非同期ジェネレーター関数をラップしてログ出力を追加するデコレータ関数
 
     Args:
         meta_info: ログに追加する追加情報の辞書
+        max_length: ログに残すチャンク（summaryモードでは先頭・末尾の内容）の最大文字数
+        mode: "summary"（ストリーム終了時に集計を1件出力）または "chunk"（チャンクごとに出力）
+              省略時は環境変数LOG_STREAM_MODE
+        sample_every: summaryモードでN件に1件のチャンクも出力する（0で無効）
+                      省略時は環境変数LOG_STREAM_SAMPLE_EVERY
 
     Returns:
         decorator: ラップする非同期ジェネレーター関数を受け取るデコレータ関数
     """
+    mode = (mode or LOG_STREAM_MODE).lower()
+    sample_every = LOG_STREAM_SAMPLE_EVERY if sample_every is None else sample_every
+
+    def log_chunk(chunk: Any, index: Optional[int] = None) -> None:
+        # ログ用の辞書を準備（meta_infoのコピーまたは新規辞書）
+        if isinstance(meta_info, dict):
+            streaming_log = copy(meta_info)
+        else:
+            streaming_log = {}
+        if index is not None:
+            streaming_log["chunk_index"] = index
+
+        # chunkの長さを制限する
+        streaming_log["chunk"] = sanitize_request_data(chunk, max_length=max_length)
+
+        # ログ出力
+        logger.info(streaming_log)
 
     def decorator(generator_func: callable) -> callable:
-        @wraps(generator_func)
-        async def wrapper(*args, **kwargs) -> any:
-            # 元のジェネレーター関数を実行し、各チャンクを処理
-            async for chunk in generator_func(*args, **kwargs):
-                # ログ用の辞書を準備（meta_infoのディープコピーまたは新規辞書）
-                if isinstance(meta_info, dict):
-                    streaming_log = copy(meta_info)
-                else:
-                    streaming_log = {}
-
-                # chunkの長さを制限する
-                streaming_log["chunk"] = sanitize_request_data(
-                    chunk, max_length=max_length
-                )
+        if mode == "chunk":
 
-                # ログ出力
-                logger.info(streaming_log)
+            @wraps(generator_func)
+            async def wrapper(*args, **kwargs) -> any:
+                # 元のジェネレーター関数を実行し、各チャンクを処理
+                async for chunk in generator_func(*args, **kwargs):
+                    log_chunk(chunk)
+
+                    # 元のチャンクを次の処理へ渡す（切り詰めたのはログ用だけ）
+                    yield chunk
+
+            return wrapper
 
-                # 元のチャンクを次の処理へ渡す（切り詰めたのはログ用だけ）
-                yield chunk
+        @wraps(generator_func)
+        async def summary_wrapper(*args, **kwargs) -> any:
+            summary = StreamSummary(max_length)
+            status = "completed"
+            try:
+                async for chunk in generator_func(*args, **kwargs):
+                    summary.add(chunk)
+                    if sample_every and (summary.chunks - 1) % sample_every == 0:
+                        log_chunk(chunk, summary.chunks - 1)
+                    yield chunk
+            except (GeneratorExit, asyncio.CancelledError):
+                # クライアントの切断などでストリームが途中で閉じられた
+                status = "cancelled"
+                raise
+            except Exception:
+                status = "error"
+                raise
+            finally:
+                streaming_log = copy(meta_info) if isinstance(meta_info, dict) else {}
+                # 先頭・末尾の内容はmax_length文字までに制限済み
+                streaming_log.update(summary.to_dict(status))
+                logger.info(streaming_log)
 
-        return wrapper
+        return summary_wrapper
 
     return decorator
 
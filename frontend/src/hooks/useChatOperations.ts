@@ -1,7 +1,7 @@
 import { useState, useCallback, useRef } from 'react';
-import { Message, ChatRequest } from '../types/apiTypes';
+import { Message, ChatRequest, ChatRequestMessage } from '../types/apiTypes';
 import { FileData } from '../utils/fileUtils';
-import { useApiCall } from './useApiCall';
+import { useApiCall, StreamingApiResponse } from './useApiCall';
 import { useErrorHandler } from './useErrorHandler';
 import { useLoadingState } from './useLoadingState';
 import { useChatHistory } from './useChatHistory';
@@ -20,6 +20,8 @@ export const useChatOperations = () => {
   const [backupMessages, setBackupMessages] = useState<Message[]>([]);
 
   const abortControllerRef = useRef<AbortController | null>(null);
+  // 添付ファイルのID → アップロード済みのhash（同じファイルを毎回送らない）
+  const attachmentHashesRef = useRef<Map<string, string>>(new Map());
   
   const { streamingApiCall, apiCall } = useApiCall();
   const { handleError, clearError } = useErrorHandler();
@@ -45,6 +47,33 @@ export const useChatOperations = () => {
     }
   }, [apiCall, selectedModel, API_BASE_URL, handleError]);
 
+  /**
+   * 添付ファイルを1度だけアップロードし、メッセージのfilesをhashの参照に置き換える
+   */
+  const toRequestMessages = useCallback(async (
+    sourceMessages: Message[]
+  ): Promise<ChatRequestMessage[]> => {
+    const hashes = attachmentHashesRef.current;
+    return Promise.all(sourceMessages.map(async (msg) => {
+      if (!msg.files || msg.files.length === 0) {
+        return msg;
+      }
+      const files = await Promise.all(msg.files.map(async (file) => {
+        let hash = hashes.get(file.id);
+        if (!hash) {
+          const response = await apiCall<{ hash: string }>(
+            `${API_BASE_URL}/backend/chat/attachments`,
+            { body: { content: file.content, mimeType: file.mimeType, name: file.name } }
+          );
+          hash = response.data.hash;
+          hashes.set(file.id, hash);
+        }
+        return { id: file.id, name: file.name, size: file.size, mimeType: file.mimeType, hash };
+      }));
+      return { ...msg, files };
+    }));
+  }, [apiCall, API_BASE_URL]);
+
   /**
    * チャットメッセージを送信（ストリーミング）
    */
@@ -80,20 +109,31 @@ export const useChatOperations = () => {
         let updatedMessages = [...messages, userMessage];
         setMessages(updatedMessages);
 
-        // チャットリクエストを作成
-        const chatRequest: ChatRequest = {
-          messages: updatedMessages,
+        // チャットリクエストを作成（添付ファイルはhashで参照する）
+        const createChatRequest = async (): Promise<ChatRequest> => ({
+          messages: await toRequestMessages(updatedMessages),
           model: selectedModel,
-        };
+        });
 
         // ストリーミングAPIを呼び出し
-        const { reader, decoder } = await streamingApiCall(
-          `${API_BASE_URL}/backend/chat`,
-          {
-            body: chatRequest,
+        let stream: StreamingApiResponse;
+        try {
+          stream = await streamingApiCall(`${API_BASE_URL}/backend/chat`, {
+            body: await createChatRequest(),
             signal,
+          });
+        } catch (error) {
+          // サーバー側で添付ファイルが削除されていた場合（409）は再アップロードして1度だけ再送する
+          if (!(error instanceof Error) || !error.message.includes('status: 409')) {
+            throw error;
           }
-        );
+          attachmentHashesRef.current.clear();
+          stream = await streamingApiCall(`${API_BASE_URL}/backend/chat`, {
+            body: await createChatRequest(),
+            signal,
+          });
+        }
+        const { reader, decoder } = stream;
 
         // アシスタントメッセージを追加
         let assistantMessage = '';
@@ -147,6 +187,7 @@ export const useChatOperations = () => {
     messages,
     selectedModel,
     streamingApiCall,
+    toRequestMessages,
     API_BASE_URL,
     clearError,
     handleError,
@@ -10,14 +10,30 @@ export interface Message {
   files?: FileData[]; // 統一されたファイル管理形式
 }
 
+// アップロード済みの添付ファイルの参照（contentの代わりにSHA-256のhashを送る）
+export interface AttachmentRef {
+  id: string;
+  name: string;
+  size: number;
+  mimeType: string;
+  hash: string;
+}
+
+export interface ChatRequestMessage {
+  role: Message["role"];
+  content: string;
+  files?: (FileData | AttachmentRef)[];
+}
+
 export interface ChatRequest {
-  messages: Message[];
+  messages: ChatRequestMessage[];
   model: string;
   chunked?: boolean;
   chunkId?: string;
   chunkIndex?: number;
   totalChunks?: number;
   chunkData?: string;
+  chunkChecksum?: string; // chunkDataをデコードしたバイト列のSHA-256（16進数）
 }
 
 export interface ChatHistory {
@@ -0,0 +1,111 @@
+"""
+チャットのストリーミング応答によるイベントループの遅延を計測するベンチマーク
+
+Vertex AIのストリームを模した同期ジェネレーター（チャンクごとにブロッキングで待つ）を
+同時に --streams 本読み込み、次の2つの方式を比較する。
+- inline : 同期ジェネレーターをイベントループ上でそのまま回す（従来の /chat）
+- thread : app.core.stream_bridge.iterate_in_thread で専用スレッドから受け取る
+計測中は10msごとに起きるプローブタスクの寝過ごし時間（イベントループの遅延）と、
+全ストリームの読み込みが終わるまでの時間を集計する。
+
+使い方:
+    PYTHONPATH=.:backend python scripts/benchmarks/bench_chat_stream_loop_lag.py
+    PYTHONPATH=.:backend python scripts/benchmarks/bench_chat_stream_loop_lag.py --streams 50 --chunks 20 --chunk-delay-ms 50
+
+結果の例（1 vCPU、既定値: --streams 50 --chunks 20 --chunk-delay-ms 50、スレッド数32）:
+    mode      elapsed s   lag p50 ms   lag p99 ms   lag max ms
+    inline        50.24      7521.65      7545.65      7545.65
+    thread         2.04         0.23         1.84         1.91
+inlineでは1本のストリームの待ち時間の間ほかの全てのリクエストが止まり、ストリームは直列に処理される。
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List
+
+from app.core.stream_bridge import iterate_in_thread
+
+PROBE_INTERVAL = 0.01
+
+
+def fake_stream(chunks: int, chunk_delay: float) -> Iterator[str]:
+    """generate_content(stream=True) を模した同期ジェネレーター"""
+    for index in range(chunks):
+        time.sleep(chunk_delay)
+        yield f"chunk-{index} "
+
+
+async def _probe(lags: List[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(max(0.0, time.perf_counter() - start - PROBE_INTERVAL))
+
+
+async def _read_inline(chunks: int, chunk_delay: float) -> int:
+    count = 0
+    for _ in fake_stream(chunks, chunk_delay):
+        count += 1
+        await asyncio.sleep(0)
+    return count
+
+
+async def _read_thread(chunks: int, chunk_delay: float, executor: ThreadPoolExecutor) -> int:
+    count = 0
+    async for _ in iterate_in_thread(lambda: fake_stream(chunks, chunk_delay), executor):
+        count += 1
+    return count
+
+
+async def run(mode: str, streams: int, chunks: int, chunk_delay: float, workers: int) -> Dict[str, float]:
+    lags: List[float] = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe(lags, stop))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    start = time.perf_counter()
+    if mode == "inline":
+        counts = await asyncio.gather(*(_read_inline(chunks, chunk_delay) for _ in range(streams)))
+    else:
+        counts = await asyncio.gather(
+            *(_read_thread(chunks, chunk_delay, executor) for _ in range(streams))
+        )
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe
+    executor.shutdown()
+    assert sum(counts) == streams * chunks
+
+    lags.sort()
+    return {
+        "elapsed": elapsed,
+        "p50": statistics.median(lags) * 1000,
+        "p99": lags[int(len(lags) * 0.99)] * 1000,
+        "max": lags[-1] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--chunk-delay-ms", type=float, default=50.0)
+    parser.add_argument("--workers", type=int, default=32, help="threadモードのスレッド数")
+    parser.add_argument("--modes", nargs="+", default=["inline", "thread"])
+    args = parser.parse_args()
+
+    print(f"{'mode':<8}{'elapsed s':>11}{'lag p50 ms':>13}{'lag p99 ms':>13}{'lag max ms':>13}")
+    for mode in args.modes:
+        result = asyncio.run(
+            run(mode, args.streams, args.chunks, args.chunk_delay_ms / 1000, args.workers)
+        )
+        print(
+            f"{mode:<8}{result['elapsed']:>11.2f}{result['p50']:>13.2f}"
+            f"{result['p99']:>13.2f}{result['max']:>13.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+画像の縮小・再圧縮（process_uploaded_image）のベンチマーク
+
+スマートフォンの写真（既定では4032x3024・JPEG品質92）のコーパスを、次の2つの方式で処理する時間を比較する。
+- legacy  : 全体をデコードしてLANCZOSで縮小し、optimize=Trueのまま品質を10ずつ下げて再エンコードする（従来の実装）
+- current : app.utils.file_utils.process_uploaded_image（draft()・reduce→resize・品質の二分探索）
+--corpus にディレクトリを指定するとその中のJPEGを使い、指定しない場合は写真に近い合成画像
+（グラデーション・図形・センサーノイズ）を --count 枚作成して使う。
+--max-image-size を小さくすると品質の探索（再エンコード）が発生する条件を計測できる。
+
+使い方（backendの設定（.env）が読み込める環境で実行する）:
+    PYTHONPATH=.:backend python scripts/benchmarks/bench_image_recompress.py
+    PYTHONPATH=.:backend python scripts/benchmarks/bench_image_recompress.py --max-image-size 300000
+    PYTHONPATH=.:backend python scripts/benchmarks/bench_image_recompress.py --corpus ~/Pictures/phone
+
+結果の例（1 vCPU、合成画像6枚、MAX_LONG_EDGE=1568）:
+    MAX_IMAGE_SIZE=5242880（品質85の1回のエンコードで収まる）
+    mode       median ms   total s   avg KB
+    legacy         295.8      1.78    122.4
+    current        160.8      0.96    124.0
+    speedup: 1.85x
+
+    --max-image-size 60000（品質の探索が発生する）
+    mode       median ms   total s   avg KB
+    legacy         354.3      2.13     45.6
+    current        188.1      1.13     42.8
+    speedup: 1.89x
+4032x3024の写真はdraft()により2016x1512でデコードされ、デコードとリサイズの時間がほぼ半分になる。
+探索はoptimize無しで試すため、最終的な容量は上限に対して少し余裕を持った値になる。
+"""
+
+import argparse
+import base64
+import io
+import os
+import random
+import statistics
+import time
+from typing import Callable, List
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from app.utils import file_utils
+
+
+def synthetic_photo(seed: int, size=(4032, 3024)) -> bytes:
+    """写真に近い合成画像（なめらかな背景・図形・ノイズ）をJPEG品質92で返す"""
+    rng = random.Random(seed)
+    width, height = size
+    background = Image.linear_gradient("L").resize(size).convert("RGB")
+    tint = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+    image = Image.blend(background, tint, 0.6)
+    draw = ImageDraw.Draw(image)
+    for _ in range(60):
+        x, y = rng.randrange(width), rng.randrange(height)
+        r = rng.randrange(40, 600)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=color)
+        else:
+            draw.rectangle((x - r, y - r // 2, x + r, y + r // 2), fill=color)
+    image = image.filter(ImageFilter.GaussianBlur(3))
+    noise = Image.effect_noise(size, 40).convert("RGB")
+    image = Image.blend(image, noise, 0.12)
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=92)
+    return output.getvalue()
+
+
+def legacy_process_uploaded_image(image_data: str) -> str:
+    """変更前の process_uploaded_image（比較用）"""
+    header = None
+    if image_data.startswith("data:"):
+        header, image_data = image_data.split(",", 1)
+    image = Image.open(io.BytesIO(base64.b64decode(image_data)))
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+    width, height = image.size
+    if max(width, height) > file_utils.MAX_LONG_EDGE:
+        scale = file_utils.MAX_LONG_EDGE / max(width, height)
+        image = image.resize((int(width * scale), int(height * scale)), Image.Resampling.LANCZOS)
+    quality = 85
+    output = io.BytesIO()
+    image = image.convert("RGB")
+    image.save(output, format="JPEG", quality=quality, optimize=True)
+    output_data = output.getvalue()
+    while len(output_data) > file_utils.MAX_IMAGE_SIZE and quality > 30:
+        quality -= 10
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=quality, optimize=True)
+        output_data = output.getvalue()
+    return "data:image/jpeg;base64," + base64.b64encode(output_data).decode("utf-8")
+
+
+def load_corpus(directory: str, count: int) -> List[str]:
+    if directory:
+        names = sorted(
+            name for name in os.listdir(directory) if name.lower().endswith((".jpg", ".jpeg"))
+        )
+        blobs = [open(os.path.join(directory, name), "rb").read() for name in names]
+    else:
+        blobs = [synthetic_photo(seed) for seed in range(count)]
+    return ["data:image/jpeg;base64," + base64.b64encode(blob).decode("ascii") for blob in blobs]
+
+
+def measure(fn: Callable[[str], str], corpus: List[str], repeat: int):
+    times, sizes = [], []
+    for data_url in corpus:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn(data_url)
+            best = min(best, time.perf_counter() - start)
+        times.append(best)
+        sizes.append(len(base64.b64decode(result.split(",", 1)[1])))
+    return times, sizes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default="", help="JPEGのディレクトリ（省略時は合成画像）")
+    parser.add_argument("--count", type=int, default=6, help="合成画像の枚数")
+    parser.add_argument("--repeat", type=int, default=3, help="1枚あたりの計測回数（最小値を使う）")
+    parser.add_argument("--max-image-size", type=int, default=file_utils.MAX_IMAGE_SIZE)
+    args = parser.parse_args()
+
+    file_utils.MAX_IMAGE_SIZE = args.max_image_size
+    corpus = load_corpus(args.corpus, args.count)
+    print(f"images={len(corpus)} MAX_LONG_EDGE={file_utils.MAX_LONG_EDGE} MAX_IMAGE_SIZE={args.max_image_size}")
+    print(f"{'mode':<9}{'median ms':>11}{'total s':>10}{'avg KB':>9}")
+    results = {}
+    for mode, fn in (("legacy", legacy_process_uploaded_image), ("current", file_utils.process_uploaded_image)):
+        times, sizes = measure(fn, corpus, args.repeat)
+        results[mode] = sum(times)
+        print(
+            f"{mode:<9}{statistics.median(times) * 1000:>11.1f}{sum(times):>10.2f}"
+            f"{statistics.mean(sizes) / 1024:>9.1f}"
+        )
+    print(f"speedup: {results['legacy'] / results['current']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+ログ出力によるイベントループの遅延を計測するベンチマーク
+
+同期ハンドラ（従来のbasicConfig相当: StreamHandler + FileHandler）と
+QueueHandler/QueueListener経由の非同期パイプラインを同じ負荷で比較する。
+リクエスト処理を模したタスクが1msごとにログを出す間、
+- logger.info の呼び出しに掛かった時間（イベントループのスレッドが止まる時間）
+- 1msごとに起きるプローブタスクの寝過ごし時間（イベントループの遅延）
+を集計する。--io-delay-ms で書き込みが遅いストレージ（ディスクの競合など）を模擬できる。
+
+使い方:
+    PYTHONPATH=. python scripts/benchmarks/bench_logging_latency.py --tasks 50 --seconds 5
+    PYTHONPATH=. python scripts/benchmarks/bench_logging_latency.py --io-delay-ms 0.2
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import queue
+import statistics
+import tempfile
+import time
+from logging.handlers import QueueListener
+from typing import Dict, List, Tuple
+
+from common_utils.logger import JsonFormatter, _DroppingQueueHandler, _LogQueueListener
+
+
+class _SlowFileHandler(logging.FileHandler):
+    """書き込みごとに指定時間ブロックするFileHandler（遅いストレージの模擬）"""
+
+    def __init__(self, filename: str, delay_seconds: float):
+        super().__init__(filename)
+        self.delay_seconds = delay_seconds
+
+    def emit(self, record: logging.LogRecord) -> None:
+        super().emit(record)
+        if self.delay_seconds:
+            time.sleep(self.delay_seconds)
+
+
+def _output_handlers(log_dir: str, io_delay_ms: float) -> List[logging.Handler]:
+    """標準出力の代わりに/dev/null、ファイルは一時ディレクトリに出力する"""
+    stream = logging.StreamHandler(open(os.devnull, "w"))
+    file = _SlowFileHandler(os.path.join(log_dir, "bench.log"), io_delay_ms / 1000)
+    for handler in (stream, file):
+        handler.setFormatter(JsonFormatter())
+    return [stream, file]
+
+
+def _setup(
+    mode: str, log_dir: str, io_delay_ms: float
+) -> Tuple[logging.Logger, QueueListener | None, _DroppingQueueHandler | None]:
+    bench_logger = logging.getLogger(f"bench.{mode}")
+    bench_logger.propagate = False
+    bench_logger.setLevel(logging.INFO)
+    handlers = _output_handlers(log_dir, io_delay_ms)
+    if mode == "sync":
+        for handler in handlers:
+            bench_logger.addHandler(handler)
+        return bench_logger, None, None
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(10000)
+    queue_handler = _DroppingQueueHandler(log_queue)
+    bench_logger.addHandler(queue_handler)
+    listener = _LogQueueListener(log_queue, *handlers)
+    listener.start()
+    return bench_logger, listener, queue_handler
+
+
+def _percentile(values: List[float], ratio: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+async def _run(
+    mode: str, tasks: int, seconds: float, io_delay_ms: float
+) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as log_dir:
+        bench_logger, listener, queue_handler = _setup(mode, log_dir, io_delay_ms)
+        stop = asyncio.Event()
+        lags: List[float] = []
+        call_times: List[float] = []
+
+        async def load(index: int) -> None:
+            payload = {"event": "chunk", "task": index, "text": "x" * 2000}
+            while not stop.is_set():
+                start = time.perf_counter()
+                bench_logger.info(payload)
+                call_times.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0.001)
+
+        async def probe() -> None:
+            while not stop.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.001)
+                lags.append((time.perf_counter() - start - 0.001) * 1000)
+
+        workers = [asyncio.create_task(load(i)) for i in range(tasks)]
+        prober = asyncio.create_task(probe())
+        await asyncio.sleep(seconds)
+        stop.set()
+        await asyncio.gather(*workers, prober)
+        if listener is not None:
+            listener.stop()
+        for handler in bench_logger.handlers:
+            handler.close()
+
+    lags.sort()
+    call_times.sort()
+    logged = len(call_times)
+    dropped = queue_handler.dropped if queue_handler is not None else 0
+    return {
+        "logged_per_sec": logged / seconds,
+        "dropped": dropped,
+        "call_p50_ms": statistics.median(call_times),
+        "call_p99_ms": _percentile(call_times, 0.99),
+        "lag_p50_ms": statistics.median(lags),
+        "lag_p99_ms": _percentile(lags, 0.99),
+        "lag_max_ms": lags[-1],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tasks", type=int, default=50, help="ログを出し続けるタスク数")
+    parser.add_argument("--seconds", type=float, default=5.0, help="各モードの計測時間")
+    parser.add_argument(
+        "--io-delay-ms", type=float, default=0.0, help="ファイル書き込み1回ごとの追加の遅延"
+    )
+    args = parser.parse_args()
+
+    for mode in ("sync", "queue"):
+        result = asyncio.run(_run(mode, args.tasks, args.seconds, args.io_delay_ms))
+        print(
+            f"{mode:>5}: {result['logged_per_sec']:>7.0f} logs/s (dropped {result['dropped']})  "
+            f"logger.info p50={result['call_p50_ms']:.3f}ms p99={result['call_p99_ms']:.3f}ms  "
+            f"loop lag p50={result['lag_p50_ms']:.2f}ms "
+            f"p99={result['lag_p99_ms']:.2f}ms max={result['lag_max_ms']:.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Hypercornのワーカー数によるスループットの比較ベンチマーク
+
+実際のFastAPIアプリ（app.main:app）の外部SDK呼び出しだけをローカルのスタブに置き換え、
+1ワーカーとNワーカーで次のエンドポイントのスループットとレイテンシを比較する。
+- POST /backend/chat      : Vertex AIのストリーミング応答を模したブロッキングなジェネレーター
+- GET  /backend/whisper/jobs : Firestoreのクエリを模したブロッキングな呼び出し + 50件のJSON応答
+スタブはSDKと同じくイベントループのスレッドをブロックするため、
+1ワーカーでは1コアで直列化され、ワーカー数を増やすとCPU数に応じてスループットが伸びる。
+
+使い方（バックエンドの必須環境変数を設定した状態で、リポジトリのルートから実行）:
+    PYTHONPATH=.:backend python scripts/benchmarks/bench_server_workers.py 1 auto
+    PYTHONPATH=.:backend python scripts/benchmarks/bench_server_workers.py --concurrency 64 --seconds 10
+
+結果の例（1 vCPU、1 2 --concurrency 16 --seconds 5、uvloop、スタブの待ち時間20ms）:
+    workers endpoint      req/s     p50 ms    p99 ms
+    1       chat           39.2      411.2     474.2
+    1       jobs           27.7      570.1     669.0
+    2       chat           73.6      230.4     412.9
+    2       jobs           51.4      310.9     516.7
+1 vCPUでもSDKの待ち時間はワーカー間で重なるためスループットはほぼ倍になる。
+CPUが複数あれば "auto"（CPU数）までCPU処理（ログ・JSON変換）も並列化される。
+なおメトリクス（/backend/metrics）やトークンキャッシュはワーカーごとに独立する。
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+from typing import Dict, List
+
+import httpx
+
+# 複数ワーカー時に各ワーカーが読み込むスタブ付きアプリ
+STUB_APPLICATION_PATH = "scripts.benchmarks.bench_server_workers:create_stub_app()"
+
+REQUEST_HEADERS = {"X-Request-Id": "F0123456789ab", "Authorization": "Bearer bench"}
+
+CHAT_BODY = {
+    "messages": [{"role": "user", "content": "ベンチマーク"}],
+    "model": "bench-model",
+}
+
+
+class _FakeQuery:
+    """Firestoreのクエリを模したスタブ（stream()でブロッキングに待ってからドキュメントを返す）"""
+
+    def __init__(self, delay: float, docs: int):
+        self.delay = delay
+        self.docs = docs
+
+    def where(self, *args, **kwargs):
+        return self
+
+    def order_by(self, *args, **kwargs):
+        return self
+
+    def limit(self, *args, **kwargs):
+        return self
+
+    def stream(self):
+        time.sleep(self.delay)
+        return [
+            SimpleNamespace(
+                id=f"job-{index}",
+                to_dict=lambda index=index: {
+                    "file_hash": f"{index:064x}",
+                    "status": "completed",
+                    "user_email": "bench@example.com",
+                    "filename": f"audio-{index}.wav",
+                    "tags": ["bench"],
+                },
+            )
+            for index in range(self.docs)
+        ]
+
+
+class _FakeFirestore:
+    def __init__(self, delay: float, docs: int):
+        self.delay = delay
+        self.docs = docs
+
+    def collection(self, name: str) -> _FakeQuery:
+        return _FakeQuery(self.delay, self.docs)
+
+
+def create_stub_app():
+    """外部SDKの呼び出しをスタブに置き換えたapp.main:appを返す（各ワーカーで呼ばれる）"""
+    from app.api import chat, whisper
+    from app.api.auth import get_current_user
+    from app.core.clients import get_clients
+    from app.main import app
+    from app.services import chat_service
+
+    upstream_delay = float(os.environ.get("BENCH_UPSTREAM_DELAY_MS", "20")) / 1000
+    chunks = int(os.environ.get("BENCH_CHAT_CHUNKS", "10"))
+    firestore = _FakeFirestore(upstream_delay, docs=50)
+
+    def fake_message_function(**kwargs):
+        for index in range(chunks):
+            time.sleep(upstream_delay / chunks)
+            yield f"chunk-{index} "
+
+    async def fake_check_timeout_jobs(db):
+        time.sleep(upstream_delay / 2)
+
+    chat_service.common_message_function = fake_message_function
+    chat.get_api_key_for_model = lambda model: ""
+    whisper.check_and_update_timeout_jobs = fake_check_timeout_jobs
+    whisper._get_current_processing_job_count = lambda: 10**6
+    app.dependency_overrides[get_current_user] = lambda: {
+        "uid": "bench",
+        "email": "bench@example.com",
+    }
+    app.dependency_overrides[get_clients] = lambda: SimpleNamespace(firestore=firestore)
+    return app
+
+
+def serve(workers: str, port: int) -> None:
+    """スタブ付きアプリをapp.core.server.run_serverで起動する"""
+    from app.core.config import get_settings
+    from app.core.server import run_server
+
+    settings = dataclasses.replace(
+        get_settings(), server_workers=workers, port=port, ssl_cert_path="", ssl_key_path=""
+    )
+    run_server(create_stub_app(), settings, application_path=STUB_APPLICATION_PATH)
+
+
+async def _wait_until_ready(base_url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                # 応答が返れば起動済みとみなす（/backend/metrics は既定で無効のため404になる）
+                await client.get(f"{base_url}/backend/metrics")
+                return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("サーバーが起動しませんでした")
+
+
+async def _load(base_url: str, endpoint: str, concurrency: int, seconds: float) -> Dict[str, float]:
+    """concurrency本の接続で指定秒数リクエストを送り続ける"""
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+
+        async def worker() -> None:
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                if endpoint == "chat":
+                    async with client.stream(
+                        "POST", "/backend/chat", json=CHAT_BODY, headers=REQUEST_HEADERS
+                    ) as response:
+                        await response.aread()
+                else:
+                    response = await client.get("/backend/whisper/jobs", headers=REQUEST_HEADERS)
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+        "errors": errors,
+    }
+
+
+def bench(workers: str, port: int, concurrency: int, seconds: float) -> Dict[str, Dict[str, float]]:
+    server = subprocess.Popen(
+        [sys.executable, __file__, "--serve", "--port", str(port), "--workers", workers],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        asyncio.run(_wait_until_ready(base_url))
+        return {
+            endpoint: asyncio.run(_load(base_url, endpoint, concurrency, seconds))
+            for endpoint in ("chat", "jobs")
+        }
+    finally:
+        # SIGTERMで処理中のリクエストを待って終了する（graceful drain）
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("worker_counts", nargs="*", default=["1", "auto"], help='比較するワーカー数（"auto"でCPU数）')
+    parser.add_argument("--workers", default="1", help=argparse.SUPPRESS)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.workers, args.port)
+        return
+
+    print(f"{'workers':<8}{'endpoint':<10}{'req/s':>9}{'p50 ms':>11}{'p99 ms':>10}{'errors':>8}")
+    for workers in args.worker_counts:
+        for endpoint, result in bench(workers, args.port, args.concurrency, args.seconds).items():
+            print(
+                f"{workers:<8}{endpoint:<10}{result['rps']:>9.1f}{result['p50_ms']:>11.1f}"
+                f"{result['p99_ms']:>10.1f}{result['errors']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -63,6 +63,106 @@ def mock_heavy_modules():
 mock_heavy_modules()
 
 
+# ==============================================================================
+# Backend Settings Environment
+# ==============================================================================
+
+# app.core.config.Settings が必要とする環境変数のテスト用デフォルト値
+BACKEND_TEST_ENV = {
+    "FRONTEND_PATH": "./frontend/dist",
+    "SENSITIVE_KEYS": "password,token,secret",
+    "GCP_PROJECT_ID": "test-project",
+    "GCP_REGION": "us-central1",
+    "GCS_BUCKET_NAME": "test-bucket",
+    "GCS_BUCKET": "test-bucket",
+    "PUBSUB_TOPIC": "test-topic",
+    "WHISPER_JOBS_COLLECTION": "whisper_jobs",
+    "WHISPER_AUDIO_BLOB": "whisper/{file_hash}.{ext}",
+    "WHISPER_COMBINE_BLOB": "whisper/{file_hash}/combine.json",
+    "MODELS": "{gemini-2.0-flash-001},gemini-2.0-flash-lite-preview-02-05",
+    "LOGOUT_LOG_MAX_LENGTH": "100",
+    "VERIFY_AUTH_LOG_MAX_LENGTH": "200",
+    "MIDDLE_WARE_LOG_MAX_LENGTH": "200",
+    "CHAT_LOG_MAX_LENGTH": "300",
+    "CONFIG_LOG_MAX_LENGTH": "300",
+    "GEOCODING_LOG_MAX_LENGTH": "300",
+    "GENERATE_IMAGE_LOG_MAX_LENGTH": "500",
+    "SPEECH2TEXT_LOG_MAX_LENGTH": "1200",
+    "GENERAL_LOG_MAX_LENGTH": "300",
+    "MAX_IMAGES": "10",
+    "MAX_AUDIO_FILES": "1",
+    "MAX_TEXT_FILES": "10",
+    "MAX_LONG_EDGE": "1568",
+    "MAX_IMAGE_SIZE": "5242880",
+    "GOOGLE_MAPS_API_CACHE_TTL": "2592000",
+    "GEOCODING_NO_IMAGE_MAX_BATCH_SIZE": "300",
+    "GEOCODING_WITH_IMAGE_MAX_BATCH_SIZE": "30",
+    "SPEECH_MAX_SECONDS": "10800",
+    "IMAGEN_MODELS": "{imagen-3.0-generate-002},imagen-3.0-generate-001",
+    "IMAGEN_NUMBER_OF_IMAGES": "{1},2,3,4",
+    "IMAGEN_ASPECT_RATIOS": "1:1,9:16,16:9",
+    "IMAGEN_LANGUAGES": "auto,en,ja",
+    "IMAGEN_ADD_WATERMARK": "true,false",
+    "IMAGEN_SAFETY_FILTER_LEVELS": "{block_medium_and_above},block_only_high",
+    "IMAGEN_PERSON_GENERATIONS": "dont_allow,{allow_adult}",
+    "WHISPER_MAX_SECONDS": "5400",
+    "WHISPER_MAX_BYTES": "104857600",
+    # テストでは公開鍵証明書の定期取得（ネットワークアクセス）を行わない
+    "TOKEN_CERT_REFRESH_SECONDS": "0",
+}
+
+# 他の値から既定値を求める設定（tests/app の conftest が残した値を使わず、既定値で検証する）
+BACKEND_UNSET_ENV = ("MAX_AUDIO_BASE64_CHARS",)
+
+for _key, _value in BACKEND_TEST_ENV.items():
+    os.environ.setdefault(_key, _value)
+
+
+@pytest.fixture
+def backend_env(monkeypatch):
+    """Settingsのキャッシュをクリアし、テスト用の環境変数を設定する"""
+    from app.core.config import get_settings
+
+    for key, value in BACKEND_TEST_ENV.items():
+        monkeypatch.setenv(key, value)
+    for key in BACKEND_UNSET_ENV:
+        monkeypatch.delenv(key, raising=False)
+    get_settings.cache_clear()
+    yield monkeypatch
+    get_settings.cache_clear()
+
+
+@pytest.fixture
+def inline_worker_pool(backend_env):
+    """
+    プロセスプールの代わりにスレッドで実行し、プールで実行する関数の呼び出しを記録する
+    replace(module, function_name, executor_getter, cache_getter, cache_bytes) で
+    moduleのプール・結果のキャッシュを置き換え、function_nameの呼び出しの引数のリストを返す
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app.services.attachment_store import BytesLruCache
+
+    executor = ThreadPoolExecutor(max_workers=2)
+
+    def replace(module, function_name, executor_getter, cache_getter, cache_bytes):
+        calls = []
+        function = getattr(module, function_name)
+
+        def counting(arg):
+            calls.append(arg)
+            return function(arg)
+
+        cache = BytesLruCache(cache_bytes)
+        backend_env.setattr(module, function_name, counting)
+        backend_env.setattr(module, executor_getter, lambda: executor)
+        backend_env.setattr(module, cache_getter, lambda: cache)
+        return calls
+
+    yield replace
+    executor.shutdown()
+
+
 # ==============================================================================
 # Emulator Availability Check
 # ==============================================================================
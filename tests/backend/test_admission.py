@@ -0,0 +1,95 @@
+"""
+Vertex AI呼び出しのアドミッション制御のテスト
+
+app.services.admission のモデルごとの同時実行数の制限・待ち行列の上限とタイムアウト、
+429/503のバックオフ付きの再試行と、/chat が混雑時にRetry-After付きの429を返すことを確認します。
+"""
+
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.services.admission import AdmissionController, AdmissionRejected, call_with_backoff
+
+REQUEST_HEADERS = {"X-Request-Id": "F0123456789ab"}
+
+
+class QuotaExceeded(Exception):
+    code = 429
+
+
+class TestAdmissionController:
+    """AdmissionControllerのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_queue_full_is_rejected(self):
+        """同時実行数と待ち行列が埋まっている場合はすぐに拒否されること"""
+        controller = AdmissionController(concurrency=1, max_queue=1, queue_timeout=5)
+        ticket = await controller.acquire("m")
+        waiter = asyncio.create_task(controller.acquire("m"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("m")
+        ticket.release()
+        ticket.release()  # 2回目は何もしない
+        (await waiter).release()
+
+        assert rejected.value.retry_after >= 1
+        assert not controller._model_slots("m").semaphore.locked()
+
+    @pytest.mark.asyncio
+    async def test_wait_times_out(self):
+        """待ち時間がタイムアウトした場合は拒否され、他のモデルの枠には影響しないこと"""
+        controller = AdmissionController(concurrency=1, max_queue=4, queue_timeout=0.01)
+        await controller.acquire("m")
+
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire("m")
+        async with controller.admit("other"):
+            pass
+
+
+def test_backoff_retries_only_throttling_errors():
+    """429は再試行し、それ以外のエラーはそのまま送出すること"""
+    delays = []
+    results = iter([QuotaExceeded(), QuotaExceeded(), "ok"])
+
+    def call():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert call_with_backoff(call, "op", attempts=4, base_delay=1, max_delay=2, sleep=delays.append) == "ok"
+    assert len(delays) == 2 and all(0 <= d <= 2 for d in delays)
+    with pytest.raises(ValueError):
+        call_with_backoff(lambda: (_ for _ in ()).throw(ValueError()), "op", sleep=delays.append)
+    assert len(delays) == 2
+
+
+def test_chat_returns_429_with_retry_after(backend_env, monkeypatch):
+    """実行枠を取得できない場合、/chat はRetry-After付きの429を返すこと"""
+    from app.api import chat
+    from app.api.auth import get_current_user
+
+    class Busy:
+        async def acquire(self, model):
+            raise AdmissionRejected(model, 7)
+
+    monkeypatch.setattr(chat, "get_admission_controller", lambda: Busy())
+    monkeypatch.setattr(chat, "get_api_key_for_model", lambda model: "key")
+    app = FastAPI()
+    app.include_router(chat.router, prefix="/backend")
+    app.dependency_overrides[get_current_user] = lambda: {"uid": "u", "email": "u@example.com"}
+
+    response = TestClient(app).post(
+        "/backend/chat",
+        json={"model": "gemini-2.0-flash-001", "messages": [{"role": "user", "content": "hi"}]},
+        headers=REQUEST_HEADERS,
+    )
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "7"
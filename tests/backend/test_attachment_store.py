@@ -0,0 +1,176 @@
+"""
+チャット添付ファイルのストアのテスト
+
+app.services.attachment_store のコンテンツアドレスでの保存・重複排除・LRUによる削除と、
+/chat/attachments でのアップロード、未保存のhashや他のユーザーのhashを参照した /chat が409になることを確認します。
+"""
+
+import base64
+import hashlib
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.services.attachment_store import (
+    LocalAttachmentStore,
+    decode_file_content,
+    missing_attachments,
+    owner_key,
+)
+
+REQUEST_HEADERS = {"X-Request-Id": "F0123456789ab"}
+
+
+class TestLocalAttachmentStore:
+    """LocalAttachmentStoreのテスト"""
+
+    def test_put_is_content_addressed(self, tmp_path):
+        """同じ内容は同じSHA-256で1度だけ保存されること"""
+        store = LocalAttachmentStore(str(tmp_path), max_bytes=1024, cache_bytes=1024)
+
+        first = store.put(b"hello", "u")
+        second = store.put(b"hello", "u")
+
+        assert first == second == hashlib.sha256(b"hello").hexdigest()
+        assert store.get(owner_key("u", first)) == b"hello"
+        assert [p.name for p in tmp_path.iterdir()] == [owner_key("u", first)]
+
+    def test_keys_are_scoped_by_owner(self, tmp_path):
+        """同じ内容でもユーザーごとに別のキーで保存され、他のユーザーのhashは無いものとして扱うこと"""
+        store = LocalAttachmentStore(str(tmp_path), max_bytes=1024, cache_bytes=1024)
+        digest = store.put(b"secret", "alice")
+
+        assert missing_attachments(store, "alice", [digest]) == []
+        assert missing_attachments(store, "bob", [digest]) == [digest]
+        assert store.get(owner_key("bob", digest)) is None
+
+    def test_least_recently_used_is_evicted(self, tmp_path):
+        """合計サイズの上限を超えると最も古く使われたファイルから削除されること"""
+        store = LocalAttachmentStore(str(tmp_path), max_bytes=10, cache_bytes=0)
+        a = store.put(b"aaaa", "u")
+        b = store.put(b"bbbb", "u")
+        store.get(owner_key("u", a))
+        c = store.put(b"cccc", "u")
+
+        assert missing_attachments(store, "u", [a, b, c]) == [b]
+        assert store.get(owner_key("u", b)) is None
+
+    def test_existing_files_are_loaded(self, tmp_path):
+        """再起動後も保存済みのファイルを参照できること"""
+        digest = LocalAttachmentStore(str(tmp_path), 1024, 1024).put(b"persisted", "u")
+
+        assert LocalAttachmentStore(str(tmp_path), 1024, 1024).get(owner_key("u", digest)) == b"persisted"
+
+    def test_directory_is_shared_between_workers(self, tmp_path):
+        """同じディレクトリを使う別のワーカーが保存・削除したファイルも反映されること"""
+        first = LocalAttachmentStore(str(tmp_path), max_bytes=10, cache_bytes=0)
+        second = LocalAttachmentStore(str(tmp_path), max_bytes=10, cache_bytes=0)
+        a = first.put(b"aaaa", "u")
+        b = second.put(b"bbbb", "u")
+
+        assert first.exists(owner_key("u", b)) and first.get(owner_key("u", b)) == b"bbbb"
+        assert second.exists(owner_key("u", a)) and second.get(owner_key("u", a)) == b"aaaa"
+
+        # 合計サイズはディレクトリ全体で数え、最も古く使われたファイル（b）を削除する
+        c = first.put(b"cccc", "u")
+        assert missing_attachments(second, "u", [a, b, c]) == [b]
+        assert second.get(owner_key("u", b)) is None
+        assert sum(p.stat().st_size for p in tmp_path.iterdir()) <= 10
+
+    def test_decode_file_content(self):
+        """画像はbase64（data URL）をデコードし、テキストはUTF-8で保存すること"""
+        encoded = "data:image/png;base64," + base64.b64encode(b"\x89PNG").decode()
+
+        assert decode_file_content(encoded, "image/png") == b"\x89PNG"
+        assert decode_file_content("本文", "text/plain") == "本文".encode("utf-8")
+
+
+class TestChatAttachmentApi:
+    """/chat/attachments と /chat のhash参照のテスト"""
+
+    @pytest.fixture
+    def client(self, backend_env, tmp_path, monkeypatch):
+        from app.api import chat
+        from app.api.auth import get_current_user
+
+        store = LocalAttachmentStore(str(tmp_path), 1024 * 1024, 1024 * 1024)
+        monkeypatch.setattr(chat, "get_attachment_store", lambda: store)
+        app = FastAPI()
+        app.include_router(chat.router, prefix="/backend")
+        app.dependency_overrides[get_current_user] = lambda: {"uid": "u", "email": "u@example.com"}
+        return TestClient(app)
+
+    def test_upload_returns_hash(self, client):
+        """アップロードするとSHA-256のhashが返ること"""
+        response = client.post(
+            "/backend/chat/attachments",
+            json={"content": "memo", "mimeType": "text/plain", "name": "memo.txt"},
+            headers=REQUEST_HEADERS,
+        )
+
+        assert response.status_code == 200
+        assert response.json() == {"hash": hashlib.sha256(b"memo").hexdigest(), "size": 4}
+
+    def test_unknown_hash_is_conflict(self, client):
+        """保存されていないhashを参照した場合は409で不足しているhashが返ること"""
+        unknown = "0" * 64
+        response = client.post(
+            "/backend/chat",
+            json={
+                "model": "gemini-2.0-flash-001",
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": "要約して",
+                        "files": [{"name": "a.txt", "mimeType": "text/plain", "hash": unknown}],
+                    }
+                ],
+            },
+            headers=REQUEST_HEADERS,
+        )
+
+        assert response.status_code == 409
+        assert response.json()["detail"] == {"missing": [unknown]}
+
+    def test_other_users_hash_is_conflict(self, client):
+        """他のユーザーがアップロードしたhashは保存されていないものとして409になること"""
+        from app.api.auth import get_current_user
+
+        client.app.dependency_overrides[get_current_user] = lambda: {"uid": "other", "email": ""}
+        digest = client.post(
+            "/backend/chat/attachments",
+            json={"content": "機密", "mimeType": "text/plain", "name": "secret.txt"},
+            headers=REQUEST_HEADERS,
+        ).json()["hash"]
+        client.app.dependency_overrides[get_current_user] = lambda: {"uid": "u", "email": ""}
+
+        response = client.post(
+            "/backend/chat",
+            json={
+                "model": "gemini-2.0-flash-001",
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": "要約して",
+                        "files": [{"name": "secret.txt", "mimeType": "text/plain", "hash": digest}],
+                    }
+                ],
+            },
+            headers=REQUEST_HEADERS,
+        )
+
+        assert response.status_code == 409
+        assert response.json()["detail"] == {"missing": [digest]}
+
+    def test_hashes_are_resolved_to_owner_keys(self, backend_env):
+        """/chat では files のhashをユーザーのストアのキーに置き換えてから参照すること"""
+        from app.api.chat import _scope_attachment_hashes
+
+        digest = hashlib.sha256(b"memo").hexdigest()
+        messages = [{"role": "user", "content": "見て", "files": [{"name": "a.txt", "hash": digest}]}]
+
+        scoped = _scope_attachment_hashes(messages, "u")
+
+        assert scoped[0]["files"][0]["hash"] == owner_key("u", digest)
+        assert messages[0]["files"][0]["hash"] == digest
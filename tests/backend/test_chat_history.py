@@ -0,0 +1,102 @@
+"""
+チャット履歴のトークン予算による調整のテスト
+
+app.services.chat_history が予算内の会話はそのまま返し、予算を超えた会話は古いターンから省略すること、
+count_tokensの結果をキャッシュして概算を補正すること、参照されている添付ファイルを残すことを確認します。
+"""
+
+from app.services.chat_history import HistoryTrimmer
+
+MODEL = "gemini-2.0-flash-001"
+
+
+def conversation(turns: int, size: int = 400):
+    messages = [{"role": "system", "content": "あなたはアシスタントです"}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"質問{i} " + "a" * size})
+        messages.append({"role": "assistant", "content": f"回答{i} " + "b" * size})
+    messages.append({"role": "user", "content": "最後の質問"})
+    return messages
+
+
+def test_conversation_within_budget_is_unchanged():
+    """予算内の会話はそのまま返し、count_tokensも呼ばないこと"""
+    calls = []
+    messages = conversation(2)
+
+    result = HistoryTrimmer(10000).fit(MODEL, messages, lambda msgs: calls.append(msgs) or 0)
+
+    assert result.messages is messages
+    assert result.tokens_saved == 0
+    assert calls == []
+
+
+def test_old_turns_are_dropped_to_target():
+    """予算を超えた場合は古いターンから省略して要約を付け、省略したトークン数を返すこと"""
+    messages = conversation(10)
+
+    result = HistoryTrimmer(1000, target_ratio=0.5).fit(MODEL, messages)
+
+    assert result.messages[0] == messages[0]
+    assert result.messages[-1]["content"].endswith("最後の質問")
+    assert result.messages[1]["role"] == "user"
+    assert "省略した主な質問" in result.messages[1]["content"]
+    assert result.tokens <= 500
+    assert result.tokens_saved == result.original_tokens - result.tokens > 0
+
+
+def test_count_tokens_is_cached_and_calibrates_estimate():
+    """count_tokensの結果は同じ先頭部分では再利用され、概算の補正に使われること"""
+    calls = []
+
+    def count_tokens(msgs):
+        calls.append(len(msgs))
+        return 2000
+
+    trimmer = HistoryTrimmer(2500, count_threshold=0.1)
+    messages = conversation(4)
+    first = trimmer.fit(MODEL, messages, count_tokens)
+    trimmer.fit(MODEL, messages, count_tokens)
+
+    assert first.original_tokens == 2000
+    assert calls == [len(messages)]
+    assert trimmer.counter.estimate(MODEL, messages, _fingerprints(messages)) == 2000
+    assert trimmer.counter.ratio(MODEL) > 1.0
+
+
+def test_attachment_referenced_by_recent_turn_is_kept():
+    """省略したターンの添付ファイルでも、残ったメッセージで名前が出てくるものは残すこと"""
+    report = {"name": "report.pdf", "mimeType": "application/pdf", "hash": "0" * 64, "size": 400}
+    other = {"name": "other.txt", "mimeType": "text/plain", "content": "memo"}
+    messages = conversation(6)
+    messages[1] = dict(messages[1], files=[report, other])
+    messages[-1] = {"role": "user", "content": "report.pdfの結論は？"}
+
+    result = HistoryTrimmer(800, target_ratio=0.5).fit(MODEL, messages)
+
+    assert result.kept_attachments == ["report.pdf"]
+    assert result.messages[1]["files"] == [report]
+
+
+def test_list_content_keeps_image_parts():
+    """残った最初のメッセージがリスト形式の場合は、画像のパートを残したまま要約を先頭に追加すること"""
+    last = [
+        {"type": "text", "text": "この画像は？"},
+        {"type": "image_url", "image_url": {"url": "data:image/png;base64,AAAA"}},
+    ]
+    messages = conversation(6)
+    messages[-1] = {"role": "user", "content": last}
+
+    result = HistoryTrimmer(100).fit(MODEL, messages)
+
+    content = result.messages[-1]["content"]
+    assert content[0]["type"] == "text" and "省略した主な質問" in content[0]["text"]
+    assert content[1:] == last
+    assert messages[-1]["content"] == last
+
+
+def _fingerprints(messages):
+    from app.services.context_cache import message_fingerprints
+
+    return message_fingerprints(MODEL, messages)
+
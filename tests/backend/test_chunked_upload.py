@@ -0,0 +1,151 @@
+"""
+チャットリクエストの分割アップロードのテスト
+
+app.services.chunked_upload のチャンクの保存・順不同での結合・チェックサムの検証・合計サイズの上限・期限切れの削除と、
+/chat が全チャンクが揃うまで202を返し、揃ったら結合したリクエストで応答することを確認します。
+"""
+
+import base64
+import hashlib
+import json
+import os
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.services.chunked_upload import (
+    ChunkedUploadStore,
+    ChunkUploadError,
+    load_assembled_request,
+)
+
+REQUEST_HEADERS = {"X-Request-Id": "F0123456789ab"}
+CHUNK_ID = "upload-0001"
+
+
+def split_payload(payload: bytes, size: int):
+    return [
+        base64.b64encode(payload[i : i + size]).decode() for i in range(0, len(payload), size)
+    ]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChunkedUploadStore(
+        str(tmp_path), ttl_seconds=60, max_chunk_bytes=1024, max_chunks=16, max_total_bytes=4096
+    )
+
+
+class TestChunkedUploadStore:
+    """ChunkedUploadStoreのテスト"""
+
+    def test_out_of_order_chunks_are_assembled(self, store):
+        """順不同で届いたチャンクがchunkIndexの順に結合されること"""
+        payload = json.dumps({"model": "m", "messages": [{"role": "user", "content": "x" * 50}]})
+        chunks = split_payload(payload.encode(), 16)
+        order = list(reversed(range(len(chunks))))
+
+        statuses = [store.save_chunk(CHUNK_ID, i, len(chunks), chunks[i], "u") for i in order]
+
+        assert all(s.assembled_path is None for s in statuses[:-1])
+        assert statuses[-1].received == len(chunks)
+        assert load_assembled_request(store, statuses[-1]) == json.loads(payload)
+        assert not os.path.exists(os.path.dirname(statuses[-1].assembled_path))
+
+    def test_checksum_mismatch_is_rejected(self, store):
+        """chunkChecksumが一致しないチャンクは保存されないこと"""
+        data = base64.b64encode(b"abc").decode()
+
+        with pytest.raises(ChunkUploadError):
+            store.save_chunk(CHUNK_ID, 0, 2, data, "u", checksum="0" * 64)
+        status = store.save_chunk(CHUNK_ID, 0, 2, data, "u", hashlib.sha256(b"abc").hexdigest())
+
+        assert status.received == 1
+
+    def test_total_size_over_limit_is_rejected(self, store, tmp_path):
+        """受信したチャンクの合計がmax_total_bytesを超えた場合は413にしてアップロードを削除すること"""
+        chunk = base64.b64encode(b"x" * 1024).decode()
+        for index in range(4):
+            store.save_chunk(CHUNK_ID, index, 8, chunk, "u")
+        # 再送は上書きのため合計に数えない
+        store.save_chunk(CHUNK_ID, 3, 8, chunk, "u")
+
+        with pytest.raises(ChunkUploadError) as error:
+            store.save_chunk(CHUNK_ID, 4, 8, chunk, "u")
+
+        assert error.value.status_code == 413
+        assert not (tmp_path / CHUNK_ID).exists()
+
+    def test_other_user_and_total_mismatch_are_rejected(self, store):
+        """他のユーザーのchunkIdやtotalChunksの変更は拒否されること"""
+        data = base64.b64encode(b"abc").decode()
+        store.save_chunk(CHUNK_ID, 0, 2, data, "u")
+
+        with pytest.raises(ChunkUploadError) as forbidden:
+            store.save_chunk(CHUNK_ID, 1, 2, data, "other")
+        with pytest.raises(ChunkUploadError):
+            store.save_chunk(CHUNK_ID, 1, 3, data, "u")
+
+        assert forbidden.value.status_code == 403
+
+    def test_expired_uploads_are_purged(self, store, tmp_path):
+        """ttl_seconds以上更新の無いアップロードが削除されること"""
+        store.save_chunk(CHUNK_ID, 0, 2, base64.b64encode(b"abc").decode(), "u")
+
+        assert store.purge_expired(now=time.time()) == 0
+        assert store.purge_expired(now=time.time() + 61) == 1
+        assert list(tmp_path.iterdir()) == []
+
+
+class TestChunkedChatApi:
+    """/chat の分割アップロードのテスト"""
+
+    @pytest.fixture
+    def client(self, backend_env, store, monkeypatch):
+        from app.api import chat
+        from app.api.auth import get_current_user
+
+        async def fake_stream(*, model, messages, **kwargs):
+            yield f"{model}:{messages[-1]['content']}"
+
+        monkeypatch.setattr(chat, "get_chunked_upload_store", lambda: store)
+        monkeypatch.setattr(chat, "get_api_key_for_model", lambda model: "key")
+        monkeypatch.setattr(chat, "stream_message_async", fake_stream)
+        app = FastAPI()
+        app.include_router(chat.router, prefix="/backend")
+        app.dependency_overrides[get_current_user] = lambda: {"uid": "u", "email": "u@example.com"}
+        return TestClient(app)
+
+    def test_last_chunk_streams_assembled_request(self, client):
+        """全チャンクが揃うまでは202を返し、揃ったら結合したリクエストで応答すること"""
+        payload = json.dumps(
+            {"model": "gemini-2.0-flash-001", "messages": [{"role": "user", "content": "分割"}]}
+        ).encode()
+        chunks = split_payload(payload, 20)
+        responses = [
+            client.post(
+                "/backend/chat",
+                json={
+                    "model": "gemini-2.0-flash-001",
+                    "messages": [],
+                    "chunked": True,
+                    "chunkId": CHUNK_ID,
+                    "chunkIndex": i,
+                    "totalChunks": len(chunks),
+                    "chunkData": chunk,
+                },
+                headers=REQUEST_HEADERS,
+            )
+            for i, chunk in enumerate(chunks)
+        ]
+
+        assert [r.status_code for r in responses[:-1]] == [202] * (len(chunks) - 1)
+        assert responses[0].json() == {
+            "chunkId": CHUNK_ID,
+            "received": 1,
+            "totalChunks": len(chunks),
+        }
+        assert responses[-1].status_code == 200
+        assert responses[-1].text == "gemini-2.0-flash-001:分割"
@@ -0,0 +1,132 @@
+"""
+Vertex AIのコンテキストキャッシュのテスト
+
+app.services.context_cache が会話の先頭部分のキャッシュを作成して次のターンで再利用すること、
+作成できないモデルではキャッシュを使わず、429/503の場合は次のターンで再び作成すること、
+上限を超えたキャッシュを削除することを確認します。
+"""
+
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.services import context_cache
+from app.services.context_cache import ContextCacheManager, estimate_text_tokens
+
+MODEL = "gemini-2.0-flash-001"
+
+
+class ApiError(Exception):
+    """google.api_core の例外と同じくHTTPのステータスコードをcodeに持つ"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+class ImmediateExecutor:
+    """バックグラウンド処理をその場で実行する"""
+
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+def conversation(turns: int):
+    messages = [{"role": "system", "content": "x" * 400}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"質問{i}" + "y" * 200})
+        messages.append({"role": "assistant", "content": f"回答{i}"})
+    messages.append({"role": "user", "content": "最後の質問"})
+    return messages
+
+
+@pytest.fixture
+def created(monkeypatch):
+    calls = []
+
+    def fake_create(model, system_instruction, contents, ttl_seconds, display_name):
+        calls.append((system_instruction, contents))
+        cached = MagicMock()
+        cached.name = f"cachedContents/{len(calls)}"
+        return cached
+
+    monkeypatch.setattr(context_cache, "_create_cached_content", fake_create)
+    return calls
+
+
+def make_manager(**kwargs):
+    manager = ContextCacheManager(ttl_seconds=600, min_tokens=100, **kwargs)
+    manager._executor = ImmediateExecutor()
+    return manager
+
+
+def test_prefix_is_cached_and_reused_next_turn(created):
+    """先頭部分のキャッシュを作成し、次のターンではキャッシュ以降のメッセージだけを送ること"""
+    manager = make_manager()
+    messages = conversation(1)
+
+    assert manager.plan(MODEL, messages, lambda msgs: msgs) is None
+    next_turn = messages + [{"role": "assistant", "content": "回答"}, {"role": "user", "content": "次"}]
+    plan = manager.plan(MODEL, next_turn, lambda msgs: msgs)
+
+    assert len(created) == 1
+    system_instruction, contents = created[0]
+    assert system_instruction == "x" * 400
+    assert [m["role"] for m in contents] == ["user", "assistant"]
+    assert plan.prefix_length == len(messages) - 1
+    assert plan.cached_content.name == "cachedContents/1"
+
+
+def test_failed_model_falls_back(monkeypatch):
+    """キャッシュを作成できないモデルでは再試行まで作成せず、キャッシュ無しで送ること"""
+    create = MagicMock(side_effect=ApiError(400, "minimum token count"))
+    monkeypatch.setattr(context_cache, "_create_cached_content", create)
+    manager = make_manager()
+
+    assert manager.plan(MODEL, conversation(1), lambda msgs: msgs) is None
+    assert manager.plan(MODEL, conversation(2), lambda msgs: msgs) is None
+    assert create.call_count == 1
+
+
+def test_throttled_create_is_retried_next_turn(monkeypatch):
+    """429/503で作成できなかった場合はモデルを非対応とせず、次のターンで再び作成すること"""
+    create = MagicMock(side_effect=[ApiError(429, "quota exceeded"), MagicMock()])
+    monkeypatch.setattr(context_cache, "_create_cached_content", create)
+    manager = make_manager()
+
+    assert manager.plan(MODEL, conversation(1), lambda msgs: msgs) is None
+    manager.plan(MODEL, conversation(2), lambda msgs: msgs)
+
+    assert create.call_count == 2
+    assert MODEL not in manager._unsupported
+
+
+def test_list_content_system_message(created):
+    """リスト形式のsystemメッセージはテキストのパートをシステム指示にすること"""
+    messages = conversation(1)
+    messages[0] = {
+        "role": "system",
+        "content": [{"type": "text", "text": "x" * 400}, {"type": "image_url", "image_url": {}}],
+    }
+
+    make_manager().plan(MODEL, messages, lambda msgs: msgs)
+
+    assert created[0][0] == "x" * 400
+
+
+def test_evicted_cache_is_deleted(created):
+    """上限件数を超えたキャッシュはVertex AIからも削除されること"""
+    manager = make_manager(max_entries=1)
+    manager.plan(MODEL, conversation(1), lambda msgs: msgs)
+    first = list(manager._entries.values())[0].cached_content
+
+    manager.plan("other-model", conversation(1), lambda msgs: msgs)
+
+    assert len(manager._entries) == 1
+    first.delete.assert_called_once()
+
+
+def test_estimate_text_tokens():
+    """英数字は4文字、日本語は1文字を1トークンとして概算すること"""
+    assert estimate_text_tokens("abcdefgh") == 2
+    assert estimate_text_tokens("日本語") == 3
@@ -0,0 +1,53 @@
+"""
+サーバー起動設定のテスト
+
+app.core.server のワーカー数の決定（CPU数・cgroupの上限）とHypercornの設定値を確認します。
+"""
+
+import dataclasses
+
+from app.core import server
+from app.core.config import get_settings
+
+
+class TestServerConfig:
+    """サーバー起動設定のテスト"""
+
+    def test_cgroup_cpu_limit(self, tmp_path):
+        """cgroupのquota/periodは切り上げられ、上限無しの場合はNoneになること"""
+        cpu_max = tmp_path / "cpu.max"
+        cpu_max.write_text("150000 100000\n")
+        assert server._cgroup_cpu_limit(str(cpu_max)) == 2
+
+        cpu_max.write_text("max 100000\n")
+        assert server._cgroup_cpu_limit(str(cpu_max)) is None
+        assert server._cgroup_cpu_limit(str(tmp_path / "missing")) is None
+
+    def test_resolve_worker_count(self, monkeypatch):
+        """"auto"は利用可能なCPU数、数値はその値（最小1）になること"""
+        monkeypatch.setattr(server, "available_cpus", lambda: 3)
+
+        assert server.resolve_worker_count("auto") == 3
+        assert server.resolve_worker_count("") == 3
+        assert server.resolve_worker_count("2") == 2
+        assert server.resolve_worker_count("0") == 1
+
+    def test_build_server_config(self, backend_env):
+        """SERVER_*の設定がHypercornの設定に反映されること"""
+        settings = dataclasses.replace(
+            get_settings(),
+            server_workers="4",
+            server_worker_class="asyncio",
+            server_keep_alive_seconds=30.0,
+            server_backlog=512,
+            server_graceful_timeout_seconds=5.0,
+        )
+
+        config = server.build_server_config(settings)
+
+        assert config.workers == 4
+        assert config.worker_class == "asyncio"
+        assert config.keep_alive_timeout == 30.0
+        assert config.backlog == 512
+        assert config.graceful_timeout == 5.0
+        assert config.application_path == server.APPLICATION_PATH
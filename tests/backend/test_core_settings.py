@@ -0,0 +1,76 @@
+"""
+設定オブジェクトとクライアントレジストリのテスト
+
+app.core.config.Settings が環境変数を1度だけ解釈すること、
+app.core.clients.ClientRegistry がクライアントを使い回すことを確認します。
+"""
+
+import pytest
+from unittest.mock import MagicMock
+
+from app.core.config import Settings, get_settings
+from app.core.clients import ClientRegistry
+
+
+class TestSettings:
+    """Settingsの生成テスト"""
+
+    def test_from_env_parses_typed_values(self, backend_env):
+        """環境変数が型付きの値に変換されること"""
+        backend_env.setenv("ORIGINS", "http://localhost:5173,http://localhost:5174")
+        backend_env.setenv("MAX_PROCESSING_JOBS", "7")
+
+        settings = Settings.from_env()
+
+        assert settings.origins == ["http://localhost:5173", "http://localhost:5174"]
+        assert settings.max_images == 10
+        assert settings.max_processing_jobs == 7
+        assert settings.sensitive_keys == ["password", "token", "secret"]
+        assert settings.port == 8080
+
+    def test_max_audio_bytes_is_capped_by_whisper_max_bytes(self, backend_env):
+        """MAX_AUDIO_BYTESはWHISPER_MAX_BYTESを超えないこと"""
+        backend_env.setenv("WHISPER_MAX_BYTES", "1000")
+        backend_env.setenv("MAX_AUDIO_BYTES", "5000")
+
+        settings = Settings.from_env()
+
+        assert settings.max_audio_bytes == 1000
+        assert settings.max_audio_base64_chars == 1500
+
+    def test_missing_required_value_raises(self, backend_env):
+        """必須の環境変数が無い場合はKeyErrorになること"""
+        backend_env.delenv("GCP_PROJECT_ID")
+
+        with pytest.raises(KeyError):
+            Settings.from_env()
+
+    def test_get_settings_is_cached(self, backend_env):
+        """get_settingsはプロセス内で同じインスタンスを返すこと"""
+        assert get_settings() is get_settings()
+
+
+class TestClientRegistry:
+    """ClientRegistryのテスト"""
+
+    def test_client_is_created_once(self, backend_env):
+        """同じ名前のクライアントは1度だけ生成されること"""
+        registry = ClientRegistry(get_settings())
+        factory = MagicMock(side_effect=lambda: object())
+
+        first = registry._get_or_create("firestore", factory)
+        second = registry._get_or_create("firestore", factory)
+
+        assert first is second
+        factory.assert_called_once()
+
+    def test_close_closes_created_clients(self, backend_env):
+        """closeで生成済みクライアントが閉じられ、レジストリが空になること"""
+        registry = ClientRegistry(get_settings())
+        client = MagicMock()
+        registry._get_or_create("storage", lambda: client)
+
+        registry.close()
+
+        client.close.assert_called_once()
+        assert registry._clients == {}
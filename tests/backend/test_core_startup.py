@@ -0,0 +1,63 @@
+"""
+起動処理のテスト
+
+app.core.startup の遅延初期化・ウォームアップ対象の解釈・起動レポートを確認します。
+"""
+
+import sys
+
+import pytest
+
+from app.core import startup
+
+
+class TestStartup:
+    """起動処理のテスト"""
+
+    def test_resolve_warmup_targets(self, backend_env):
+        """カンマ区切りの指定が対象名のリストになり、不明な名前は無視されること"""
+        assert startup.resolve_warmup_targets("") == []
+        assert startup.resolve_warmup_targets(" Firebase, vertexai ,unknown") == [
+            "firebase",
+            "vertexai",
+        ]
+        assert startup.resolve_warmup_targets("all") == list(startup.WARMUP_TARGETS)
+
+    def test_record_import_is_reported(self, backend_env):
+        """record_importで計測した時間が起動レポートに含まれること"""
+        with startup.record_import("test.module"):
+            pass
+
+        report = startup.startup_report()
+
+        assert report["event"] == "startup_report"
+        assert "test.module" in report["imports_ms"]
+
+    def test_init_vertex_ai_runs_once(self, backend_env, monkeypatch):
+        """VertexAIの初期化は1度だけ行われること"""
+        vertexai = sys.modules["vertexai"]
+        vertexai.init.reset_mock()
+        monkeypatch.setattr(startup, "_vertex_ai_initialized", False)
+
+        startup.init_vertex_ai()
+        startup.init_vertex_ai()
+
+        vertexai.init.assert_called_once_with(
+            project="test-project", location="us-central1"
+        )
+        assert "vertexai" in startup.startup_report()["inits_ms"]
+
+    @pytest.mark.asyncio
+    async def test_warm_up_ignores_failures(self, backend_env, monkeypatch):
+        """ウォームアップ対象の失敗が他の対象の初期化を妨げないこと"""
+        called = []
+
+        def fail():
+            raise RuntimeError("boom")
+
+        monkeypatch.setitem(startup.WARMUP_TARGETS, "firebase", fail)
+        monkeypatch.setitem(startup.WARMUP_TARGETS, "storage", lambda: called.append("storage"))
+
+        await startup.warm_up(["firebase", "storage"])
+
+        assert called == ["storage"]
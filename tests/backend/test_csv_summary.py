@@ -0,0 +1,98 @@
+"""
+CSV添付ファイルの要約のテスト
+
+app.utils.csv_analyzer が列の型・欠損数・最小値/最大値・頻出値を集計し、分析する行数の上限で読み込みを止めること、
+app.services.csv_summary が大きなCSVだけを要約に置き換え、textFilesのCSVにも同じキャッシュを使うことを確認します。
+"""
+
+import pytest
+
+from app.utils.csv_analyzer import analyze_csv, format_csv_summary
+
+
+def make_csv(rows: int) -> str:
+    lines = ["id,city,score,joined,active"]
+    for i in range(rows):
+        city = ("Tokyo", "Osaka", "Nagoya")[i % 3]
+        score = "" if i % 10 == 0 else f"{i * 0.5}"
+        lines.append(f"{i},{city},{score},2024-01-{i % 28 + 1:02d},{'true' if i % 2 else 'false'}")
+    return "\n".join(lines) + "\n"
+
+
+def test_column_statistics():
+    """チャンクをまたいで列の型と統計が集計されること"""
+    summary = analyze_csv(make_csv(1000), sample_rows=10_000, chunk_rows=300)
+    columns = {column.name: column for column in summary.columns}
+
+    assert summary.analyzed_rows == summary.estimated_rows == 1000
+    assert [columns[name].inferred_type for name in ("id", "city", "score", "joined", "active")] == [
+        "integer", "string", "float", "datetime", "boolean",
+    ]
+    assert (columns["id"].minimum, columns["id"].maximum) == (0, 999)
+    assert columns["score"].nulls == 100
+    assert columns["city"].top.most_common(1) == [("Tokyo", 334)]
+    assert columns["joined"].first_date.startswith("2024-01-01")
+
+
+def test_sampling_stops_early():
+    """分析する行数の上限で読み込みを止め、総行数は見積もりで示すこと"""
+    summary = analyze_csv(make_csv(5000), sample_rows=1000, chunk_rows=400)
+    text = format_csv_summary(summary)
+
+    assert summary.analyzed_rows == 1000
+    assert summary.estimated_rows == 5000
+    assert "先頭1,000行を分析" in text
+    assert "id, city, score, joined, active" in text
+
+
+@pytest.mark.asyncio
+async def test_only_large_csv_is_summarized(backend_env):
+    """CHAT_CSV_SUMMARY_CHARSを超えるCSVだけが要約に置き換えられること"""
+    backend_env.setenv("CHAT_CSV_SUMMARY_CHARS", "10000")
+    from app.services.csv_summary import summarize_message_csvs
+
+    large, small = make_csv(2000), make_csv(5)
+    messages = [
+        {
+            "role": "user",
+            "content": "分析して",
+            "files": [
+                {"name": "large.csv", "mimeType": "text/csv", "content": large},
+                {"name": "small.csv", "mimeType": "text/csv", "content": small},
+            ],
+        }
+    ]
+
+    summarized = await summarize_message_csvs(messages)
+
+    files = summarized[0]["files"]
+    assert files[0]["content"].startswith("[CSVの要約")
+    assert len(files[0]["content"]) < len(large) // 10
+    assert files[1]["content"] == small
+    assert messages[0]["files"][0]["content"] == large
+
+
+def test_text_file_csv_uses_summary_cache(backend_env, monkeypatch):
+    """textFilesのCSVも同じ要約のキャッシュを使い、同じ内容は1度だけ分析すること"""
+    backend_env.setenv("CHAT_CSV_SUMMARY_CHARS", "10000")
+    from app.core.config import get_settings
+    from app.services import csv_summary
+    from app.utils.file_utils import process_text_file
+
+    get_settings.cache_clear()
+    csv_summary.get_csv_summary_cache.cache_clear()
+    calls = []
+
+    def counting_analyze(*args, **kwargs):
+        calls.append(args)
+        return analyze_csv(*args, **kwargs)
+
+    monkeypatch.setattr(csv_summary, "analyze_csv", counting_analyze)
+    large = make_csv(2000)
+
+    first = process_text_file({"name": "large.csv", "type": "csv", "content": large})
+    second = process_text_file({"name": "large.csv", "type": "csv", "content": large})
+
+    assert first["content"] == second["content"]
+    assert first["content"].startswith("[CSVの要約")
+    assert len(calls) == 1
@@ -0,0 +1,98 @@
+"""
+チャットのWord（DOCX）添付ファイルのテキスト抽出のテスト
+
+app.services.document_extractor がDOCXの本体をメモリ上で解析してテキストに置き換え、
+同じ内容のファイルは1回だけ解析すること、クライアントで抽出済みのテキストはそのまま送ることを確認します。
+"""
+
+import base64
+import importlib
+import io
+import sys
+import zipfile
+
+import pytest
+
+from app.services import document_extractor
+from app.utils.file_utils import process_docx_text
+
+DOCUMENT_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    "<w:body>{}</w:body></w:document>"
+)
+
+
+def make_docx(*paragraphs: str) -> bytes:
+    body = "".join(f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>" for text in paragraphs)
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w") as docx:
+        docx.writestr("word/document.xml", DOCUMENT_XML.format(body))
+    return output.getvalue()
+
+
+def docx_file(name: str, data: bytes) -> dict:
+    content = f"data:{document_extractor.DOCX_MIME_TYPE};base64," + base64.b64encode(data).decode()
+    return {"name": name, "mimeType": document_extractor.DOCX_MIME_TYPE, "content": content}
+
+
+@pytest.fixture
+def real_docx2txt(monkeypatch):
+    """tests/app の conftest が sys.modules の docx2txt をMagicMockに置き換えている場合も本物で解析する"""
+    from app.utils import file_utils
+
+    monkeypatch.delitem(sys.modules, "docx2txt", raising=False)
+    monkeypatch.setattr(file_utils, "docx2txt", importlib.import_module("docx2txt"))
+
+
+@pytest.fixture
+def parses(inline_worker_pool, real_docx2txt):
+    return inline_worker_pool(
+        document_extractor,
+        "extract_docx_text",
+        "get_document_executor",
+        "get_document_text_cache",
+        1024 * 1024,
+    )
+
+
+def test_process_docx_text_without_temp_file(real_docx2txt):
+    """process_docx_textはbase64のDOCXからテキストを抽出すること"""
+    assert process_docx_text(base64.b64encode(make_docx("議事録", "決定事項")).decode()) == "議事録\n\n決定事項"
+    assert process_docx_text(base64.b64encode(b"not a zip").decode()) == "[DOCX text extraction error]"
+
+
+@pytest.mark.asyncio
+async def test_each_unique_document_is_parsed_once(parses):
+    """同じ内容のDOCXは1回だけ解析し、次のターンではキャッシュを使うこと"""
+    minutes, plan = make_docx("議事録"), make_docx("計画")
+    messages = [
+        {"role": "user", "content": "前回", "files": [docx_file("a.docx", minutes)]},
+        {"role": "assistant", "content": "はい"},
+        {
+            "role": "user",
+            "content": "比較して",
+            "files": [docx_file("a.docx", minutes), docx_file("b.docx", plan), docx_file("copy.docx", minutes)],
+        },
+    ]
+
+    extracted = await document_extractor.extract_message_documents(messages)
+    await document_extractor.extract_message_documents(messages)
+
+    assert [f["content"] for f in extracted[2]["files"]] == ["議事録", "計画", "議事録"]
+    assert extracted[0]["files"][0]["content"] == "議事録"
+    assert sorted(parses) == sorted([minutes, plan])
+    assert messages[0]["files"][0]["content"].startswith("data:")
+
+
+@pytest.mark.asyncio
+async def test_client_extracted_text_is_kept(parses):
+    """クライアントで抽出済みのテキストはそのまま送り、壊れたDOCXはエラーの表示に置き換えること"""
+    text_file = {"name": "c.docx", "mimeType": document_extractor.DOCX_MIME_TYPE, "content": "抽出済み"}
+    broken = docx_file("d.docx", b"PK\x03\x04broken")
+    messages = [{"role": "user", "content": "読んで", "files": [text_file, broken]}]
+
+    extracted = await document_extractor.extract_message_documents(messages)
+
+    assert extracted[0]["files"][0] is text_file
+    assert extracted[0]["files"][1]["content"] == document_extractor.DOCX_EXTRACTION_ERROR
@@ -0,0 +1,38 @@
+"""
+共有するエグゼキューターのテスト
+
+app.core.executors の lazy_executor が最初に使う時に1度だけ作成し、
+shutdown_executors が作成済みのものだけを終了することを確認します。
+"""
+
+from unittest.mock import MagicMock
+
+from app.core.executors import lazy_executor, shutdown_executors
+
+
+def test_created_on_first_use_and_shut_down_once():
+    """getは同じエグゼキューターを返し、終了後は次のgetで作り直すこと"""
+    factory = MagicMock(side_effect=lambda: MagicMock())
+    get, shutdown = lazy_executor(factory)
+
+    first = get()
+    assert get() is first
+    shutdown()
+    shutdown()
+
+    first.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+    assert get() is not first
+    assert factory.call_count == 2
+    shutdown()
+
+
+def test_shutdown_executors_skips_unused():
+    """shutdown_executorsは作成済みのものだけをcloseで終了すること"""
+    closed = []
+    get_used, _ = lazy_executor(lambda: "used", close=closed.append)
+    lazy_executor(lambda: "unused", close=closed.append)
+
+    get_used()
+    shutdown_executors()
+
+    assert closed == ["used"]
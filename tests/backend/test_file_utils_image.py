@@ -0,0 +1,73 @@
+"""
+画像の縮小・再圧縮（process_uploaded_image）のテスト
+
+JPEGがdraft()とreduce→resizeを経てMAX_LONG_EDGEちょうどに縮小されること、
+容量の上限を超える場合は上限に収まる品質が選ばれること、PNGはPNGのまま返ることを確認します。
+"""
+
+import base64
+import io
+import random
+
+from PIL import Image, ImageDraw
+
+
+def data_url(image: Image.Image, image_format: str, **options) -> str:
+    output = io.BytesIO()
+    image.save(output, format=image_format, **options)
+    mime_type = "image/png" if image_format == "PNG" else "image/jpeg"
+    return f"data:{mime_type};base64," + base64.b64encode(output.getvalue()).decode()
+
+
+def decode(result: str) -> bytes:
+    return base64.b64decode(result.split(",", 1)[1])
+
+
+def busy_photo(size=(4000, 3000)) -> Image.Image:
+    """圧縮しにくい（図形とノイズの多い）画像"""
+    rng = random.Random(0)
+    image = Image.blend(
+        Image.new("RGB", size, (90, 140, 200)), Image.effect_noise(size, 60).convert("RGB"), 0.3
+    )
+    draw = ImageDraw.Draw(image)
+    for _ in range(200):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.rectangle((x, y, x + 80, y + 50), fill=tuple(rng.randrange(256) for _ in range(3)))
+    return image
+
+
+def test_jpeg_is_downscaled_to_long_edge(backend_env):
+    """大きなJPEGは長辺がMAX_LONG_EDGEちょうどになり、縦横比が保たれること"""
+    from app.utils import file_utils
+
+    result = file_utils.process_uploaded_image(data_url(busy_photo(), "JPEG", quality=92))
+
+    image = Image.open(io.BytesIO(decode(result)))
+    assert result.startswith("data:image/jpeg;base64,")
+    assert image.size == (file_utils.MAX_LONG_EDGE, round(3000 * file_utils.MAX_LONG_EDGE / 4000))
+
+
+def test_quality_search_fits_max_image_size(backend_env, monkeypatch):
+    """品質85で上限を超える場合は、上限に収まる品質で再エンコードされること"""
+    from app.utils import file_utils
+
+    monkeypatch.setattr(file_utils, "MAX_IMAGE_SIZE", 150 * 1024)
+    source = data_url(busy_photo(), "JPEG", quality=92)
+
+    result = decode(file_utils.process_uploaded_image(source))
+
+    assert len(result) <= 150 * 1024
+    # 下限の品質よりは良い画質で収まる（下限まで落としていない）
+    monkeypatch.setattr(file_utils, "MAX_IMAGE_SIZE", 1)
+    smallest = decode(file_utils.process_uploaded_image(source))
+    assert len(result) > len(smallest)
+
+
+def test_png_stays_png(backend_env):
+    """PNGはPNGのまま縮小されること"""
+    from app.utils import file_utils
+
+    result = file_utils.process_uploaded_image(data_url(Image.new("RGBA", (3200, 800)), "PNG"))
+
+    assert result.startswith("data:image/png;base64,")
+    assert Image.open(io.BytesIO(decode(result))).size == (file_utils.MAX_LONG_EDGE, 392)
@@ -0,0 +1,83 @@
+"""
+チャットの画像添付ファイルの正規化のテスト
+
+app.services.image_normalizer が画像をMAX_LONG_EDGEまで縮小し、
+同じ画像は入力のhashごとに再圧縮せず再利用すること、
+プロセスプールのワーカーのログが出力されることを確認します。
+"""
+
+import base64
+import io
+import json
+import logging
+
+import pytest
+from PIL import Image
+
+from app.services import image_normalizer
+
+
+def encode_image(size, image_format: str) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", size, (120, 30, 200)).save(output, format=image_format)
+    return output.getvalue()
+
+
+@pytest.fixture
+def normalizer(inline_worker_pool):
+    return inline_worker_pool(
+        image_normalizer,
+        "process_uploaded_image",
+        "get_image_executor",
+        "get_normalized_image_cache",
+        16 * 1024 * 1024,
+    )
+
+
+@pytest.mark.asyncio
+async def test_large_image_is_downscaled_and_memoized(normalizer):
+    """MAX_LONG_EDGEを超える画像は縮小され、2回目は再圧縮しないこと"""
+    from app.utils import file_utils
+
+    content = "data:image/jpeg;base64," + base64.b64encode(encode_image((3000, 2000), "JPEG")).decode()
+    messages = [{"role": "user", "content": "見て", "files": [{"name": "a.jpg", "mimeType": "image/jpeg", "content": content}]}]
+
+    first = await image_normalizer.normalize_message_images(messages)
+    second = await image_normalizer.normalize_message_images(messages)
+
+    normalized = first[0]["files"][0]
+    image = Image.open(io.BytesIO(base64.b64decode(normalized["content"].split(",", 1)[1])))
+    assert file_utils.MAX_LONG_EDGE - 1 <= max(image.size) <= file_utils.MAX_LONG_EDGE
+    assert normalized["mimeType"] == "image/jpeg"
+    assert second == first
+    assert len(normalizer) == 1
+    assert messages[0]["files"][0]["content"] == content
+
+
+@pytest.mark.asyncio
+async def test_attachment_keeps_format(normalizer):
+    """hash参照の添付ファイルは形式を変えずに縮小し、対象外の形式はそのままにすること"""
+    png = encode_image((2400, 600), "PNG")
+
+    normalized = await image_normalizer.normalize_attachment(png, "image/png")
+
+    assert Image.open(io.BytesIO(normalized)).format == "PNG"
+    assert Image.open(io.BytesIO(normalized)).size[0] <= 1568
+    assert await image_normalizer.normalize_attachment(b"GIF89a", "image/gif") is None
+
+
+def log_in_worker(message: str) -> None:
+    logging.getLogger("app.worker").error(message)
+
+
+def test_worker_logs_are_written(backend_env, capfd):
+    """プロセスプールのワーカーで出力したログがキューに残らず標準出力に書き込まれること"""
+    executor = image_normalizer.get_image_executor()
+    try:
+        executor.submit(log_in_worker, "ワーカーのログ").result(timeout=30)
+    finally:
+        image_normalizer.shutdown_image_executor()
+
+    lines = [json.loads(line) for line in capfd.readouterr().out.splitlines() if line.startswith("{")]
+    logged = [line for line in lines if line["logger"] == "app.worker"]
+    assert [(line["severity"], line["message"]) for line in logged] == [("ERROR", "ワーカーのログ")]
@@ -0,0 +1,69 @@
+"""
+ログ用サニタイズ処理のテスト
+
+common_utils.logger.sanitize_request_data が機密キーを伏せ字にし、
+要素数・文字数の上限を超える部分を切り詰めることを確認します。
+"""
+
+from common_utils.logger import REDACTED, TRUNCATED, sanitize_request_data
+
+SENSITIVE_KEYS = ["password", "token", "secret"]
+
+
+class TestSanitizeRequestData:
+    """sanitize_request_dataのテスト"""
+
+    def test_sensitive_keys_are_redacted(self):
+        """機密キーは大文字小文字を問わずネストした辞書でも伏せ字になること"""
+        data = {"user": "u", "password": "p", "nested": {"IdToken": "t", "n": 1}}
+
+        result = sanitize_request_data(data, 100, SENSITIVE_KEYS)
+
+        assert result == {
+            "user": "u",
+            "password": REDACTED,
+            "nested": {"IdToken": REDACTED, "n": 1},
+        }
+
+    def test_json_body_is_parsed_and_redacted(self):
+        """上限以内のJSON文字列・バイト列はパースして伏せ字にすること"""
+        body = b'{"email": "a@example.com", "secret": "s"}'
+
+        result = sanitize_request_data(body, 100, SENSITIVE_KEYS)
+
+        assert result == {"email": "a@example.com", "secret": REDACTED}
+
+    def test_long_string_is_truncated_before_parsing(self):
+        """上限を超える文字列はパースせずに切り詰め、含まれる機密値は伏せ字にすること"""
+        body = '{"password": "hunter2", "image": "' + "A" * 10_000 + '"}'
+
+        result = sanitize_request_data(body, 50, SENSITIVE_KEYS)
+
+        assert isinstance(result, str)
+        assert result.endswith(TRUNCATED)
+        assert "hunter2" not in result
+        assert len(result) < 100
+
+    def test_node_budget_limits_large_lists(self):
+        """要素数の上限を超えたリストは残りの件数だけを記録すること"""
+        data = {"jobs": [{"id": i} for i in range(10_000)]}
+
+        result = sanitize_request_data(data, 100, SENSITIVE_KEYS, max_nodes=50)
+
+        jobs = result["jobs"]
+        assert len(jobs) < 50
+        assert jobs[-1].startswith(TRUNCATED)
+
+    def test_byte_budget_limits_total_output(self):
+        """出力文字数の合計が上限を超えないこと"""
+        data = ["x" * 100 for _ in range(100)]
+
+        result = sanitize_request_data(data, 100, max_bytes=250)
+
+        assert sum(len(item) for item in result) < 300
+
+    def test_scalars_and_plain_strings_are_unchanged(self):
+        """数値や短い文字列はそのまま返すこと"""
+        assert sanitize_request_data(123) == 123
+        assert sanitize_request_data("hello") == "hello"
+        assert sanitize_request_data(b"hello") == "hello"
@@ -0,0 +1,108 @@
+"""
+ログ出力パイプラインのテスト
+
+common_utils.logger の JSON フォーマッタ、ロガーごとのサンプリング、
+キューが満杯の場合にINFO以下のログを破棄して呼び出し側をブロックしないこと、
+WARNING以上のログは破棄せず、破棄した件数を報告することを確認します。
+"""
+
+import json
+import logging
+import queue
+
+from common_utils.logger import JsonFormatter, SamplingFilter, _DroppingQueueHandler
+
+
+def _record(name: str, level: int, msg, args=()) -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+class TestJsonFormatter:
+    """JsonFormatterのテスト"""
+
+    def test_dict_message_is_structured(self):
+        """辞書のログはmessageに構造化データとして出力されること"""
+        line = JsonFormatter().format(
+            _record("app", logging.INFO, {"event": "request_completed", "status": 200})
+        )
+
+        payload = json.loads(line)
+        assert payload["severity"] == "INFO"
+        assert payload["logger"] == "app"
+        assert payload["message"] == {"event": "request_completed", "status": 200}
+
+    def test_string_message_is_formatted(self):
+        """%形式の引数は展開されて出力されること"""
+        line = JsonFormatter().format(_record("app", logging.WARNING, "user %s", ("a",)))
+
+        assert json.loads(line)["message"] == "user a"
+
+
+class TestSamplingFilter:
+    """SamplingFilterのテスト"""
+
+    def test_rate_applies_to_child_loggers(self):
+        """親ロガーの割合が子ロガーにも適用されること"""
+        sampling = SamplingFilter({"httpx": 0.0})
+
+        assert not sampling.filter(_record("httpx._client", logging.INFO, "x"))
+        assert sampling.filter(_record("app", logging.INFO, "x"))
+
+    def test_warnings_are_never_sampled(self):
+        """WARNING以上のログは間引かれないこと"""
+        sampling = SamplingFilter({"httpx": 0.0})
+
+        assert sampling.filter(_record("httpx", logging.ERROR, "x"))
+
+
+class TestDroppingQueueHandler:
+    """_DroppingQueueHandlerのテスト"""
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        """キューが満杯の場合はブロックせずに破棄件数を数えること"""
+        handler = _DroppingQueueHandler(queue.Queue(1))
+
+        handler.handle(_record("app", logging.INFO, "first"))
+        handler.handle(_record("app", logging.INFO, "second"))
+
+        assert handler.queue.qsize() == 1
+        assert handler.dropped == 1
+
+    def test_warnings_are_written_directly_when_full(self):
+        """キューが満杯でもWARNING以上のログは破棄せず、出力用のハンドラで直接書き込むこと"""
+        written = []
+        fallback = logging.Handler()
+        fallback.emit = written.append
+        handler = _DroppingQueueHandler(queue.Queue(1), fallback=fallback)
+
+        handler.handle(_record("app", logging.INFO, "first"))
+        handler.handle(_record("app", logging.ERROR, "failed"))
+
+        assert [record.msg for record in written] == ["failed"]
+        assert handler.dropped == 0
+
+    def test_dropped_count_is_reported(self):
+        """破棄した件数は、次にキューに入れられたときにWARNINGのログで報告されること"""
+        handler = _DroppingQueueHandler(queue.Queue(2))
+        for message in ("first", "second", "dropped"):
+            handler.handle(_record("app", logging.INFO, message))
+        handler.queue.get_nowait()
+        handler.queue.get_nowait()
+
+        handler.handle(_record("app", logging.INFO, "next"))
+
+        queued, report = handler.queue.get_nowait(), handler.queue.get_nowait()
+        assert queued.msg == "next"
+        assert report.levelno == logging.WARNING
+        assert report.msg == {"event": "log_records_dropped", "dropped": 1, "dropped_total": 1}
+
+    def test_dict_message_is_kept_for_listener(self):
+        """辞書のログは文字列化されずにキューへ渡されること"""
+        handler = _DroppingQueueHandler(queue.Queue())
+        message = {"event": "x"}
+
+        handler.handle(_record("app", logging.INFO, message))
+
+        queued = handler.queue.get_nowait()
+        assert queued.msg == {"event": "x"}
+        assert queued.msg is not message
@@ -0,0 +1,162 @@
+"""
+メトリクスとServer-Timingヘッダーのテスト
+
+app.core.metrics のヒストグラム・外部サービス呼び出しの計測と、
+MetricsMiddleware がServer-Timingヘッダーを付けてルートごとに記録することを確認します。
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.metrics import (
+    MetricsMiddleware,
+    MetricsRegistry,
+    instrument_upstream,
+    render_metrics,
+)
+
+
+class TestMetricsRegistry:
+    """MetricsRegistryのテスト"""
+
+    def test_histogram_renders_cumulative_buckets(self):
+        """ヒストグラムは累積のバケットと合計・件数を出力すること"""
+        registry = MetricsRegistry()
+        histogram = registry.histogram("latency_seconds", "Latency", ("route",), (0.1, 1.0))
+        histogram.observe("/a", value=0.05)
+        histogram.observe("/a", value=0.5)
+        histogram.observe("/a", value=5)
+
+        text = registry.render()
+
+        assert 'latency_seconds_bucket{route="/a",le="0.1"} 1.0' in text
+        assert 'latency_seconds_bucket{route="/a",le="1.0"} 2.0' in text
+        assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3.0' in text
+        assert 'latency_seconds_count{route="/a"} 3.0' in text
+        assert "# TYPE latency_seconds histogram" in text
+
+    def test_label_values_are_escaped(self):
+        """ラベルの値の引用符とバックスラッシュはエスケープされること"""
+        registry = MetricsRegistry()
+        registry.counter("errors_total", "Errors", ("reason",)).inc('say "hi"\\')
+
+        assert 'errors_total{reason="say \\"hi\\"\\\\"} 1.0' in registry.render()
+
+    def test_constant_labels_are_added_to_every_sample(self):
+        """複数ワーカーの場合のpidのラベルは、ラベルの無いサンプルや集計関数の出力にも付くこと"""
+        registry = MetricsRegistry()
+        registry.counter("requests_total", "Requests").inc()
+        registry.histogram("latency_seconds", "Latency", ("route",), (1.0,)).observe("/a", value=0.5)
+        registry.add_collector(lambda: ["# TYPE entries gauge", 'entries{kind="x"} 3'])
+        registry.set_constant_labels(pid="123")
+
+        lines = registry.render().splitlines()
+
+        assert 'requests_total{pid="123"} 1.0' in lines
+        assert 'latency_seconds_bucket{pid="123",route="/a",le="1.0"} 1.0' in lines
+        assert 'latency_seconds_sum{pid="123",route="/a"} 0.5' in lines
+        assert 'entries{pid="123",kind="x"} 3' in lines
+        assert "# TYPE entries gauge" in lines
+
+
+class TestInstrumentUpstream:
+    """instrument_upstreamのテスト"""
+
+    def test_generator_is_timed_until_exhausted(self):
+        """ジェネレーターを返す関数は最後まで読み終えた時点で記録されること"""
+
+        @instrument_upstream("test_stream", "generate")
+        def stream():
+            yield from ("a", "b")
+
+        chunks = stream()
+        assert 'service="test_stream"' not in render_metrics()
+
+        assert list(chunks) == ["a", "b"]
+        assert 'upstream_call_duration_seconds_count{service="test_stream",operation="generate"} 1.0' in render_metrics()
+
+    @pytest.mark.asyncio
+    async def test_failures_are_counted(self):
+        """例外が発生した呼び出しはエラーとして数えられること"""
+
+        @instrument_upstream("test_failing")
+        async def call():
+            raise RuntimeError("unavailable")
+
+        with pytest.raises(RuntimeError):
+            await call()
+
+        assert 'upstream_call_errors_total{service="test_failing",operation="call"} 1.0' in render_metrics()
+
+
+class TestMetricsMiddleware:
+    """MetricsMiddlewareのテスト"""
+
+    def test_server_timing_and_route_metrics(self):
+        """Server-Timingに外部サービスの時間が載り、ルートのテンプレートで記録されること"""
+
+        @instrument_upstream("test_db", "lookup")
+        def lookup(item_id: str) -> dict:
+            return {"id": item_id}
+
+        app = FastAPI()
+        app.add_middleware(MetricsMiddleware)
+
+        @app.get("/test-metrics/items/{item_id}")
+        async def get_item(item_id: str):
+            return lookup(item_id)
+
+        response = TestClient(app).get("/test-metrics/items/42")
+
+        assert response.status_code == 200
+        server_timing = response.headers["Server-Timing"]
+        assert server_timing.startswith("app;dur=")
+        assert "test_db;dur=" in server_timing
+
+        text = render_metrics()
+        assert (
+            'http_requests_total{method="GET",route="/test-metrics/items/{item_id}",status="200"}'
+            in text
+        )
+        assert 'http_requests_in_flight{method="GET"} 0.0' in text
+        assert "log_records_dropped_total " in text
+
+
+class TestMetricsEndpoint:
+    """/backend/metrics の公開設定のテスト"""
+
+    @pytest.fixture
+    def make_client(self, backend_env, monkeypatch):
+        from app.core.config import get_settings
+
+        def make_client(**env):
+            for key, value in env.items():
+                monkeypatch.setenv(key, value)
+            get_settings.cache_clear()
+            from app.api.metrics import router
+
+            app = FastAPI()
+            app.include_router(router, prefix="/backend")
+            return TestClient(app)
+
+        return make_client
+
+    def test_disabled_by_default(self, make_client, monkeypatch):
+        """METRICS_ENABLEDを設定しない場合は404を返すこと"""
+        monkeypatch.delenv("METRICS_ENABLED", raising=False)
+
+        assert make_client().get("/backend/metrics").status_code == 404
+
+    def test_token_is_required(self, make_client):
+        """METRICS_TOKENを設定した場合は一致するBearerトークンが無いと401を返すこと"""
+        client = make_client(METRICS_ENABLED="true", METRICS_TOKEN="scrape-secret")
+
+        missing = client.get("/backend/metrics")
+        wrong = client.get("/backend/metrics", headers={"Authorization": "Bearer other"})
+        ok = client.get("/backend/metrics", headers={"Authorization": "Bearer scrape-secret"})
+
+        assert missing.status_code == wrong.status_code == 401
+        assert missing.headers["WWW-Authenticate"] == "Bearer"
+        assert ok.status_code == 200
+        assert ok.headers["content-type"].startswith("text/plain; version=0.0.4")
@@ -0,0 +1,59 @@
+"""
+チャットモデルのレジストリのテスト
+
+app.services.model_registry の許可モデル一覧の解析と、
+GenerativeModelのインスタンスがモデル名・生成設定ごとに再利用されることを確認します。
+"""
+
+import sys
+
+from app.services.model_registry import GenerativeModelCache, parse_model_options
+
+GENERATION = (0.2, 0.95, 40, 8192, True)
+
+
+class TestParseModelOptions:
+    """parse_model_optionsのテスト"""
+
+    def test_braced_model_is_default(self):
+        """{}で囲まれたモデルがデフォルトになり、一覧には括弧を外した名前が入ること"""
+        allow_list = parse_model_options("gemini-2.0-flash-lite, {gemini-2.0-flash-001}")
+
+        assert allow_list.models == ("gemini-2.0-flash-lite", "gemini-2.0-flash-001")
+        assert allow_list.default_model == "gemini-2.0-flash-001"
+        assert "gemini-2.0-flash-001" in allow_list
+        assert "{gemini-2.0-flash-001}" not in allow_list
+
+    def test_first_model_is_default_without_braces(self):
+        """{}が無い場合は先頭のモデルがデフォルトになり、旧形式のmodel:defaultも受け付けること"""
+        allow_list = parse_model_options("a:default,b")
+
+        assert allow_list.models == ("a", "b")
+        assert allow_list.default_model == "a"
+
+
+class TestGenerativeModelCache:
+    """GenerativeModelCacheのテスト"""
+
+    def test_instances_are_reused_per_model_and_config(self, backend_env):
+        """同じモデル名・生成設定では2回目以降GenerativeModelを作成しないこと"""
+        generative_models = sys.modules["vertexai.generative_models"]
+        generative_models.GenerativeModel.reset_mock()
+        cache = GenerativeModelCache()
+
+        cache.get("gemini-2.0-flash-001", GENERATION)
+        cache.get("gemini-2.0-flash-001", GENERATION)
+        cache.get("gemini-2.0-flash-001", (0.5,) + GENERATION[1:])
+
+        assert generative_models.GenerativeModel.call_count == 2
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    def test_least_recently_used_model_is_evicted(self, backend_env):
+        """上限を超えた場合は最も古く使われたモデルから破棄されること"""
+        cache = GenerativeModelCache(maxsize=1)
+
+        cache.get("a", GENERATION)
+        cache.get("b", GENERATION)
+        cache.get("a", GENERATION)
+
+        assert cache.misses == 3
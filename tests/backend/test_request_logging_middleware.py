@@ -0,0 +1,66 @@
+"""
+リクエストロギングミドルウェアのテスト
+
+app.api.auth.LogRequestMiddleware がボディを消費せずに先頭部分だけを写し取ること、
+リクエストIDの検証を従来どおり行うことを確認します。
+"""
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from common_utils.logger import log_request
+
+VALID_REQUEST_ID = "F0123456789ab"
+
+
+@pytest.fixture
+def client(backend_env, monkeypatch):
+    from app.api import auth
+    from app.api.auth import LogRequestMiddleware
+
+    # リクエストIDが不要なパスを明示的に設定する
+    monkeypatch.setattr(auth, "UNNEED_REQUEST_ID_PATH", ["/backend/config"])
+    monkeypatch.setattr(auth, "UNNEED_REQUEST_ID_PATH_STARTSWITH", ["/assets/"])
+    monkeypatch.setattr(auth, "UNNEED_REQUEST_ID_PATH_ENDSWITH", [".svg"])
+
+    app = FastAPI()
+    app.add_middleware(LogRequestMiddleware, body_prefix_bytes=16)
+
+    @app.post("/backend/echo")
+    async def echo(request: Request):
+        body = await request.body()
+        request_info = await log_request(request, None, 1000)
+        return {"size": len(body), "logged": request_info["request_body"].decode()}
+
+    return TestClient(app)
+
+
+class TestLogRequestMiddleware:
+    """LogRequestMiddlewareのテスト"""
+
+    def test_body_reaches_endpoint_and_only_prefix_is_logged(self, client):
+        """エンドポイントにはボディ全体が渡り、ログには先頭部分だけが残ること"""
+        body = b"x" * 100_000
+
+        response = client.post(
+            "/backend/echo", content=body, headers={"X-Request-Id": VALID_REQUEST_ID}
+        )
+
+        assert response.status_code == 200
+        assert response.json() == {"size": 100_000, "logged": "x" * 16}
+
+    def test_invalid_request_id_is_rejected(self, client):
+        """無効なリクエストIDは403になること"""
+        response = client.post(
+            "/backend/echo", content=b"{}", headers={"X-Request-Id": "invalid"}
+        )
+
+        assert response.status_code == 403
+        assert response.json() == {"error": "無効なリクエストIDです"}
+
+    def test_options_request_skips_validation(self, client):
+        """OPTIONSリクエストはリクエストIDの検証を行わないこと"""
+        response = client.options("/backend/echo")
+
+        assert response.status_code != 403
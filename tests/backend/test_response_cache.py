@@ -0,0 +1,101 @@
+"""
+チャット応答のキャッシュのテスト
+
+app.services.response_cache のキーの正規化・LRU・ディスクへの保存と、
+common_message_function が2回目の同じリクエストで保存済みの応答を同じチャンクの区切りで返し、
+キャッシュから返した応答はVertex AIの呼び出しとして数えないことを確認します。
+"""
+
+from types import SimpleNamespace
+
+from app.core.metrics import render_metrics
+from app.services.response_cache import DiskResponseBackend, ResponseCache, response_cache_key
+
+MODEL = "gemini-2.0-flash-001"
+GENERATION = (0.2, 0.95, 40, 8192, True)
+
+
+def test_key_is_canonical():
+    """辞書のキーの順序に関わらず同じキーになり、生成設定が違えば別のキーになること"""
+    a = [{"role": "user", "content": "要約して"}]
+    b = [{"content": "要約して", "role": "user"}]
+
+    assert response_cache_key(MODEL, GENERATION, a) == response_cache_key(MODEL, GENERATION, b)
+    assert response_cache_key(MODEL, GENERATION, a) != response_cache_key(
+        MODEL, (0.9,) + GENERATION[1:], a
+    )
+
+
+def test_memory_lru_and_disk_backend(tmp_path):
+    """メモリの上限を超えた応答もディスクから読み込め、再起動後も使えること"""
+    backend = DiskResponseBackend(str(tmp_path), max_bytes=1024 * 1024, ttl_seconds=60)
+    cache = ResponseCache(max_entries=1, ttl_seconds=60, backend=backend)
+    cache.put("a" * 64, ["こん", "にちは"])
+    cache.put("b" * 64, ["別の応答"])
+
+    assert cache.get("a" * 64) == ["こん", "にちは"]
+    restarted = ResponseCache(1, 60, DiskResponseBackend(str(tmp_path), 1024 * 1024, 60))
+    assert restarted.get("b" * 64) == ["別の応答"]
+    assert restarted.get("c" * 64) is None
+
+
+def test_cached_response_is_replayed_as_stream(backend_env, monkeypatch):
+    """同じリクエストの2回目はVertex AIを呼ばずに同じチャンクで応答すること"""
+    from app.services import chat_service
+
+    calls = []
+
+    class FakeModel:
+        def generate_content(self, contents, stream=False):
+            calls.append(contents)
+            return iter([SimpleNamespace(text="定型の"), SimpleNamespace(text="要約です")])
+
+    cache = ResponseCache(16, 60)
+    monkeypatch.setattr(chat_service, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(chat_service, "prepare_messages_for_vertex", lambda messages: messages)
+    monkeypatch.setattr(
+        chat_service, "get_model_cache", lambda: SimpleNamespace(get=lambda *args: FakeModel())
+    )
+    monkeypatch.setattr(chat_service, "get_model_allow_list", lambda: {MODEL})
+    messages = [{"role": "user", "content": "次の文章を要約して: ..."}]
+
+    first = list(chat_service.common_message_function(model=MODEL, messages=messages, stream=True))
+    second = list(chat_service.common_message_function(model=MODEL, messages=messages, stream=True))
+
+    assert first == second == ["定型の", "要約です"]
+    assert len(calls) == 1
+
+
+def vertex_generate_count() -> float:
+    prefix = 'upstream_call_duration_seconds_count{service="vertex",operation="generate_content"} '
+    for line in render_metrics().splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return 0.0
+
+
+def test_cache_hit_is_not_counted_as_upstream_call(backend_env, monkeypatch):
+    """キャッシュから返した応答はVertex AIの呼び出し回数・所要時間に記録されないこと"""
+    from app.services import chat_service
+
+    class FakeModel:
+        def generate_content(self, contents, stream=False):
+            return SimpleNamespace(text="定型の要約です")
+
+    cache = ResponseCache(16, 60)
+    monkeypatch.setattr(chat_service, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(chat_service, "prepare_messages_for_vertex", lambda messages: messages)
+    monkeypatch.setattr(
+        chat_service, "get_model_cache", lambda: SimpleNamespace(get=lambda *args: FakeModel())
+    )
+    monkeypatch.setattr(chat_service, "get_model_allow_list", lambda: {MODEL})
+    messages = [{"role": "user", "content": "次の文章を要約して: ..."}]
+
+    before = vertex_generate_count()
+    first = chat_service.common_message_function(model=MODEL, messages=messages, trim_history=False)
+    after_miss = vertex_generate_count()
+    second = chat_service.common_message_function(model=MODEL, messages=messages, trim_history=False)
+
+    assert first == second == "定型の要約です"
+    assert after_miss == before + 1
+    assert vertex_generate_count() == after_miss
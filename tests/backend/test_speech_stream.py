@@ -0,0 +1,240 @@
+"""
+音声認識のストリーミングのテスト
+
+/speech2text/stream が開始メッセージで認証し、届いた音声を順に認識に渡しながら
+途中結果・確定結果を返すこと、認証できない場合は接続を閉じること、
+/speech2text が認識の応答を音声認識用のスレッドプールで読み、NDJSONでも返せること、
+multipart・octet-streamの音声をボディの受信に合わせてチャンクごとに認識に渡すことを確認します。
+"""
+
+import base64
+import datetime
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+
+def result(text, is_final, words=()):
+    alternative = SimpleNamespace(transcript=text, words=list(words))
+    return SimpleNamespace(alternatives=[alternative], is_final=is_final, stability=0.8)
+
+
+def word(text, start, end):
+    return SimpleNamespace(
+        word=text,
+        start_offset=datetime.timedelta(seconds=start),
+        end_offset=datetime.timedelta(seconds=end),
+    )
+
+
+@pytest.fixture
+def speech_app(backend_env, monkeypatch):
+    from app.api import speech
+
+    received = []
+
+    def fake_recognize(audio_chunks, language_codes, encoding, sample_rate_hertz):
+        # 音声が届くたびに途中結果を返し、音声の終わりで確定結果を返す
+        for chunk in audio_chunks:
+            received.append(chunk)
+            yield SimpleNamespace(results=[result(f"途中{len(received)}", False)])
+        yield SimpleNamespace(results=[result("こんにちは", True, [word("こんにちは", 0.5, 1.25)])])
+
+    def fake_verify(token):
+        if token != "valid":
+            raise ValueError("invalid token")
+        return {"uid": "u", "email": "u@example.com"}
+
+    monkeypatch.setattr(speech, "streaming_recognize_v2", fake_recognize)
+    monkeypatch.setattr(speech, "verify_token", fake_verify)
+    app = FastAPI()
+    app.include_router(speech.router, prefix="/backend")
+    return TestClient(app), received
+
+
+def test_interim_and_final_results_are_streamed(speech_app):
+    """音声を送るたびに途中結果が返り、停止後に確定結果と終了が返ること"""
+    client, received = speech_app
+
+    with client.websocket_connect("/backend/speech2text/stream") as ws:
+        ws.send_json({"token": "valid", "encoding": "LINEAR16", "sampleRateHertz": 16000})
+        assert ws.receive_json() == {"type": "ready"}
+        ws.send_bytes(b"\x00" * 3200)
+        first = ws.receive_json()
+        ws.send_bytes(b"\x01" * 3200)
+        second = ws.receive_json()
+        ws.send_json({"type": "stop"})
+        final = ws.receive_json()
+        end = ws.receive_json()
+
+    assert first == {"type": "interim", "text": "途中1", "stability": 0.8}
+    assert second["text"] == "途中2"
+    assert final == {
+        "type": "final",
+        "text": "こんにちは",
+        "timed_transcription": [
+            {"start_time": "00:00:00.500", "end_time": "00:00:01.250", "text": "こんにちは"}
+        ],
+    }
+    assert end == {"type": "end"}
+    assert received == [b"\x00" * 3200, b"\x01" * 3200]
+
+
+def test_invalid_token_closes_connection(speech_app):
+    """認証できない場合や、開始メッセージ・音声形式・サンプリングレートが不正な場合は1008で閉じること"""
+    client, received = speech_app
+
+    starts = (
+        {"token": "invalid"},
+        {"token": "valid", "encoding": "MP3"},
+        [],
+        "x",
+        1,
+        {"token": "valid", "encoding": "LINEAR16", "sampleRateHertz": "16000"},
+        {"token": "valid", "encoding": "LINEAR16", "sampleRateHertz": 0},
+    )
+    for start in starts:
+        with client.websocket_connect("/backend/speech2text/stream") as ws:
+            ws.send_json(start)
+            with pytest.raises(WebSocketDisconnect) as closed:
+                ws.receive_json()
+        assert closed.value.code == 1008
+    assert received == []
+
+
+@pytest.fixture
+def transcribe_app(backend_env, monkeypatch):
+    from app.api import speech
+    from app.api.auth import get_current_user
+
+    threads = []
+
+    def fake_transcribe(audio_content, language_codes):
+        threads.append(threading.current_thread().name)
+        if not isinstance(audio_content, bytes):
+            # 受信したチャンクをそのまま記録する
+            threads.append(list(audio_content))
+        yield SimpleNamespace(results=[result("一文目", True, [word("一文目", 0, 1)])])
+        yield SimpleNamespace(results=[result("二文目", True)])
+
+    monkeypatch.setattr(speech, "transcribe_streaming_v2", fake_transcribe)
+    app = FastAPI()
+    app.include_router(speech.router, prefix="/backend")
+    app.dependency_overrides[get_current_user] = lambda: {"uid": "u", "email": "u@example.com"}
+    return TestClient(app), threads
+
+
+def test_transcription_runs_in_speech_executor(transcribe_app):
+    """認識の応答は音声認識用のスレッドプールで読まれ、JSONでまとめて返ること"""
+    client, threads = transcribe_app
+    audio = "data:audio/wav;base64," + base64.b64encode(b"RIFF" + b"\x00" * 64).decode()
+
+    response = client.post(
+        "/backend/speech2text", json={"audio_data": audio}, headers={"X-Request-Id": "F0123456789ab"}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["transcription"] == "一文目\n二文目"
+    assert response.json()["timed_transcription"][0] == {
+        "start_time": "00:00:00.000", "end_time": "00:00:01.000", "text": "一文目",
+    }
+    assert threads and threads[0].startswith("speech-stream")
+
+
+def test_transcription_streams_ndjson(transcribe_app):
+    """Acceptにapplication/x-ndjsonを指定した場合は確定した結果を1行ずつ返すこと"""
+    client, _ = transcribe_app
+    audio = base64.b64encode(b"RIFF" + b"\x00" * 64).decode()
+
+    response = client.post(
+        "/backend/speech2text",
+        json={"audio_data": audio},
+        headers={"X-Request-Id": "F0123456789ab", "Accept": "application/x-ndjson"},
+    )
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["type"] for line in lines] == ["final", "final", "end"]
+    assert lines[-1]["transcription"] == "一文目\n二文目"
+    assert len(lines[-1]["timed_transcription"]) == 2
+
+
+def audio_body(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def test_octet_stream_is_recognized(transcribe_app):
+    """octet-streamのボディがそのまま認識に渡されること"""
+    client, threads = transcribe_app
+    chunks = [bytes([i]) * 1000 for i in range(5)]
+
+    response = client.post(
+        "/backend/speech2text",
+        content=audio_body(chunks),
+        headers={"X-Request-Id": "F0123456789ab", "Content-Type": "application/octet-stream"},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["transcription"] == "一文目\n二文目"
+    assert b"".join(threads[1]) == b"".join(chunks)
+
+
+def test_multipart_audio_part_is_streamed(transcribe_app):
+    """multipartのうち音声のパートのデータだけが認識に渡され、音声が無い場合は400を返すこと"""
+    client, threads = transcribe_app
+    audio = bytes(range(256)) * 40
+
+    response = client.post(
+        "/backend/speech2text",
+        data={"note": "memo"},
+        files={"audio": ("rec.webm", audio, "audio/webm")},
+        headers={"X-Request-Id": "F0123456789ab", "Accept": "application/x-ndjson"},
+    )
+    empty = client.post(
+        "/backend/speech2text",
+        data={"note": "memo"},
+        files={"other": ("", b"", "text/plain")},
+        headers={"X-Request-Id": "F0123456789ab"},
+    )
+
+    assert [json.loads(line)["type"] for line in response.text.splitlines()][-1] == "end"
+    assert b"".join(threads[1]) == audio
+    assert empty.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_multipart_is_parsed_per_received_chunk(backend_env):
+    """multipartのボディは受信したメッセージごとに解析され、音声のデータが順に返ること"""
+    from starlette.requests import Request
+
+    from app.api.speech import multipart_audio_chunks
+
+    audio = bytes(range(256)) * 64
+    body = (
+        b"--b\r\nContent-Disposition: form-data; name=\"note\"\r\n\r\nmemo\r\n"
+        b"--b\r\nContent-Disposition: form-data; name=\"audio\"; filename=\"a.wav\"\r\n"
+        b"Content-Type: audio/wav\r\n\r\n" + audio + b"\r\n--b--\r\n"
+    )
+    messages = [
+        {"type": "http.request", "body": body[i : i + 1024], "more_body": i + 1024 < len(body)}
+        for i in range(0, len(body), 1024)
+    ]
+
+    async def receive():
+        return messages.pop(0)
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "headers": [(b"content-type", b"multipart/form-data; boundary=b")],
+    }
+    chunks = [chunk async for chunk in multipart_audio_chunks(Request(scope, receive))]
+
+    assert b"".join(chunks) == audio
+    assert len(chunks) >= len(audio) // 1024
+    assert max(len(chunk) for chunk in chunks) <= 1024
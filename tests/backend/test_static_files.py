@@ -0,0 +1,100 @@
+"""
+静的ファイル配信のテスト
+
+app.core.static_files の圧縮済みファイルの作成・選択、キャッシュヘッダー、
+index.htmlのETagによる再検証（304）を確認します。
+"""
+
+import gzip
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.core.static_files import (
+    IMMUTABLE_CACHE_CONTROL,
+    REVALIDATE_CACHE_CONTROL,
+    CachedIndexHtml,
+    PrecompressedStaticFiles,
+    accepted_encodings,
+    available_encodings,
+    precompress_directory,
+)
+
+ASSET_BODY = b"console.log('hello');\n" * 200
+
+
+def _client(tmp_path) -> TestClient:
+    assets = tmp_path / "assets"
+    assets.mkdir()
+    (assets / "index-BxY1a2b3.js").write_bytes(ASSET_BODY)
+    (assets / "plain.css").write_bytes(b"body{}")
+    (tmp_path / "index.html").write_text("<html>app</html>")
+    precompress_directory(str(assets))
+
+    app = FastAPI()
+    app.mount("/assets", PrecompressedStaticFiles(directory=str(assets)))
+    index_html = CachedIndexHtml(str(tmp_path / "index.html"))
+
+    @app.get("/{path:path}")
+    async def index(request: Request, path: str):
+        return index_html.response(request)
+
+    return TestClient(app)
+
+
+class TestPrecompress:
+    """圧縮済みファイルの作成のテスト"""
+
+    def test_variants_are_created_once(self, tmp_path):
+        """圧縮対象のファイルだけ圧縮済みファイルが作られ、2回目は作り直さないこと"""
+        (tmp_path / "app-12345678.js").write_bytes(ASSET_BODY)
+        (tmp_path / "small.js").write_bytes(b"x")
+        (tmp_path / "logo.png").write_bytes(ASSET_BODY)
+
+        assert precompress_directory(str(tmp_path)) == len(available_encodings())
+        assert gzip.decompress((tmp_path / "app-12345678.js.gz").read_bytes()) == ASSET_BODY
+        assert not (tmp_path / "small.js.gz").exists()
+        assert not (tmp_path / "logo.png.gz").exists()
+        assert precompress_directory(str(tmp_path)) == 0
+
+    def test_accepted_encodings(self):
+        """q=0のエンコーディングは受け入れないものとして扱うこと"""
+        assert accepted_encodings("gzip, deflate, br;q=0") == ["gzip", "deflate"]
+        assert accepted_encodings("") == []
+
+
+class TestStaticServing:
+    """静的ファイル配信のテスト"""
+
+    def test_precompressed_asset_is_served(self, tmp_path):
+        """gzipを受け入れるクライアントには圧縮済みファイルをimmutableで返すこと"""
+        response = _client(tmp_path).get(
+            "/assets/index-BxY1a2b3.js", headers={"Accept-Encoding": "gzip"}
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+        assert response.headers["content-type"].startswith("text/javascript")
+        assert response.content == ASSET_BODY
+
+    def test_unhashed_asset_is_revalidated(self, tmp_path):
+        """ハッシュを含まないファイルは無圧縮で毎回再検証させること"""
+        response = _client(tmp_path).get(
+            "/assets/plain.css", headers={"Accept-Encoding": "identity"}
+        )
+
+        assert "content-encoding" not in response.headers
+        assert response.headers["cache-control"] == REVALIDATE_CACHE_CONTROL
+
+    def test_index_html_etag(self, tmp_path):
+        """index.htmlはETagが一致すれば304を返すこと"""
+        client = _client(tmp_path)
+
+        first = client.get("/chat")
+        second = client.get("/whisper", headers={"If-None-Match": first.headers["etag"]})
+
+        assert first.status_code == 200
+        assert first.text == "<html>app</html>"
+        assert second.status_code == 304
+        assert second.content == b""
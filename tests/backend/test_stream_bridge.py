@@ -0,0 +1,100 @@
+"""
+同期ストリームのブリッジのテスト
+
+app.core.stream_bridge.iterate_in_thread がイベントループをブロックせずに要素を受け渡し、
+例外の再送出と読み手の途中終了に対応すること、
+ChunkFeeder が非同期に届くチャンクをスレッドの読み手に順に渡すことを確認します。
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.core.stream_bridge import ChunkFeeder, iterate_in_thread
+
+
+@pytest.fixture
+def executor():
+    pool = ThreadPoolExecutor(max_workers=4)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+class TestIterateInThread:
+    """iterate_in_threadのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_items_are_read_without_blocking_loop(self, executor):
+        """ブロッキングな生産側を待つ間もイベントループが動き続けること"""
+        ticks = 0
+
+        def slow_stream():
+            for index in range(3):
+                time.sleep(0.05)
+                yield index
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker_task = asyncio.create_task(ticker())
+        items = [item async for item in iterate_in_thread(slow_stream, executor)]
+        ticker_task.cancel()
+
+        assert items == [0, 1, 2]
+        assert ticks >= 5
+
+    @pytest.mark.asyncio
+    async def test_error_is_reraised(self, executor):
+        """生産側の例外は読み手で再送出されること"""
+
+        def failing_stream():
+            yield "partial"
+            raise RuntimeError("upstream failed")
+
+        items = []
+        with pytest.raises(RuntimeError, match="upstream failed"):
+            async for item in iterate_in_thread(failing_stream, executor):
+                items.append(item)
+
+        assert items == ["partial"]
+
+    @pytest.mark.asyncio
+    async def test_consumer_exit_closes_generator(self, executor):
+        """読み手が途中で終了すると、バッファ待ちの生産側も止まりジェネレーターが閉じられること"""
+        closed = threading.Event()
+
+        def endless_stream():
+            try:
+                while True:
+                    yield "chunk"
+            finally:
+                closed.set()
+
+        stream = iterate_in_thread(endless_stream, executor, buffer_size=1)
+        assert await stream.__anext__() == "chunk"
+        await stream.aclose()
+
+        assert await asyncio.to_thread(closed.wait, 5)
+
+
+class TestChunkFeeder:
+    """ChunkFeederのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_chunks_reach_thread_reader_in_order(self):
+        """満杯の間はputが待ち、close後は残りを読み終えてからイテレーションが終わること"""
+        feeder = ChunkFeeder(max_chunks=2)
+        reader = asyncio.create_task(asyncio.to_thread(list, feeder))
+
+        for index in range(10):
+            await feeder.put(index)
+        feeder.close()
+        await feeder.put("ignored")
+
+        assert await asyncio.wait_for(reader, 5) == list(range(10))
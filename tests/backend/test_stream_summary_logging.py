@@ -0,0 +1,124 @@
+"""
+ストリーミング応答のログ集計のテスト
+
+common_utils.logger.wrap_asyncgenerator_logger の summary モードが
+ストリームごとに集計を1件だけ出力し、chunk モードが従来どおりチャンクごとに出力することを確認します。
+"""
+
+from unittest.mock import patch
+
+import pytest
+
+from common_utils.logger import StreamSummary, wrap_asyncgenerator_logger
+
+
+async def _collect(generator):
+    return [chunk async for chunk in generator]
+
+
+def _logged(mock_info):
+    return [call.args[0] for call in mock_info.call_args_list]
+
+
+class TestStreamSummaryLogging:
+    """wrap_asyncgenerator_loggerのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_summary_is_logged_once(self):
+        """summaryモードではストリーム終了時に1件だけ集計が出力されること"""
+
+        @wrap_asyncgenerator_logger(meta_info={"path": "/backend/chat"}, max_length=5, mode="summary")
+        async def stream():
+            for text in ("hello ", "streaming ", "world"):
+                yield text
+
+        with patch("common_utils.logger.logger.info") as mock_info:
+            chunks = await _collect(stream())
+
+        assert chunks == ["hello ", "streaming ", "world"]
+        (summary,) = _logged(mock_info)
+        assert summary["event"] == "stream_summary"
+        assert summary["path"] == "/backend/chat"
+        assert summary["status"] == "completed"
+        assert summary["chunks"] == 3
+        assert summary["bytes"] == len("hello streaming world")
+        assert summary["head"] == "hello"
+        assert summary["tail"] == "world"
+        assert set(summary["gap_ms"]) == {"p50", "p90", "p99", "max"}
+        assert summary["ttfb_ms"] is not None
+
+    @pytest.mark.asyncio
+    async def test_sampled_chunks_are_logged(self):
+        """sample_everyを指定するとN件に1件のチャンクも出力されること"""
+
+        @wrap_asyncgenerator_logger(mode="summary", sample_every=2)
+        async def stream():
+            for index in range(5):
+                yield str(index)
+
+        with patch("common_utils.logger.logger.info") as mock_info:
+            await _collect(stream())
+
+        logged = _logged(mock_info)
+        assert [log["chunk_index"] for log in logged if "chunk_index" in log] == [0, 2, 4]
+        assert logged[-1]["event"] == "stream_summary"
+
+    @pytest.mark.asyncio
+    async def test_error_status_is_recorded(self):
+        """ストリームが例外で終了した場合もstatusをerrorとして集計が出力されること"""
+
+        @wrap_asyncgenerator_logger(mode="summary")
+        async def stream():
+            yield "partial"
+            raise RuntimeError("upstream failed")
+
+        with patch("common_utils.logger.logger.info") as mock_info:
+            with pytest.raises(RuntimeError):
+                await _collect(stream())
+
+        (summary,) = _logged(mock_info)
+        assert summary["status"] == "error"
+        assert summary["chunks"] == 1
+
+    @pytest.mark.asyncio
+    async def test_chunk_mode_logs_every_chunk(self):
+        """chunkモードでは従来どおりチャンクごとに出力されること"""
+
+        @wrap_asyncgenerator_logger(meta_info={"path": "/x"}, mode="chunk")
+        async def stream():
+            for text in ("a", "b"):
+                yield text
+
+        with patch("common_utils.logger.logger.info") as mock_info:
+            await _collect(stream())
+
+        assert _logged(mock_info) == [
+            {"path": "/x", "chunk": "a"},
+            {"path": "/x", "chunk": "b"},
+        ]
+
+
+class TestStreamSummary:
+    """StreamSummaryの先頭・末尾の内容のテスト"""
+
+    def test_short_multibyte_stream_has_no_tail(self):
+        """先頭に収まる短い日本語の応答は、バイト数が多くても末尾を重複して出力しないこと"""
+        summary = StreamSummary(sample_length=10)
+        summary.add("こんにちは".encode("utf-8"))
+        summary.add("世界")
+
+        result = summary.to_dict("completed")
+
+        assert result["head"] == "こんにちは世界"
+        assert result["tail"] == ""
+        assert result["bytes"] == 21
+
+    def test_tail_of_large_byte_chunk_is_its_end(self):
+        """sample_lengthより大きいバイト列のチャンクでは、末尾にチャンクの最後の内容を残すこと"""
+        summary = StreamSummary(sample_length=4)
+        summary.add(b"head" + b"-" * 100 + b"tail")
+
+        result = summary.to_dict("completed")
+
+        assert result["head"] == "head"
+        assert result["tail"] == "tail"
@@ -0,0 +1,122 @@
+"""
+検証済みIDトークンキャッシュのテスト
+
+app.core.token_cache.VerifiedTokenCache の有効期限・LRU破棄・統計と、
+get_current_user が同じトークンの署名検証を1度だけ行うことを確認します。
+"""
+
+import sys
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.core.token_cache import VerifiedTokenCache, get_token_cache
+
+
+def _request(token: str) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/backend/config",
+            "headers": [(b"authorization", f"Bearer {token}".encode())],
+        }
+    )
+
+
+class TestVerifiedTokenCache:
+    """VerifiedTokenCacheのテスト"""
+
+    def test_hit_until_exp(self):
+        """expまではヒットし、expを過ぎると破棄されること"""
+        cache = VerifiedTokenCache(maxsize=10)
+        claims = {"uid": "user-1", "exp": 1000}
+        cache.put("token-1", claims)
+
+        assert cache.get("token-1", now=999) == claims
+        assert cache.get("token-1", now=1000) is None
+        assert cache.stats() == {
+            "size": 0,
+            "maxsize": 10,
+            "hits": 1,
+            "misses": 1,
+            "expired": 1,
+            "evictions": 0,
+        }
+
+    def test_least_recently_used_is_evicted(self):
+        """上限を超えると最も古く使われたエントリが破棄されること"""
+        cache = VerifiedTokenCache(maxsize=2)
+        cache.put("a", {"exp": 1000})
+        cache.put("b", {"exp": 1000})
+        cache.get("a", now=0)
+        cache.put("c", {"exp": 1000})
+
+        assert cache.get("b", now=0) is None
+        assert cache.get("a", now=0) is not None
+        assert cache.get("c", now=0) is not None
+        assert cache.stats()["evictions"] == 1
+
+    def test_token_is_not_stored_in_plain_text(self):
+        """キーにはトークンそのものではなくハッシュを使うこと"""
+        cache = VerifiedTokenCache()
+        cache.put("secret-token", {"exp": 1000})
+
+        assert "secret-token" not in cache._entries
+
+    def test_claims_without_exp_are_not_cached(self):
+        """expが無いクレームはキャッシュしないこと"""
+        cache = VerifiedTokenCache()
+        cache.put("token", {"uid": "user-1"})
+
+        assert cache.stats()["size"] == 0
+
+
+class TestGetCurrentUserCache:
+    """get_current_userのキャッシュ利用テスト"""
+
+    @pytest.fixture
+    def firebase_auth(self, backend_env, monkeypatch):
+        from app.api import auth as auth_module
+
+        get_token_cache.cache_clear()
+        firebase_admin = MagicMock()
+        firebase_admin.auth.verify_id_token.return_value = {
+            "uid": "user-1",
+            "exp": time.time() + 3600,
+        }
+        monkeypatch.setitem(sys.modules, "firebase_admin", firebase_admin)
+        monkeypatch.setattr(auth_module, "init_firebase", lambda: None)
+        yield firebase_admin.auth
+        get_token_cache.cache_clear()
+
+    @pytest.mark.asyncio
+    async def test_token_is_verified_once(self, firebase_auth):
+        """同じトークンの署名検証は1度だけ行われること"""
+        from app.api.auth import get_current_user
+
+        first = await get_current_user(_request("token-1"))
+        second = await get_current_user(_request("token-1"))
+
+        assert first["uid"] == second["uid"] == "user-1"
+        firebase_auth.verify_id_token.assert_called_once_with(
+            "token-1", clock_skew_seconds=60
+        )
+        assert get_token_cache().stats()["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_invalid_token_is_not_cached(self, firebase_auth):
+        """検証に失敗したトークンはキャッシュされず、毎回401になること"""
+        from app.api.auth import get_current_user
+
+        firebase_auth.verify_id_token.side_effect = ValueError("invalid token")
+
+        for _ in range(2):
+            with pytest.raises(HTTPException) as exc_info:
+                await get_current_user(_request("bad-token"))
+            assert exc_info.value.status_code == 401
+
+        assert firebase_auth.verify_id_token.call_count == 2